@@ -0,0 +1,107 @@
+"""
+Feed Reactions Benchmark
+========================
+Compares the cost of building one /posts feed page's reaction data:
+
+* aggregate - the previous approach: fetch the page, then ``$group`` the
+  page's ``post_reactions`` rows to find each post's top five emoji
+* stored    - the denormalized approach: fetch the page and read the
+  ``reaction_counts`` histogram already on each post
+
+Seeds a scratch database on the MongoDB at MONGO_URL (dropped afterwards)
+with posts carrying a growing number of reactions each.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 python -m benchmarks.bench_feed_reactions
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from core.post_counters import reconcile_post_counters, top_reactions
+
+EMOJIS = ["👍", "❤️", "😂", "😮", "😢", "😡", "🔥", "👏", "🤔", "💯"]
+REACTIONS_PER_POST = [0, 10, 100, 1_000]
+POSTS = 200
+PAGE = 10
+ROUNDS = 200
+
+
+async def seed(db, reactions_per_post: int) -> None:
+    await db.posts.create_index([("created_at", -1)])
+    await db.post_reactions.create_index([("post_id", 1), ("user_id", 1)])
+    now = datetime.now(timezone.utc)
+    posts = [{"id": str(uuid.uuid4()), "created_at": now - timedelta(minutes=i),
+              "likes_count": 0, "comments_count": 0} for i in range(POSTS)]
+    await db.posts.insert_many(posts)
+    reactions = [
+        {"id": str(uuid.uuid4()), "post_id": post["id"], "user_id": f"u{j}", "emoji": random.choice(EMOJIS)}
+        for post in posts for j in range(reactions_per_post)
+    ]
+    for start in range(0, len(reactions), 10_000):
+        await db.post_reactions.insert_many(reactions[start:start + 10_000])
+    await reconcile_post_counters(db)
+
+
+async def page_with_aggregate(db):
+    posts = await db.posts.find({}, {"_id": 0}).sort("created_at", -1).limit(PAGE).to_list(PAGE)
+    post_ids = [p["id"] for p in posts]
+    top = {}
+    async for item in db.post_reactions.aggregate([
+        {"$match": {"post_id": {"$in": post_ids}}},
+        {"$group": {"_id": {"post_id": "$post_id", "emoji": "$emoji"}, "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+        {"$group": {"_id": "$_id.post_id", "reactions": {"$push": {"emoji": "$_id.emoji", "count": "$count"}}}},
+    ]):
+        top[item["_id"]] = item["reactions"][:5]
+    return [top.get(p["id"], []) for p in posts]
+
+
+async def page_with_histogram(db):
+    posts = await db.posts.find({}, {"_id": 0}).sort("created_at", -1).limit(PAGE).to_list(PAGE)
+    return [top_reactions(p.get("reaction_counts")) for p in posts]
+
+
+async def bench(label: str, build_page, db) -> float:
+    await build_page(db)  # warm the connection pool and caches
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        await build_page(db)
+        timings.append((time.perf_counter() - start) * 1000)
+    median = statistics.median(timings)
+    p95 = statistics.quantiles(timings, n=20)[-1]
+    print(f"  {label:<10} median {median:7.2f} ms   p95 {p95:7.2f} ms")
+    return median
+
+
+async def main(mongo_url: str, scratch_db: str) -> None:
+    client = AsyncIOMotorClient(mongo_url)
+    try:
+        for per_post in REACTIONS_PER_POST:
+            await client.drop_database(scratch_db)
+            db = client[scratch_db]
+            await seed(db, per_post)
+            print(f"{PAGE}-post feed page, {per_post:,} reactions per post")
+            before = await bench("aggregate", page_with_aggregate, db)
+            after = await bench("stored", page_with_histogram, db)
+            print(f"  speedup    {before / after:7.1f}x\n")
+    finally:
+        await client.drop_database(scratch_db)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--scratch-db", default="zion_bench_reactions")
+    args = parser.parse_args()
+    asyncio.run(main(args.mongo_url, args.scratch_db))
@@ -0,0 +1,128 @@
+"""
+Link Preview Benchmark
+======================
+Compares building a link preview against a local HTTP fixture server:
+
+* previous - a new ``aiohttp`` session per call, the whole page read with
+  ``response.text()`` and scanned with IGNORECASE regexes
+* fetch    - ``LinkPreviewService.fetch``: pooled session, parsing stops at
+  ``</head>`` (uncached cost of a new URL)
+* cached   - ``LinkPreviewService.preview`` for a URL already cached
+
+for pages of growing size, then a burst of concurrent requests for one URL
+(previous: one fetch each; service: one shared fetch).
+
+The fixture server adds a fixed latency per response to stand in for a
+remote site. No MongoDB is needed; the cache is in-process only.
+
+Usage (from backend/):
+    python -m benchmarks.bench_link_preview
+"""
+
+import argparse
+import asyncio
+import re
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from core.cache import TieredCache
+from core.link_preview import LinkPreviewService
+
+PAGE_SIZES_KB = [16, 256, 2_048]
+ROUNDS = 50
+BURST = 100
+
+HEAD = (
+    "<html><head><title>Fixture page</title>"
+    '<meta property="og:title" content="Fixture">'
+    '<meta property="og:description" content="A page served by the benchmark">'
+    '<meta property="og:image" content="/cover.jpg">'
+    "</head>"
+)
+
+
+async def previous_preview(url: str) -> dict:
+    """The pre-existing implementation, kept here only for comparison."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=5)) as response:
+            html = await response.text()
+
+    def extract_og_tag(property_name):
+        for pattern in [
+            rf'<meta[^>]*property=["\']og:{property_name}["\'][^>]*content=["\']([^"\']*)["\']',
+            rf'<meta[^>]*content=["\']([^"\']*)["\'][^>]*property=["\']og:{property_name}["\']',
+        ]:
+            match = re.search(pattern, html, re.IGNORECASE)
+            if match:
+                return match.group(1)
+        return None
+
+    title = extract_og_tag("title")
+    if not title:
+        match = re.search(r"<title[^>]*>([^<]*)</title>", html, re.IGNORECASE)
+        title = match.group(1) if match else None
+    return {"title": title, "description": extract_og_tag("description"),
+            "image": extract_og_tag("image"), "site_name": extract_og_tag("site_name")}
+
+
+def fixture_app(latency: float) -> web.Application:
+    async def page(request):
+        await asyncio.sleep(latency)
+        size = int(request.match_info["kb"]) * 1024
+        body = "<body>" + "<p>lorem ipsum dolor sit amet</p>" * (size // 32) + "</body></html>"
+        return web.Response(text=HEAD + body, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/page/{kb}", page)
+    return app
+
+
+async def timed(label: str, call, rounds: int = ROUNDS) -> float:
+    await call()  # warm up
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - start) * 1000)
+    median = statistics.median(timings)
+    print(f"  {label:<10} median {median:8.2f} ms   p95 {statistics.quantiles(timings, n=20)[-1]:8.2f} ms")
+    return median
+
+
+async def main(latency: float) -> None:
+    server = TestServer(fixture_app(latency))
+    await server.start_server()
+    cache = TieredCache(namespace="bench", shared=False)
+    service = LinkPreviewService(cache=cache)
+    try:
+        for kb in PAGE_SIZES_KB:
+            url = str(server.make_url(f"/page/{kb}"))
+            print(f"{kb:,} KB page, {latency * 1000:.0f} ms server latency")
+            before = await timed("previous", lambda: previous_preview(url))
+            after = await timed("fetch", lambda: service.fetch(url))
+            await timed("cached", lambda: service.preview(url))
+            print(f"  speedup    {before / after:8.1f}x uncached\n")
+
+        url = str(server.make_url("/page/256"))
+        print(f"{BURST} concurrent requests for one uncached URL")
+        start = time.perf_counter()
+        await asyncio.gather(*(previous_preview(url) for _ in range(BURST)))
+        print(f"  previous   {(time.perf_counter() - start) * 1000:8.2f} ms")
+        await cache.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(service.preview(url) for _ in range(BURST)))
+        print(f"  service    {(time.perf_counter() - start) * 1000:8.2f} ms")
+    finally:
+        await service.close()
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=20, help="delay added by the fixture server")
+    args = parser.parse_args()
+    asyncio.run(main(args.latency_ms / 1000))
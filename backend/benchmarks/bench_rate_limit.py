@@ -0,0 +1,106 @@
+"""
+Rate Limiter Benchmark
+======================
+Shows that the sliding-window-counter limiter has constant per-request cost
+as the number of tracked keys grows and as the per-key request volume
+grows, compared with the previous timestamp-list implementation (whose list
+is rebuilt on every call under one global lock).
+
+Usage (from backend/):
+    python -m benchmarks.bench_rate_limit
+    REDIS_URL=redis://localhost:6379/0 python -m benchmarks.bench_rate_limit --shared
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, List
+
+from core.rate_limit import RateLimiter
+
+KEY_COUNTS = [100, 1_000, 10_000, 100_000, 1_000_000]
+HOT_KEY_LIMITS = [10, 100, 1_000, 10_000]
+SAMPLES = 20_000
+
+
+class TimestampListLimiter:
+    """The pre-existing in-memory limiter, kept here only for comparison."""
+
+    def __init__(self):
+        self._requests: Dict[str, List[float]] = {}
+        self._lock = asyncio.Lock()
+
+    async def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> bool:
+        async with self._lock:
+            current_time = time.time()
+            window_start = current_time - window_seconds
+            if key in self._requests:
+                self._requests[key] = [t for t in self._requests[key] if t > window_start]
+            else:
+                self._requests[key] = []
+            if len(self._requests[key]) >= max_requests:
+                return False
+            self._requests[key].append(current_time)
+            return True
+
+
+async def bench(label: str, check, key_count: int, limit: int) -> float:
+    # Warm the key space so the structure holds key_count live keys
+    for i in range(key_count):
+        await check(f"user:{i}", limit, 60)
+
+    keys = [f"user:{random.randrange(key_count)}" for _ in range(SAMPLES)]
+    start = time.perf_counter()
+    for key in keys:
+        await check(key, limit, 60)
+    elapsed = time.perf_counter() - start
+    per_call_us = elapsed / SAMPLES * 1e6
+    print(f"  {label:<22} keys={key_count:>9,}  {per_call_us:8.2f} µs/request")
+    return per_call_us
+
+
+async def bench_hot_key(label: str, check, limit: int) -> float:
+    # One busy caller that has used its whole budget: every further request
+    # is evaluated against `limit` requests already inside the window.
+    for _ in range(limit):
+        await check("user:hot", limit, 60)
+
+    start = time.perf_counter()
+    for _ in range(SAMPLES):
+        await check("user:hot", limit, 60)
+    elapsed = time.perf_counter() - start
+    per_call_us = elapsed / SAMPLES * 1e6
+    print(f"  {label:<22} in-window={limit:>7,}  {per_call_us:8.2f} µs/request")
+    return per_call_us
+
+
+async def main(shared: bool, limit: int) -> None:
+    print(f"Sliding-window counter ({'shared Redis' if shared else 'local'}), limit={limit}/60s")
+    for key_count in KEY_COUNTS:
+        limiter = RateLimiter(namespace="bench", shared=shared)
+        await limiter.start()
+        await bench("sliding window", limiter.is_allowed, key_count, limit)
+        await limiter.close()
+
+    print(f"\nTimestamp list (previous implementation), limit={limit}/60s")
+    for key_count in KEY_COUNTS[:4]:
+        legacy = TimestampListLimiter()
+        await bench("timestamp list", legacy.is_allowed, key_count, limit)
+
+    print("\nSingle hot key, growing number of requests inside the window")
+    for hot_limit in HOT_KEY_LIMITS:
+        limiter = RateLimiter(namespace="bench", shared=shared)
+        await limiter.start()
+        await bench_hot_key("sliding window", limiter.is_allowed, hot_limit)
+        await limiter.close()
+    for hot_limit in HOT_KEY_LIMITS[:3]:
+        await bench_hot_key("timestamp list", TimestampListLimiter().is_allowed, hot_limit)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shared", action="store_true", help="use the Redis backend from REDIS_URL")
+    parser.add_argument("--limit", type=int, default=100, help="requests allowed per window")
+    args = parser.parse_args()
+    asyncio.run(main(args.shared, args.limit))
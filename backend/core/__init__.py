@@ -11,11 +11,99 @@ from .logging import (
     request_context,
     JSONFormatter
 )
+from .cache import LRUCache, TieredCache
+from .principal_cache import PrincipalCache
+from .rate_limit import RateLimiter, RateLimitRule, RateLimitMiddleware
+from .pubsub import InProcessBroker, RedisBroker, create_broker
+from .metrics import MetricsMiddleware, MongoCommandMetrics, render_metrics
+from .query_budget import QueryBudgetExceeded, QueryBudgetMiddleware, QueryRecorderListener, recording
+from .loaders import BatchLoader, RequestLoaders, request_loaders
+from .pagination import InvalidCursor, Keyset
+from .counting import CountMode, ListCounter
+from .indexes import IndexRegistry, IndexSpec, HotQuery, reconcile_indexes, find_collscans
+from .timelines import NewsTimelines
+from .family_graph import FamilyGraph
+from .org_graph import OrgGraph
+from .post_counters import set_reaction, clear_reaction, top_reactions, reconcile_post_counters
+from .audience import post_audience, viewer_audience, visible_to, backfill_post_audiences
+from .batch import BatchDispatcher, BatchError, shared_principal, current_principal
+from .link_preview import LinkPreviewService
+from .media import attach_media
+from .journal import ChangeJournal
+from .connections import ModuleConnections, ConnectionSet
+from .suggestions import SuggestionEngine
+from .people_search import find_people, people_query, rank_people, search_fields
+from .relationships import Relationship, RelationshipResolver
+from .social_counters import SocialCounters
+from .relationship_sets import RelationshipSets
+from .jobs import SharedCursor, run_once
+from .redis_client import get_redis, close_redis
 
 __all__ = [
     'setup_logging',
     'get_logger',
     'ContextLogger',
     'request_context',
-    'JSONFormatter'
+    'JSONFormatter',
+    'LRUCache',
+    'TieredCache',
+    'PrincipalCache',
+    'RateLimiter',
+    'RateLimitRule',
+    'RateLimitMiddleware',
+    'InProcessBroker',
+    'RedisBroker',
+    'create_broker',
+    'MetricsMiddleware',
+    'MongoCommandMetrics',
+    'render_metrics',
+    'QueryBudgetExceeded',
+    'QueryBudgetMiddleware',
+    'QueryRecorderListener',
+    'recording',
+    'BatchLoader',
+    'RequestLoaders',
+    'request_loaders',
+    'InvalidCursor',
+    'Keyset',
+    'CountMode',
+    'ListCounter',
+    'IndexRegistry',
+    'IndexSpec',
+    'HotQuery',
+    'reconcile_indexes',
+    'find_collscans',
+    'NewsTimelines',
+    'post_audience',
+    'viewer_audience',
+    'visible_to',
+    'backfill_post_audiences',
+    'FamilyGraph',
+    'OrgGraph',
+    'set_reaction',
+    'clear_reaction',
+    'top_reactions',
+    'reconcile_post_counters',
+    'BatchDispatcher',
+    'BatchError',
+    'shared_principal',
+    'current_principal',
+    'LinkPreviewService',
+    'attach_media',
+    'ChangeJournal',
+    'ModuleConnections',
+    'ConnectionSet',
+    'SuggestionEngine',
+    'find_people',
+    'people_query',
+    'rank_people',
+    'search_fields',
+    'Relationship',
+    'RelationshipResolver',
+    'SocialCounters',
+    'RelationshipSets',
+    'SharedCursor',
+    'run_once',
+    'get_redis',
+    'close_redis'
 ]
@@ -0,0 +1,129 @@
+"""
+Post Audiences for ZION.CITY API
+================================
+Family-post visibility expressed as data so it can be evaluated by MongoDB.
+
+Each post stores an ``audience`` array of facet tokens derived from its
+``visibility`` and ``family_id`` when it is written:
+
+==========================  ===================================
+visibility                  audience
+==========================  ===================================
+PUBLIC                      ``public``
+FAMILY_ONLY/HOUSEHOLD_ONLY  ``family:<id>``
+PARENTS_ONLY                ``family:<id>:PARENT``
+FATHERS_ONLY                ``family:<id>:PARENT:MALE``
+MOTHERS_ONLY                ``family:<id>:PARENT:FEMALE``
+CHILDREN_ONLY               ``family:<id>:CHILD``
+EXTENDED_FAMILY_ONLY        ``family:<id>:EXTENDED_FAMILY``
+ONLY_ME (or no family)      nothing - the author only
+==========================  ===================================
+
+A viewer holds the matching tokens for every family they belong to
+(``family:<id>``, ``family:<id>:<relationship>`` and
+``family:<id>:<relationship>:<gender>``), so "can this user see the post"
+becomes ``author is the viewer OR audience $in viewer tokens`` - a
+condition on a multikey index that lets feed pages return ``limit``
+visible posts per round-trip instead of filtering them afterwards.
+
+Viewer tokens are computed per request from current memberships and
+gender, so relationship or gender changes need no post rewrites. Posts
+written before the ``audience`` field existed are filled in once by
+``backfill_post_audiences``.
+
+Usage:
+    from core.audience import post_audience, viewer_audience, visible_to
+
+    post["audience"] = post_audience(post)                      # on write
+
+    tokens = viewer_audience(memberships, current_user.gender)  # on read
+    query["$or"] = visible_to(current_user.id, tokens)
+"""
+
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PUBLIC = "public"
+
+# visibility -> (relationship, gender) facet appended to the family token
+ROLE_FACETS = {
+    "FAMILY_ONLY": (),
+    "HOUSEHOLD_ONLY": (),  # households are not modelled yet; same as FAMILY_ONLY
+    "PARENTS_ONLY": ("PARENT",),
+    "FATHERS_ONLY": ("PARENT", "MALE"),
+    "MOTHERS_ONLY": ("PARENT", "FEMALE"),
+    "CHILDREN_ONLY": ("CHILD",),
+    "EXTENDED_FAMILY_ONLY": ("EXTENDED_FAMILY",),
+}
+
+BACKFILL_BATCH = 500
+
+
+def _value(value: Any) -> Optional[str]:
+    """Plain string for enum members (visibility, gender) or None."""
+    return getattr(value, "value", value) or None
+
+
+def post_audience(post: Dict[str, Any]) -> List[str]:
+    """Audience tokens for a post; empty means only the author can see it."""
+    visibility = _value(post.get("visibility")) or "FAMILY_ONLY"
+    if visibility == "PUBLIC":
+        return [PUBLIC]
+
+    family_id = post.get("family_id")
+    facets = ROLE_FACETS.get(visibility)
+    if not family_id or facets is None:
+        return []
+    return [":".join(("family", family_id) + facets)]
+
+
+def viewer_audience(memberships: Iterable[Dict[str, Any]], gender: Any = None) -> List[str]:
+    """Tokens a viewer matches, from their active ``family_members`` rows."""
+    gender = _value(gender)
+    tokens = [PUBLIC]
+    for membership in memberships:
+        family = f"family:{membership['family_id']}"
+        tokens.append(family)
+        relationship = membership.get("relationship")
+        if relationship:
+            tokens.append(f"{family}:{relationship}")
+            if gender:
+                tokens.append(f"{family}:{relationship}:{gender}")
+    return tokens
+
+
+def visible_to(user_id: str, tokens: List[str]) -> List[Dict[str, Any]]:
+    """``$or`` branches matching posts the viewer may see."""
+    return [{"user_id": user_id}, {"audience": {"$in": tokens}}]
+
+
+async def backfill_post_audiences(collection, batch: int = BACKFILL_BATCH) -> int:
+    """Set ``audience`` on posts that predate it; returns the number updated."""
+    updated = 0
+    while True:
+        posts = await collection.find(
+            {"audience": {"$exists": False}},
+            {"_id": 0, "id": 1, "visibility": 1, "family_id": 1}
+        ).limit(batch).to_list(batch)
+        if not posts:
+            break
+
+        # One update per distinct audience rather than one per post
+        groups = defaultdict(list)
+        for post in posts:
+            groups[tuple(post_audience(post))].append(post["id"])
+        for audience, post_ids in groups.items():
+            result = await collection.update_many(
+                {"id": {"$in": post_ids}, "audience": {"$exists": False}},
+                {"$set": {"audience": list(audience)}}
+            )
+            updated += result.modified_count
+        if len(posts) < batch:
+            break
+
+    if updated:
+        logger.info(f"Backfilled audience on {updated} posts")
+    return updated
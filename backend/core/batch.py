@@ -0,0 +1,183 @@
+"""
+Batch Requests for ZION.CITY API
+================================
+Runs several API sub-requests inside one ``POST /api/batch`` request,
+concurrently and in-process, with one status and body per item. Items
+share the authenticated principal and the request-scoped loaders.
+
+Usage:
+    from core.batch import BatchDispatcher, shared_principal
+
+    batch = BatchDispatcher(RateLimitMiddleware(app.router, ...), excluded_paths={"/api/batch"})
+
+    @api_router.post("/batch")
+    async def run_batch(payload: BatchRequest, request: Request, user = Depends(get_current_user)):
+        request_loaders(db)  # create before dispatch so items share them
+        with shared_principal(token, user):
+            return {"responses": await batch.run(request.scope, payload.requests)}
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from fastapi.exception_handlers import http_exception_handler, request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 20))
+DEFAULT_METHODS = frozenset({"GET"})
+
+# Headers copied from the batch request to each sub-request
+FORWARDED_HEADERS = frozenset({b"authorization", b"accept", b"accept-language", b"user-agent", b"x-real-ip"})
+# Response headers that describe the transport rather than the result
+DROPPED_HEADERS = frozenset({"content-length", "content-type", "content-encoding", "vary"})
+
+_principal: contextvars.ContextVar[Optional[Tuple[str, Any]]] = contextvars.ContextVar("batch_principal", default=None)
+
+
+@contextmanager
+def shared_principal(token: str, user: Any) -> Iterator[None]:
+    """Expose an authenticated user to sub-requests sent with ``token``."""
+    reset = _principal.set((token, user))
+    try:
+        yield
+    finally:
+        _principal.reset(reset)
+
+
+def current_principal(token: str) -> Optional[Any]:
+    """The shared user when serving a batch item with the same token."""
+    shared = _principal.get()
+    if shared is not None and shared[0] == token:
+        return shared[1]
+    return None
+
+
+class BatchError(ValueError):
+    """Raised for a batch that cannot be run at all (e.g. too many items)."""
+
+
+class BatchDispatcher:
+    """Dispatches sub-requests into an ASGI app and collects their results."""
+
+    def __init__(
+        self,
+        app,
+        prefix: str = "/api/",
+        max_items: int = MAX_ITEMS,
+        methods: Iterable[str] = DEFAULT_METHODS,
+        excluded_paths: Iterable[str] = (),
+    ):
+        self.app = app
+        self.prefix = prefix
+        self.max_items = max_items
+        self.methods = frozenset(m.upper() for m in methods)
+        self.excluded_paths = frozenset(excluded_paths)
+
+    async def run(self, scope: Dict[str, Any], items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run every item concurrently; results keep the order of ``items``."""
+        if len(items) > self.max_items:
+            raise BatchError(f"Batch too large: {len(items)} requests (maximum {self.max_items})")
+        return list(await asyncio.gather(*(self.call(scope, item) for item in items)))
+
+    async def call(self, scope: Dict[str, Any], item: Dict[str, Any]) -> Dict[str, Any]:
+        """Run one item; never raises."""
+        item_id = item.get("id")
+        method = (item.get("method") or "GET").upper()
+        url = urlsplit(item.get("path") or "")
+
+        if not url.path.startswith(self.prefix) or url.path in self.excluded_paths:
+            return _result(item_id, 400, {"detail": f"Path not allowed in a batch: {url.path or '(empty)'}"})
+        if method not in self.methods:
+            return _result(item_id, 405, {"detail": f"Method not allowed in a batch: {method}"})
+
+        body = b""
+        headers = [(k, v) for k, v in scope.get("headers", []) if k in FORWARDED_HEADERS]
+        if item.get("body") is not None:
+            body = json.dumps(item["body"]).encode("utf-8")
+            headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+
+        sub_scope = {
+            "type": "http",
+            "asgi": scope.get("asgi", {"version": "3.0"}),
+            "http_version": scope.get("http_version", "1.1"),
+            "method": method,
+            "scheme": scope.get("scheme", "http"),
+            "server": scope.get("server"),
+            "client": scope.get("client"),
+            "root_path": scope.get("root_path", ""),
+            "path": url.path,
+            "raw_path": url.path.encode("utf-8"),
+            "query_string": url.query.encode("utf-8"),
+            "headers": headers,
+            "app": scope.get("app"),
+            "state": {},
+        }
+        capture = _Capture(body)
+        try:
+            await self.app(sub_scope, capture.receive, capture.send)
+        except HTTPException as e:
+            await self._handle(http_exception_handler, sub_scope, e, capture)
+        except RequestValidationError as e:
+            await self._handle(request_validation_exception_handler, sub_scope, e, capture)
+        except Exception:
+            logger.exception(f"Batch item {method} {url.path} failed")
+            return _result(item_id, 500, {"detail": "Internal server error"})
+        return capture.result(item_id)
+
+    @staticmethod
+    async def _handle(handler, scope, exc, capture: "_Capture") -> None:
+        response = await handler(Request(scope), exc)
+        capture.reset()
+        await response(scope, capture.receive, capture.send)
+
+
+class _Capture:
+    """ASGI receive/send pair that buffers the response."""
+
+    def __init__(self, body: bytes):
+        self._body = body
+        self._sent_body = False
+        self.reset()
+
+    def reset(self) -> None:
+        self.status = 500
+        self.headers: Dict[str, str] = {}
+        self.chunks: List[bytes] = []
+
+    async def receive(self) -> Dict[str, Any]:
+        if self._sent_body:
+            # Nothing more will arrive; park like a server would until cancelled
+            await asyncio.Event().wait()
+        self._sent_body = True
+        return {"type": "http.request", "body": self._body, "more_body": False}
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            for key, value in message.get("headers", []):
+                self.headers[key.decode("latin-1").lower()] = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            self.chunks.append(message.get("body", b""))
+
+    def result(self, item_id: Any) -> Dict[str, Any]:
+        raw = b"".join(self.chunks)
+        if self.headers.get("content-type", "").startswith("application/json") and raw:
+            body = json.loads(raw)
+        else:
+            body = raw.decode("utf-8", errors="replace") if raw else None
+        headers = {k: v for k, v in self.headers.items() if k not in DROPPED_HEADERS}
+        return _result(item_id, self.status, body, headers)
+
+
+def _result(item_id: Any, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return {"id": item_id, "status": status, "headers": headers or {}, "body": body}
@@ -0,0 +1,420 @@
+"""
+Tiered Cache for ZION.CITY API
+==============================
+Two-level cache shared by all gunicorn workers:
+
+* an in-process LRU tier bounded by entry count and memory, with per-key TTL;
+* an optional shared Redis tier (any Redis-protocol server);
+* a Redis pub/sub invalidation channel so that ``invalidate()`` on one worker
+  drops the local copy on every other worker.
+
+Values are stored pickled in both tiers. This gives exact memory accounting
+for the local tier and means callers always receive a private copy, so a hot
+path can mutate a cached document without corrupting the cache.
+
+Usage:
+    from core.cache import TieredCache
+
+    cache = TieredCache(namespace="zion", default_ttl=300)
+    await cache.start()          # in the app lifespan, once per worker
+
+    org = await cache.get_or_set(f"org:{org_id}", load_org, ttl=120)
+    await cache.invalidate(f"org:{org_id}")
+"""
+
+import asyncio
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache of pickled blobs with per-key TTL.
+
+    Bounded both by number of entries and by total blob size. All operations
+    are O(1) except ``clear_expired``.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (blob, expires_at)
+        self._data: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the blob for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            blob, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return blob
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        """Return seconds until key expires, or None if not present."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            return max(0.0, entry[1] - time.monotonic())
+
+    def set(self, key: str, blob: bytes, ttl: float) -> None:
+        """Store blob under key for ttl seconds, evicting LRU entries as needed."""
+        size = len(blob)
+        if size > self.max_bytes:
+            # Never let one oversized value flush the whole tier
+            self.pop(key)
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (blob, time.monotonic() + ttl)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._data))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def pop(self, key: str) -> bool:
+        """Remove key; return True if it was present."""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+                return True
+            return False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def clear_expired(self) -> int:
+        """Drop all expired entries and return how many were removed."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (_, exp) in self._data.items() if exp <= now]
+            for key in expired:
+                self._remove(key)
+        return len(expired)
+
+    def _remove(self, key: str) -> None:
+        blob, _ = self._data.pop(key)
+        self._bytes -= len(blob)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+
+class TieredCache:
+    """
+    Local LRU tier + optional shared Redis tier + cross-worker invalidation.
+
+    Redis errors never propagate to callers: the cache degrades to local-only
+    and logs at debug level, so a Redis outage costs hit rate, not requests.
+    """
+
+    def __init__(
+        self,
+        namespace: str = "zion",
+        default_ttl: int = 300,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        local_ttl: Optional[int] = None,
+        redis_url: Optional[str] = None,
+        shared: bool = True,
+    ):
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        # Upper bound on how long a worker trusts its local copy; invalidation
+        # messages are best-effort, so this bounds staleness if one is lost.
+        self.local_ttl = local_ttl if local_ttl is not None else default_ttl
+        self.local = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self._redis_url = redis_url
+        self._shared_enabled = shared
+        self._redis = None
+        self._origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._channel = f"{namespace}:cache:invalidate"
+        self._subscriber_task: Optional[asyncio.Task] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._listeners: List[Tuple[str, Callable[[Optional[str]], None]]] = []
+        self._stats = {
+            "local_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "invalidations_sent": 0,
+            "invalidations_received": 0,
+            "shared_errors": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Connect the shared tier and start listening for invalidations."""
+        if not self._shared_enabled:
+            return
+        # Re-derive the origin id after fork: with preload_app every worker
+        # inherits the master's instance and would otherwise ignore its peers.
+        self._origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._redis = get_redis(self._redis_url)
+        if self._redis is None:
+            logger.info(f"Cache '{self.namespace}' running in local-only mode")
+            return
+        self._subscriber_task = asyncio.create_task(self._listen_invalidations())
+
+    async def close(self) -> None:
+        if self._subscriber_task:
+            self._subscriber_task.cancel()
+            try:
+                await self._subscriber_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._subscriber_task = None
+        self._redis = None
+
+    @property
+    def shared(self) -> bool:
+        return self._redis is not None
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Get a value from the local tier, falling back to the shared tier."""
+        blob = self.local.get(key)
+        if blob is not None:
+            self._stats["local_hits"] += 1
+            return pickle.loads(blob)
+
+        if self._redis is not None:
+            try:
+                pipe = self._redis.pipeline(transaction=False)
+                pipe.get(self._rkey(key))
+                pipe.pttl(self._rkey(key))
+                blob, pttl = await pipe.execute()
+            except Exception as e:
+                self._shared_error("get", e)
+                blob, pttl = None, -2
+            if blob is not None:
+                self._stats["shared_hits"] += 1
+                remaining = pttl / 1000 if pttl and pttl > 0 else self.local_ttl
+                self.local.set(key, blob, min(remaining, self.local_ttl))
+                return pickle.loads(blob)
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Store value in both tiers with the given TTL (seconds)."""
+        ttl = ttl or self.default_ttl
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.local.set(key, blob, min(ttl, self.local_ttl))
+        self._stats["sets"] += 1
+        if self._redis is not None:
+            try:
+                await self._redis.set(self._rkey(key), blob, px=int(ttl * 1000))
+            except Exception as e:
+                self._shared_error("set", e)
+
+    async def delete(self, key: str) -> None:
+        """Delete key from every tier on every worker."""
+        await self.invalidate(key)
+
+    async def invalidate(self, *keys: str, local: bool = True) -> None:
+        """
+        Drop keys locally, in the shared tier, and broadcast to other workers.
+
+        ``local=False`` leaves this worker's tier and listeners alone, for
+        listeners that already updated their own state in place.
+        """
+        if not keys:
+            return
+        if local:
+            for key in keys:
+                self.local.pop(key)
+                self._notify_listeners(key)
+        if self._redis is None:
+            return
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.delete(*[self._rkey(k) for k in keys])
+            pipe.publish(self._channel, json.dumps({"origin": self._origin, "keys": list(keys)}))
+            await pipe.execute()
+            self._stats["invalidations_sent"] += len(keys)
+        except Exception as e:
+            self._shared_error("invalidate", e)
+
+    async def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None,
+    ) -> Any:
+        """
+        Return the cached value for key, computing it with loader on a miss.
+
+        Concurrent misses for the same key in this worker share a single
+        loader call. ``None`` results are not cached.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The request that owned the load was cancelled; load it ourselves
+                return await loader()
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+            if value is not None:
+                await self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so the loop does not warn when nobody was waiting
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def clear(self) -> None:
+        """Clear the local tier on every worker. Shared entries expire by TTL."""
+        self.local.clear()
+        self._notify_listeners(None)
+        if self._redis is not None:
+            try:
+                await self._redis.publish(self._channel, json.dumps({"origin": self._origin, "clear": True}))
+            except Exception as e:
+                self._shared_error("clear", e)
+
+    def on_invalidate(self, prefix: str, callback: Callable[[Optional[str]], None]) -> None:
+        """
+        Register a synchronous callback for invalidations of keys under prefix.
+
+        Lets other per-worker structures (which do not live in this cache)
+        reuse the cross-worker invalidation channel. The callback receives the
+        invalidated key, or None when the whole cache is cleared.
+        """
+        self._listeners.append((prefix, callback))
+
+    async def clear_expired(self) -> int:
+        """Evict expired local entries (Redis expires its own keys)."""
+        return self.local.clear_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["local_hits"] + self._stats["shared_hits"] + self._stats["misses"]
+        hits = self._stats["local_hits"] + self._stats["shared_hits"]
+        return {
+            **self._stats,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self.local),
+            "bytes": self.local.nbytes,
+            "max_entries": self.local.max_entries,
+            "max_bytes": self.local.max_bytes,
+            "evictions": self.local.evictions,
+            "default_ttl": self.default_ttl,
+            "shared": self.shared,
+        }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _rkey(self, key: str) -> str:
+        return f"{self.namespace}:cache:{key}"
+
+    def _shared_error(self, op: str, error: Exception) -> None:
+        self._stats["shared_errors"] += 1
+        logger.debug(f"Cache shared tier {op} failed: {error}")
+
+    def _notify_listeners(self, key: Optional[str]) -> None:
+        for prefix, callback in self._listeners:
+            if key is None or key.startswith(prefix):
+                try:
+                    callback(key)
+                except Exception as e:
+                    logger.error(f"Cache invalidation listener failed for {key}: {e}")
+
+    def _apply_invalidation(self, payload: Dict[str, Any]) -> None:
+        if payload.get("origin") == self._origin:
+            return
+        if payload.get("clear"):
+            self.local.clear()
+            self._notify_listeners(None)
+            return
+        for key in payload.get("keys", []):
+            self.local.pop(key)
+            self._notify_listeners(key)
+            self._stats["invalidations_received"] += 1
+
+    async def _listen_invalidations(self) -> None:
+        """Subscribe to the invalidation channel, reconnecting with backoff."""
+        backoff = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(self._channel)
+                backoff = 1
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        self._apply_invalidation(json.loads(message["data"]))
+                    except (ValueError, TypeError) as e:
+                        logger.debug(f"Ignoring malformed invalidation: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Anything could have changed while we were deaf
+                self.local.clear()
+                self._notify_listeners(None)
+                logger.warning(f"Cache invalidation listener error: {e}; retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
@@ -0,0 +1,232 @@
+"""
+Module Connections for ZION.CITY API
+====================================
+"Whose posts may this user's feed in module X show" - the connected-user
+set behind ``get_module_connections``.
+
+The family module uses family connections, the organizations module uses
+organization colleagues, and the news, journal, services, marketplace,
+finance and events modules use the union of both. The user is always
+included. The inputs are already cached by ``FamilyGraph`` and
+``OrgGraph``, but merging them (and pickling both sets out of the cache)
+was repeated on every call, and one screen load calls it several times.
+
+``ModuleConnections`` memoizes the merged set per user and source
+combination in a per-worker LRU, bounded by entry count and TTL. It
+listens on the ``TieredCache`` invalidation channel for the keys the two
+graphs invalidate, so a family or organization change drops exactly the
+affected users' entries on every worker:
+
+* ``family_graph:<user>``  - that user's family connections changed
+* ``org_graph:user:<user>`` - that user joined or left an organization
+* ``org_graph:org:<token>`` - an organization's members changed; every
+  memoized user of that organization is dropped
+
+Sets are returned as ``ConnectionSet``: an immutable set that renders as
+a Mongo ``$in`` clause without rebuilding a list per call and supports
+``in`` / ``&`` for filtering in Python.
+
+Usage:
+    from core.connections import ModuleConnections
+
+    module_connections = ModuleConnections(family_graph, org_graph)
+    module_connections.attach(cache)
+
+    connected = await module_connections.get(user_id, "news")
+    query["user_id"] = connected.as_in()
+    visible = connected & candidate_ids
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .cache import TieredCache
+from .family_graph import CACHE_PREFIX as FAMILY_PREFIX
+from .org_graph import ORG_PREFIX, USER_PREFIX as ORG_USER_PREFIX
+
+CACHE_TTL = int(os.environ.get("MODULE_CONNECTIONS_CACHE_TTL", 300))
+MAX_ENTRIES = int(os.environ.get("MODULE_CONNECTIONS_MAX_ENTRIES", 5000))
+
+FAMILY = "family"
+ORGANIZATIONS = "organizations"
+
+# module -> connection sources
+MODULE_SOURCES: Dict[str, Tuple[str, ...]] = {
+    "family": (FAMILY,),
+    "organizations": (ORGANIZATIONS,),
+    **{module: (FAMILY, ORGANIZATIONS)
+       for module in ("news", "journal", "services", "marketplace", "finance", "events")},
+}
+
+
+class ConnectionSet:
+    """Immutable set of user ids with a reusable ``$in`` rendering."""
+
+    __slots__ = ("ids", "_sorted")
+
+    def __init__(self, ids: Iterable[str]):
+        self.ids: FrozenSet[str] = frozenset(ids)
+        self._sorted: Optional[List[str]] = None
+
+    def as_list(self) -> List[str]:
+        if self._sorted is None:
+            self._sorted = sorted(self.ids)
+        return list(self._sorted)
+
+    def as_in(self) -> Dict[str, List[str]]:
+        """Mongo ``{"$in": [...]}`` clause for these ids."""
+        return {"$in": self.as_list()}
+
+    def __and__(self, other: Iterable[str]) -> Set[str]:
+        return set(self.ids.intersection(other))
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self.ids
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ConnectionSet):
+            return self.ids == other.ids
+        return self.ids == other
+
+    def __hash__(self) -> int:
+        return hash(self.ids)
+
+    def __repr__(self) -> str:
+        return f"ConnectionSet({len(self.ids)} users)"
+
+
+class ModuleConnections:
+    """Per-user memoized connection sets, invalidated with the underlying graphs."""
+
+    def __init__(self, family_graph, org_graph, ttl: float = CACHE_TTL, max_entries: int = MAX_ENTRIES):
+        self.family_graph = family_graph
+        self.org_graph = org_graph
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (user_id, sources) -> (connections, organization tokens, expires_at)
+        self._entries: "OrderedDict[Tuple[str, Tuple[str, ...]], Tuple[ConnectionSet, FrozenSet[str], float]]" = OrderedDict()
+        self._by_user: Dict[str, Set[Tuple[str, ...]]] = {}
+        self._by_org: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; a set computed across one is not stored
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def attach(self, bus: TieredCache) -> None:
+        """Follow the graphs' invalidations on every worker."""
+        bus.on_invalidate(FAMILY_PREFIX, lambda key: self._on_user_key(key, FAMILY_PREFIX))
+        bus.on_invalidate(ORG_USER_PREFIX, lambda key: self._on_user_key(key, ORG_USER_PREFIX))
+        bus.on_invalidate(ORG_PREFIX, self._on_org_key)
+
+    async def get(self, user_id: str, module: str) -> ConnectionSet:
+        """Connected users (including user_id) for a module; unknown modules give only the user."""
+        sources = MODULE_SOURCES.get(module)
+        if sources is None:
+            return ConnectionSet([user_id])
+
+        key = (user_id, sources)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            epoch = self._epoch
+
+        ids: Set[str] = {user_id}
+        tokens: FrozenSet[str] = frozenset()
+        if FAMILY in sources:
+            ids |= await self.family_graph.connections(user_id)
+        if ORGANIZATIONS in sources:
+            tokens = frozenset(await self.org_graph.organizations(user_id))
+            if tokens:
+                ids = ids.union(*(await self.org_graph.members(tokens)).values())
+        connections = ConnectionSet(ids)
+        self._store(key, connections, tokens, epoch)
+        return connections
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop user_id's memoized sets in this worker."""
+        with self._lock:
+            self._epoch += 1
+            for sources in list(self._by_user.get(user_id, ())):
+                self._remove((user_id, sources))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._by_user.clear()
+            self._by_org.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+        }
+
+    def _store(self, key: Tuple[str, Tuple[str, ...]], connections: ConnectionSet,
+               tokens: FrozenSet[str], epoch: int) -> None:
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (connections, tokens, time.monotonic() + self.ttl)
+            self._by_user.setdefault(key[0], set()).add(key[1])
+            for token in tokens:
+                self._by_org.setdefault(token, set()).add(key[0])
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple[str, Tuple[str, ...]]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id, sources = key
+        remaining = self._by_user.get(user_id, set())
+        remaining.discard(sources)
+        if not remaining:
+            self._by_user.pop(user_id, None)
+        # The user's other organization-based entry was built from the same
+        # memberships (a membership change drops both), so keep it indexed
+        if any(ORGANIZATIONS in s for s in remaining):
+            return
+        for token in entry[1]:
+            users = self._by_org.get(token)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._by_org[token]
+
+    def _on_user_key(self, key: Optional[str], prefix: str) -> None:
+        if key is None:
+            self.clear()
+        else:
+            self.invalidate_user(key[len(prefix):])
+
+    def _on_org_key(self, key: Optional[str]) -> None:
+        if key is None:
+            self.clear()
+            return
+        with self._lock:
+            self._epoch += 1
+            for user_id in list(self._by_org.get(key[len(ORG_PREFIX):], ())):
+                for sources in list(self._by_user.get(user_id, ())):
+                    self._remove((user_id, sources))
@@ -0,0 +1,103 @@
+"""
+List Counting Strategies for ZION.CITY API
+==========================================
+``count_documents`` walks every matching index entry (or document), so an
+exact total on a large listing costs as much as - or more than - the page
+it accompanies. List endpoints instead choose a strategy per call:
+
+* ``exact``  - a full ``count_documents``; only when the client asks for it
+* ``capped`` - count at most ``cap + 1`` matches and report ``cap`` with
+               ``total_exact: false`` beyond that (rendered as "1000+")
+* ``cached`` - an exact count shared through the tiered cache for ``ttl``
+               seconds; for filter combinations that repeat (catalogues)
+* ``none``   - skip counting (infinite scroll relies on ``next_cursor``)
+
+Usage:
+    from core.counting import CountMode, ListCounter
+
+    counter = ListCounter(cache)
+
+    @api_router.get("/things")
+    async def list_things(count: CountMode = CountMode.CAPPED):
+        counted = await counter.count(db.things, query, count)
+        return {"things": things, **counted.fields()}
+"""
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAP = int(os.environ.get("COUNT_CAP", 1000))
+DEFAULT_TTL = int(os.environ.get("COUNT_CACHE_TTL", 60))
+
+
+class CountMode(str, Enum):
+    EXACT = "exact"
+    CAPPED = "capped"
+    CACHED = "cached"
+    NONE = "none"
+
+
+@dataclass(frozen=True)
+class Count:
+    """A list total and whether it is the true number of matches."""
+    value: Optional[int]
+    exact: bool
+
+    @property
+    def display(self) -> Optional[str]:
+        if self.value is None:
+            return None
+        return str(self.value) if self.exact else f"{self.value}+"
+
+    def fields(self) -> Dict[str, Any]:
+        """Response fields: ``total`` plus ``total_exact``."""
+        return {"total": self.value, "total_exact": self.exact}
+
+
+class ListCounter:
+    """Counts list queries according to a CountMode."""
+
+    def __init__(self, cache=None, cap: int = DEFAULT_CAP, ttl: int = DEFAULT_TTL):
+        self.cache = cache
+        self.cap = cap
+        self.ttl = ttl
+
+    async def count(
+        self,
+        collection,
+        query: Dict[str, Any],
+        mode: CountMode = CountMode.CAPPED,
+        cap: Optional[int] = None,
+        ttl: Optional[int] = None,
+    ) -> Count:
+        mode = CountMode(mode)
+        if mode is CountMode.NONE:
+            return Count(None, False)
+
+        if mode is CountMode.CAPPED:
+            cap = cap or self.cap
+            # limit makes the server stop after cap + 1 matches
+            found = await collection.count_documents(query, limit=cap + 1)
+            return Count(cap, False) if found > cap else Count(found, True)
+
+        if mode is CountMode.CACHED and self.cache is not None:
+            value = await self.cache.get_or_set(
+                self.cache_key(collection.name, query),
+                lambda: collection.count_documents(query),
+                ttl=ttl or self.ttl,
+            )
+            return Count(value, True)
+
+        return Count(await collection.count_documents(query), True)
+
+    @staticmethod
+    def cache_key(collection_name: str, query: Dict[str, Any]) -> str:
+        digest = hashlib.sha1(json.dumps(query, sort_keys=True, default=str).encode()).hexdigest()
+        return f"count:{collection_name}:{digest}"
@@ -0,0 +1,167 @@
+"""
+Family Connection Graph for ZION.CITY API
+=========================================
+Materialized per-user family connection sets.
+
+A user's family connections are the members of every family they belong
+to plus the members of every family those families subscribe to (active,
+accepted memberships and ACTIVE subscriptions only). Computing that takes
+a multi-stage ``$lookup`` across ``family_members`` and
+``family_subscriptions``; feeds need it on every request, while it only
+changes when someone joins or leaves a family or a subscription changes.
+
+Each user's set is therefore stored in ``family_connections``
+(``{user_id, families, connections, updated_at}``) and cached in the
+tiered cache. Writes that change the graph call ``family_changed`` with
+the families involved; only the users whose sets can change - members of
+those families and of families subscribed to them - are recomputed, with
+three ``$in`` queries and one bulk write for the whole batch. Users without
+a stored set are built on first read.
+
+Usage:
+    from core.family_graph import FamilyGraph
+
+    family_graph = FamilyGraph(db, cache)
+
+    connected = await family_graph.connections(user_id)   # Set[str]
+
+    await db.family_members.insert_one(member)             # join
+    await family_graph.family_changed([family_id], users=[user_id])
+
+    affected = await family_graph.affected_users([family_id])  # before a delete
+    await db.family_members.delete_many({"family_id": family_id})
+    await family_graph.rebuild(affected)
+"""
+
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Set
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = int(os.environ.get("FAMILY_GRAPH_CACHE_TTL", 300))
+CACHE_PREFIX = "family_graph:"
+
+ACTIVE_MEMBER = {"is_active": True, "invitation_accepted": True}
+ACTIVE_SUBSCRIPTION = {"is_active": True, "status": "ACTIVE"}
+
+
+class FamilyGraph:
+    """Per-user family connection sets, materialized and cached."""
+
+    def __init__(self, db, cache=None, ttl: int = CACHE_TTL):
+        self.db = db
+        self.cache = cache
+        self.ttl = ttl
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    async def connections(self, user_id: str) -> Set[str]:
+        """User IDs connected to user_id through families and subscriptions."""
+        if self.cache is None:
+            return set(await self._load(user_id))
+        return set(await self.cache.get_or_set(CACHE_PREFIX + user_id, lambda: self._load(user_id), ttl=self.ttl))
+
+    async def _load(self, user_id: str) -> List[str]:
+        doc = await self.db.family_connections.find_one({"user_id": user_id})
+        if doc is not None:
+            return doc["connections"]
+        built = await self.rebuild([user_id])
+        return sorted(built[user_id])
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    async def affected_users(self, family_ids: Iterable[str]) -> Set[str]:
+        """Users whose sets include members of these families."""
+        family_ids = list(set(family_ids))
+        if not family_ids:
+            return set()
+        subscribers = await self.db.family_subscriptions.find(
+            {"target_family_id": {"$in": family_ids}, **ACTIVE_SUBSCRIPTION},
+            {"_id": 0, "subscriber_family_id": 1}
+        ).to_list(None)
+        families = family_ids + [s["subscriber_family_id"] for s in subscribers]
+        members = await self.db.family_members.find(
+            {"family_id": {"$in": families}, **ACTIVE_MEMBER},
+            {"_id": 0, "user_id": 1}
+        ).to_list(None)
+        return {m["user_id"] for m in members if m.get("user_id")}
+
+    async def family_changed(self, family_ids: Iterable[str], users: Iterable[str] = ()) -> None:
+        """
+        Recompute sets after a membership or subscription change.
+
+        ``users`` adds people who are no longer found through the families
+        (a member who just left); everyone still in them is found here.
+        """
+        affected = await self.affected_users(family_ids)
+        affected.update(u for u in users if u)
+        await self.rebuild(affected)
+
+    async def rebuild(self, user_ids: Iterable[str]) -> Dict[str, Set[str]]:
+        """Recompute, store and invalidate the sets of several users."""
+        user_ids = list(set(user_ids))
+        if not user_ids:
+            return {}
+
+        memberships = await self.db.family_members.find(
+            {"user_id": {"$in": user_ids}, **ACTIVE_MEMBER},
+            {"_id": 0, "user_id": 1, "family_id": 1}
+        ).to_list(None)
+        families_of = defaultdict(set)
+        for m in memberships:
+            families_of[m["user_id"]].add(m["family_id"])
+        own_families = set().union(*families_of.values()) if families_of else set()
+
+        subscriptions = await self.db.family_subscriptions.find(
+            {"subscriber_family_id": {"$in": list(own_families)}, **ACTIVE_SUBSCRIPTION},
+            {"_id": 0, "subscriber_family_id": 1, "target_family_id": 1}
+        ).to_list(None) if own_families else []
+        targets_of = defaultdict(set)
+        for s in subscriptions:
+            targets_of[s["subscriber_family_id"]].add(s["target_family_id"])
+
+        reachable = own_families.union(*targets_of.values()) if targets_of else own_families
+        members = await self.db.family_members.find(
+            {"family_id": {"$in": list(reachable)}, **ACTIVE_MEMBER},
+            {"_id": 0, "user_id": 1, "family_id": 1}
+        ).to_list(None) if reachable else []
+        members_of = defaultdict(set)
+        for m in members:
+            if m.get("user_id"):
+                members_of[m["family_id"]].add(m["user_id"])
+
+        built = {}
+        for user_id in user_ids:
+            connected = set()
+            for family_id in families_of[user_id]:
+                connected |= members_of[family_id]
+                for target_id in targets_of[family_id]:
+                    connected |= members_of[target_id]
+            built[user_id] = connected
+
+        now = datetime.now(timezone.utc)
+        await self.db.family_connections.bulk_write([
+            UpdateOne(
+                {"user_id": user_id},
+                {"$set": {
+                    "families": sorted(families_of[user_id]),
+                    "connections": sorted(connected),
+                    "updated_at": now,
+                }},
+                upsert=True
+            )
+            for user_id, connected in built.items()
+        ], ordered=False)
+        if self.cache is not None:
+            await self.cache.invalidate(*(CACHE_PREFIX + u for u in user_ids))
+        logger.debug(f"Rebuilt family connections for {len(user_ids)} users")
+        return built
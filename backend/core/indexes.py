@@ -0,0 +1,323 @@
+"""
+Declarative MongoDB Indexes for ZION.CITY API
+=============================================
+An index registry, a reconciler that brings a database in line with it,
+and an ``explain()``-based checker that flags collection scans on hot
+queries.
+
+* ``IndexRegistry``      - the declared indexes (plain, unique, partial, TTL)
+* ``reconcile_indexes``  - creates missing indexes, drops retired ones
+                           once their replacement exists, reports
+                           conflicting and unregistered ones; safe to run
+                           on every startup
+* ``HotQuery`` / ``find_collscans`` - run representative queries through
+                           ``explain()`` and report any plan containing a
+                           COLLSCAN stage
+
+The application's indexes and hot queries are declared in ``db_indexes.py``.
+
+Usage:
+    from core.indexes import IndexRegistry, reconcile_indexes
+
+    INDEXES = IndexRegistry()
+    INDEXES.add("users", "id", unique=True)
+    INDEXES.add("work_members", [("organization_id", 1), ("user_id", 1), ("status", 1)])
+    INDEXES.add("password_reset_tokens", "expires_at", ttl=0)
+    INDEXES.add("marketplace_products", [("category", 1), ("created_at", -1)], partial={"status": "active"})
+    INDEXES.retire("posts", [("user_id", 1), ("created_at", -1)],
+                   superseded_by=[("user_id", 1), ("created_at", -1), ("id", -1)])
+
+    report = await reconcile_indexes(db, INDEXES)
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+IndexKeys = Tuple[Tuple[str, Any], ...]
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """One declared index."""
+    collection: str
+    keys: IndexKeys
+    unique: bool = False
+    sparse: bool = False
+    partial: Optional[Dict[str, Any]] = None
+    ttl: Optional[int] = None  # expireAfterSeconds
+    name: Optional[str] = None
+
+    @property
+    def index_name(self) -> str:
+        """Explicit name, or MongoDB's default name for the key pattern."""
+        return self.name or "_".join(f"{k}_{v}" for k, v in self.keys)
+
+    def create_options(self) -> Dict[str, Any]:
+        options: Dict[str, Any] = {"name": self.index_name, "background": True}
+        if self.unique:
+            options["unique"] = True
+        if self.sparse:
+            options["sparse"] = True
+        if self.partial is not None:
+            options["partialFilterExpression"] = self.partial
+        if self.ttl is not None:
+            options["expireAfterSeconds"] = self.ttl
+        return options
+
+    def matches(self, info: Dict[str, Any]) -> bool:
+        """Whether an ``index_information()`` entry implements this spec."""
+        return (
+            tuple((k, _direction(v)) for k, v in info.get("key", [])) == tuple((k, _direction(v)) for k, v in self.keys)
+            and bool(info.get("unique", False)) == self.unique
+            and bool(info.get("sparse", False)) == self.sparse
+            and _plain(info.get("partialFilterExpression")) == _plain(self.partial)
+            and info.get("expireAfterSeconds") == self.ttl
+        )
+
+
+class IndexRegistry:
+    """Ordered collection of ``IndexSpec``s, declared in one place."""
+
+    def __init__(self):
+        self._specs: Dict[Tuple[str, str], IndexSpec] = {}
+        # collection -> {retired index name: name of the index that supersedes it}
+        self._retired: Dict[str, Dict[str, str]] = {}
+
+    def add(
+        self,
+        collection: str,
+        keys: Union[str, Sequence[Tuple[str, Any]]],
+        unique: bool = False,
+        sparse: bool = False,
+        partial: Optional[Dict[str, Any]] = None,
+        ttl: Optional[int] = None,
+        name: Optional[str] = None,
+    ) -> IndexSpec:
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        spec = IndexSpec(collection, tuple(tuple(k) for k in keys), unique, sparse, partial, ttl, name)
+        existing = self._specs.get((collection, spec.index_name))
+        if existing is not None and existing != spec:
+            raise ValueError(f"Index {collection}.{spec.index_name} declared twice with different options")
+        self._specs[(collection, spec.index_name)] = spec
+        return spec
+
+    def retire(
+        self,
+        collection: str,
+        keys: Union[str, Sequence[Tuple[str, Any]]],
+        superseded_by: Union[str, Sequence[Tuple[str, Any]]],
+        name: Optional[str] = None,
+    ) -> str:
+        """
+        Mark an index that is no longer wanted.
+
+        Reconciliation drops it only once the index with the keys
+        ``superseded_by`` exists, so queries are never left without an
+        index while the replacement is built.
+        """
+        index_name = _index_name(collection, keys, name)
+        if (collection, index_name) in self._specs:
+            raise ValueError(f"Index {collection}.{index_name} is both declared and retired")
+        self._retired.setdefault(collection, {})[index_name] = _index_name(collection, superseded_by)
+        return index_name
+
+    def retired(self, collection: str) -> Dict[str, str]:
+        """Retired index names of collection, each mapped to the index that supersedes it."""
+        return dict(self._retired.get(collection, {}))
+
+    def collections(self) -> List[str]:
+        return sorted({spec.collection for spec in self._specs.values()} | set(self._retired))
+
+    def for_collection(self, collection: str) -> List[IndexSpec]:
+        return [spec for spec in self._specs.values() if spec.collection == collection]
+
+    def __iter__(self) -> Iterator[IndexSpec]:
+        return iter(self._specs.values())
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+
+@dataclass
+class ReconcileReport:
+    """Outcome of ``reconcile_indexes``."""
+    created: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    conflicts: List[str] = field(default_factory=list)
+    unregistered: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.created)} created, {len(self.dropped)} dropped, {len(self.unchanged)} unchanged, "
+            f"{len(self.conflicts)} conflicting, {len(self.unregistered)} unregistered, "
+            f"{len(self.errors)} failed"
+        )
+
+
+async def reconcile_indexes(db, registry: IndexRegistry, drop_conflicting: bool = False) -> ReconcileReport:
+    """
+    Create every registered index that is missing.
+
+    An existing index with the same name but different keys or options is
+    a conflict: it is reported (and only rebuilt when ``drop_conflicting``
+    is set, since dropping an index on a live collection is not free).
+    Retired indexes (``IndexRegistry.retire``) are dropped after the
+    declared indexes were created, and only once the index superseding
+    them exists; other existing indexes that are not registered are
+    reported, never dropped.
+    """
+    report = ReconcileReport()
+    for collection in registry.collections():
+        try:
+            existing = await db[collection].index_information()
+        except Exception as e:
+            report.errors.append(f"{collection}: {e}")
+            continue
+
+        declared = registry.for_collection(collection)
+        retired = registry.retired(collection)
+        known_names = {spec.index_name for spec in declared} | set(retired)
+
+        for spec in declared:
+            label = f"{collection}.{spec.index_name}"
+            info = existing.get(spec.index_name)
+            if info is not None and spec.matches(info):
+                report.unchanged.append(label)
+                continue
+            if info is not None:
+                if not drop_conflicting:
+                    report.conflicts.append(label)
+                    logger.warning(f"Index {label} exists with different options; not rebuilding")
+                    continue
+            try:
+                if info is not None:
+                    await db[collection].drop_index(spec.index_name)
+                await db[collection].create_index(list(spec.keys), **spec.create_options())
+                report.created.append(label)
+            except Exception as e:
+                # e.g. IndexOptionsConflict when the same keys exist under another name
+                report.errors.append(f"{label}: {e}")
+
+        if any(name in existing for name in retired):
+            await _drop_retired(db[collection], collection, retired, report)
+
+        report.unregistered.extend(
+            f"{collection}.{name}" for name in existing if name != "_id_" and name not in known_names
+        )
+
+    return report
+
+
+async def _drop_retired(collection, collection_name: str, retired: Dict[str, str], report: ReconcileReport) -> None:
+    # Re-read: the superseding index must be present (built) before its predecessor goes
+    try:
+        existing = await collection.index_information()
+    except Exception as e:
+        report.errors.append(f"{collection_name}: {e}")
+        return
+    for name, replacement in retired.items():
+        if name not in existing:
+            continue
+        label = f"{collection_name}.{name}"
+        if replacement not in existing:
+            logger.warning(f"Index {label} is retired but kept until {replacement} exists")
+            continue
+        try:
+            await collection.drop_index(name)
+            report.dropped.append(label)
+        except Exception as e:
+            report.errors.append(f"{label}: {e}")
+
+
+# ============================================================
+# COLLSCAN detection
+# ============================================================
+
+@dataclass(frozen=True)
+class HotQuery:
+    """A representative query that must be served by an index."""
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[Tuple[Tuple[str, int], ...]] = None
+
+
+def plan_stages(plan: Any) -> List[str]:
+    """All stage names in an explain plan (classic and slot-based engines)."""
+    stages: List[str] = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+async def explain_stages(db, query: HotQuery) -> List[str]:
+    """Stages of the winning plan for a hot query."""
+    cursor = db[query.collection].find(query.filter)
+    if query.sort:
+        cursor = cursor.sort(list(query.sort))
+    explain = await cursor.explain()
+    return plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+
+
+async def find_collscans(db, queries: Sequence[HotQuery]) -> List[Tuple[HotQuery, List[str]]]:
+    """Return (query, stages) for every hot query whose plan scans a collection."""
+    failures = []
+    for query in queries:
+        stages = await explain_stages(db, query)
+        if "COLLSCAN" in stages:
+            failures.append((query, stages))
+    return failures
+
+
+def sample_document(query_filter: Dict[str, Any]) -> Dict[str, Any]:
+    """A document matching the equality/range parts of a filter, for seeding."""
+    doc: Dict[str, Any] = {}
+    for key, value in query_filter.items():
+        if key in ("$or", "$and") and value:
+            doc.update(sample_document(value[0]))
+        elif key.startswith("$") or "." in key:
+            continue
+        elif isinstance(value, dict):
+            for op in ("$in", "$all"):
+                if value.get(op):
+                    doc[key] = value[op][0]
+                    break
+            else:
+                for op in ("$gte", "$gt", "$lte", "$lt", "$eq"):
+                    if op in value:
+                        doc[key] = value[op]
+                        break
+        else:
+            doc[key] = value
+    return doc
+
+
+def _index_name(collection: str, keys: Union[str, Sequence[Tuple[str, Any]]], name: Optional[str] = None) -> str:
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    return IndexSpec(collection, tuple(tuple(k) for k in keys), name=name).index_name
+
+
+def _direction(value: Any) -> Any:
+    # index_information reports 1.0 for indexes created by some drivers
+    return int(value) if isinstance(value, float) else value
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
@@ -0,0 +1,115 @@
+"""
+Background Job State for ZION.CITY API
+======================================
+Background work coordinated across workers through ``job_state``
+documents: one-off data migrations that run once per database, and
+id-ordered walks over a collection that all workers advance together.
+
+Usage:
+    from core.jobs import SharedCursor, run_once
+
+    await run_once(db, "post_audiences", lambda: backfill_post_audiences(db.posts))
+
+    walk = SharedCursor(db, "post_counters", db.posts, batch=200)
+    posts = await walk.next_batch({"_id": 0, "id": 1, "likes_count": 1})
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+STATE_COLLECTION = "job_state"
+
+# A migration still "running" after this long died with its worker and may be re-claimed
+STALE_AFTER = int(os.environ.get("JOB_STALE_AFTER", 3600))
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+async def run_once(db, name: str, job: Callable[[], Awaitable[Any]], stale_after: int = STALE_AFTER) -> bool:
+    """
+    Run a one-off migration unless it already ran on this database.
+
+    The first worker to claim ``name`` runs it; the others skip it. A
+    failure is logged and recorded instead of raised, so the migrations
+    after it still run, and a failed migration is retried on the next
+    start. Returns whether the job ran (successfully) in this call.
+    """
+    state = db[STATE_COLLECTION]
+    now = datetime.now(timezone.utc)
+    try:
+        # Matches only a failed or abandoned claim; a missing document is
+        # inserted, an existing done/running one raises DuplicateKeyError
+        await state.update_one(
+            {"id": name, "$or": [
+                {"status": FAILED},
+                {"status": RUNNING, "started_at": {"$lt": now - timedelta(seconds=stale_after)}},
+            ]},
+            {"$set": {"status": RUNNING, "started_at": now}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    except Exception as e:
+        logger.error(f"Migration {name} could not be claimed: {e}")
+        return False
+
+    try:
+        result = await job()
+    except Exception as e:
+        logger.error(f"Migration {name} failed: {e}")
+        await state.update_one(
+            {"id": name}, {"$set": {"status": FAILED, "error": str(e), "finished_at": datetime.now(timezone.utc)}}
+        )
+        return False
+
+    await state.update_one(
+        {"id": name}, {"$set": {"status": DONE, "result": result, "finished_at": datetime.now(timezone.utc)}}
+    )
+    logger.info(f"Migration {name} completed: {result}")
+    return True
+
+
+class SharedCursor:
+    """An id-ordered walk over a collection, one batch per call, shared by every worker."""
+
+    def __init__(self, db, name: str, collection, batch: int, query: Optional[Dict[str, Any]] = None):
+        self.state = db[STATE_COLLECTION]
+        self.name = name
+        self.collection = collection
+        self.batch = batch
+        self.query = query or {}
+
+    async def next_batch(self, projection: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Claim the batch after the stored cursor and advance it.
+
+        Returns an empty list when another worker claimed the same batch
+        first. After the last batch the walk starts over.
+        """
+        doc = await self.state.find_one({"id": self.name}, {"_id": 0, "cursor": 1})
+        after = (doc or {}).get("cursor")
+        query = dict(self.query)
+        if after is not None:
+            query["$and"] = [*query.get("$and", []), {"id": {"$gt": after}}]
+        docs = await self.collection.find(query, projection).sort("id", 1).limit(self.batch).to_list(self.batch)
+        next_cursor = docs[-1]["id"] if len(docs) == self.batch else None
+
+        try:
+            claimed = await self.state.update_one(
+                {"id": self.name, "cursor": after},
+                {"$set": {"cursor": next_cursor, "updated_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return []
+        if not claimed.matched_count and claimed.upserted_id is None:
+            return []
+        return docs
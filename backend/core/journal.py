@@ -0,0 +1,117 @@
+"""
+Change Journal for ZION.CITY API
+================================
+Per-user, versioned log of "something changed for you" events, served as
+deltas by ``GET /api/sync?since=<version>``.
+
+Clients used to poll several full pages (notifications, unread counts,
+direct chats, feeds) on timers. With the journal they poll one endpoint:
+an idle client gets an empty ``204`` from a single indexed lookup, and a
+busy one gets the list of what changed and refetches only that.
+
+Each user has one ``sync_journal`` document::
+
+    {"user_id": ..., "version": 42, "entries": [{"kind", "id", "data", "at"}, ...]}
+
+``record`` bumps ``version`` and appends the entry in the same atomic
+update (``$inc`` + ``$push`` with ``$slice``), so versions are gap-free
+and never reordered; an entry's version is derived from its position.
+Only the last ``max_entries`` are kept - a client further behind than
+that is told to ``reset`` (refetch everything) instead.
+
+Entries are hints, not payloads: ``kind`` plus the id of the changed
+object and a little routing data (e.g. the chat id of a message).
+
+Usage:
+    from core.journal import ChangeJournal
+
+    change_journal = ChangeJournal(db)
+    await change_journal.record(recipient_ids, "message", message_id, {"chat_id": chat_id})
+    delta = await change_journal.changes(user_id, since=41)   # None when nothing changed
+"""
+
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_MAX_ENTRIES = int(os.environ.get("SYNC_JOURNAL_MAX_ENTRIES", 200))
+
+# Kinds of change recorded by the server
+KINDS = frozenset({"notification", "work_notification", "message", "feed", "task", "rsvp"})
+
+
+class ChangeJournal:
+    """Per-user change journal backed by one document per user."""
+
+    def __init__(self, db, max_entries: int = JOURNAL_MAX_ENTRIES):
+        self.collection = db.sync_journal
+        self.max_entries = max_entries
+
+    async def record(
+        self,
+        user_ids: Iterable[str],
+        kind: str,
+        ref_id: str,
+        data: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Append one change for each user; a single write for any number of users."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown change kind: {kind}")
+        user_ids = [u for u in dict.fromkeys(user_ids) if u]
+        if not user_ids:
+            return
+        now = datetime.now(timezone.utc)
+        entry = {"kind": kind, "id": ref_id, "at": now}
+        if data:
+            entry["data"] = data
+        update = {
+            "$inc": {"version": 1},
+            "$push": {"entries": {"$each": [entry], "$slice": -self.max_entries}},
+            "$set": {"updated_at": now},
+        }
+        try:
+            await self.collection.bulk_write(
+                [UpdateOne({"user_id": user_id}, update, upsert=True) for user_id in user_ids],
+                ordered=False,
+            )
+        except Exception as e:
+            # The journal only speeds up polling; never fail the write it describes
+            logger.warning(f"Change journal write failed ({kind} {ref_id}): {e}")
+
+    async def version(self, user_id: str) -> int:
+        """Current version for user_id (0 before the first change)."""
+        doc = await self.collection.find_one({"user_id": user_id}, {"_id": 0, "version": 1})
+        return doc["version"] if doc else 0
+
+    async def changes(self, user_id: str, since: int) -> Optional[Dict[str, Any]]:
+        """
+        Changes after version ``since``, or None when there are none.
+
+        Returns ``{"version", "reset", "changes": [{"version", "kind", "id", ...}]}``;
+        ``reset`` is set when entries after ``since`` were already dropped,
+        or when ``since`` is ahead of the journal (e.g. a restored database,
+        or a journal document that no longer exists).
+        """
+        # One lookup either way; entries are only sent when the version moved
+        doc = await self.collection.find_one(
+            {"user_id": user_id},
+            {"_id": 0, "version": 1, "entries": {"$cond": [{"$eq": ["$version", since]}, [], "$entries"]}},
+        )
+        if doc is None:
+            return {"version": 0, "reset": True, "changes": []} if since > 0 else None
+        if doc["version"] == since:
+            return None
+        entries: List[Dict[str, Any]] = doc.get("entries", [])
+        first = doc["version"] - len(entries) + 1
+        changes = [
+            {"version": first + i, **entry}
+            for i, entry in enumerate(entries)
+            if first + i > since
+        ]
+        reset = since < first - 1 or since > doc["version"]
+        return {"version": doc["version"], "reset": reset, "changes": changes}
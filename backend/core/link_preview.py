@@ -0,0 +1,265 @@
+"""
+Link Previews for ZION.CITY API
+===============================
+OpenGraph previews for URLs pasted into posts and chats.
+
+The same popular link is pasted by many users, so previews are cached per
+URL in two tiers:
+
+* the shared ``TieredCache`` (in-process LRU, plus Redis when configured)
+* the ``link_previews`` collection, whose ``expires_at`` TTL index lets
+  MongoDB drop stale entries; it survives restarts and cache evictions
+
+Concurrent requests for the same URL in one worker share a single fetch.
+Failed fetches are cached briefly in the ``TieredCache`` (both tiers, for
+``LINK_PREVIEW_FAILURE_TTL``) but never stored in MongoDB, so a dead link
+is not retried by every user who pastes it.
+
+Fetching goes through one pooled ``aiohttp`` session per worker, and the
+page is parsed as it streams in: parsing stops at ``</head>`` (or the
+first ``<body>`` tag) or after ``max_bytes``, whichever comes first, so a
+large page costs a few kilobytes of download instead of the whole
+document.
+
+Usage:
+    from core.link_preview import LinkPreviewService
+
+    link_previews = LinkPreviewService(db, cache)
+    preview = await link_previews.preview(url)   # {"url", "title", ...}
+    await link_previews.close()                  # in the app lifespan
+"""
+
+import asyncio
+import codecs
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from html.parser import HTMLParser
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import parse_qs, urljoin, urlparse
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = int(os.environ.get("LINK_PREVIEW_CACHE_TTL", 24 * 3600))
+FAILURE_TTL = int(os.environ.get("LINK_PREVIEW_FAILURE_TTL", 600))
+MAX_BYTES = int(os.environ.get("LINK_PREVIEW_MAX_KB", 64)) * 1024
+FETCH_TIMEOUT = 5
+CHUNK_SIZE = 8192
+USER_AGENT = "Mozilla/5.0 (compatible; ZionBot/1.0)"
+OG_FIELDS = ("title", "description", "image", "site_name")
+
+
+def empty_preview(url: str) -> Dict[str, Any]:
+    return {"url": url, "title": None, "description": None, "image": None,
+            "site_name": None, "is_youtube": False, "youtube_id": None}
+
+
+def youtube_preview(url: str) -> Optional[Dict[str, Any]]:
+    """Preview for a YouTube video URL (no fetch needed), else None."""
+    parsed = urlparse(url)
+    youtube_id = None
+    if "youtube.com" in parsed.netloc and "/watch" in parsed.path:
+        youtube_id = parse_qs(parsed.query).get("v", [None])[0]
+    elif "youtu.be" in parsed.netloc:
+        youtube_id = parsed.path.strip("/")
+    elif "youtube.com" in parsed.netloc and "/embed/" in parsed.path:
+        youtube_id = parsed.path.split("/embed/")[1].split("?")[0]
+    if not youtube_id:
+        return None
+    return {
+        "url": url,
+        "title": "YouTube Video",
+        "description": None,
+        "image": f"https://img.youtube.com/vi/{youtube_id}/hqdefault.jpg",
+        "site_name": "YouTube",
+        "is_youtube": True,
+        "youtube_id": youtube_id,
+    }
+
+
+class HeadParser(HTMLParser):
+    """Collects ``og:*`` meta tags and ``<title>``; sets ``done`` at the end of the head."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.og: Dict[str, str] = {}
+        self.title: Optional[str] = None
+        self.done = False
+        self._title_parts: Optional[list] = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "meta":
+            attrs = dict(attrs)
+            prop = (attrs.get("property") or attrs.get("name") or "").lower()
+            if prop.startswith("og:") and attrs.get("content") is not None:
+                self.og.setdefault(prop[3:], attrs["content"])
+        elif tag == "title" and self.title is None:
+            self._title_parts = []
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._title_parts is not None:
+            self.title = "".join(self._title_parts).strip() or None
+            self._title_parts = None
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._title_parts is not None:
+            self._title_parts.append(data)
+
+
+async def parse_head(chunks: AsyncIterator[bytes], charset: Optional[str] = None,
+                     max_bytes: int = MAX_BYTES) -> HeadParser:
+    """Feed streamed HTML to a ``HeadParser`` until the head ends or max_bytes is read."""
+    try:
+        decoder = codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parser = HeadParser()
+    received = 0
+    async for chunk in chunks:
+        chunk = chunk[:max_bytes - received]
+        received += len(chunk)
+        parser.feed(decoder.decode(chunk))
+        if parser.done or received >= max_bytes:
+            break
+    return parser
+
+
+class LinkPreviewService:
+    """Fetches, parses and caches link previews."""
+
+    def __init__(
+        self,
+        db=None,
+        cache=None,
+        ttl: int = CACHE_TTL,
+        failure_ttl: int = FAILURE_TTL,
+        max_bytes: int = MAX_BYTES,
+        timeout: float = FETCH_TIMEOUT,
+        max_connections: int = 50,
+    ):
+        self.collection = db.link_previews if db is not None else None
+        self.cache = cache
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def preview(self, url: str) -> Dict[str, Any]:
+        """Preview for url, from cache when possible."""
+        url = url.strip()
+        youtube = youtube_preview(url)
+        if youtube:
+            return youtube
+
+        key = f"link_preview:{hashlib.sha256(url.encode('utf-8')).hexdigest()}"
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        # Coalesce concurrent misses here rather than with cache.get_or_set:
+        # the TTL depends on whether the fetch succeeded
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The request that owned the fetch was cancelled; fetch it ourselves
+                return await self._load(key, url)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            preview = await self._load(key, url)
+            future.set_result(preview)
+            return preview
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so the loop does not warn when nobody was waiting
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _load(self, key: str, url: str) -> Dict[str, Any]:
+        if self.collection is not None:
+            stored = await self.collection.find_one(
+                {"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"_id": 0})
+            if stored:
+                await self._remember(key, stored["preview"], self.ttl)
+                return stored["preview"]
+
+        try:
+            preview = await self.fetch(url)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.info(f"Link preview failed for {url}: {e!r}")
+            preview = None
+
+        if preview is None:
+            preview = empty_preview(url)
+            await self._remember(key, preview, self.failure_ttl)
+            return preview
+
+        await self._remember(key, preview, self.ttl)
+        if self.collection is not None:
+            await self.collection.update_one(
+                {"key": key},
+                {"$set": {"key": key, "url": url, "preview": preview,
+                          "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl)}},
+                upsert=True,
+            )
+        return preview
+
+    async def fetch(self, url: str) -> Optional[Dict[str, Any]]:
+        """Fetch and parse url; None when the page is not available."""
+        async with self._get_session().get(url, headers={"User-Agent": USER_AGENT}) as response:
+            if response.status != 200:
+                return None
+            preview = empty_preview(url)
+            if response.content_type not in ("text/html", "application/xhtml+xml"):
+                return preview
+            head = await parse_head(response.content.iter_chunked(CHUNK_SIZE), response.charset, self.max_bytes)
+            if (response.content_length or self.max_bytes + 1) <= self.max_bytes:
+                # Small page: drain the rest so the connection goes back to the pool
+                await response.content.read()
+
+        for field in OG_FIELDS:
+            preview[field] = head.og.get(field) or None
+        preview["title"] = preview["title"] or head.title
+        if preview["image"]:
+            preview["image"] = urljoin(str(response.url), preview["image"])
+        return preview
+
+    async def _remember(self, key: str, preview: Dict[str, Any], ttl: int) -> None:
+        if self.cache is not None:
+            await self.cache.set(key, preview, ttl)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
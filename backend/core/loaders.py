@@ -0,0 +1,178 @@
+"""
+Request-Scoped Batch Loaders for ZION.CITY API
+==============================================
+DataLoader-style batching for the lookups every list endpoint repeats:
+users, organizations, departments, media files and news channels.
+
+All ``load()`` calls made in the same event-loop tick are coalesced into a
+single ``{"id": {"$in": [...]}}`` query per collection, with a lightweight
+projection. Results are memoized for the rest of the request, so a user who
+authored ten comments is fetched once.
+
+Loaders are request-scoped: ``request_loaders(db)`` returns the instance
+bound to the current request context, creating it on first use. Documents
+are shared within the request - copy before mutating. Long-running jobs
+should create their own ``RequestLoaders(db)`` per unit of work instead.
+
+Usage:
+    from core.loaders import request_loaders
+
+    loaders = request_loaders(db)
+    authors = await loaders.users.load_many(p["author_id"] for p in posts)  # one query
+    for post in posts:
+        post["author"] = authors.get(post["author_id"])
+
+    # or, from code that handles one item at a time under asyncio.gather:
+    author = await loaders.users.load(post["author_id"])
+"""
+
+import asyncio
+import contextvars
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lightweight projections: the fields list views actually render.
+USER_SUMMARY = {
+    "_id": 0, "id": 1, "first_name": 1, "last_name": 1, "middle_name": 1,
+    "email": 1, "profile_picture": 1, "avatar_url": 1, "is_online": 1, "last_seen": 1,
+}
+ORGANIZATION_SUMMARY = {
+    "_id": 0, "id": 1, "organization_id": 1, "name": 1, "organization_type": 1,
+    "logo_url": 1, "is_private": 1, "address_city": 1,
+}
+DEPARTMENT_SUMMARY = {"_id": 0, "id": 1, "organization_id": 1, "name": 1, "color": 1}
+MEDIA_SUMMARY = {
+    "_id": 0, "id": 1, "original_filename": 1, "stored_filename": 1, "file_path": 1,
+    "file_type": 1, "mime_type": 1, "file_size": 1, "uploaded_by": 1, "metadata": 1,
+}
+CHANNEL_SUMMARY = {
+    "_id": 0, "id": 1, "name": 1, "avatar_url": 1, "owner_id": 1,
+    "organization_id": 1, "is_verified": 1, "is_official": 1, "subscribers_count": 1,
+}
+
+
+class BatchLoader:
+    """
+    Coalesces per-key lookups on one collection into ``$in`` queries.
+
+    ``load(key)`` resolves to the document or ``None``. Keys requested in
+    the same tick are fetched together; every key is fetched at most once
+    per loader.
+    """
+
+    def __init__(self, collection, key_field: str = "id", projection: Optional[Dict[str, int]] = None):
+        self.collection = collection
+        self.key_field = key_field
+        self.projection = projection
+        self._memo: Dict[Any, asyncio.Future] = {}
+        self._pending: List[Any] = []
+        self._scheduled = False
+        self.batches = 0
+
+    def load(self, key: Any) -> "asyncio.Future":
+        """Return a future resolving to the document for key (or None)."""
+        future = self._memo.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._memo[key] = future
+            self._pending.append(key)
+            if not self._scheduled:
+                self._scheduled = True
+                # Dispatch after every coroutine in this tick has queued its keys
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return future
+
+    async def load_many(self, keys: Iterable[Any]) -> Dict[Any, dict]:
+        """Load several keys with one query; returns {key: document} for keys found."""
+        unique = list(dict.fromkeys(k for k in keys if k is not None))
+        documents = await asyncio.gather(*(self.load(k) for k in unique))
+        return {k: doc for k, doc in zip(unique, documents) if doc is not None}
+
+    def prime(self, key: Any, document: Optional[dict]) -> None:
+        """Seed the memo with a document fetched elsewhere."""
+        if key not in self._memo:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(document)
+            self._memo[key] = future
+
+    def clear(self, key: Any) -> None:
+        """Forget a memoized key (e.g. after updating that document)."""
+        self._memo.pop(key, None)
+
+    async def _dispatch(self) -> None:
+        keys, self._pending, self._scheduled = self._pending, [], False
+        if not keys:
+            return
+        self.batches += 1
+        futures = {key: self._memo[key] for key in keys if key in self._memo}
+        try:
+            documents = await self.collection.find({self.key_field: {"$in": keys}}, self.projection).to_list(None)
+            found = {doc.get(self.key_field): doc for doc in documents}
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            # Do not memoize failures
+            for key in futures:
+                self._memo.pop(key, None)
+            return
+        for key, future in futures.items():
+            if not future.done():
+                future.set_result(found.get(key))
+
+
+class RequestLoaders:
+    """The batch loaders of one request."""
+
+    def __init__(self, db):
+        self.db = db
+        self.users = BatchLoader(db.users, projection=USER_SUMMARY)
+        self.organizations = BatchLoader(db.work_organizations, projection=ORGANIZATION_SUMMARY)
+        # Older organization documents are keyed by "organization_id" only
+        self.organizations_by_alias = BatchLoader(
+            db.work_organizations, key_field="organization_id", projection=ORGANIZATION_SUMMARY
+        )
+        self.departments = BatchLoader(db.departments, projection=DEPARTMENT_SUMMARY)
+        self.media = BatchLoader(db.media_files, projection=MEDIA_SUMMARY)
+        self.channels = BatchLoader(db.news_channels, projection=CHANNEL_SUMMARY)
+        self._custom: Dict[tuple, BatchLoader] = {}
+
+    async def load_organizations(self, org_ids: Iterable[str]) -> Dict[str, dict]:
+        """Load organizations by ``id``, falling back to ``organization_id``."""
+        org_ids = list(org_ids)
+        found = await self.organizations.load_many(org_ids)
+        missing = [i for i in org_ids if i is not None and i not in found]
+        if missing:
+            found.update(await self.organizations_by_alias.load_many(missing))
+        return found
+
+    def loader(self, collection_name: str, projection: Optional[Dict[str, int]] = None, key_field: str = "id") -> BatchLoader:
+        """Ad-hoc loader for another collection or projection (shared within the request)."""
+        cache_key = (collection_name, key_field, tuple(sorted((projection or {}).items())))
+        loader = self._custom.get(cache_key)
+        if loader is None:
+            loader = BatchLoader(self.db[collection_name], key_field=key_field, projection=projection)
+            self._custom[cache_key] = loader
+        return loader
+
+
+_current_loaders: contextvars.ContextVar[Optional[RequestLoaders]] = contextvars.ContextVar(
+    "request_loaders", default=None
+)
+
+
+def request_loaders(db) -> RequestLoaders:
+    """
+    Return the loaders of the current request, creating them on first use.
+
+    Each request runs in its own context, so loaders (and their memoized
+    documents) never leak between requests.
+    """
+    loaders = _current_loaders.get()
+    if loaders is None or loaders.db is not db:
+        loaders = RequestLoaders(db)
+        _current_loaders.set(loaders)
+    return loaders
@@ -0,0 +1,60 @@
+"""
+Media Attachment for ZION.CITY API
+==================================
+Bulk path for attaching uploaded media files to posts, albums and other
+content.
+
+Endpoints receive a list of ``media_files`` ids from the client. Attaching
+them means checking that the caller uploaded each file, optionally
+re-tagging the files with the module they now belong to, and returning
+their metadata for the response. ``attach_media`` does all of that in one
+``$in`` query plus at most one ``update_many``, whatever the number of
+files, instead of a find/update/find round-trip per file.
+
+Usage:
+    from core.media import attach_media
+
+    files = await attach_media(db, media_file_ids, current_user.id, source_module="family")
+    post.media_files = [f["id"] for f in files]
+"""
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+async def attach_media(
+    db,
+    media_ids: Iterable[str],
+    owner_id: str,
+    source_module: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Media files from media_ids uploaded by owner_id, in request order.
+
+    Ids that are unknown or belong to someone else are dropped; duplicates
+    are returned once. With ``source_module``, files tagged with another
+    module are moved to it.
+    """
+    ids = list(dict.fromkeys(i for i in media_ids if i))
+    if not ids:
+        return []
+
+    found = await db.media_files.find(
+        {"id": {"$in": ids}, "uploaded_by": owner_id}, {"_id": 0}
+    ).to_list(len(ids))
+    by_id = {media["id"]: media for media in found}
+
+    if source_module is not None:
+        retag = [media["id"] for media in found if media.get("source_module") != source_module]
+        if retag:
+            await db.media_files.update_many(
+                {"id": {"$in": retag}}, {"$set": {"source_module": source_module}}
+            )
+            for media_id in retag:
+                by_id[media_id]["source_module"] = source_module
+
+    if len(by_id) < len(ids):
+        logger.debug(f"Dropped {len(ids) - len(by_id)} media ids not owned by {owner_id}")
+    return [by_id[media_id] for media_id in ids if media_id in by_id]
@@ -0,0 +1,195 @@
+"""
+Prometheus Metrics for ZION.CITY API
+====================================
+Per-route request instrumentation and MongoDB command monitoring, exposed
+in the Prometheus text format.
+
+* ``MetricsMiddleware``  - ASGI middleware recording request duration,
+                           in-flight requests and status codes, labelled by
+                           route template (``/api/posts/{post_id}``), never
+                           by raw path
+* ``MongoCommandMetrics`` - pymongo command listener recording command counts
+                           and durations, labelled by the route that issued
+                           them
+
+Under gunicorn every worker keeps its own counters. When
+``PROMETHEUS_MULTIPROC_DIR`` is set (gunicorn.conf.py does this before the
+app is loaded) workers write them to shared files and ``render_metrics``
+aggregates all workers on each scrape. Without ``prometheus_client``
+installed everything here is a no-op.
+
+Usage:
+    from core.metrics import MetricsMiddleware, MongoCommandMetrics, render_metrics
+
+    client = AsyncIOMotorClient(url, event_listeners=[MongoCommandMetrics()])
+    app.add_middleware(MetricsMiddleware)
+
+    body, content_type = render_metrics()
+"""
+
+import contextvars
+import logging
+import os
+import time
+from typing import Iterable, Optional, Tuple
+
+from pymongo import monitoring
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+except ImportError:
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    Counter = Gauge = Histogram = None
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_AVAILABLE = Counter is not None
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")
+
+# Label used for requests that matched no route (404s, scanners) so that
+# arbitrary paths can never create new time series.
+UNMATCHED_ROUTE = "<unmatched>"
+# Label used for Mongo commands issued outside any request (startup, jobs).
+NO_ROUTE = "<background>"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+if PROMETHEUS_AVAILABLE:
+    HTTP_REQUESTS = Counter(
+        "zion_http_requests_total",
+        "HTTP requests by route template, method and status code",
+        ["method", "route", "status"],
+    )
+    HTTP_DURATION = Histogram(
+        "zion_http_request_duration_seconds",
+        "HTTP request duration by route template",
+        ["method", "route"],
+        buckets=REQUEST_BUCKETS,
+    )
+    HTTP_IN_PROGRESS = Gauge(
+        "zion_http_requests_in_progress",
+        "HTTP requests currently being served",
+        ["method"],
+        multiprocess_mode="livesum",
+    )
+    MONGO_COMMANDS = Counter(
+        "zion_mongo_commands_total",
+        "MongoDB commands by issuing route, command and outcome",
+        ["route", "command", "outcome"],
+    )
+    MONGO_DURATION = Histogram(
+        "zion_mongo_command_duration_seconds",
+        "MongoDB command duration by issuing route and command",
+        ["route", "command"],
+        buckets=MONGO_BUCKETS,
+    )
+    QUERY_BUDGET_VIOLATIONS = Counter(
+        "zion_query_budget_violations_total",
+        "Requests exceeding their query budget (kind=budget) or repeating a query shape (kind=repeated)",
+        ["route", "kind"],
+    )
+
+# The ASGI scope of the request being served. Motor runs pymongo in a thread
+# pool but copies the context, so command listeners see the issuing request.
+_current_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("metrics_scope", default=None)
+
+
+def route_template(scope: dict) -> str:
+    """Return the matched route's path template, or UNMATCHED_ROUTE."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path else UNMATCHED_ROUTE
+
+
+def current_route() -> str:
+    """Route template of the request being served, or NO_ROUTE."""
+    scope = _current_scope.get()
+    return NO_ROUTE if scope is None else route_template(scope)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route request metrics.
+
+    Add it as the outermost middleware so that time spent in other
+    middleware (rate limiting, compression) is included. The route label is
+    read after the request completes, once FastAPI has stored the matched
+    route in the scope.
+    """
+
+    def __init__(self, app, skip_paths: Iterable[str] = ()):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if not PROMETHEUS_AVAILABLE or scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        token = _current_scope.set(scope)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_PROGRESS.labels(method).dec()
+            route = route_template(scope)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            HTTP_DURATION.labels(method, route).observe(elapsed)
+            _current_scope.reset(token)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener attributing commands to the issuing route."""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._record(event, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._record(event, "failure")
+
+    def _record(self, event, outcome: str) -> None:
+        if not PROMETHEUS_AVAILABLE:
+            return
+        route = current_route()
+        MONGO_COMMANDS.labels(route, event.command_name, outcome).inc()
+        MONGO_DURATION.labels(route, event.command_name).observe(event.duration_micros / 1e6)
+
+
+def record_query_budget_violation(route: str, kind: str) -> None:
+    if PROMETHEUS_AVAILABLE:
+        QUERY_BUDGET_VIOLATIONS.labels(route, kind).inc()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Render all metrics (every worker in multiprocess mode) as Prometheus text."""
+    if not PROMETHEUS_AVAILABLE:
+        return b"# prometheus_client is not installed\n", CONTENT_TYPE_LATEST
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    from prometheus_client import REGISTRY
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
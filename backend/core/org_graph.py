@@ -0,0 +1,157 @@
+"""
+Organization Membership Graph for ZION.CITY API
+===============================================
+"Who are X's colleagues" and "do A and B share an organization" without a
+query per organization.
+
+Memberships come from two collections:
+
+* ``user_affiliations`` - self-declared work/school/university affiliations
+  (``affiliation_id``)
+* ``work_members``      - work-module organizations (``organization_id``)
+
+Both are read with ``is_active: True`` as the only status condition (work
+memberships that are left or removed are soft-deleted through it).
+
+The graph keeps two kinds of cached sets:
+
+* ``org_graph:user:<user_id>`` - the user's organizations, as tokens such
+  as ``affiliation:<id>`` / ``work:<id>``
+* ``org_graph:org:<token>``    - every active member of one organization
+  (no row cap)
+
+A cold ``colleagues`` call costs one indexed query per source for the
+user's organizations and one ``$in`` query per source for all missing
+member sets; warm calls cost none. Membership writes (join, leave,
+removal, approval, role change) call ``member_changed`` /
+``org_changed``, which invalidate the affected keys on every worker.
+
+Usage:
+    from core.org_graph import OrgGraph
+
+    org_graph = OrgGraph(db, cache)
+
+    colleagues = await org_graph.colleagues(user_id)          # Set[str]
+    if await org_graph.share_org(user_a, user_b): ...
+
+    await db.work_members.insert_one(member)
+    await org_graph.member_changed("work", organization_id, user_id)
+"""
+
+import logging
+import os
+from typing import Dict, Iterable, List, Set
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = int(os.environ.get("ORG_GRAPH_CACHE_TTL", 300))
+USER_PREFIX = "org_graph:user:"
+ORG_PREFIX = "org_graph:org:"
+
+# source -> (collection, organization id field)
+SOURCES = {
+    "affiliation": ("user_affiliations", "affiliation_id"),
+    "work": ("work_members", "organization_id"),
+}
+
+
+def org_token(source: str, org_id: str) -> str:
+    return f"{source}:{org_id}"
+
+
+class OrgGraph:
+    """Cached organization memberships and member sets."""
+
+    def __init__(self, db, cache=None, ttl: int = CACHE_TTL):
+        self.db = db
+        self.cache = cache
+        self.ttl = ttl
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    async def organizations(self, user_id: str) -> Set[str]:
+        """Tokens of every organization user_id is an active member of."""
+        if self.cache is None:
+            return set(await self._load_organizations(user_id))
+        return set(await self.cache.get_or_set(
+            USER_PREFIX + user_id, lambda: self._load_organizations(user_id), ttl=self.ttl
+        ))
+
+    async def members(self, tokens: Iterable[str]) -> Dict[str, Set[str]]:
+        """Active member IDs of each organization token."""
+        tokens = set(tokens)
+        found: Dict[str, Set[str]] = {}
+        if self.cache is not None:
+            for token in tokens:
+                cached = await self.cache.get(ORG_PREFIX + token)
+                if cached is not None:
+                    found[token] = set(cached)
+
+        missing = tokens - set(found)
+        if missing:
+            loaded = await self._load_members(missing)
+            for token in missing:
+                found[token] = loaded.get(token, set())
+                if self.cache is not None:
+                    await self.cache.set(ORG_PREFIX + token, sorted(found[token]), ttl=self.ttl)
+        return found
+
+    async def colleagues(self, user_id: str) -> Set[str]:
+        """Everyone sharing at least one organization with user_id (including them)."""
+        orgs = await self.organizations(user_id)
+        if not orgs:
+            return set()
+        return set().union(*(await self.members(orgs)).values())
+
+    async def share_org(self, user_a: str, user_b: str) -> bool:
+        """Whether two users are active members of a common organization."""
+        return bool(await self.organizations(user_a) & await self.organizations(user_b))
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+
+    async def member_changed(self, source: str, org_id: str, user_id: str) -> None:
+        """A user joined, left, was removed from or approved into an organization."""
+        if self.cache is not None:
+            await self.cache.invalidate(USER_PREFIX + user_id, ORG_PREFIX + org_token(source, org_id))
+
+    async def org_changed(self, source: str, org_id: str) -> None:
+        """Membership details of an organization changed (roles, ownership)."""
+        if self.cache is not None:
+            await self.cache.invalidate(ORG_PREFIX + org_token(source, org_id))
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    async def _load_organizations(self, user_id: str) -> List[str]:
+        tokens = []
+        for source, (collection, field) in SOURCES.items():
+            rows = await self.db[collection].find(
+                {"user_id": user_id, "is_active": True},
+                {"_id": 0, field: 1}
+            ).to_list(None)
+            tokens.extend(org_token(source, row[field]) for row in rows if row.get(field))
+        return sorted(set(tokens))
+
+    async def _load_members(self, tokens: Set[str]) -> Dict[str, Set[str]]:
+        by_source: Dict[str, List[str]] = {}
+        for token in tokens:
+            source, _, org_id = token.partition(":")
+            if source in SOURCES:
+                by_source.setdefault(source, []).append(org_id)
+
+        members: Dict[str, Set[str]] = {}
+        for source, org_ids in by_source.items():
+            collection, field = SOURCES[source]
+            rows = await self.db[collection].find(
+                {field: {"$in": org_ids}, "is_active": True},
+                {"_id": 0, field: 1, "user_id": 1}
+            ).to_list(None)
+            for row in rows:
+                if row.get("user_id"):
+                    members.setdefault(org_token(source, row[field]), set()).add(row["user_id"])
+        return members
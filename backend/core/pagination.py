@@ -0,0 +1,99 @@
+"""
+Keyset (Cursor) Pagination for ZION.CITY API
+=============================================
+Opaque cursors for feed and history endpoints, keyed on the sort field plus
+``id`` as a tie-breaker.
+
+Offset pagination makes MongoDB walk and discard ``offset`` index entries
+for every page, and rows inserted while a client scrolls shift every later
+page. A keyset cursor instead records the last row's ``(sort value, id)``
+and the next page starts strictly after it, so page N costs the same as
+page 1 when an index on ``(..., sort field, id)`` backs the query.
+
+Cursors are URL-safe base64 JSON. They are opaque to clients but not
+secret; ``decode`` only accepts scalar values, so a forged cursor can never
+smuggle query operators into a filter.
+
+Usage:
+    from core.pagination import Keyset, InvalidCursor
+
+    NEWEST_FIRST = Keyset("created_at", -1)
+
+    query = NEWEST_FIRST.after(query, cursor)          # raises InvalidCursor
+    docs = await coll.find(query).sort(NEWEST_FIRST.sort).limit(limit + 1).to_list(limit + 1)
+    docs, next_cursor = NEWEST_FIRST.page(docs, limit)  # next_cursor is None on the last page
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+_SCALARS = (str, int, float, bool)
+
+
+class InvalidCursor(ValueError):
+    """A cursor that was not produced by the same Keyset."""
+
+
+@dataclass(frozen=True)
+class Keyset:
+    """Sort order over ``(field, id_field)`` with cursor encoding."""
+    field: str = "created_at"
+    direction: int = -1
+    id_field: str = "id"
+
+    @property
+    def sort(self) -> List[Tuple[str, int]]:
+        return [(self.field, self.direction), (self.id_field, self.direction)]
+
+    def encode(self, doc: Dict[str, Any]) -> str:
+        """Cursor pointing just past ``doc``."""
+        value = doc.get(self.field)
+        if isinstance(value, datetime):
+            value = {"dt": value.isoformat()}
+        payload = json.dumps({"k": self.field, "v": value, "id": doc.get(self.id_field)}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> Tuple[Any, Any]:
+        """Return ``(sort value, id)`` stored in a cursor."""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            value, doc_id = payload["v"], payload["id"]
+            if payload["k"] != self.field:
+                raise InvalidCursor("Cursor belongs to a different listing")
+            if isinstance(value, dict):
+                value = datetime.fromisoformat(value["dt"])
+        except InvalidCursor:
+            raise
+        except Exception:
+            raise InvalidCursor("Malformed cursor")
+        if not isinstance(value, _SCALARS + (datetime, type(None))) or not isinstance(doc_id, _SCALARS):
+            raise InvalidCursor("Malformed cursor")
+        return value, doc_id
+
+    def after(self, query: Dict[str, Any], cursor: Optional[str]) -> Dict[str, Any]:
+        """Restrict ``query`` to rows after the cursor (unchanged when cursor is empty)."""
+        if not cursor:
+            return query
+        value, doc_id = self.decode(cursor)
+        op = "$lt" if self.direction < 0 else "$gt"
+        condition = {"$or": [
+            {self.field: {op: value}},
+            {self.field: value, self.id_field: {op: doc_id}},
+        ]}
+        # $and keeps any $or/$and already present in the query intact
+        return {**query, "$and": query.get("$and", []) + [condition]}
+
+    def page(self, docs: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Trim a ``limit + 1`` fetch to ``limit`` rows and return the next cursor.
+
+        The cursor is ``None`` when there is no further page.
+        """
+        if len(docs) <= limit:
+            return docs, None
+        docs = docs[:limit]
+        return docs, self.encode(docs[-1])
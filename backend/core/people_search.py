@@ -0,0 +1,206 @@
+"""
+People Search for ZION.CITY API
+===============================
+Indexed name search for ``/users/search``, ``/users/contacts``,
+``/users/search/basic`` and the admin user list.
+
+Each user document carries ``search_keys``: every prefix (edge n-gram) of
+every token of the user's first, last and middle name, display alias and
+email, after normalization, plus each whole token as ``=token``. A lookup
+normalizes the query the same way and matches with
+``{"search_keys": {"$all": [...]}}`` on a multikey index, so "ив пет"
+finds "Иван Петров" without scanning the collection the way the previous
+unanchored case-insensitive ``$regex`` did.
+
+Normalization lowercases, strips diacritics and transliterates Cyrillic
+to Latin, so Cyrillic and Latin spellings of a name meet on the same
+keys ("Иван" and "Ivan" -> ``ivan``). A few spelling variants are folded
+(``y``/``й``/``ы`` -> ``i``, ``x`` -> ``ks``) so "Alexey" and "Алексей"
+match too.
+
+Keys are written by ``search_fields`` wherever a user is created or a
+name/email field changes, and filled in for existing users by
+``backfill_search_keys`` by a startup migration. ``find_people`` first
+reads users matching every query token as a whole token, then fills the
+remaining slots from the prefix lookup ranked by how many query tokens
+match a whole name token, then by name.
+
+Usage:
+    from core.people_search import find_people, people_query, search_fields
+
+    user_doc.update(search_fields(user_doc))                        # on insert
+    update.update(search_fields(current_user.dict(), update))       # on profile update
+
+    query = people_query("ив пет")            # None when the text has no tokens
+    users = await find_people(db.users, "ив пет", limit, {"id": {"$ne": user_id}}, projection)
+"""
+
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELD = "search_keys"
+
+# Fields whose tokens are indexed
+NAME_FIELDS = ("first_name", "last_name", "middle_name", "name_alias")
+INDEXED_FIELDS = NAME_FIELDS + ("email",)
+
+# Prefixes are indexed up to this length; longer query tokens are truncated
+MAX_PREFIX = 20
+
+# Marks a whole-token key ("=ivan") apart from the prefix keys ("iva", "ivan")
+EXACT = "="
+
+# Prefix candidates read per remaining result, so ranking has something to reorder
+RANK_POOL = 3
+
+BACKFILL_BATCH = 500
+
+CYRILLIC = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "iu",
+    "я": "ia", "і": "i", "ї": "i", "є": "e", "ґ": "g",
+}
+LATIN_FOLDS = {"y": "i", "x": "ks"}
+_TRANSLATE = str.maketrans({**CYRILLIC, **LATIN_FOLDS})
+_SEPARATORS = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip diacritics and transliterate to folded Latin."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return text.translate(_TRANSLATE)
+
+
+def tokens(text: Optional[str]) -> List[str]:
+    """Normalized word tokens of text."""
+    if not text:
+        return []
+    return [t for t in _SEPARATORS.split(normalize(text)) if t]
+
+
+def index_keys(user: Dict[str, Any]) -> List[str]:
+    """Every prefix of every indexed token of a user document, and every whole token."""
+    keys = set()
+    for field in INDEXED_FIELDS:
+        for token in tokens(user.get(field)):
+            keys.add(EXACT + token)
+            for end in range(1, min(len(token), MAX_PREFIX) + 1):
+                keys.add(token[:end])
+    return sorted(keys)
+
+
+def search_fields(user: Dict[str, Any], update: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    ``{"search_keys": [...]}`` to store with a user, or ``{}``.
+
+    With ``update`` (a ``$set`` about to be applied to ``user``), keys are
+    only returned when the update touches an indexed field.
+    """
+    if update is not None:
+        if not any(field in update for field in INDEXED_FIELDS):
+            return {}
+        user = {**user, **update}
+    return {SEARCH_FIELD: index_keys(user)}
+
+
+def people_query(text: str, exact: bool = False) -> Optional[Dict[str, Any]]:
+    """Indexed filter for users matching every token of text as a prefix (or, with exact, as a whole token)."""
+    if exact:
+        keys = list(dict.fromkeys(EXACT + token for token in tokens(text)))
+    else:
+        keys = list(dict.fromkeys(token[:MAX_PREFIX] for token in tokens(text)))
+    if not keys:
+        return None
+    if len(keys) == 1:
+        return {SEARCH_FIELD: keys[0]}
+    return {SEARCH_FIELD: {"$all": keys}}
+
+
+def rank_people(users: Iterable[Dict[str, Any]], text: str) -> List[Dict[str, Any]]:
+    """Order users by whole-token matches of the query, then by name."""
+    wanted = tokens(text)
+
+    def sort_key(user):
+        name_tokens = {t for field in INDEXED_FIELDS for t in tokens(user.get(field))}
+        exact = sum(token in name_tokens for token in wanted)
+        name = normalize(f"{user.get('last_name') or ''} {user.get('first_name') or ''}")
+        return (-exact, name, user.get("id", ""))
+
+    return sorted(users, key=sort_key)
+
+
+async def find_people(
+    collection,
+    text: str,
+    limit: int,
+    query: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Up to ``limit`` users matching text, best matches first.
+
+    Users matching every query token as a whole token are read first, so
+    they are never cut off by the size of the prefix pool; the remaining
+    slots are filled from the prefix lookup, ranked with ``rank_people``.
+    """
+    prefix = people_query(text)
+    if prefix is None:
+        return []
+    query = query or {}
+
+    exact = await collection.find(
+        {"$and": [query, people_query(text, exact=True)]}, projection
+    ).limit(limit).to_list(limit)
+    users = rank_people(exact, text)
+    if len(users) == limit:
+        return users
+
+    pool = (limit - len(users)) * RANK_POOL
+    found = [user["id"] for user in users]
+    rest = await collection.find(
+        {"$and": [query, prefix, {"id": {"$nin": found}}]}, projection
+    ).limit(pool).to_list(pool)
+    return users + rank_people(rest, text)[:limit - len(users)]
+
+
+async def backfill_search_keys(collection, batch: int = BACKFILL_BATCH, rebuild: bool = False) -> int:
+    """
+    Set ``search_keys`` on users that predate it; returns the number updated.
+
+    With ``rebuild`` every user's keys are recomputed (after the key
+    format changed), walking the collection in id order.
+    """
+    projection = {"_id": 0, "id": 1, **{field: 1 for field in INDEXED_FIELDS}}
+    updated = 0
+    after = None
+    while True:
+        if rebuild:
+            query = {"id": {"$gt": after}} if after is not None else {}
+            users = await collection.find(query, projection).sort("id", 1).limit(batch).to_list(batch)
+        else:
+            users = await collection.find(
+                {SEARCH_FIELD: {"$exists": False}}, projection
+            ).limit(batch).to_list(batch)
+        if not users:
+            break
+        await collection.bulk_write(
+            [UpdateOne({"id": user["id"]}, {"$set": search_fields(user)}) for user in users],
+            ordered=False,
+        )
+        updated += len(users)
+        after = users[-1]["id"]
+        if len(users) < batch:
+            break
+
+    if updated:
+        logger.info(f"Backfilled search keys on {updated} users")
+    return updated
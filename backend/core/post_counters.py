@@ -0,0 +1,262 @@
+"""
+Post Counters for ZION.CITY API
+===============================
+Denormalized engagement counters on ``posts`` documents.
+
+Each post carries ``likes_count``, ``comments_count`` and a reaction
+histogram ``reaction_counts: {emoji: n}``. Writes keep them current with
+atomic ``$inc`` updates, so feed pages read counts and top reactions
+straight from the post documents - no ``$group`` over ``post_reactions``
+per page.
+
+Reaction writes go through ``set_reaction`` / ``clear_reaction``: the
+user's reaction row (unique on ``(post_id, user_id)``) is swapped with
+``find_one_and_update`` / ``find_one_and_delete``, and the returned
+previous emoji tells which histogram buckets to move.
+
+Counters can still drift (crashes between the two writes, manual data
+fixes), so ``reconcile_post_counters`` recomputes them from
+``post_likes``, ``post_comments`` and ``post_reactions`` and rewrites the
+posts that differ. The periodic cleanup job checks a batch per run with
+``reconcile_step``; a full pass can also be run with:
+
+    python -m core.post_counters [--all]
+
+Usage:
+    from core.post_counters import set_reaction, top_reactions
+
+    previous = await set_reaction(db, post_id, user_id, "🔥", new_reaction.dict())
+    post["top_reactions"] = top_reactions(post.get("reaction_counts"))
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .jobs import SharedCursor
+
+logger = logging.getLogger(__name__)
+
+REACTIONS_FIELD = "reaction_counts"
+RECONCILE_BATCH = int(os.environ.get("POST_COUNTERS_RECONCILE_BATCH", 200))
+REACTION_INDEX = "post_id_1_user_id_1"
+COUNTER_FIELDS = ("likes_count", "comments_count", REACTIONS_FIELD)
+
+
+def top_reactions(counts: Optional[Dict[str, int]], limit: int = 5) -> List[Dict[str, Any]]:
+    """The most used emoji of a histogram, as ``[{"emoji", "count"}]``."""
+    ranked = sorted(((e, n) for e, n in (counts or {}).items() if n > 0), key=lambda item: -item[1])
+    return [{"emoji": emoji, "count": count} for emoji, count in ranked[:limit]]
+
+
+async def set_reaction(db, post_id: str, user_id: str, emoji: str, document: Dict[str, Any]) -> Optional[str]:
+    """
+    Set user_id's reaction on a post; returns the previous emoji or None.
+
+    ``document`` is the full reaction row used when the user had none.
+    """
+    on_insert = {k: v for k, v in document.items() if k not in ("post_id", "user_id", "emoji", "created_at")}
+
+    async def swap():
+        return await db.post_reactions.find_one_and_update(
+            {"post_id": post_id, "user_id": user_id},
+            {"$set": {"emoji": emoji, "created_at": document.get("created_at")}, "$setOnInsert": on_insert},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    try:
+        previous = await swap()
+    except DuplicateKeyError:
+        # A concurrent first reaction (e.g. a double click) inserted the row
+        # first, so the user already has a reaction: update that row instead
+        previous = await swap()
+    old_emoji = previous.get("emoji") if previous else None
+    if old_emoji != emoji:
+        delta = {f"{REACTIONS_FIELD}.{emoji}": 1}
+        if old_emoji:
+            delta[f"{REACTIONS_FIELD}.{old_emoji}"] = -1
+        await db.posts.update_one({"id": post_id}, {"$inc": delta})
+    return old_emoji
+
+
+async def clear_reaction(db, post_id: str, user_id: str) -> Optional[str]:
+    """Remove user_id's reaction; returns the removed emoji or None."""
+    removed = await db.post_reactions.find_one_and_delete({"post_id": post_id, "user_id": user_id})
+    if not removed:
+        return None
+    await db.posts.update_one({"id": post_id}, {"$inc": {f"{REACTIONS_FIELD}.{removed['emoji']}": -1}})
+    return removed["emoji"]
+
+
+# ============================================================
+# Reconciliation
+# ============================================================
+
+async def actual_counters(db, post_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Counters recomputed from the source collections for a batch of posts."""
+    actual = {
+        post_id: {"likes_count": 0, "comments_count": 0, REACTIONS_FIELD: {}}
+        for post_id in post_ids
+    }
+
+    likes = db.post_likes.aggregate([
+        {"$match": {"post_id": {"$in": post_ids}}},
+        {"$group": {"_id": "$post_id", "count": {"$sum": 1}}},
+    ])
+    async for row in likes:
+        actual[row["_id"]]["likes_count"] = row["count"]
+
+    # Only top-level comments count towards the post (replies count on
+    # their parent comment); deleted comments are soft-deleted
+    comments = db.post_comments.aggregate([
+        {"$match": {"post_id": {"$in": post_ids}, "parent_comment_id": None, "is_deleted": {"$ne": True}}},
+        {"$group": {"_id": "$post_id", "count": {"$sum": 1}}},
+    ])
+    async for row in comments:
+        actual[row["_id"]]["comments_count"] = row["count"]
+
+    reactions = db.post_reactions.aggregate([
+        {"$match": {"post_id": {"$in": post_ids}}},
+        {"$group": {"_id": {"post_id": "$post_id", "emoji": "$emoji"}, "count": {"$sum": 1}}},
+    ])
+    async for row in reactions:
+        actual[row["_id"]["post_id"]][REACTIONS_FIELD][row["_id"]["emoji"]] = row["count"]
+
+    return actual
+
+
+PROJECTION = {"_id": 0, "id": 1, **{field: 1 for field in COUNTER_FIELDS}}
+
+
+def _drifted(post: Dict[str, Any], actual: Dict[str, Any]) -> bool:
+    stored = {k: v for k, v in (post.get(REACTIONS_FIELD) or {}).items() if v}
+    return (
+        post.get("likes_count") != actual["likes_count"]
+        or post.get("comments_count") != actual["comments_count"]
+        or REACTIONS_FIELD not in post
+        or stored != actual[REACTIONS_FIELD]
+    )
+
+
+async def reconcile_post_counters(
+    db,
+    post_ids: Optional[Iterable[str]] = None,
+    only_missing: bool = False,
+    batch: int = RECONCILE_BATCH,
+) -> int:
+    """
+    Repair drifted counters; returns the number of posts rewritten.
+
+    Checks ``post_ids`` when given, otherwise every post (or, with
+    ``only_missing``, every post without a reaction histogram).
+    """
+    if post_ids is not None:
+        query: Dict[str, Any] = {"id": {"$in": list(post_ids)}}
+    elif only_missing:
+        query = {REACTIONS_FIELD: {"$exists": False}}
+    else:
+        query = {}
+    repaired = 0
+    last_id = None
+    while True:
+        page_query = dict(query)
+        if last_id is not None:
+            page_query["$and"] = [{"id": {"$gt": last_id}}]
+        posts = await db.posts.find(page_query, PROJECTION).sort("id", 1).limit(batch).to_list(batch)
+        if not posts:
+            break
+        last_id = posts[-1]["id"]
+        repaired += await _repair(db, posts)
+        if len(posts) < batch:
+            break
+
+    if repaired:
+        logger.info(f"Reconciled counters on {repaired} posts")
+    return repaired
+
+
+async def reconcile_step(db, batch: int = RECONCILE_BATCH) -> int:
+    """
+    Check the next batch of posts; returns the number rewritten.
+
+    The position is shared by all workers (``core.jobs.SharedCursor``), so
+    repeated calls from any worker walk every post and then start over.
+    """
+    posts = await SharedCursor(db, "post_counters", db.posts, batch).next_batch(PROJECTION)
+    repaired = await _repair(db, posts)
+    if repaired:
+        logger.info(f"Reconciled counters on {repaired} posts")
+    return repaired
+
+
+async def _repair(db, posts: List[Dict[str, Any]]) -> int:
+    if not posts:
+        return 0
+    actual = await actual_counters(db, [p["id"] for p in posts])
+    repaired = 0
+    for post in posts:
+        if _drifted(post, actual[post["id"]]):
+            # Only if the counters are still the ones read: a $inc that landed
+            # after the recount is left alone (the next pass re-checks it)
+            read = {field: post.get(field) for field in COUNTER_FIELDS}
+            result = await db.posts.update_one({"id": post["id"], **read}, {"$set": actual[post["id"]]})
+            repaired += result.modified_count
+    return repaired
+
+
+async def unique_reactions(db) -> int:
+    """
+    Delete duplicate reaction rows and make ``(post_id, user_id)`` unique.
+
+    Keeps each user's newest row, reconciles the affected posts and
+    rebuilds the non-unique index as unique; returns the rows deleted.
+    """
+    duplicates = await db.post_reactions.aggregate([
+        {"$group": {"_id": {"post_id": "$post_id", "user_id": "$user_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ], allowDiskUse=True).to_list(None)
+
+    deleted = 0
+    for group in duplicates:
+        rows = await db.post_reactions.find(
+            group["_id"], {"_id": 0, "id": 1}
+        ).sort([("created_at", -1), ("id", -1)]).to_list(None)
+        result = await db.post_reactions.delete_many({"id": {"$in": [row["id"] for row in rows[1:]]}})
+        deleted += result.deleted_count
+    if duplicates:
+        await reconcile_post_counters(db, {group["_id"]["post_id"] for group in duplicates})
+
+    info = (await db.post_reactions.index_information()).get(REACTION_INDEX)
+    if info is not None and not info.get("unique"):
+        await db.post_reactions.drop_index(REACTION_INDEX)
+    await db.post_reactions.create_index([("post_id", 1), ("user_id", 1)], name=REACTION_INDEX, unique=True)
+    if deleted:
+        logger.info(f"Deleted {deleted} duplicate post reactions")
+    return deleted
+
+
+async def _main(args) -> int:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    try:
+        repaired = await reconcile_post_counters(client[args.db], only_missing=not args.all)
+        print(f"Repaired counters on {repaired} posts")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute denormalized post counters")
+    parser.add_argument("--all", action="store_true", help="check every post, not only posts without a histogram")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default=os.environ.get("DB_NAME", "zion_city"))
+    sys.exit(asyncio.run(_main(parser.parse_args())))
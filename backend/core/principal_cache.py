@@ -0,0 +1,138 @@
+"""
+Authenticated Principal Cache for ZION.CITY API
+===============================================
+Short-lived, size-bounded, per-worker cache of the ``User`` object resolved
+by ``get_current_user``. Entries are keyed by user id and a digest of the
+bearer token, so the common authenticated path costs only the JWT decode.
+
+Writes to ``db.users`` must call ``invalidate_user()``; when the cache is
+attached to a ``TieredCache`` the invalidation reaches every worker over the
+shared invalidation channel.
+
+Usage:
+    from core.principal_cache import PrincipalCache
+
+    principal_cache = PrincipalCache(ttl=30, max_entries=10000)
+    principal_cache.attach(cache)
+
+    user = principal_cache.get(user_id, token)
+    if user is None:
+        user = await load_user(user_id)
+        principal_cache.set(user_id, token, user)
+
+    await principal_cache.invalidate_user(user_id)
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from .cache import TieredCache
+
+KEY_PREFIX = "principal:"
+
+
+class PrincipalCache:
+    """
+    LRU cache of authenticated principals with a per-user key index.
+
+    The index makes ``invalidate_user`` O(tokens for that user) instead of a
+    scan, since one user may hold several live tokens (devices).
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (user_id, token_digest) -> (principal, expires_at)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, float]]" = OrderedDict()
+        self._by_user: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._bus: Optional[TieredCache] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def attach(self, bus: TieredCache) -> None:
+        """Receive (and send) user invalidations over a TieredCache channel."""
+        self._bus = bus
+        bus.on_invalidate(KEY_PREFIX, self._on_invalidate)
+
+    def get(self, user_id: str, token: str) -> Optional[Any]:
+        key = (user_id, _digest(token))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return principal
+
+    def set(self, user_id: str, token: str, principal: Any) -> None:
+        key = (user_id, _digest(token))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (principal, time.monotonic() + self.ttl)
+            self._by_user.setdefault(user_id, set()).add(key[1])
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    async def invalidate_user(self, user_id: str) -> None:
+        """Drop every cached principal for user_id on all workers."""
+        if self._bus is not None:
+            # The bus calls back into _on_invalidate locally and on peers
+            await self._bus.invalidate(f"{KEY_PREFIX}{user_id}")
+        else:
+            self._drop_user(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+        }
+
+    def _on_invalidate(self, key: Optional[str]) -> None:
+        if key is None:
+            self.clear()
+        else:
+            self._drop_user(key[len(KEY_PREFIX):])
+
+    def _drop_user(self, user_id: str) -> None:
+        with self._lock:
+            for digest in list(self._by_user.get(user_id, ())):
+                self._remove((user_id, digest))
+            self.invalidations += 1
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        self._entries.pop(key, None)
+        digests = self._by_user.get(key[0])
+        if digests is not None:
+            digests.discard(key[1])
+            if not digests:
+                del self._by_user[key[0]]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
@@ -0,0 +1,185 @@
+"""
+Pub/Sub Broker for ZION.CITY API
+================================
+Cross-worker event fan-out used by the WebSocket layer. Every gunicorn
+worker subscribes to the same channel patterns and relays each event to the
+sockets it holds locally, so an event published by any worker reaches every
+connected client.
+
+Two interchangeable backends:
+
+* ``RedisBroker``      - Redis PUBLISH/PSUBSCRIBE (any Redis-protocol server)
+* ``InProcessBroker``  - direct dispatch inside one process; used for a single
+                         worker without Redis and as a stand-in in tests
+                         (several managers can share one instance to
+                         simulate several workers)
+
+Usage:
+    from core.pubsub import create_broker
+
+    broker = create_broker(namespace="zion")
+    await broker.subscribe("chat:*", on_chat_event)   # handler(channel, data)
+    await broker.start()
+    await broker.publish("chat:123", '{"type": "typing"}')
+"""
+
+import asyncio
+import logging
+from fnmatch import fnmatchcase
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .redis_client import REDIS_URL, aioredis, get_redis
+
+logger = logging.getLogger(__name__)
+
+# handler(channel, data) - channel is returned without the namespace prefix
+Handler = Callable[[str, str], Awaitable[None]]
+
+
+class InProcessBroker:
+    """Dispatches published events to matching handlers in this process."""
+
+    shared = False
+
+    def __init__(self):
+        self._subscriptions: List[Tuple[str, Handler]] = []
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def subscribe(self, pattern: str, handler: Handler) -> None:
+        self._subscriptions.append((pattern, handler))
+
+    async def publish(self, channel: str, data: str) -> None:
+        await _dispatch(self._subscriptions, channel, data)
+
+    def stats(self) -> Dict[str, object]:
+        return {"shared": False, "subscriptions": len(self._subscriptions)}
+
+
+class RedisBroker:
+    """
+    Redis PUBLISH/PSUBSCRIBE broker.
+
+    A worker receives its own publications through the subscription, so
+    local and remote sockets share one delivery path. If a publish fails the
+    event is dispatched locally, so at least this worker's sockets get it.
+    """
+
+    shared = True
+
+    def __init__(self, namespace: str = "zion", redis_url: Optional[str] = None):
+        self.namespace = namespace
+        self._redis_url = redis_url
+        self._redis = None
+        self._pubsub = None
+        self._subscriptions: List[Tuple[str, Handler]] = []
+        self._listener_task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        self._redis = get_redis(self._redis_url)
+        if self._redis is None:
+            logger.warning("RedisBroker has no Redis connection; dispatching in-process only")
+            return
+        self._listener_task = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener_task = None
+        self._redis = None
+
+    async def subscribe(self, pattern: str, handler: Handler) -> None:
+        self._subscriptions.append((pattern, handler))
+        if self._pubsub is not None:
+            await self._pubsub.psubscribe(self._channel(pattern))
+
+    async def publish(self, channel: str, data: str) -> None:
+        if self._redis is not None:
+            try:
+                await self._redis.publish(self._channel(channel), data)
+                self.published += 1
+                return
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Broker publish to {channel} failed, delivering locally: {e}")
+        await _dispatch(self._subscriptions, channel, data)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "shared": self._pubsub is not None,
+            "subscriptions": len(self._subscriptions),
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+    def _channel(self, channel: str) -> str:
+        return f"{self.namespace}:ws:{channel}"
+
+    async def _listen(self) -> None:
+        """Pattern-subscribe to every registered channel, reconnecting with backoff."""
+        prefix_len = len(self._channel(""))
+        backoff = 1
+        while True:
+            try:
+                self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                patterns = {self._channel(p) for p, _ in self._subscriptions}
+                if patterns:
+                    await self._pubsub.psubscribe(*patterns)
+                backoff = 1
+                while True:
+                    if not self._pubsub.subscribed:
+                        # Nothing to listen to yet; get_message would raise
+                        await asyncio.sleep(0.1)
+                        continue
+                    message = await self._pubsub.get_message(timeout=1.0)
+                    if message is None or message.get("type") != "pmessage":
+                        continue
+                    self.received += 1
+                    channel = _text(message["channel"])[prefix_len:]
+                    await _dispatch(self._subscriptions, channel, _text(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Broker listener error: {e}; retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if self._pubsub is not None:
+                    try:
+                        await self._pubsub.aclose()
+                    except Exception:
+                        pass
+                    self._pubsub = None
+
+
+def create_broker(namespace: str = "zion", redis_url: Optional[str] = None):
+    """Return a RedisBroker when Redis is configured, else an InProcessBroker."""
+    if (redis_url or REDIS_URL) and aioredis is not None:
+        return RedisBroker(namespace=namespace, redis_url=redis_url)
+    return InProcessBroker()
+
+
+async def _dispatch(subscriptions: List[Tuple[str, Handler]], channel: str, data: str) -> None:
+    for pattern, handler in list(subscriptions):
+        if fnmatchcase(channel, pattern):
+            try:
+                await handler(channel, data)
+            except Exception as e:
+                logger.error(f"Broker handler for {pattern} failed on {channel}: {e}")
+
+
+def _text(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
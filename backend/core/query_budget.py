@@ -0,0 +1,214 @@
+"""
+Query Budgets for ZION.CITY API
+===============================
+Request-scoped MongoDB query recording with per-route budgets and N+1
+detection, built on pymongo command monitoring.
+
+Every command issued while serving a request is recorded together with its
+*shape*: the command, the collection and the filter with all values
+replaced by ``?``. A list endpoint that issues one ``find_one`` per item
+shows up as one shape repeated N times, regardless of the ids involved.
+
+* ``QueryRecorderListener``  - pymongo listener feeding the active recorder
+* ``QueryBudgetMiddleware``  - ASGI middleware recording each request and
+                               logging (or raising, in tests) when a route
+                               exceeds its budget or repeats a shape
+* ``recording()``            - context manager for recording outside
+                               requests; used by the pytest fixture
+
+Usage:
+    from core.query_budget import QueryRecorderListener, QueryBudgetMiddleware, recording
+
+    client = AsyncIOMotorClient(url, event_listeners=[QueryRecorderListener()])
+    app.add_middleware(QueryBudgetMiddleware, default_budget=30, budgets={"/api/notifications": 5})
+
+    with recording() as recorder:
+        await db.users.find_one({"id": user_id})
+    assert recorder.count == 1
+"""
+
+import contextvars
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from pymongo import monitoring
+
+from .metrics import record_query_budget_violation, route_template
+
+logger = logging.getLogger(__name__)
+
+# Driver housekeeping and cursor continuation; not logical queries.
+IGNORED_COMMANDS = frozenset({
+    "hello", "ismaster", "isMaster", "ping", "buildInfo",
+    "saslStart", "saslContinue", "endSessions", "getMore", "killCursors",
+})
+
+# Where each command keeps the filter that defines its shape.
+_FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "aggregate": "pipeline",
+}
+# Write commands keep their filters inside a list of statements.
+_STATEMENT_FIELDS = {"update": ("updates", "q"), "delete": ("deletes", "q")}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request or test exceeds its query budget."""
+
+
+def normalize(value: Any) -> Any:
+    """Replace every literal in a filter or pipeline with ``?``."""
+    if isinstance(value, Mapping):
+        return {key: normalize(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)) and value and all(isinstance(v, Mapping) for v in value):
+        # Sub-documents ($or branches, pipeline stages) keep their structure
+        return [normalize(v) for v in value]
+    return "?"
+
+
+def query_shape(command_name: str, command: Mapping[str, Any]) -> Tuple[str, str]:
+    """Return (collection, shape) for a command document."""
+    collection = command.get(command_name)
+    collection = collection if isinstance(collection, str) else ""
+
+    if command_name in _FILTER_FIELDS:
+        body = command.get(_FILTER_FIELDS[command_name]) or {}
+    elif command_name in _STATEMENT_FIELDS:
+        field, key = _STATEMENT_FIELDS[command_name]
+        statements = command.get(field) or [{}]
+        body = statements[0].get(key) or {}
+    else:
+        body = {}
+    return collection, f"{command_name} {collection} {normalize(body)}"
+
+
+class QueryRecorder:
+    """Queries issued within one request (or one ``recording()`` block)."""
+
+    def __init__(self):
+        self.queries: List[Tuple[str, str]] = []  # (collection, shape)
+        self.shapes: Counter = Counter()
+        self._lock = threading.Lock()  # Motor reports from its executor threads
+
+    def record(self, command_name: str, command: Mapping[str, Any]) -> None:
+        if command_name in IGNORED_COMMANDS:
+            return
+        collection, shape = query_shape(command_name, command)
+        with self._lock:
+            self.queries.append((collection, shape))
+            self.shapes[shape] += 1
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Shapes issued at least `threshold` times, most frequent first."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def violations(self, budget: Optional[int], repeat_threshold: Optional[int]) -> List[str]:
+        """Human-readable budget and N+1 violations (empty when within budget)."""
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f"{self.count} queries (budget {budget})")
+        if repeat_threshold:
+            problems.extend(f"{n}x {shape}" for shape, n in self.repeated(repeat_threshold))
+        return problems
+
+    def check(self, budget: Optional[int] = None, repeat_threshold: Optional[int] = None) -> None:
+        """Raise QueryBudgetExceeded if the recorded queries break the budget."""
+        problems = self.violations(budget, repeat_threshold)
+        if problems:
+            raise QueryBudgetExceeded("Query budget exceeded: " + "; ".join(problems))
+
+
+_current_recorder: contextvars.ContextVar[Optional[QueryRecorder]] = contextvars.ContextVar(
+    "query_recorder", default=None
+)
+
+
+def current_recorder() -> Optional[QueryRecorder]:
+    return _current_recorder.get()
+
+
+@contextmanager
+def recording() -> Iterator[QueryRecorder]:
+    """Record every query issued inside the block (in this context)."""
+    recorder = QueryRecorder()
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+
+
+class QueryRecorderListener(monitoring.CommandListener):
+    """pymongo listener that feeds commands to the active recorder."""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        recorder = _current_recorder.get()
+        if recorder is not None:
+            recorder.record(event.command_name, event.command)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+
+class QueryBudgetMiddleware:
+    """
+    ASGI middleware enforcing per-route query budgets.
+
+    ``budgets`` maps route templates to their maximum number of queries;
+    other routes use ``default_budget``. Any shape repeated
+    ``repeat_threshold`` times in one request is reported as a suspected
+    N+1. ``mode`` is ``"log"`` (warn and count in Prometheus), ``"raise"``
+    (raise QueryBudgetExceeded after the response; for tests and local
+    development) or ``"off"``.
+    """
+
+    def __init__(
+        self,
+        app,
+        default_budget: Optional[int] = 30,
+        budgets: Optional[Dict[str, int]] = None,
+        repeat_threshold: Optional[int] = 5,
+        mode: str = "log",
+    ):
+        self.app = app
+        self.default_budget = default_budget
+        self.budgets = dict(budgets or {})
+        self.repeat_threshold = repeat_threshold
+        self.mode = mode
+
+    async def __call__(self, scope, receive, send):
+        if self.mode == "off" or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with recording() as recorder:
+            await self.app(scope, receive, send)
+
+        route = route_template(scope)
+        budget = self.budgets.get(route, self.default_budget)
+        problems = recorder.violations(budget, self.repeat_threshold)
+        if not problems:
+            return
+
+        if budget is not None and recorder.count > budget:
+            record_query_budget_violation(route, "budget")
+        if self.repeat_threshold and recorder.repeated(self.repeat_threshold):
+            record_query_budget_violation(route, "repeated")
+
+        message = f"Query budget exceeded on {scope['method']} {route}: " + "; ".join(problems)
+        if self.mode == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
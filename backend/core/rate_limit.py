@@ -0,0 +1,300 @@
+"""
+Rate Limiting for ZION.CITY API
+===============================
+Sliding-window-counter rate limiter with fixed memory per key and O(1) cost
+per request, plus an ASGI middleware that applies limits declaratively per
+route group.
+
+Each key keeps only the request count of the current fixed window and of
+the previous one. The sliding estimate is
+
+    previous * (1 - elapsed_fraction_of_current_window) + current
+
+which is accurate to within a few percent of a true sliding log without
+storing timestamps. When ``REDIS_URL`` is configured the counters live in
+Redis (one atomic Lua call per request) so limits hold across all gunicorn
+workers; on Redis errors the limiter falls back to per-worker counters.
+
+Usage:
+    from core.rate_limit import RateLimiter, RateLimitRule, RateLimitMiddleware
+
+    rate_limiter = RateLimiter()
+    result = await rate_limiter.hit("search:user-1", limit=30, window=60)
+
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=rate_limiter,
+        rules=[RateLimitRule("search", r"^/api/users/search$", 30, 60)],
+        identify=lambda scope: "anonymous",
+    )
+"""
+
+import json
+import logging
+import math
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RateLimitResult:
+    """Outcome of one rate-limit check."""
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: int = 0
+
+
+@dataclass
+class RateLimitRule:
+    """
+    Declarative limit for a route group.
+
+    ``pattern`` is matched against the request path; ``methods`` restricts
+    the rule to the given HTTP methods (all methods when empty).
+    """
+    name: str
+    pattern: str
+    max_requests: int
+    window_seconds: int
+    methods: Set[str] = field(default_factory=set)
+
+    def __post_init__(self):
+        self._regex = re.compile(self.pattern)
+        self.methods = {m.upper() for m in self.methods}
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods and method not in self.methods:
+            return False
+        return self._regex.match(path) is not None
+
+
+class LocalSlidingWindow:
+    """
+    Per-process sliding-window counters: a few integers per key.
+
+    Used directly when no shared backend is configured and as the fallback
+    when the shared backend is unreachable.
+    """
+
+    def __init__(self):
+        # key -> (window_seconds, window_index, current_count, previous_count)
+        self._counters: Dict[str, Tuple[int, int, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: int, now: Optional[float] = None) -> RateLimitResult:
+        now = time.time() if now is None else now
+        index = int(now // window)
+        weight = 1.0 - (now % window) / window
+
+        with self._lock:
+            entry = self._counters.get(key)
+            current, previous = 0, 0
+            if entry is not None:
+                _, stored_index, stored_current, stored_previous = entry
+                if stored_index == index:
+                    current, previous = stored_current, stored_previous
+                elif stored_index == index - 1:
+                    previous = stored_current
+
+            estimate = previous * weight + current
+            if estimate + 1 > limit:
+                self._counters[key] = (window, index, current, previous)
+                return RateLimitResult(False, limit, 0, _retry_after(previous, current, limit, window, now))
+
+            current += 1
+            self._counters[key] = (window, index, current, previous)
+            return RateLimitResult(True, limit, max(0, int(limit - (previous * weight + current))))
+
+    def cleanup(self, now: Optional[float] = None) -> int:
+        """Drop counters whose windows can no longer affect any decision."""
+        now = time.time() if now is None else now
+        with self._lock:
+            stale = [
+                key for key, (window, index, _, _) in self._counters.items()
+                if index < int(now // window) - 1
+            ]
+            for key in stale:
+                del self._counters[key]
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+
+# Atomic sliding-window check in Redis. KEYS: current, previous window.
+# ARGV: limit, window seconds, previous-window weight.
+_SLIDING_WINDOW_LUA = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local limit = tonumber(ARGV[1])
+local estimate = previous * tonumber(ARGV[3]) + current
+if estimate + 1 > limit then
+    return {0, current, previous}
+end
+current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]) * 2)
+end
+return {1, current, previous}
+"""
+
+
+class RateLimiter:
+    """
+    Sliding-window rate limiter with a shared Redis backend and local fallback.
+    """
+
+    def __init__(self, namespace: str = "zion", redis_url: Optional[str] = None, shared: bool = True):
+        self.namespace = namespace
+        self.local = LocalSlidingWindow()
+        self._redis_url = redis_url
+        self._shared_enabled = shared
+        self._redis = None
+        self._script = None
+        self.rejected = 0
+        self.shared_errors = 0
+
+    async def start(self) -> None:
+        """Connect the shared backend (call once per worker)."""
+        if not self._shared_enabled:
+            return
+        self._redis = get_redis(self._redis_url)
+        if self._redis is not None:
+            self._script = self._redis.register_script(_SLIDING_WINDOW_LUA)
+        else:
+            logger.info("Rate limiter running with per-worker counters")
+
+    async def close(self) -> None:
+        self._redis = None
+        self._script = None
+
+    @property
+    def shared(self) -> bool:
+        return self._redis is not None
+
+    async def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        """Count one request for key and report whether it is allowed."""
+        if self._script is not None:
+            now = time.time()
+            index = int(now // window)
+            weight = 1.0 - (now % window) / window
+            base = f"{self.namespace}:rl:{{{key}}}:{window}"
+            try:
+                allowed, current, previous = await self._script(
+                    keys=[f"{base}:{index}", f"{base}:{index - 1}"],
+                    args=[limit, window, weight],
+                )
+                current, previous = int(current), int(previous)
+                if allowed:
+                    return RateLimitResult(True, limit, max(0, int(limit - (previous * weight + current))))
+                self.rejected += 1
+                return RateLimitResult(False, limit, 0, _retry_after(previous, current, limit, window, now))
+            except Exception as e:
+                self.shared_errors += 1
+                logger.debug(f"Shared rate limiter unavailable, using local counters: {e}")
+
+        result = self.local.hit(key, limit, window)
+        if not result.allowed:
+            self.rejected += 1
+        return result
+
+    async def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> bool:
+        """Check if request is allowed within rate limit"""
+        return (await self.hit(key, max_requests, window_seconds)).allowed
+
+    async def cleanup(self) -> int:
+        """Clean up stale local counters (Redis keys expire on their own)."""
+        return self.local.cleanup()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "tracked_keys": len(self.local),
+            "rejected": self.rejected,
+            "shared": self.shared,
+            "shared_errors": self.shared_errors,
+        }
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware applying the first matching ``RateLimitRule`` to each
+    HTTP request. Requests that match no rule pass through untouched.
+
+    ``identify(scope)`` returns the caller identity (user id or client IP);
+    the limiter key is ``"{rule.name}:{identity}"``.
+    """
+
+    def __init__(
+        self,
+        app,
+        limiter: RateLimiter,
+        rules: Iterable[RateLimitRule],
+        identify: Callable[[dict], str],
+        message: str = "Too many requests",
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.rules: List[RateLimitRule] = list(rules)
+        self.identify = identify
+        self.message = message
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rule = self._match(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = f"{rule.name}:{self.identify(scope)}"
+        result = await self.limiter.hit(key, rule.max_requests, rule.window_seconds)
+        if not result.allowed:
+            await self._reject(send, result)
+            return
+
+        await self.app(scope, receive, send)
+
+    def _match(self, method: str, path: str) -> Optional[RateLimitRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    async def _reject(self, send, result: RateLimitResult) -> None:
+        body = json.dumps({"detail": self.message}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(result.retry_after).encode()),
+                (b"x-ratelimit-limit", str(result.limit).encode()),
+                (b"x-ratelimit-remaining", b"0"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _retry_after(previous: int, current: int, limit: int, window: int, now: float) -> int:
+    """Seconds until the sliding estimate drops enough to admit one request."""
+    elapsed = now % window
+    if current + 1 > limit:
+        # Only the next window can help
+        return max(1, math.ceil(window - elapsed))
+    if previous <= 0:
+        return 1
+    # Need previous * (1 - t/window) + current + 1 <= limit
+    t = window * (1 - (limit - current - 1) / previous)
+    return max(1, math.ceil(t - elapsed))
+
@@ -0,0 +1,70 @@
+"""
+Shared Redis Connection for ZION.CITY API
+=========================================
+Lazily creates one asyncio Redis client per worker process. Redis is an
+optional dependency: when ``REDIS_URL`` is unset or the ``redis`` package is
+not installed, ``get_redis()`` returns ``None`` and callers fall back to
+their in-process implementation.
+
+Usage:
+    from core.redis_client import get_redis
+
+    redis = get_redis()
+    if redis is not None:
+        await redis.set("key", b"value", px=60000)
+"""
+
+import logging
+import os
+from typing import Optional
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - optional dependency
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.environ.get("REDIS_URL", "")
+
+_client = None
+_client_pid: Optional[int] = None
+
+
+def get_redis(url: Optional[str] = None):
+    """
+    Return the process-wide asyncio Redis client, or None if unavailable.
+
+    The client is created on first use rather than at import time so that
+    gunicorn's ``preload_app`` does not share sockets between forked workers.
+    """
+    global _client, _client_pid
+
+    url = url or REDIS_URL
+    if not url or aioredis is None:
+        return None
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        _client = aioredis.from_url(
+            url,
+            socket_timeout=2,
+            socket_connect_timeout=2,
+            health_check_interval=30,
+        )
+        _client_pid = pid
+        logger.info(f"Redis client created for worker {pid}")
+    return _client
+
+
+async def close_redis() -> None:
+    """Close the process-wide Redis client if one was created."""
+    global _client, _client_pid
+
+    if _client is not None:
+        try:
+            await _client.aclose()
+        except Exception as e:
+            logger.debug(f"Redis close error: {e}")
+    _client = None
+    _client_pid = None
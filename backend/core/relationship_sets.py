@@ -0,0 +1,203 @@
+"""
+Relationship Sets for ZION.CITY API
+===================================
+Each active user's friend, following and subscribed-channel ids, kept as
+compact sets in a per-worker cache.
+
+Feed, events, suggestions and relationship-flag code used to load these
+lists with ``.to_list(1000)`` on every request - silently dropping
+everything past the thousandth row for heavy users, and repeating the same
+three reads several times per page load. ``RelationshipSets`` loads each
+set once, in full, and serves it from an LRU bounded by entry count and
+TTL. Sets are returned as ``ConnectionSet`` (``in``, ``&`` and ``$in``
+rendering).
+
+The friend, follow and subscribe endpoints update the cached sets in
+place after writing the relationship row, and broadcast
+``relationship_sets:<user>`` on the ``TieredCache`` invalidation channel
+so other workers drop their copies:
+
+* ``friended`` / ``unfriended``     - the friends set of both users
+* ``followed`` / ``unfollowed``     - the following set of the follower
+* ``subscribed`` / ``unsubscribed`` - the channels set of the subscriber
+
+Usage:
+    from core.relationship_sets import RelationshipSets
+
+    relationship_sets = RelationshipSets(db)
+    relationship_sets.attach(cache)
+
+    friends = await relationship_sets.friends(user_id)
+    query["user_id"] = friends.as_in()
+
+    await db.user_follows.insert_one(follow)
+    await relationship_sets.followed(follower_id, target_id)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .cache import TieredCache
+from .connections import ConnectionSet
+
+CACHE_TTL = int(os.environ.get("RELATIONSHIP_SETS_CACHE_TTL", 600))
+MAX_ENTRIES = int(os.environ.get("RELATIONSHIP_SETS_MAX_ENTRIES", 20000))
+
+CACHE_PREFIX = "relationship_sets:"
+
+FRIENDS = "friends"
+FOLLOWING = "following"
+CHANNELS = "channels"
+KINDS = (FRIENDS, FOLLOWING, CHANNELS)
+
+# (user_id, kind, member id, added)
+Change = Tuple[str, str, str, bool]
+
+
+class RelationshipSets:
+    """Per-user friend / following / channel id sets, updated in place on writes."""
+
+    def __init__(self, db, ttl: float = CACHE_TTL, max_entries: int = MAX_ENTRIES):
+        self.db = db
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bus: Optional[TieredCache] = None
+        # (user_id, kind) -> (ids, expires_at)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[ConnectionSet, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every change; a set loaded across one is not stored
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def attach(self, bus: TieredCache) -> None:
+        """Broadcast changes to, and follow changes from, other workers."""
+        self.bus = bus
+        bus.on_invalidate(CACHE_PREFIX, self._on_key)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    async def friends(self, user_id: str) -> ConnectionSet:
+        return await self.get(user_id, FRIENDS)
+
+    async def following(self, user_id: str) -> ConnectionSet:
+        return await self.get(user_id, FOLLOWING)
+
+    async def channels(self, user_id: str) -> ConnectionSet:
+        return await self.get(user_id, CHANNELS)
+
+    async def get(self, user_id: str, kind: str) -> ConnectionSet:
+        """One of user_id's sets (see ``KINDS``), loaded in full on a miss."""
+        key = (user_id, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            epoch = self._epoch
+
+        ids = ConnectionSet(await self._load(user_id, kind))
+        with self._lock:
+            if epoch == self._epoch:
+                self._entries[key] = (ids, time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return ids
+
+    async def _load(self, user_id: str, kind: str) -> List[str]:
+        if kind == FRIENDS:
+            friendships = await self.db.user_friendships.find(
+                {"$or": [{"user1_id": user_id}, {"user2_id": user_id}]},
+                {"_id": 0, "user1_id": 1, "user2_id": 1},
+            ).to_list(None)
+            return [f["user2_id"] if f["user1_id"] == user_id else f["user1_id"] for f in friendships]
+        if kind == FOLLOWING:
+            return await self.db.user_follows.distinct("target_id", {"follower_id": user_id})
+        if kind == CHANNELS:
+            return await self.db.channel_subscriptions.distinct("channel_id", {"subscriber_id": user_id})
+        raise ValueError(f"Unknown relationship set: {kind}")
+
+    # ------------------------------------------------------------------
+    # Writes (call after the relationship row was written or deleted)
+    # ------------------------------------------------------------------
+
+    async def friended(self, user_a: str, user_b: str, added: bool = True) -> None:
+        await self._apply([(user_a, FRIENDS, user_b, added), (user_b, FRIENDS, user_a, added)])
+
+    async def unfriended(self, user_a: str, user_b: str) -> None:
+        await self.friended(user_a, user_b, added=False)
+
+    async def followed(self, follower_id: str, target_id: str, added: bool = True) -> None:
+        await self._apply([(follower_id, FOLLOWING, target_id, added)])
+
+    async def unfollowed(self, follower_id: str, target_id: str) -> None:
+        await self.followed(follower_id, target_id, added=False)
+
+    async def subscribed(self, user_id: str, channel_id: str, added: bool = True) -> None:
+        await self._apply([(user_id, CHANNELS, channel_id, added)])
+
+    async def unsubscribed(self, user_id: str, channel_id: str) -> None:
+        await self.subscribed(user_id, channel_id, added=False)
+
+    async def invalidate(self, user_ids: Iterable[str]) -> None:
+        """Drop the sets of user_ids on every worker (bulk changes)."""
+        user_ids = list(dict.fromkeys(user_ids))
+        for user_id in user_ids:
+            self.invalidate_user(user_id)
+        await self._broadcast(user_ids)
+
+    async def _apply(self, changes: List[Change]) -> None:
+        with self._lock:
+            self._epoch += 1
+            for user_id, kind, member, added in changes:
+                entry = self._entries.get((user_id, kind))
+                if entry is None:
+                    continue
+                ids = entry[0].ids | {member} if added else entry[0].ids - {member}
+                self._entries[(user_id, kind)] = (ConnectionSet(ids), entry[1])
+        await self._broadcast(dict.fromkeys(change[0] for change in changes))
+
+    async def _broadcast(self, user_ids: Iterable[str]) -> None:
+        if self.bus is not None:
+            await self.bus.invalidate(*(f"{CACHE_PREFIX}{user_id}" for user_id in user_ids), local=False)
+
+    # ------------------------------------------------------------------
+    # Local state
+    # ------------------------------------------------------------------
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop user_id's sets in this worker."""
+        with self._lock:
+            self._epoch += 1
+            for kind in KINDS:
+                self._entries.pop((user_id, kind), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+        }
+
+    def _on_key(self, key: Optional[str]) -> None:
+        if key is None:
+            self.clear()
+        else:
+            self.invalidate_user(key[len(CACHE_PREFIX):])
@@ -0,0 +1,134 @@
+"""
+Relationship Resolver for ZION.CITY API
+=======================================
+Friend / follow / friend-request flags between the current user and a
+list of other users, for search results, profiles and people lists.
+
+Endpoints used to run a ``find_one`` per flag per listed user (three or
+four per row). ``RelationshipResolver.resolve`` answers every flag for
+any number of targets with three ``$in`` queries, one per collection,
+each covering both directions:
+
+* ``user_friendships`` - is_friend
+* ``user_follows``     - is_following, follows_me
+* ``friend_requests``  - request_sent, request_received (PENDING only)
+
+With ``relationship_sets`` (``core.relationship_sets.RelationshipSets``)
+is_friend and is_following are answered from the viewer's cached sets,
+leaving one ``user_follows`` query for follows_me and the requests query.
+
+Usage:
+    from core.relationships import RelationshipResolver
+
+    relationships = RelationshipResolver(db)
+
+    relations = await relationships.resolve(current_user.id, [u["id"] for u in users])
+    for user in users:
+        user.update(relations[user["id"]].flags())
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Relationship:
+    """How the viewer relates to one other user."""
+    is_friend: bool = False
+    is_following: bool = False
+    follows_me: bool = False
+    request_sent: bool = False
+    request_received: bool = False
+    request_id: Optional[str] = None
+
+    def flags(self) -> Dict[str, Any]:
+        """The flags list endpoints add to each user."""
+        return {
+            "is_friend": self.is_friend,
+            "is_following": self.is_following,
+            "follows_me": self.follows_me,
+            "request_sent": self.request_sent,
+        }
+
+
+NONE = Relationship()
+
+
+class RelationshipResolver:
+    """Batched relationship flags between a viewer and many users."""
+
+    def __init__(self, db, relationship_sets=None):
+        self.db = db
+        self.relationship_sets = relationship_sets
+
+    async def resolve(self, viewer_id: str, target_ids: Iterable[str]) -> Dict[str, Relationship]:
+        """Relationship of viewer_id to each target (three queries; two once the viewer's sets are cached)."""
+        targets = [t for t in dict.fromkeys(target_ids) if t and t != viewer_id]
+        if not targets:
+            return {}
+
+        (friends, following, followers), requests = await asyncio.gather(
+            self._graph(viewer_id, targets),
+            self.db.friend_requests.find(
+                {"status": "PENDING", "$or": [
+                    {"sender_id": viewer_id, "receiver_id": {"$in": targets}},
+                    {"receiver_id": viewer_id, "sender_id": {"$in": targets}},
+                ]},
+                {"_id": 0, "id": 1, "sender_id": 1, "receiver_id": 1},
+            ).to_list(2 * len(targets)),
+        )
+
+        sent = {r["receiver_id"]: r["id"] for r in requests if r["sender_id"] == viewer_id}
+        received = {r["sender_id"]: r["id"] for r in requests if r["receiver_id"] == viewer_id}
+
+        return {
+            target: Relationship(
+                is_friend=target in friends,
+                is_following=target in following,
+                follows_me=target in followers,
+                request_sent=target in sent,
+                request_received=target in received,
+                request_id=sent.get(target) or received.get(target),
+            )
+            for target in targets
+        }
+
+    async def _graph(self, viewer_id: str, targets: List[str]) -> Tuple[Set[str], Set[str], Set[str]]:
+        """Targets that are the viewer's friends, that the viewer follows, and that follow the viewer."""
+        if self.relationship_sets is not None:
+            friend_ids, following_ids, followers = await asyncio.gather(
+                self.relationship_sets.friends(viewer_id),
+                self.relationship_sets.following(viewer_id),
+                self.db.user_follows.distinct("follower_id", {"target_id": viewer_id, "follower_id": {"$in": targets}}),
+            )
+            return friend_ids & targets, following_ids & targets, set(followers)
+
+        friendships, follows = await asyncio.gather(
+            self.db.user_friendships.find(
+                {"$or": [
+                    {"user1_id": viewer_id, "user2_id": {"$in": targets}},
+                    {"user2_id": viewer_id, "user1_id": {"$in": targets}},
+                ]},
+                {"_id": 0, "user1_id": 1, "user2_id": 1},
+            ).to_list(len(targets)),
+            self.db.user_follows.find(
+                {"$or": [
+                    {"follower_id": viewer_id, "target_id": {"$in": targets}},
+                    {"target_id": viewer_id, "follower_id": {"$in": targets}},
+                ]},
+                {"_id": 0, "follower_id": 1, "target_id": 1},
+            ).to_list(2 * len(targets)),
+        )
+        return (
+            {f["user2_id"] if f["user1_id"] == viewer_id else f["user1_id"] for f in friendships},
+            {f["target_id"] for f in follows if f["follower_id"] == viewer_id},
+            {f["follower_id"] for f in follows if f["target_id"] == viewer_id},
+        )
+
+    async def between(self, viewer_id: str, target_id: str) -> Relationship:
+        """Relationship of viewer_id to a single user."""
+        return (await self.resolve(viewer_id, [target_id])).get(target_id, NONE)
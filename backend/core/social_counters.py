@@ -0,0 +1,229 @@
+"""
+Social Counters for ZION.CITY API
+=================================
+Denormalized friend / follower / following counts on ``users`` documents
+and subscriber counts on ``news_channels`` documents.
+
+Profile headers and ``/users/me/social-stats`` used to count
+``user_friendships`` and ``user_follows`` on every view. Now the counts
+are read from the documents, and the relationship endpoints keep them
+current with atomic ``$inc`` updates made after the relationship row was
+actually written or deleted:
+
+* follow / unfollow   - ``following_count`` of the follower and
+  ``followers_count`` of the target (one ``bulk_write``)
+* friend accept / remove - ``friends_count`` of both users (one
+  ``update_many``)
+* subscribe / unsubscribe - ``subscribers_count`` of the channel
+
+Counters can still drift (a crash between the two writes, manual data
+fixes, rows left behind by deleted accounts), so ``SocialCounters``
+recomputes them from the relationship collections and rewrites the
+documents that differ. The server runs ``reconcile_missing`` once per
+database for documents that have no counters yet, and ``reconcile_step``
+from the periodic cleanup job, which walks all users and channels a batch
+at a time from a position shared by all workers.
+
+Usage:
+    from core.social_counters import SocialCounters
+
+    social_counters = SocialCounters(db)
+
+    await db.user_follows.insert_one(follow)
+    await social_counters.followed(follower_id, target_id)
+
+    counts = await social_counters.user_counts(user_id)
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from .jobs import SharedCursor
+
+logger = logging.getLogger(__name__)
+
+USER_COUNTERS = ("friends_count", "followers_count", "following_count")
+CHANNEL_COUNTER = "subscribers_count"
+
+RECONCILE_BATCH = int(os.environ.get("SOCIAL_COUNTERS_RECONCILE_BATCH", 500))
+
+PROJECTION = {"_id": 0, "id": 1, CHANNEL_COUNTER: 1, **{field: 1 for field in USER_COUNTERS}}
+
+
+class SocialCounters:
+    """Maintains and repairs social counters on users and channels."""
+
+    def __init__(self, db, batch: int = RECONCILE_BATCH):
+        self.db = db
+        self.batch = batch
+        # Where the rolling reconciliation continues, shared by all workers
+        self._user_walk = SharedCursor(db, "social_counters:users", db.users, batch)
+        self._channel_walk = SharedCursor(db, "social_counters:channels", db.news_channels, batch)
+
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+
+    async def followed(self, follower_id: str, target_id: str, delta: int = 1) -> None:
+        """follower_id started (delta=1) or stopped (delta=-1) following target_id."""
+        await self.db.users.bulk_write([
+            UpdateOne({"id": follower_id}, {"$inc": {"following_count": delta}}),
+            UpdateOne({"id": target_id}, {"$inc": {"followers_count": delta}}),
+        ], ordered=False)
+
+    async def unfollowed(self, follower_id: str, target_id: str) -> None:
+        await self.followed(follower_id, target_id, delta=-1)
+
+    async def befriended(self, user_a: str, user_b: str, delta: int = 1) -> None:
+        """A friendship between user_a and user_b was created (1) or removed (-1)."""
+        await self.db.users.update_many({"id": {"$in": [user_a, user_b]}}, {"$inc": {"friends_count": delta}})
+
+    async def unfriended(self, user_a: str, user_b: str) -> None:
+        await self.befriended(user_a, user_b, delta=-1)
+
+    async def subscribed(self, channel_id: str, delta: int = 1) -> None:
+        """A subscription to channel_id was created (1) or removed (-1)."""
+        await self.db.news_channels.update_one({"id": channel_id}, {"$inc": {CHANNEL_COUNTER: delta}})
+
+    async def unsubscribed(self, channel_id: str) -> None:
+        await self.subscribed(channel_id, delta=-1)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    async def user_counts(self, user_id: str) -> Dict[str, int]:
+        """The stored counters of one user (zeros for unknown users)."""
+        doc = await self.db.users.find_one(
+            {"id": user_id}, {"_id": 0, **{field: 1 for field in USER_COUNTERS}}
+        )
+        return counts_of(doc)
+
+    # ------------------------------------------------------------------
+    # Reconciliation
+    # ------------------------------------------------------------------
+
+    async def reconcile_users(self, user_ids: Iterable[str]) -> int:
+        """Recompute the counters of user_ids; returns the number rewritten."""
+        users = await self.db.users.find(
+            {"id": {"$in": list(user_ids)}}, {"_id": 0, "id": 1, **{field: 1 for field in USER_COUNTERS}}
+        ).to_list(None)
+        return await self._repair_users(users)
+
+    async def reconcile_channels(self, channel_ids: Iterable[str]) -> int:
+        """Recompute the subscriber counts of channel_ids; returns the number rewritten."""
+        channels = await self.db.news_channels.find(
+            {"id": {"$in": list(channel_ids)}}, {"_id": 0, "id": 1, CHANNEL_COUNTER: 1}
+        ).to_list(None)
+        return await self._repair_channels(channels)
+
+    async def reconcile_missing(self) -> int:
+        """Fill counters on users and channels that have none; returns the number written."""
+        repaired = 0
+        for collection, field, repair in (
+            (self.db.users, "followers_count", self._repair_users),
+            (self.db.news_channels, CHANNEL_COUNTER, self._repair_channels),
+        ):
+            last_id = None
+            while True:
+                page, last_id = await self._page(collection, last_id, {field: {"$exists": False}})
+                repaired += await repair(page)
+                if last_id is None:
+                    break
+        if repaired:
+            logger.info(f"Filled social counters on {repaired} documents")
+        return repaired
+
+    async def reconcile_step(self) -> int:
+        """
+        Check the next batch of users and channels; returns the number rewritten.
+
+        The positions are stored in ``job_state`` (``core.jobs.SharedCursor``),
+        so the walk survives restarts and workers do not repeat each other's batches.
+        """
+        users = await self._user_walk.next_batch(PROJECTION)
+        channels = await self._channel_walk.next_batch(PROJECTION)
+        repaired = await self._repair_users(users) + await self._repair_channels(channels)
+        if repaired:
+            logger.info(f"Reconciled social counters on {repaired} documents")
+        return repaired
+
+    async def _page(self, collection, after: Optional[str], query: Optional[Dict[str, Any]] = None):
+        """One id-ordered batch after ``after`` and the cursor for the next (None at the end)."""
+        query = dict(query or {})
+        if after is not None:
+            query["$and"] = [{"id": {"$gt": after}}]
+        docs = await collection.find(query, PROJECTION).sort("id", 1).limit(self.batch).to_list(self.batch)
+        next_cursor = docs[-1]["id"] if len(docs) == self.batch else None
+        return docs, next_cursor
+
+    async def _repair_users(self, users: List[Dict[str, Any]]) -> int:
+        if not users:
+            return 0
+        actual = await self.actual_user_counts([u["id"] for u in users])
+        # Only if the counters are still the ones read: a $inc that landed
+        # after the recount is left alone (the next pass re-checks it)
+        updates = [
+            UpdateOne(
+                {"id": user["id"], **{field: user.get(field) for field in USER_COUNTERS}},
+                {"$set": actual[user["id"]]},
+            )
+            for user in users
+            if any(user.get(field) != actual[user["id"]][field] for field in USER_COUNTERS)
+        ]
+        if not updates:
+            return 0
+        result = await self.db.users.bulk_write(updates, ordered=False)
+        return result.modified_count
+
+    async def _repair_channels(self, channels: List[Dict[str, Any]]) -> int:
+        if not channels:
+            return 0
+        ids = [c["id"] for c in channels]
+        actual = await self._group_count(self.db.channel_subscriptions, {"channel_id": {"$in": ids}}, "$channel_id")
+        updates = [
+            UpdateOne(
+                {"id": channel["id"], CHANNEL_COUNTER: channel.get(CHANNEL_COUNTER)},
+                {"$set": {CHANNEL_COUNTER: actual.get(channel["id"], 0)}},
+            )
+            for channel in channels
+            if channel.get(CHANNEL_COUNTER) != actual.get(channel["id"], 0)
+        ]
+        if not updates:
+            return 0
+        result = await self.db.news_channels.bulk_write(updates, ordered=False)
+        return result.modified_count
+
+    async def actual_user_counts(self, user_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """Counters of user_ids computed from the relationship collections."""
+        as_user1, as_user2, followers, following = await asyncio.gather(
+            self._group_count(self.db.user_friendships, {"user1_id": {"$in": user_ids}}, "$user1_id"),
+            self._group_count(self.db.user_friendships, {"user2_id": {"$in": user_ids}}, "$user2_id"),
+            self._group_count(self.db.user_follows, {"target_id": {"$in": user_ids}}, "$target_id"),
+            self._group_count(self.db.user_follows, {"follower_id": {"$in": user_ids}}, "$follower_id"),
+        )
+        return {
+            user_id: {
+                "friends_count": as_user1.get(user_id, 0) + as_user2.get(user_id, 0),
+                "followers_count": followers.get(user_id, 0),
+                "following_count": following.get(user_id, 0),
+            }
+            for user_id in user_ids
+        }
+
+    @staticmethod
+    async def _group_count(collection, match: Dict[str, Any], key: str) -> Dict[str, int]:
+        rows = await collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": key, "n": {"$sum": 1}}},
+        ]).to_list(None)
+        return {row["_id"]: row["n"] for row in rows}
+
+
+def counts_of(user: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """The counter fields of a user document, defaulting to zero."""
+    return {field: max((user or {}).get(field) or 0, 0) for field in USER_COUNTERS}
@@ -0,0 +1,330 @@
+"""
+Friend Suggestions for ZION.CITY API
+====================================
+"People you may know" for ``/users/suggestions``, generated from the
+user's graph (mutual friends, organizations, schools, followers, city)
+and served from a ranked per-user ``user_suggestions`` list that the
+periodic job refreshes.
+
+Usage:
+    from core.suggestions import SuggestionEngine
+
+    suggestions = SuggestionEngine(db, org_graph)
+
+    cards, has_more = await suggestions.page(user_id, offset=0, limit=20)
+    await suggestions.drop(user_id, [target_id])     # request sent / followed
+    await suggestions.expire([user_a, user_b])        # friendship changed
+    await suggestions.refresh()                       # periodic job
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUGGESTIONS_TTL = int(os.environ.get("SUGGESTIONS_TTL", 6 * 3600))
+SUGGESTIONS_MAX_ITEMS = int(os.environ.get("SUGGESTIONS_MAX_ITEMS", 200))
+REFRESH_BATCH = int(os.environ.get("SUGGESTIONS_REFRESH_BATCH", 50))
+
+# Upper bounds on the rows read while generating candidates
+FRIEND_EDGES_SCAN = 20_000
+FOLLOWERS_SCAN = 2_000
+SAME_CITY_SCAN = 200
+
+SCORE_MUTUAL_FRIEND = 10
+SCORE_COLLEAGUE = 8
+SCORE_SCHOOL = 7
+SCORE_FOLLOWS_YOU = 6
+SCORE_SAME_CITY = 5
+SCORE_SAME_COUNTRY = 2
+
+SCHOOL_AFFILIATION_TYPES = ("SCHOOL", "UNIVERSITY")
+
+# Fields rendered on a suggestion card
+USER_CARD = {
+    "_id": 0, "id": 1, "first_name": 1, "last_name": 1, "middle_name": 1,
+    "profile_picture": 1, "avatar_url": 1, "address_city": 1, "address_country": 1,
+}
+LOCATION = {"_id": 0, "id": 1, "address_city": 1, "address_country": 1}
+
+# computed_at of an expired list: sorts before every real build
+EXPIRED = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+async def _resolved(value):
+    return value
+
+
+class _Candidate:
+    __slots__ = ("mutual", "colleague", "school", "follows_you")
+
+    def __init__(self):
+        self.mutual: Set[str] = set()
+        self.colleague = False
+        self.school = False
+        self.follows_you = False
+
+    def base_score(self) -> int:
+        return (
+            len(self.mutual) * SCORE_MUTUAL_FRIEND
+            + SCORE_COLLEAGUE * self.colleague
+            + SCORE_SCHOOL * self.school
+            + SCORE_FOLLOWS_YOU * self.follows_you
+        )
+
+
+class SuggestionEngine:
+    """Builds, stores and serves ranked per-user suggestion lists."""
+
+    def __init__(self, db, org_graph, ttl: int = SUGGESTIONS_TTL, max_items: int = SUGGESTIONS_MAX_ITEMS,
+                 relationship_sets=None):
+        self.db = db
+        self.org_graph = org_graph
+        self.relationship_sets = relationship_sets
+        self.ttl = ttl
+        self.max_items = max_items
+
+    # ------------------------------------------------------------------
+    # Serving
+    # ------------------------------------------------------------------
+
+    async def page(self, user_id: str, offset: int = 0, limit: int = 20) -> Tuple[List[Dict[str, Any]], bool]:
+        """One page of ranked suggestion cards and whether more follow."""
+        doc = await self.db.user_suggestions.find_one(
+            {"user_id": user_id}, {"_id": 0, "items": {"$slice": [offset, limit + 1]}}
+        )
+        if doc is None:
+            items = (await self.rebuild(user_id))[offset:offset + limit + 1]
+        else:
+            items = doc.get("items", [])
+        has_more = len(items) > limit
+        items = items[:limit]
+        if not items:
+            return [], has_more
+
+        users = await self.db.users.find(
+            {"id": {"$in": [item["user_id"] for item in items]}}, USER_CARD
+        ).to_list(len(items))
+        by_id = {user["id"]: user for user in users}
+        cards = []
+        for item in items:
+            user = by_id.get(item["user_id"])
+            if user is None:
+                continue  # deleted since the list was built
+            cards.append({
+                **user,
+                "score": item["score"],
+                "mutual_friends_count": item["mutual_friends_count"],
+                "suggestion_reasons": item["reasons"],
+            })
+        return cards, has_more
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    async def drop(self, user_id: str, candidate_ids: Iterable[str]) -> None:
+        """Remove candidates from user_id's list (request sent, followed)."""
+        candidate_ids = list(candidate_ids)
+        if candidate_ids:
+            await self.db.user_suggestions.update_one(
+                {"user_id": user_id}, {"$pull": {"items": {"user_id": {"$in": candidate_ids}}}}
+            )
+
+    async def expire(self, user_ids: Iterable[str]) -> None:
+        """Queue the lists of user_ids for the next refresh."""
+        user_ids = list(user_ids)
+        if user_ids:
+            await self.db.user_suggestions.update_many(
+                {"user_id": {"$in": user_ids}}, {"$set": {"computed_at": EXPIRED}}
+            )
+
+    async def refresh(self, limit: int = REFRESH_BATCH) -> int:
+        """Rebuild up to limit expired or outdated lists, oldest first; returns the count."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        due = await self.db.user_suggestions.find(
+            {"computed_at": {"$lt": cutoff}}, {"_id": 0, "user_id": 1, "computed_at": 1}
+        ).sort("computed_at", 1).limit(limit).to_list(limit)
+        rebuilt = 0
+        for doc in due:
+            # Claim the list so other workers running the same job skip it
+            claimed = await self.db.user_suggestions.update_one(
+                {"user_id": doc["user_id"], "computed_at": doc["computed_at"]},
+                {"$set": {"computed_at": datetime.now(timezone.utc)}},
+            )
+            if not claimed.modified_count:
+                continue
+            try:
+                await self.rebuild(doc["user_id"])
+                rebuilt += 1
+            except Exception as e:
+                logger.error(f"Suggestion refresh failed for {doc['user_id']}: {e}")
+        return rebuilt
+
+    async def rebuild(self, user_id: str) -> List[Dict[str, Any]]:
+        """Generate, rank and store user_id's list; returns the stored items."""
+        items = await self.build(user_id)
+        await self.db.user_suggestions.update_one(
+            {"user_id": user_id},
+            {"$set": {"items": items, "computed_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        return items
+
+    # ------------------------------------------------------------------
+    # Candidate generation
+    # ------------------------------------------------------------------
+
+    async def build(self, user_id: str) -> List[Dict[str, Any]]:
+        """Ranked suggestion items for user_id (not stored)."""
+        db = self.db
+        me, friend_ids, following, pending, followers, org_tokens, children = await asyncio.gather(
+            db.users.find_one({"id": user_id}, LOCATION),
+            self._friend_ids(user_id),
+            self._following_ids(user_id),
+            db.friend_requests.find(
+                {"$or": [
+                    {"sender_id": user_id, "status": "PENDING"},
+                    {"receiver_id": user_id, "status": "PENDING"},
+                ]},
+                {"_id": 0, "sender_id": 1, "receiver_id": 1},
+            ).to_list(None),
+            db.user_follows.find({"target_id": user_id}, {"_id": 0, "follower_id": 1}).to_list(FOLLOWERS_SCAN),
+            self.org_graph.organizations(user_id),
+            db.family_students.find({"parent_ids": user_id}, {"_id": 0, "organization_id": 1}).to_list(50),
+        )
+        me = me or {}
+        exclude = (
+            friend_ids
+            | following
+            | {r["sender_id"] for r in pending}
+            | {r["receiver_id"] for r in pending}
+            | {user_id}
+        )
+        school_ids = list({c["organization_id"] for c in children if c.get("organization_id")})
+        affiliation_ids = [t.split(":", 1)[1] for t in org_tokens if t.startswith("affiliation:")]
+        city = me.get("address_city")
+
+        edges, members, affiliations, co_parents, neighbours = await asyncio.gather(
+            db.user_friendships.find(
+                {"$or": [{"user1_id": {"$in": list(friend_ids)}}, {"user2_id": {"$in": list(friend_ids)}}]},
+                {"_id": 0, "user1_id": 1, "user2_id": 1},
+            ).to_list(FRIEND_EDGES_SCAN) if friend_ids else _resolved([]),
+            self.org_graph.members(org_tokens) if org_tokens else _resolved({}),
+            db.affiliations.find(
+                {"id": {"$in": affiliation_ids}}, {"_id": 0, "id": 1, "type": 1}
+            ).to_list(len(affiliation_ids)) if affiliation_ids else _resolved([]),
+            db.family_students.find(
+                {"organization_id": {"$in": school_ids}}, {"_id": 0, "parent_ids": 1}
+            ).to_list(None) if school_ids else _resolved([]),
+            db.users.find(
+                {"address_city": city, "id": {"$nin": list(exclude)}}, LOCATION
+            ).limit(SAME_CITY_SCAN).to_list(SAME_CITY_SCAN) if city else _resolved([]),
+        )
+
+        candidates: Dict[str, _Candidate] = {}
+
+        def candidate(other_id: Optional[str]) -> Optional[_Candidate]:
+            if not other_id or other_id in exclude:
+                return None
+            return candidates.setdefault(other_id, _Candidate())
+
+        for edge in edges:
+            a, b = edge["user1_id"], edge["user2_id"]
+            friend, other = (a, b) if a in friend_ids else (b, a)
+            found = candidate(other)
+            if found is not None:
+                found.mutual.add(friend)
+
+        school_affiliations = {a["id"] for a in affiliations if a.get("type") in SCHOOL_AFFILIATION_TYPES}
+        for token, member_ids in members.items():
+            source, org_id = token.split(":", 1)
+            school = source == "affiliation" and org_id in school_affiliations
+            for member_id in member_ids:
+                found = candidate(member_id)
+                if found is not None:
+                    if school:
+                        found.school = True
+                    else:
+                        found.colleague = True
+
+        for student in co_parents:
+            for parent_id in student.get("parent_ids", []):
+                found = candidate(parent_id)
+                if found is not None:
+                    found.school = True
+
+        for follow in followers:
+            found = candidate(follow["follower_id"])
+            if found is not None:
+                found.follows_you = True
+
+        locations = {user["id"]: user for user in neighbours}
+        for neighbour_id in locations:
+            candidate(neighbour_id)
+
+        # Location only adds a few points, so it is looked up for the best
+        # candidates by graph score rather than for every candidate
+        pool = sorted(candidates, key=lambda c: candidates[c].base_score(), reverse=True)[:self.max_items * 2]
+        unknown = [c for c in pool if c not in locations]
+        if unknown:
+            for user in await db.users.find({"id": {"$in": unknown}}, LOCATION).to_list(len(unknown)):
+                locations[user["id"]] = user
+
+        items = []
+        for candidate_id in pool:
+            location = locations.get(candidate_id)
+            if location is None:
+                continue  # no such user
+            items.append(self._rank(candidates[candidate_id], candidate_id, location, me))
+        items.sort(key=lambda item: (-item["score"], -item["mutual_friends_count"], item["user_id"]))
+        return items[:self.max_items]
+
+    async def _friend_ids(self, user_id: str) -> Set[str]:
+        if self.relationship_sets is not None:
+            return set(await self.relationship_sets.friends(user_id))
+        friendships = await self.db.user_friendships.find(
+            {"$or": [{"user1_id": user_id}, {"user2_id": user_id}]},
+            {"_id": 0, "user1_id": 1, "user2_id": 1},
+        ).to_list(None)
+        return {f["user2_id"] if f["user1_id"] == user_id else f["user1_id"] for f in friendships}
+
+    async def _following_ids(self, user_id: str) -> Set[str]:
+        if self.relationship_sets is not None:
+            return set(await self.relationship_sets.following(user_id))
+        return set(await self.db.user_follows.distinct("target_id", {"follower_id": user_id}))
+
+    @staticmethod
+    def _rank(found: _Candidate, candidate_id: str, location: Dict[str, Any], me: Dict[str, Any]) -> Dict[str, Any]:
+        score = found.base_score()
+        reasons = []
+        mutual_count = len(found.mutual)
+        if mutual_count == 1:
+            reasons.append("1 общий друг")
+        elif mutual_count > 1:
+            reasons.append(f"{mutual_count} общих друзей")
+
+        city, country = me.get("address_city"), me.get("address_country")
+        if city and location.get("address_city") == city:
+            score += SCORE_SAME_CITY
+            reasons.append(f"Живёт в {city}")
+        elif country and location.get("address_country") == country:
+            score += SCORE_SAME_COUNTRY
+            reasons.append(f"Из {country}")
+
+        if found.colleague:
+            reasons.append("Коллега")
+        if found.school:
+            reasons.append("Из той же школы")
+        if found.follows_you:
+            reasons.append("Подписан на вас")
+
+        return {
+            "user_id": candidate_id,
+            "score": score,
+            "mutual_friends_count": mutual_count,
+            "reasons": reasons[:3],
+        }
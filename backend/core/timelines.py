@@ -0,0 +1,355 @@
+"""
+News Timelines for ZION.CITY API
+================================
+Fan-out-on-write home timelines for ``/news/posts/feed``: each news post
+is written into its audience's ``news_timelines`` entries, and a feed page
+is one indexed range scan plus one ``$in`` fetch of the posts. Channel
+posts and high-follower authors are pulled at read time instead.
+
+Usage:
+    from core.timelines import NewsTimelines
+
+    news_timelines = NewsTimelines(db, cache)
+
+    await news_timelines.publish(post.model_dump())               # create
+    await news_timelines.refresh_connection(follower_id, author_id)  # (un)follow
+    posts, next_cursor = await news_timelines.read(user_id, limit=20, cursor=cursor)
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from .counting import Count, CountMode
+from .pagination import Keyset
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_MAX = int(os.environ.get("NEWS_TIMELINE_MAX", 800))
+FANOUT_MAX_AUDIENCE = int(os.environ.get("NEWS_FANOUT_MAX_AUDIENCE", 5000))
+BACKFILL_POSTS = int(os.environ.get("NEWS_TIMELINE_BACKFILL", 200))
+FANOUT_BATCH = 1000
+
+FRIEND_VISIBILITIES = ["PUBLIC", "FRIENDS_AND_FOLLOWERS", "FRIENDS_ONLY"]
+FOLLOWER_VISIBILITIES = ["PUBLIC", "FRIENDS_AND_FOLLOWERS"]
+
+# Timeline entries and posts share one cursor: (created_at, post id)
+TIMELINE_ORDER = Keyset("created_at", -1, id_field="post_id")
+POST_ORDER = Keyset("created_at", -1)
+
+PULL_AUTHORS_CACHE_KEY = "news:pull_authors"
+
+
+def _value(visibility: Any) -> Optional[str]:
+    return getattr(visibility, "value", visibility)
+
+
+class NewsTimelines:
+    """Materialized news timelines with a pull path for channels and large audiences."""
+
+    def __init__(
+        self,
+        db,
+        cache=None,
+        max_length: int = TIMELINE_MAX,
+        max_audience: int = FANOUT_MAX_AUDIENCE,
+        backfill: int = BACKFILL_POSTS,
+        journal=None,
+        relationship_sets=None,
+    ):
+        self.db = db
+        self.cache = cache
+        self.journal = journal
+        self.relationship_sets = relationship_sets
+        self.max_length = max_length
+        self.max_audience = max_audience
+        self.backfill = backfill
+        self._dirty: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    # ============================================================
+    # Relationships
+    # ============================================================
+
+    async def friend_ids(self, user_id: str) -> Set[str]:
+        if self.relationship_sets is not None:
+            return set(await self.relationship_sets.friends(user_id))
+        friendships = await self.db.user_friendships.find(
+            {"$or": [{"user1_id": user_id}, {"user2_id": user_id}]},
+            {"_id": 0, "user1_id": 1, "user2_id": 1},
+        ).to_list(None)
+        return {f["user2_id"] if f["user1_id"] == user_id else f["user1_id"] for f in friendships}
+
+    async def follower_ids(self, user_id: str) -> Set[str]:
+        follows = await self.db.user_follows.find({"target_id": user_id}, {"_id": 0, "follower_id": 1}).to_list(None)
+        return {f["follower_id"] for f in follows}
+
+    async def following_ids(self, user_id: str) -> Set[str]:
+        if self.relationship_sets is not None:
+            return set(await self.relationship_sets.following(user_id))
+        follows = await self.db.user_follows.find({"follower_id": user_id}, {"_id": 0, "target_id": 1}).to_list(None)
+        return {f["target_id"] for f in follows}
+
+    async def channel_ids(self, user_id: str) -> List[str]:
+        if self.relationship_sets is not None:
+            return (await self.relationship_sets.channels(user_id)).as_list()
+        return await self.db.channel_subscriptions.distinct("channel_id", {"subscriber_id": user_id})
+
+    async def pull_authors(self) -> Set[str]:
+        """Authors whose posts are read at query time rather than fanned out."""
+        async def load():
+            return await self.db.news_timeline_pull_authors.distinct("id")
+
+        if self.cache is None:
+            return set(await load())
+        return set(await self.cache.get_or_set(PULL_AUTHORS_CACHE_KEY, load, ttl=60))
+
+    async def _visibilities(self, owner_id: str, author_id: str) -> Optional[List[str]]:
+        """Visibilities of author's posts that owner may see, or None."""
+        low, high = min(owner_id, author_id), max(owner_id, author_id)
+        if await self.db.user_friendships.find_one({"user1_id": low, "user2_id": high}):
+            return FRIEND_VISIBILITIES
+        if await self.db.user_follows.find_one({"follower_id": owner_id, "target_id": author_id}):
+            return FOLLOWER_VISIBILITIES
+        return None
+
+    # ============================================================
+    # Write path
+    # ============================================================
+
+    async def publish(self, post: Dict[str, Any], wait: bool = False) -> None:
+        """
+        Add a new post to its author's timeline and fan it out.
+
+        The author's own entry is written before returning (so they see
+        their post immediately); the fan-out runs in the background unless
+        ``wait`` is set.
+        """
+        await self._insert([post["user_id"]], [post])
+        if wait:
+            await self.fan_out(post)
+            return
+        task = asyncio.create_task(self._fan_out_logged(post))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fan_out_logged(self, post: Dict[str, Any]) -> None:
+        try:
+            await self.fan_out(post)
+        except Exception as e:
+            logger.error(f"Timeline fan-out failed for post {post.get('id')}: {e}")
+
+    async def fan_out(self, post: Dict[str, Any]) -> int:
+        """Write the post into its audience's timelines; returns the audience size written."""
+        author_id = post["user_id"]
+        if author_id in await self.pull_authors():
+            return 0
+
+        audience = await self.friend_ids(author_id)
+        if _value(post.get("visibility")) != "FRIENDS_ONLY":
+            audience |= await self.follower_ids(author_id)
+        audience.discard(author_id)
+
+        if len(audience) > self.max_audience:
+            await self._mark_pull_author(author_id, len(audience))
+            return 0
+
+        await self._insert(audience, [post])
+        if self.journal is not None:
+            await self.journal.record(audience, "feed", post["id"], {"author_id": author_id})
+        return len(audience)
+
+    async def _mark_pull_author(self, author_id: str, audience: int) -> None:
+        await self.db.news_timeline_pull_authors.update_one(
+            {"id": author_id},
+            {"$set": {"audience": audience, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        if self.cache is not None:
+            await self.cache.invalidate(PULL_AUTHORS_CACHE_KEY)
+        # Followers pull this author from now on; their pushed entries are redundant
+        await self.db.news_timelines.delete_many({"author_id": author_id, "owner_id": {"$ne": author_id}})
+        logger.info(f"News author {author_id} switched to pull timelines ({audience} recipients)")
+
+    async def retract(self, post_id: str) -> None:
+        """Remove a deleted (or re-scoped) post from every timeline."""
+        await self.db.news_timelines.delete_many({"post_id": post_id})
+
+    async def refresh_connection(self, owner_id: str, author_id: str) -> None:
+        """
+        Re-derive owner's entries from author after a follow or friendship change.
+
+        Entries are dropped, then the author's most recent posts that the
+        owner may still see are backfilled.
+        """
+        await self.db.news_timelines.delete_many({"owner_id": owner_id, "author_id": author_id})
+        if author_id in await self.pull_authors():
+            return
+        visibilities = await self._visibilities(owner_id, author_id)
+        if not visibilities:
+            return
+        posts = await self.db.news_posts.find(
+            {"user_id": author_id, "is_active": True, "visibility": {"$in": visibilities}},
+            {"_id": 0, "id": 1, "user_id": 1, "created_at": 1},
+        ).sort(POST_ORDER.sort).limit(self.backfill).to_list(self.backfill)
+        await self._insert([owner_id], posts)
+
+    async def _insert(self, owner_ids: Iterable[str], posts: List[Dict[str, Any]]) -> None:
+        entries = [
+            {"owner_id": owner_id, "post_id": post["id"], "author_id": post["user_id"], "created_at": post["created_at"]}
+            for owner_id in owner_ids
+            for post in posts
+        ]
+        for start in range(0, len(entries), FANOUT_BATCH):
+            batch = entries[start:start + FANOUT_BATCH]
+            try:
+                await self.db.news_timelines.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Duplicate (owner_id, post_id) entries are expected on re-publish/backfill
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+            self._dirty.update(entry["owner_id"] for entry in batch)
+
+    async def trim(self, owner_ids: Optional[Iterable[str]] = None) -> int:
+        """Trim timelines to max_length entries (by default, those written since the last trim)."""
+        if owner_ids is None:
+            owner_ids, self._dirty = self._dirty, set()
+        trimmed = 0
+        for owner_id in owner_ids:
+            last_kept = await self.db.news_timelines.find(
+                {"owner_id": owner_id}, {"_id": 0, "post_id": 1, "created_at": 1}
+            ).sort(TIMELINE_ORDER.sort).skip(self.max_length - 1).limit(1).to_list(1)
+            if last_kept:
+                result = await self.db.news_timelines.delete_many(
+                    TIMELINE_ORDER.after({"owner_id": owner_id}, TIMELINE_ORDER.encode(last_kept[0]))
+                )
+                if result.deleted_count:
+                    trimmed += result.deleted_count
+                    await self._set_state(owner_id, trimmed=True)
+        return trimmed
+
+    async def rebuild(self, user_id: str) -> bool:
+        """Materialize a timeline from the network query; returns whether it was truncated."""
+        posts = await self.db.news_posts.find(
+            await self.network_query(user_id), {"_id": 0, "id": 1, "user_id": 1, "created_at": 1}
+        ).sort(POST_ORDER.sort).limit(self.max_length).to_list(self.max_length)
+        await self._insert([user_id], posts)
+        truncated = len(posts) >= self.max_length
+        await self._set_state(user_id, built_at=datetime.now(timezone.utc), trimmed=truncated)
+        return truncated
+
+    async def _set_state(self, owner_id: str, **fields) -> None:
+        await self.db.news_timeline_states.update_one({"owner_id": owner_id}, {"$set": fields}, upsert=True)
+
+    # ============================================================
+    # Read path
+    # ============================================================
+
+    async def network_query(self, user_id: str) -> Dict[str, Any]:
+        """The full (pull-everything) feed query for a user."""
+        friend_ids, following_ids, channel_ids = await asyncio.gather(
+            self.friend_ids(user_id), self.following_ids(user_id), self.channel_ids(user_id)
+        )
+        network_ids = list(friend_ids | following_ids)
+        return {
+            "is_active": True,
+            "$or": [
+                {"user_id": user_id},
+                {"visibility": {"$in": FOLLOWER_VISIBILITIES}, "user_id": {"$in": network_ids}},
+                {"visibility": "FRIENDS_ONLY", "user_id": {"$in": list(friend_ids)}},
+                {"channel_id": {"$in": channel_ids}},
+            ],
+        }
+
+    async def _pull_query(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Query for the sources merged at read time (channels, pull authors), or None."""
+        channel_ids, pulled = await asyncio.gather(self.channel_ids(user_id), self.pull_authors())
+        branches: List[Dict[str, Any]] = []
+        if channel_ids:
+            branches.append({"channel_id": {"$in": channel_ids}})
+        pulled.discard(user_id)
+        friends: Set[str] = set()
+        followed: Set[str] = set()
+        if pulled and self.relationship_sets is not None:
+            friend_ids, following_ids = await asyncio.gather(
+                self.relationship_sets.friends(user_id), self.relationship_sets.following(user_id)
+            )
+            friends = friend_ids & pulled
+            followed = (following_ids & pulled) - friends
+        elif pulled:
+            pulled_list = list(pulled)
+            friendships, follows = await asyncio.gather(
+                self.db.user_friendships.find({"$or": [
+                    {"user1_id": user_id, "user2_id": {"$in": pulled_list}},
+                    {"user2_id": user_id, "user1_id": {"$in": pulled_list}},
+                ]}, {"_id": 0, "user1_id": 1, "user2_id": 1}).to_list(None),
+                self.db.user_follows.distinct("target_id", {"follower_id": user_id, "target_id": {"$in": pulled_list}}),
+            )
+            friends = {f["user2_id"] if f["user1_id"] == user_id else f["user1_id"] for f in friendships}
+            followed = set(follows) - friends
+        if friends:
+            branches.append({"user_id": {"$in": list(friends)}, "visibility": {"$in": FRIEND_VISIBILITIES}})
+        if followed:
+            branches.append({"user_id": {"$in": list(followed)}, "visibility": {"$in": FOLLOWER_VISIBILITIES}})
+        if not branches:
+            return None
+        return {"is_active": True, "$or": branches}
+
+    async def read(
+        self, user_id: str, limit: int, cursor: Optional[str] = None, offset: int = 0
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Return one feed page (newest first) and the cursor of the next page.
+
+        ``offset`` is honoured for older clients by over-fetching; prefer
+        ``cursor``.
+        """
+        state = await self.db.news_timeline_states.find_one({"owner_id": user_id})
+        trimmed = await self.rebuild(user_id) if state is None else state.get("trimmed", False)
+
+        want = offset + limit + 1
+        entries = await self.db.news_timelines.find(
+            TIMELINE_ORDER.after({"owner_id": user_id}, cursor), {"_id": 0, "post_id": 1, "created_at": 1}
+        ).sort(TIMELINE_ORDER.sort).limit(want).to_list(want)
+        post_ids = [e["post_id"] for e in entries]
+
+        posts: List[Dict[str, Any]] = []
+        if post_ids:
+            posts = await self.db.news_posts.find(
+                {"id": {"$in": post_ids}, "is_active": True}, {"_id": 0}
+            ).to_list(len(post_ids))
+
+        pull_query = await self._pull_query(user_id)
+        if pull_query is not None:
+            posts += await self.db.news_posts.find(
+                POST_ORDER.after(pull_query, cursor), {"_id": 0}
+            ).sort(POST_ORDER.sort).limit(want).to_list(want)
+
+        if trimmed and len(entries) < want:
+            # Older entries were trimmed: continue from the full network
+            # query after the timeline's last entry
+            floor = TIMELINE_ORDER.encode(entries[-1]) if entries else cursor
+            remaining = want - len(entries)
+            posts += await self.db.news_posts.find(
+                POST_ORDER.after(await self.network_query(user_id), floor), {"_id": 0}
+            ).sort(POST_ORDER.sort).limit(remaining).to_list(remaining)
+
+        unique = {p["id"]: p for p in posts}
+        ordered = sorted(unique.values(), key=lambda p: (p["created_at"], p["id"]), reverse=True)
+        return POST_ORDER.page(ordered[offset:offset + limit + 1], limit)
+
+    async def count(self, user_id: str, mode: CountMode, counter) -> Count:
+        """
+        Feed total. Exact and cached counts run the full network query; the
+        default capped count only counts the user's timeline entries, which
+        is a lower bound (hence never reported as exact).
+        """
+        mode = CountMode(mode)
+        if mode in (CountMode.EXACT, CountMode.CACHED):
+            return await counter.count(self.db.news_posts, await self.network_query(user_id), mode)
+        counted = await counter.count(self.db.news_timelines, {"owner_id": user_id}, mode)
+        return Count(counted.value, False)
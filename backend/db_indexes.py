@@ -0,0 +1,299 @@
+"""
+ZION.CITY Database Indexes
+==========================
+Every MongoDB index the API relies on, declared in one place, plus the hot
+queries that must never fall back to a collection scan.
+
+The server reconciles ``INDEXES`` in the background at startup (missing
+indexes are created; only indexes marked with ``retire`` are dropped, once
+the index superseding them exists). Indexes that existed before the
+registry keep MongoDB's default names so reconciliation recognises them.
+
+Usage:
+    # Create missing indexes on the configured database
+    python db_indexes.py reconcile
+
+    # Seed a scratch database, build the indexes and fail on any COLLSCAN
+    python db_indexes.py check --mongo-url mongodb://localhost:27017
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+
+from core.indexes import HotQuery, IndexRegistry, find_collscans, reconcile_indexes, sample_document
+
+INDEXES = IndexRegistry()
+index = INDEXES.add
+retire = INDEXES.retire
+
+# ============================================================
+# Users and authentication
+# ============================================================
+index("users", "id", unique=True)
+index("users", "email", unique=True)
+# Multikey prefix keys for people search (core/people_search.py)
+index("users", "search_keys")
+index("password_reset_tokens", "token")
+index("password_reset_tokens", "user_id")
+index("password_reset_tokens", "expires_at", ttl=0)
+index("email_verification_tokens", "token")
+index("email_verification_tokens", "user_id")
+index("email_verification_tokens", "expires_at", ttl=0)
+
+# ============================================================
+# Posts, notifications, agent
+# ============================================================
+index("posts", [("created_at", -1)])
+# Keyset pagination sorts on (created_at, id); the id suffix lets the index
+# deliver that order directly instead of an in-memory sort of the remainder.
+# It also serves every query the (user_id, created_at) prefix index did.
+index("posts", [("user_id", 1), ("created_at", -1), ("id", -1)])
+retire("posts", [("user_id", 1), ("created_at", -1)], superseded_by=[("user_id", 1), ("created_at", -1), ("id", -1)])
+index("posts", [("family_id", 1), ("created_at", -1), ("id", -1)])
+# Multikey index on visibility facets (core/audience.py) for the feed's
+# "own post OR audience $in viewer tokens" branch
+index("posts", [("audience", 1), ("created_at", -1), ("id", -1)])
+index("post_likes", [("post_id", 1), ("user_id", 1)])
+# One reaction per user and post; existing duplicates are removed (and the
+# index rebuilt) by the post_reactions_unique migration in core/post_counters.py
+index("post_reactions", [("post_id", 1), ("user_id", 1)], unique=True)
+index("notifications", [("user_id", 1), ("is_read", 1), ("created_at", -1)])
+index("notifications", [("user_id", 1), ("read", 1), ("created_at", -1)])
+index("notifications", [("user_id", 1), ("created_at", -1), ("id", -1)])
+index("agent_conversations", [("user_id", 1), ("updated_at", -1)])
+# Migration markers and shared job cursors (core/jobs.py)
+index("job_state", "id", unique=True)
+# Per-user change journal behind /api/sync (core/journal.py)
+index("sync_journal", "user_id", unique=True)
+# Cached link previews (core/link_preview.py), dropped by MongoDB when stale
+index("link_previews", "key", unique=True)
+index("link_previews", "expires_at", ttl=0)
+
+# ============================================================
+# Family
+# ============================================================
+index("family_members", [("user_id", 1), ("is_active", 1)])
+index("family_members", [("family_id", 1), ("is_active", 1)])
+index("family_profiles", [("creator_id", 1)])
+index("family_subscriptions", [("subscriber_family_id", 1), ("is_active", 1)])
+index("family_subscriptions", [("target_family_id", 1), ("is_active", 1)])
+# Materialized connection sets (core/family_graph.py)
+index("family_connections", "user_id", unique=True)
+
+# ============================================================
+# Chat
+# ============================================================
+index("chat_messages", "id")
+index("chat_messages", [("group_id", 1), ("created_at", -1)])
+index("chat_messages", [("direct_chat_id", 1), ("created_at", -1), ("id", -1)])
+index("chat_messages", [("direct_chat_id", 1), ("status", 1), ("user_id", 1)])
+index("direct_chats", [("participant_ids", 1), ("is_active", 1)])
+# Typing indicators are only read within seconds of being written
+index("typing_status", [("chat_id", 1), ("chat_type", 1), ("user_id", 1)])
+index("typing_status", "updated_at", ttl=3600)
+
+# ============================================================
+# News
+# ============================================================
+index("user_friendships", [("user1_id", 1)])
+index("user_friendships", [("user2_id", 1)])
+index("user_friendships", [("user1_id", 1), ("user2_id", 1)], unique=True)
+index("user_follows", [("follower_id", 1)])
+index("user_follows", [("target_id", 1)])
+index("user_follows", [("follower_id", 1), ("target_id", 1)], unique=True)
+index("friend_requests", [("sender_id", 1), ("status", 1)])
+index("friend_requests", [("receiver_id", 1), ("status", 1)])
+# Materialized friend suggestions (core/suggestions.py) and their candidate sources
+index("user_suggestions", "user_id", unique=True)
+index("user_suggestions", "computed_at")
+index("family_students", "parent_ids")
+index("family_students", "organization_id")
+index("users", "address_city")
+index("channel_subscriptions", [("subscriber_id", 1)])
+index("channel_subscriptions", [("channel_id", 1)])
+index("news_channels", "owner_id")
+index("news_posts", [("created_at", -1)])
+index("news_posts", [("channel_id", 1), ("created_at", -1)])
+index("news_posts", [("visibility", 1), ("user_id", 1), ("created_at", -1)])
+index("news_posts", [("user_id", 1), ("created_at", -1), ("id", -1)])
+retire("news_posts", [("user_id", 1), ("created_at", -1)], superseded_by=[("user_id", 1), ("created_at", -1), ("id", -1)])
+index("news_posts", [("channel_id", 1), ("created_at", -1), ("id", -1)])
+index("news_post_likes", [("post_id", 1), ("user_id", 1)], unique=True)
+index("news_post_comments", [("post_id", 1), ("is_deleted", 1), ("created_at", 1)])
+# Materialized home timelines (core/timelines.py)
+index("news_timelines", [("owner_id", 1), ("created_at", -1), ("post_id", -1)])
+index("news_timelines", [("owner_id", 1), ("post_id", 1)], unique=True)
+index("news_timelines", [("owner_id", 1), ("author_id", 1)])
+index("news_timelines", "post_id")
+index("news_timelines", "author_id")
+index("news_timeline_states", "owner_id", unique=True)
+index("news_timeline_pull_authors", "id", unique=True)
+
+# ============================================================
+# Work
+# ============================================================
+index("work_organizations", "id")
+index("work_members", [("organization_id", 1), ("status", 1), ("user_id", 1)])
+index("work_members", [("organization_id", 1), ("is_active", 1), ("user_id", 1)])
+index("work_members", [("user_id", 1), ("status", 1)])
+index("work_members", [("user_id", 1), ("is_active", 1)])
+index("user_affiliations", [("user_id", 1), ("is_active", 1)])
+index("user_affiliations", [("affiliation_id", 1), ("is_active", 1), ("user_id", 1)])
+index("work_join_requests", [("organization_id", 1), ("status", 1), ("user_id", 1)])
+index("work_tasks", "id")
+index("work_tasks", [("organization_id", 1), ("created_at", -1)])
+index("work_tasks", [("assigned_to", 1), ("deadline", 1)])
+index("work_tasks", [("accepted_by", 1), ("deadline", 1)])
+index("work_tasks", [("created_by", 1), ("deadline", 1)])
+index("work_posts", [("organization_id", 1), ("created_at", -1), ("id", -1)])
+index("work_notifications", [("user_id", 1), ("is_read", 1), ("created_at", -1)])
+index("work_notifications", [("user_id", 1), ("id", 1)])
+index("departments", "organization_id")
+
+# ============================================================
+# Education
+# ============================================================
+index("work_students", [("organization_id", 1), ("grade", 1), ("assigned_class", 1)])
+index("work_students", "parent_ids")
+index("student_grades", [("student_id", 1), ("organization_id", 1), ("date", -1)])
+index("class_schedules", [("organization_id", 1), ("grade", 1), ("assigned_class", 1)])
+
+# ============================================================
+# Finance
+# ============================================================
+index("transactions", "id")
+index("transactions", [("from_user_id", 1), ("created_at", -1), ("id", -1)])
+index("transactions", [("to_user_id", 1), ("created_at", -1), ("id", -1)])
+index("transactions", [("from_wallet_id", 1), ("created_at", -1)])
+index("transactions", [("to_wallet_id", 1), ("created_at", -1)])
+index("transactions", [("asset_type", 1), ("created_at", -1)])
+
+# ============================================================
+# Services and marketplace
+# ============================================================
+index("service_listings", "id")
+index("service_listings", "organization_id")
+index("service_listings", [("location", "2dsphere")])
+# Catalogue queries always filter on the active status; partial indexes skip
+# drafts and archived listings entirely.
+index("service_listings", [("rating", -1)], partial={"status": "ACTIVE"}, name="active_rating")
+index("service_listings", [("category_id", 1), ("rating", -1)], partial={"status": "ACTIVE"}, name="active_category_rating")
+index("marketplace_products", "id")
+index("marketplace_products", "seller_id")
+index("marketplace_products", [("status", 1), ("created_at", -1)])
+index("marketplace_products", [("category", 1), ("created_at", -1)], partial={"status": "active"}, name="active_category_created_at")
+
+# ============================================================
+# Goodwill
+# ============================================================
+index("goodwill_events", "id")
+index("goodwill_events", [("status", 1), ("start_date", 1)])
+index("goodwill_events", [("status", 1), ("start_date", 1), ("id", 1)])
+index("goodwill_events", [("organizer_profile_id", 1), ("start_date", 1)])
+index("goodwill_events", "checkin_code", sparse=True)
+index("event_attendees", [("event_id", 1), ("user_id", 1)])
+index("event_attendees", [("event_id", 1), ("status", 1)])
+index("event_attendees", [("user_id", 1), ("status", 1)])
+
+# ============================================================
+# Media
+# ============================================================
+index("media_files", "id")
+index("media_files", "uploaded_by")
+
+
+# ============================================================
+# Hot queries (must be served by an index)
+# ============================================================
+_NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+HOT_QUERIES = [
+    HotQuery("notifications list", "notifications", {"user_id": "u1"}, (("created_at", -1), ("id", -1))),
+    HotQuery("password reset lookup", "password_reset_tokens", {"token": "t", "used": False, "expires_at": {"$gt": _NOW}}),
+    HotQuery("direct chat messages", "chat_messages",
+             {"direct_chat_id": "c1", "is_deleted": False}, (("created_at", -1), ("id", -1))),
+    HotQuery("direct chat mark read", "chat_messages", {"direct_chat_id": "c1", "user_id": {"$ne": "u1"}, "status": "sent"}),
+    HotQuery("group chat messages", "chat_messages", {"group_id": "g1"}, (("created_at", -1),)),
+    HotQuery("typing status", "typing_status",
+             {"chat_id": "c1", "chat_type": "direct", "is_typing": True, "updated_at": {"$gte": _NOW}}),
+    HotQuery("family feed", "posts",
+             {"is_published": True, "source_module": "family", "family_id": "f1",
+              "$or": [{"user_id": "u1"}, {"audience": {"$in": ["public", "family:f1", "family:f1:PARENT"]}}]},
+             (("created_at", -1), ("id", -1))),
+    HotQuery("news feed by author", "news_posts", {"user_id": {"$in": ["u1", "u2"]}}, (("created_at", -1), ("id", -1))),
+    HotQuery("news timeline page", "news_timelines", {"owner_id": "u1"}, (("created_at", -1), ("post_id", -1))),
+    HotQuery("work feed", "work_posts", {"organization_id": {"$in": ["o1", "o2"]}}, (("created_at", -1), ("id", -1))),
+    HotQuery("organization members", "work_members", {"organization_id": "o1", "status": "ACTIVE"}),
+    HotQuery("user memberships", "work_members", {"user_id": "u1", "status": "ACTIVE"}),
+    HotQuery("organization tasks", "work_tasks",
+             {"organization_id": "o1", "is_deleted": {"$ne": True}}, (("created_at", -1),)),
+    HotQuery("my tasks", "work_tasks",
+             {"$or": [{"assigned_to": "u1"}, {"accepted_by": "u1"}, {"created_by": "u1"}]}, (("deadline", 1),)),
+    HotQuery("work notifications", "work_notifications", {"user_id": "u1", "is_read": False}, (("created_at", -1),)),
+    HotQuery("student grades", "student_grades",
+             {"organization_id": "o1", "student_id": {"$in": ["s1", "s2"]}}, (("date", -1),)),
+    HotQuery("transactions", "transactions",
+             {"$or": [{"from_user_id": "u1"}, {"to_user_id": "u1"}]}, (("created_at", -1), ("id", -1))),
+    HotQuery("service catalogue", "service_listings", {"status": "ACTIVE", "category_id": "c1"}, (("rating", -1),)),
+    HotQuery("service catalogue (all)", "service_listings", {"status": "ACTIVE"}, (("rating", -1),)),
+    HotQuery("marketplace by category", "marketplace_products", {"status": "active", "category": "c1"}, (("created_at", -1),)),
+    HotQuery("marketplace latest", "marketplace_products", {"status": "active"}, (("created_at", -1),)),
+    HotQuery("goodwill upcoming", "goodwill_events",
+             {"status": {"$in": ["UPCOMING", "ONGOING"]}}, (("start_date", 1), ("id", 1))),
+    HotQuery("event attendees", "event_attendees", {"event_id": "e1", "status": "GOING"}),
+    HotQuery("my events", "event_attendees", {"user_id": "u1", "status": "GOING"}),
+]
+
+
+async def seed_hot_queries(db, filler: int = 200) -> None:
+    """Give every hot-query collection data, so the planner has a real choice."""
+    for collection in {q.collection for q in HOT_QUERIES}:
+        await db[collection].insert_many([{"seed": i} for i in range(filler)])
+    for query in HOT_QUERIES:
+        await db[query.collection].insert_one(sample_document(query.filter))
+
+
+async def _main(args) -> int:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    try:
+        if args.command == "reconcile":
+            report = await reconcile_indexes(client[args.db], INDEXES, drop_conflicting=args.drop_conflicting)
+            print(f"Indexes: {report.summary()}")
+            for label in report.conflicts + report.errors:
+                print(f"  ! {label}")
+            return 1 if report.errors else 0
+
+        db = client[args.scratch_db]
+        await client.drop_database(args.scratch_db)
+        try:
+            await seed_hot_queries(db)
+            report = await reconcile_indexes(db, INDEXES)
+            if report.errors:
+                for label in report.errors:
+                    print(f"  ! {label}")
+                return 1
+            failures = await find_collscans(db, HOT_QUERIES)
+        finally:
+            await client.drop_database(args.scratch_db)
+
+        for query, stages in failures:
+            print(f"COLLSCAN  {query.name}: {query.collection} {query.filter} -> {' > '.join(stages)}")
+        print(f"{len(HOT_QUERIES) - len(failures)}/{len(HOT_QUERIES)} hot queries use an index")
+        return 1 if failures else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile and verify ZION.CITY MongoDB indexes")
+    parser.add_argument("command", choices=["reconcile", "check"])
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default=os.environ.get("DB_NAME", "zion_city"))
+    parser.add_argument("--scratch-db", default="zion_index_check")
+    parser.add_argument("--drop-conflicting", action="store_true")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
@@ -71,10 +71,25 @@ preload_app = True
 # Reuse port for zero-downtime restarts
 reuse_port = True
 
+# =============================================================================
+# METRICS
+# =============================================================================
+# Workers write Prometheus metrics to files in this directory so that a scrape
+# served by any worker reports the totals of all workers. It must be set
+# before the app (and prometheus_client) is imported, i.e. here.
+prometheus_multiproc_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', '/tmp/zion-prometheus'
+)
+
 # =============================================================================
 # HOOKS
 # =============================================================================
 def on_starting(server):
+    # Start from an empty metrics directory; stale files from a previous run
+    # would otherwise be aggregated into the new totals
+    import shutil
+    shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+    os.makedirs(prometheus_multiproc_dir, exist_ok=True)
     print(f"🚀 Starting ZION.CITY API")
     print(f"   Workers: {workers}")
     print(f"   Threads per worker: {threads}")
@@ -91,3 +106,11 @@ def post_fork(server, worker):
 
 def worker_exit(server, worker):
     print(f"👋 Worker {worker.pid} exited")
+
+def child_exit(server, worker):
+    # Drop the dead worker's live gauges (in-flight requests)
+    try:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    except ImportError:
+        pass
@@ -56,6 +56,58 @@ CORS_ORIGINS=https://yourdomain.com,https://www.yourdomain.com
 # AI Services
 DEEPSEEK_API_KEY=sk-xxx
 EMERGENT_LLM_KEY=xxx
+
+# Shared cache tier + cross-worker invalidation (optional, any Redis-protocol server)
+REDIS_URL=redis://localhost:6379/0
+CACHE_MAX_ENTRIES=20000
+CACHE_MAX_MB=64
+
+# Prometheus multiprocess metrics (gunicorn.conf.py defaults to /tmp/zion-prometheus)
+PROMETHEUS_MULTIPROC_DIR=/tmp/zion-prometheus
+
+# Per-request MongoDB query budgets (log | raise | off)
+QUERY_BUDGET_MODE=log
+QUERY_BUDGET_DEFAULT=30
+QUERY_REPEAT_THRESHOLD=5
+
+# List totals: capped counts stop at COUNT_CAP; cached counts live COUNT_CACHE_TTL seconds
+COUNT_CAP=1000
+COUNT_CACHE_TTL=60
+
+# News timelines: entries kept per user, fan-out audience limit, posts copied on follow
+NEWS_TIMELINE_MAX=800
+NEWS_FANOUT_MAX_AUDIENCE=5000
+NEWS_TIMELINE_BACKFILL=200
+
+# Materialized family connection sets and cached organization memberships: cache lifetimes in seconds
+FAMILY_GRAPH_CACHE_TTL=300
+ORG_GRAPH_CACHE_TTL=300
+
+# Maximum sub-requests accepted by one /api/batch call
+BATCH_MAX_ITEMS=20
+
+# Link previews: cache lifetime, retry delay for failed URLs (seconds), HTML read limit (KB)
+LINK_PREVIEW_CACHE_TTL=86400
+LINK_PREVIEW_FAILURE_TTL=600
+LINK_PREVIEW_MAX_KB=64
+
+# Change journal behind /api/sync: entries kept per user before clients must refetch
+SYNC_JOURNAL_MAX_ENTRIES=200
+
+# Friend suggestions: list age before the refresh job rebuilds it (seconds), list length, lists per run
+SUGGESTIONS_TTL=21600
+SUGGESTIONS_MAX_ITEMS=200
+SUGGESTIONS_REFRESH_BATCH=50
+
+# Post counters: posts re-checked per periodic cleanup run
+POST_COUNTERS_RECONCILE_BATCH=200
+
+# Social counters: users and channels re-checked per periodic cleanup run
+SOCIAL_COUNTERS_RECONCILE_BATCH=500
+
+# Per-worker cache of each user's friend, following and channel id sets
+RELATIONSHIP_SETS_CACHE_TTL=600
+RELATIONSHIP_SETS_MAX_ENTRIES=20000
 """
 
 # ============================================================
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, Query, Request, WebSocket, WebSocketDisconnect, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, Query, Request, Response, WebSocket, WebSocketDisconnect, Body
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
@@ -25,7 +25,6 @@ from io import BytesIO
 import base64
 from functools import lru_cache
 from contextlib import asynccontextmanager
-import time
 import secrets
 
 # Email service
@@ -53,9 +52,14 @@ def safe_regex(pattern: str) -> str:
 IS_PRODUCTION = os.environ.get('ENVIRONMENT', 'development') == 'production'
 
 # MongoDB connection with optimized settings for Atlas/Production
+from core.metrics import MetricsMiddleware, MongoCommandMetrics, render_metrics
+from core.query_budget import QueryBudgetMiddleware, QueryRecorderListener
+
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(
     mongo_url,
+    # per-route command counts/latency, and per-request query budgets
+    event_listeners=[MongoCommandMetrics(), QueryRecorderListener()],
     maxPoolSize=50 if IS_PRODUCTION else 100,  # Lower pool for Atlas
     minPoolSize=5,                # Minimum connections to maintain
     maxIdleTimeMS=30000,          # Close idle connections after 30 seconds
@@ -68,99 +72,64 @@ client = AsyncIOMotorClient(
 )
 db = client[os.environ.get('DB_NAME', 'zion_city')]
 
+# Request-scoped batching of user/org/department/media/channel lookups:
+# request_loaders(db).users.load_many(ids) issues one $in query per request
+from core.loaders import request_loaders
+
+# One $in query + one update_many to validate and re-tag attached media files
+from core.media import attach_media
+
+# In-process sub-requests for /api/batch (shared principal and loaders)
+from core.batch import BatchDispatcher, BatchError, current_principal, shared_principal
+
+# Declared indexes, reconciled in the background at startup
+from core.indexes import reconcile_indexes
+from db_indexes import INDEXES
+
+# Post visibility as audience facets evaluated inside feed queries
+from core.audience import backfill_post_audiences, post_audience, viewer_audience, visible_to
+
+# Like/comment counters and reaction histograms denormalized onto posts
+from core.post_counters import clear_reaction, reconcile_post_counters, set_reaction, top_reactions, unique_reactions
+from core.post_counters import reconcile_step as reconcile_post_counters_step
+from core.jobs import run_once
+
+# Name search on normalized, transliterated prefix keys stored on each user
+from core.people_search import backfill_search_keys, find_people, people_query, search_fields
+
 # ============================================================
-# IN-MEMORY CACHE (Simple LRU Cache for frequent queries)
+# CACHE (bounded local LRU tier + optional shared Redis tier)
 # ============================================================
 
-class SimpleCache:
-    """Simple in-memory cache with TTL for frequent queries"""
-    def __init__(self, default_ttl: int = 300):  # 5 minutes default
-        self._cache: Dict[str, Any] = {}
-        self._timestamps: Dict[str, float] = {}
-        self.default_ttl = default_ttl
-        self._lock = asyncio.Lock()
-    
-    async def get(self, key: str) -> Optional[Any]:
-        """Get value from cache if not expired"""
-        async with self._lock:
-            if key in self._cache:
-                if time.time() - self._timestamps[key] < self.default_ttl:
-                    return self._cache[key]
-                else:
-                    # Expired, remove it
-                    del self._cache[key]
-                    del self._timestamps[key]
-        return None
-    
-    async def set(self, key: str, value: Any, ttl: int = None):
-        """Set value in cache with TTL"""
-        async with self._lock:
-            self._cache[key] = value
-            self._timestamps[key] = time.time()
-    
-    async def delete(self, key: str):
-        """Delete key from cache"""
-        async with self._lock:
-            self._cache.pop(key, None)
-            self._timestamps.pop(key, None)
-    
-    async def clear_expired(self):
-        """Clean up expired entries"""
-        async with self._lock:
-            current_time = time.time()
-            expired_keys = [
-                k for k, t in self._timestamps.items() 
-                if current_time - t >= self.default_ttl
-            ]
-            for key in expired_keys:
-                del self._cache[key]
-                del self._timestamps[key]
+from core.cache import TieredCache
+from core.principal_cache import PrincipalCache
+from core.redis_client import close_redis
+
+# Local tier is per worker; the Redis tier (REDIS_URL) is shared by all
+# workers and carries cross-worker invalidations.
+cache = TieredCache(
+    namespace="zion",
+    default_ttl=300,  # 5 minutes TTL
+    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 20000)),
+    max_bytes=int(os.environ.get('CACHE_MAX_MB', 64)) * 1024 * 1024,
+)
 
-# Initialize cache
-cache = SimpleCache(default_ttl=300)  # 5 minutes TTL
+# Authenticated principals resolved by get_current_user. Short TTL bounds
+# staleness of presence fields (last_seen/is_online) that are not invalidated.
+principal_cache = PrincipalCache(
+    ttl=int(os.environ.get('PRINCIPAL_CACHE_TTL', 30)),
+    max_entries=int(os.environ.get('PRINCIPAL_CACHE_MAX_ENTRIES', 10000)),
+)
+principal_cache.attach(cache)
 
 # ============================================================
-# RATE LIMITING (In-memory, simple implementation)
+# RATE LIMITING (sliding-window counters, shared via Redis)
 # ============================================================
 
-class RateLimiter:
-    """Simple in-memory rate limiter"""
-    def __init__(self):
-        self._requests: Dict[str, List[float]] = {}
-        self._lock = asyncio.Lock()
-    
-    async def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> bool:
-        """Check if request is allowed within rate limit"""
-        async with self._lock:
-            current_time = time.time()
-            window_start = current_time - window_seconds
-            
-            # Clean old requests
-            if key in self._requests:
-                self._requests[key] = [t for t in self._requests[key] if t > window_start]
-            else:
-                self._requests[key] = []
-            
-            # Check limit
-            if len(self._requests[key]) >= max_requests:
-                return False
-            
-            # Add current request
-            self._requests[key].append(current_time)
-            return True
-    
-    async def cleanup(self):
-        """Clean up old entries"""
-        async with self._lock:
-            current_time = time.time()
-            # Remove entries older than 1 hour
-            for key in list(self._requests.keys()):
-                self._requests[key] = [t for t in self._requests[key] if current_time - t < 3600]
-                if not self._requests[key]:
-                    del self._requests[key]
+from core.rate_limit import RateLimiter, RateLimitRule, RateLimitMiddleware
 
-# Initialize rate limiter
-rate_limiter = RateLimiter()
+# Initialize rate limiter (counters are shared across workers when REDIS_URL is set)
+rate_limiter = RateLimiter(namespace="zion")
 
 # Rate limit configurations
 RATE_LIMITS = {
@@ -171,16 +140,32 @@ RATE_LIMITS = {
     "default": {"max_requests": 100, "window_seconds": 60},     # 100 general requests/minute
 }
 
-async def check_rate_limit(user_id: str, limit_type: str = "default") -> bool:
-    """Check if user is within rate limit"""
-    config = RATE_LIMITS.get(limit_type, RATE_LIMITS["default"])
-    key = f"{limit_type}:{user_id}"
-    return await rate_limiter.is_allowed(key, config["max_requests"], config["window_seconds"])
+# Route groups limited by RateLimitMiddleware (first match wins)
+RATE_LIMIT_ROUTES = [
+    ("ai_chat", r"^/api/agent/(chat|chat-with-image|chat-with-search|search)$", {"POST"}),
+    ("ai_analysis", r"^/api/agent/analyze-(image|file-upload|document)$", {"POST"}),
+    ("search", r"^/api/(users/search(/basic)?|work/organizations/search|(direct-chats|chat-groups)/[^/]+/messages/search)$", set()),
+    ("posts", r"^/api/(posts|news/posts|(family-profiles|family-units)/[^/]+/posts|(work|journal)/organizations/[^/]+/posts)$", {"POST"}),
+]
+
+RATE_LIMIT_RULES = [
+    RateLimitRule(
+        name=name,
+        pattern=pattern,
+        max_requests=RATE_LIMITS[name]["max_requests"],
+        window_seconds=RATE_LIMITS[name]["window_seconds"],
+        methods=methods,
+    )
+    for name, pattern, methods in RATE_LIMIT_ROUTES
+]
 
 # ============================================================
 # PAGINATION VALIDATION
 # ============================================================
 
+from core.pagination import InvalidCursor, Keyset
+from core.counting import CountMode, ListCounter
+
 # Maximum allowed values to prevent DoS attacks
 MAX_LIMIT = 100  # Maximum items per page
 MAX_OFFSET = 10000  # Maximum offset to prevent extremely deep pagination
@@ -201,6 +186,28 @@ def validate_pagination(offset: int, limit: int) -> tuple[int, int]:
 
     return offset, limit
 
+# Keyset pagination: feeds and histories accept an opaque `cursor` alongside
+# skip/offset and return `next_cursor`; pages then cost the same at any depth.
+NEWEST_FIRST = Keyset("created_at", -1)
+SOONEST_FIRST = Keyset("start_date", 1)
+
+def apply_cursor(keyset: Keyset, query: dict, cursor: Optional[str]) -> dict:
+    """Restrict a query to rows after the cursor, rejecting malformed cursors."""
+    try:
+        return keyset.after(query, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# List totals: capped ("1000+") by default, exact only on ?count=exact, and
+# cached for catalogue filters that many users repeat
+list_counter = ListCounter(cache)
+
+# Per-user change journal behind /api/sync: writes that concern another user
+# (notifications, messages, feed items, tasks, RSVPs) leave a hint for them
+from core.journal import ChangeJournal
+
+change_journal = ChangeJournal(db)
+
 # ============================================================
 # APP LIFECYCLE & BACKGROUND TASKS
 # ============================================================
@@ -211,7 +218,12 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Starting ZION.CITY API server...")
     
-    # Create database indexes on startup (idempotent)
+    # Connect shared cache tier and invalidation listener (per worker)
+    await cache.start()
+    await rate_limiter.start()
+    await chat_manager.start()
+
+    # Create missing registered indexes in the background (idempotent)
     asyncio.create_task(ensure_indexes())
     
     # Start background cleanup task
@@ -222,46 +234,32 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("🛑 Shutting down ZION.CITY API server...")
     cleanup_task.cancel()
+    await cache.close()
+    await rate_limiter.close()
+    await chat_manager.close()
+    await link_previews.close()
+    await close_redis()
     client.close()
 
 async def ensure_indexes():
-    """Ensure all database indexes exist (runs on startup)"""
-    try:
-        # Key indexes for performance
-        await db.users.create_index("id", unique=True, background=True)
-        await db.users.create_index("email", unique=True, background=True)
-        await db.posts.create_index([("created_at", -1)], background=True)
-        await db.posts.create_index([("user_id", 1), ("created_at", -1)], background=True)
-        await db.notifications.create_index([("user_id", 1), ("is_read", 1), ("created_at", -1)], background=True)
-        await db.agent_conversations.create_index([("user_id", 1), ("updated_at", -1)], background=True)
-
-        # Additional indexes for family and chat performance
-        await db.family_members.create_index([("user_id", 1), ("is_active", 1)], background=True)
-        await db.family_members.create_index([("family_id", 1), ("is_active", 1)], background=True)
-        await db.family_profiles.create_index([("creator_id", 1)], background=True)
-        await db.posts.create_index([("user_id", 1), ("created_at", -1)], background=True)
-        await db.chat_messages.create_index([("group_id", 1), ("created_at", -1)], background=True)
-        await db.notifications.create_index([("user_id", 1), ("read", 1), ("created_at", -1)], background=True)
-
-        # News feed performance indexes
-        await db.user_friendships.create_index([("user1_id", 1)], background=True)
-        await db.user_friendships.create_index([("user2_id", 1)], background=True)
-        await db.user_friendships.create_index([("user1_id", 1), ("user2_id", 1)], unique=True, background=True)
-        await db.user_follows.create_index([("follower_id", 1)], background=True)
-        await db.user_follows.create_index([("target_id", 1)], background=True)
-        await db.user_follows.create_index([("follower_id", 1), ("target_id", 1)], unique=True, background=True)
-        await db.channel_subscriptions.create_index([("subscriber_id", 1)], background=True)
-        await db.channel_subscriptions.create_index([("channel_id", 1)], background=True)
-        await db.news_posts.create_index([("created_at", -1)], background=True)
-        await db.news_posts.create_index([("user_id", 1), ("created_at", -1)], background=True)
-        await db.news_posts.create_index([("channel_id", 1), ("created_at", -1)], background=True)
-        await db.news_posts.create_index([("visibility", 1), ("user_id", 1), ("created_at", -1)], background=True)
-        await db.news_post_likes.create_index([("post_id", 1), ("user_id", 1)], unique=True, background=True)
-
-        logger.info("✅ Database indexes verified")
+    """Reconcile the declared index registry (db_indexes.py) on startup, then run pending migrations"""
+    try:
+        report = await reconcile_indexes(db, INDEXES)
+        logger.info(f"✅ Database indexes verified: {report.summary()}")
+        for label in report.conflicts + report.errors:
+            logger.warning(f"Index reconciliation: {label}")
     except Exception as e:
         logger.warning(f"Index creation warning: {e}")
 
+    # One-off migrations, each run by one worker once per database (core/jobs.py)
+    await run_once(db, "post_reactions_unique", lambda: unique_reactions(db))
+    await run_once(db, "post_counters_fill", lambda: reconcile_post_counters(db, only_missing=True))
+    # Recompute every user's search keys after whole-token (=token) keys were added
+    await run_once(db, "search_keys_exact", lambda: backfill_search_keys(db.users, rebuild=True))
+    # Posts written before audience facets existed, users and channels before social counters
+    await run_once(db, "post_audiences", lambda: backfill_post_audiences(db.posts))
+    await run_once(db, "social_counters_fill", social_counters.reconcile_missing)
+
 async def periodic_cleanup():
     """Background task for periodic cleanup"""
     while True:
@@ -269,6 +267,10 @@ async def periodic_cleanup():
             await asyncio.sleep(300)  # Run every 5 minutes
             await cache.clear_expired()
             await rate_limiter.cleanup()
+            await news_timelines.trim()
+            await suggestion_engine.refresh()
+            await reconcile_post_counters_step(db)
+            await social_counters.reconcile_step()
             logger.debug("🧹 Periodic cleanup completed")
         except asyncio.CancelledError:
             break
@@ -298,123 +300,217 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 if IS_PRODUCTION else 30  # Longer sessions in production
 
 # === WEBSOCKET CONNECTION MANAGER ===
+from core.pubsub import create_broker
+
 class ChatConnectionManager:
-    """Manages WebSocket connections for real-time chat features"""
+    """Manages WebSocket connections for real-time chat features
+
+    Sockets live in the worker that accepted them, but events are published
+    through a broker (Redis pub/sub when REDIS_URL is set) that every worker
+    subscribes to. Each worker relays events to its own sockets, so an event
+    produced on any worker reaches every participant.
+    """
     
-    def __init__(self):
-        # Dictionary mapping chat_id to set of websocket connections
+    def __init__(self, broker=None):
+        # Dictionary mapping chat_id to set of local websocket connections
         self.chat_connections: Dict[str, Set[WebSocket]] = {}
-        # Dictionary mapping user_id to websocket connection
-        self.user_connections: Dict[str, WebSocket] = {}
+        # Dictionary mapping user_id to that user's local websockets (one per tab/device)
+        self.user_connections: Dict[str, Set[WebSocket]] = {}
+        # Reverse indexes for cleanup and exclude_user filtering
+        self.socket_users: Dict[WebSocket, str] = {}
+        self.socket_chats: Dict[WebSocket, Set[str]] = {}
+        self.broker = broker or create_broker(namespace="zion")
         # Lock for thread safety
         self._lock = asyncio.Lock()
     
+    async def start(self):
+        """Subscribe this worker to chat and user channels (call once per worker)"""
+        await self.broker.subscribe("chat:*", self._relay_chat_event)
+        await self.broker.subscribe("user:*", self._relay_user_event)
+        await self.broker.start()
+    
+    async def close(self):
+        await self.broker.close()
+    
     async def connect(self, websocket: WebSocket, user_id: str, chat_id: str = None):
         """Connect a user to WebSocket"""
         await websocket.accept()
         async with self._lock:
             # Store user connection
-            self.user_connections[user_id] = websocket
+            self.user_connections.setdefault(user_id, set()).add(websocket)
+            self.socket_users[websocket] = user_id
+            self.socket_chats[websocket] = set()
             
             # If chat_id provided, add to chat room
             if chat_id:
-                if chat_id not in self.chat_connections:
-                    self.chat_connections[chat_id] = set()
-                self.chat_connections[chat_id].add(websocket)
+                self._join(websocket, chat_id)
         
         logger.info(f"WebSocket connected: user={user_id}, chat={chat_id}")
     
     async def disconnect(self, websocket: WebSocket, user_id: str, chat_id: str = None):
         """Disconnect a user from WebSocket"""
         async with self._lock:
-            # Remove from user connections
-            if user_id in self.user_connections:
-                del self.user_connections[user_id]
-            
-            # Remove from chat connections
-            if chat_id and chat_id in self.chat_connections:
-                self.chat_connections[chat_id].discard(websocket)
-                if not self.chat_connections[chat_id]:
-                    del self.chat_connections[chat_id]
+            self._forget(websocket)
         
         logger.info(f"WebSocket disconnected: user={user_id}")
     
     async def join_chat(self, websocket: WebSocket, chat_id: str):
         """Join a specific chat room"""
         async with self._lock:
-            if chat_id not in self.chat_connections:
-                self.chat_connections[chat_id] = set()
-            self.chat_connections[chat_id].add(websocket)
+            self._join(websocket, chat_id)
     
     async def leave_chat(self, websocket: WebSocket, chat_id: str):
         """Leave a specific chat room"""
         async with self._lock:
-            if chat_id in self.chat_connections:
-                self.chat_connections[chat_id].discard(websocket)
+            self._leave(websocket, chat_id)
     
-    async def broadcast_to_chat(self, chat_id: str, message: dict, exclude_user: str = None):
-        """Broadcast a message to all users in a chat"""
-        if chat_id not in self.chat_connections:
-            return
+    async def broadcast_to_chat(self, chat_id: str, message: dict, exclude_user: str = None, ack_message_id: str = None, sender_id: str = None):
+        """Broadcast a message to all users in a chat, on every worker
         
-        disconnected = []
-        for websocket in self.chat_connections[chat_id]:
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to chat {chat_id}: {e}")
-                disconnected.append(websocket)
-        
-        # Clean up disconnected sockets
-        async with self._lock:
-            for ws in disconnected:
-                self.chat_connections[chat_id].discard(ws)
+        If ack_message_id is given, the first worker that delivers the event to
+        a participant other than sender_id marks that message as delivered.
+        """
+        header = {"exclude_user": exclude_user, "ack_message_id": ack_message_id, "sender_id": sender_id}
+        await self.broker.publish(f"chat:{chat_id}", self._encode(header, message))
     
     async def send_to_user(self, user_id: str, message: dict):
-        """Send a message to a specific user"""
-        if user_id not in self.user_connections:
-            return False
+        """Send a message to all of a user's sockets, on every worker"""
+        await self.broker.publish(f"user:{user_id}", self._encode({}, message))
+        return True
+    
+    def is_user_online(self, user_id: str) -> bool:
+        """Check if a user has an active WebSocket connection on this worker"""
+        return bool(self.user_connections.get(user_id))
+    
+    def get_online_users_in_chat(self, chat_id: str) -> int:
+        """Get number of sockets in a chat on this worker"""
+        return len(self.chat_connections.get(chat_id, ()))
+    
+    def stats(self) -> dict:
+        return {
+            "local_sockets": len(self.socket_users),
+            "local_users": len(self.user_connections),
+            "local_chats": len(self.chat_connections),
+            **self.broker.stats(),
+        }
+    
+    # --- broker relay (runs on every worker) ---
+    
+    async def _relay_chat_event(self, channel: str, data: str):
+        chat_id = channel[len("chat:"):]
+        header, payload = self._decode(data)
+        exclude_user = header.get("exclude_user")
+        sender_id = header.get("sender_id")
         
+        delivered_to_recipient = False
+        for websocket in list(self.chat_connections.get(chat_id, ())):
+            socket_user = self.socket_users.get(websocket)
+            if exclude_user and socket_user == exclude_user:
+                continue
+            if await self._send(websocket, payload) and socket_user != sender_id:
+                delivered_to_recipient = True
+        
+        ack_message_id = header.get("ack_message_id")
+        if ack_message_id and delivered_to_recipient:
+            # Conditional update: only the first worker to deliver wins
+            await db.chat_messages.update_one(
+                {"id": ack_message_id, "status": "sent"},
+                {"$set": {"status": "delivered", "delivered_at": datetime.now(timezone.utc)}}
+            )
+    
+    async def _relay_user_event(self, channel: str, data: str):
+        user_id = channel[len("user:"):]
+        _, payload = self._decode(data)
+        for websocket in list(self.user_connections.get(user_id, ())):
+            await self._send(websocket, payload)
+    
+    async def _send(self, websocket: WebSocket, payload: str) -> bool:
         try:
-            await self.user_connections[user_id].send_json(message)
+            await websocket.send_text(payload)
             return True
         except Exception as e:
-            logger.error(f"Error sending to user {user_id}: {e}")
+            logger.error(f"Error sending to websocket of user {self.socket_users.get(websocket)}: {e}")
             async with self._lock:
-                if user_id in self.user_connections:
-                    del self.user_connections[user_id]
+                self._forget(websocket)
             return False
     
-    def is_user_online(self, user_id: str) -> bool:
-        """Check if a user has an active WebSocket connection"""
-        return user_id in self.user_connections
+    # --- local bookkeeping (caller holds the lock) ---
+    
+    def _join(self, websocket: WebSocket, chat_id: str):
+        self.chat_connections.setdefault(chat_id, set()).add(websocket)
+        self.socket_chats.setdefault(websocket, set()).add(chat_id)
+    
+    def _leave(self, websocket: WebSocket, chat_id: str):
+        sockets = self.chat_connections.get(chat_id)
+        if sockets is not None:
+            sockets.discard(websocket)
+            if not sockets:
+                del self.chat_connections[chat_id]
+        self.socket_chats.get(websocket, set()).discard(chat_id)
+    
+    def _forget(self, websocket: WebSocket):
+        for chat_id in list(self.socket_chats.pop(websocket, ())):
+            self._leave(websocket, chat_id)
+        user_id = self.socket_users.pop(websocket, None)
+        if user_id is not None:
+            sockets = self.user_connections.get(user_id)
+            if sockets is not None:
+                sockets.discard(websocket)
+                if not sockets:
+                    del self.user_connections[user_id]
     
-    def get_online_users_in_chat(self, chat_id: str) -> int:
-        """Get number of online users in a chat"""
-        if chat_id not in self.chat_connections:
-            return 0
-        return len(self.chat_connections[chat_id])
+    # Wire format: one JSON header line, then the event JSON exactly as sent
+    # to clients, so relaying workers never re-serialize the payload.
+    @staticmethod
+    def _encode(header: dict, message: dict) -> str:
+        return json.dumps(header) + "\n" + json.dumps(message, default=str, ensure_ascii=False)
+    
+    @staticmethod
+    def _decode(data: str):
+        header, _, payload = data.partition("\n")
+        return json.loads(header), payload
 
 # Initialize the connection manager
 chat_manager = ChatConnectionManager()
 
 # Helper function to broadcast new message via WebSocket (defined early for use in API routes)
 async def broadcast_new_message(chat_id: str, message_data: dict, sender_id: str):
-    """Broadcast a new message to all users in a chat via WebSocket"""
+    """Broadcast a new message to all users in a chat via WebSocket
+    
+    The message is marked as delivered by whichever worker first hands it to
+    a connected recipient.
+    """
     await chat_manager.broadcast_to_chat(chat_id, {
         "type": "message",
         "message": message_data,
         "chat_id": chat_id
-    })
-    
-    # Also mark as delivered for all connected users
-    connected_count = chat_manager.get_online_users_in_chat(chat_id)
-    if connected_count > 1:  # More than just sender
-        # Update message status to delivered
-        await db.direct_chat_messages.update_one(
-            {"id": message_data.get("id")},
-            {"$set": {"status": "delivered"}}
-        )
+    }, ack_message_id=message_data.get("id"), sender_id=sender_id)
+
+async def save_notification(collection, notification: dict):
+    """Insert a notification (db.notifications or db.work_notifications) and journal it for /sync"""
+    await collection.insert_one(notification)
+    kind = "work_notification" if collection.name == "work_notifications" else "notification"
+    await change_journal.record([notification["user_id"]], kind, notification.get("id"))
+
+async def journal_chat_message(message: dict, participant_ids: Optional[List[str]] = None):
+    """Journal a new chat message for everyone else in the chat (group members when participant_ids is None)"""
+    if participant_ids is None:
+        members = await db.chat_group_members.find(
+            {"group_id": message["group_id"], "is_active": True}, {"_id": 0, "user_id": 1}
+        ).to_list(None)
+        participant_ids = [m["user_id"] for m in members]
+    chat_id = message.get("direct_chat_id") or message.get("group_id")
+    await change_journal.record(
+        [uid for uid in participant_ids if uid != message["user_id"]], "message", message["id"], {"chat_id": chat_id}
+    )
+
+async def journal_module_post(post: dict):
+    """Journal a new /posts post for the author's connections in its module (the readers of that feed)"""
+    connected = await module_connections.get(post["user_id"], post["source_module"])
+    await change_journal.record(
+        [uid for uid in connected if uid != post["user_id"]], "feed", post["id"],
+        {"author_id": post["user_id"], "module": post["source_module"]}
+    )
 
 # Enums for better type safety
 class UserRole(str, Enum):
@@ -487,6 +583,7 @@ class Post(BaseModel):
     target_audience: str = "module"  # "module", "public", "private"
     visibility: PostVisibility = PostVisibility.FAMILY_ONLY  # NEW: Role-based visibility
     family_id: Optional[str] = None  # NEW: Which family this post belongs to
+    audience: List[str] = []  # Visibility facets matched in queries (core/audience.py)
     media_files: List[str] = []  # List of MediaFile IDs
     youtube_urls: List[str] = []  # Extracted YouTube URLs
     youtube_video_id: Optional[str] = None  # Single YouTube video ID
@@ -494,6 +591,7 @@ class Post(BaseModel):
     link_domain: Optional[str] = None  # Link preview domain
     likes_count: int = 0
     comments_count: int = 0
+    reaction_counts: Dict[str, int] = {}  # emoji -> count, maintained with $inc (core/post_counters.py)
     is_published: bool = True
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: Optional[datetime] = None
@@ -3511,6 +3609,10 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # Sub-requests of /api/batch reuse the principal the batch authenticated
+    shared = current_principal(credentials.credentials)
+    if shared is not None:
+        return shared.model_copy()
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -3523,10 +3625,18 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.PyJWTError:
         raise credentials_exception
 
-    user = await get_user_by_id(user_id)
+    user = principal_cache.get(user_id, credentials.credentials)
     if user is None:
-        raise credentials_exception
-    return user
+        user = await get_user_by_id(user_id)
+        if user is None:
+            raise credentials_exception
+        principal_cache.set(user_id, credentials.credentials, user)
+    # Shallow copy so handlers can't mutate the shared cached instance
+    return user.model_copy()
+
+async def invalidate_user_principal(user_id: str):
+    """Drop cached principals for user_id on all workers. Call after any db.users write."""
+    await principal_cache.invalidate_user(user_id)
 
 async def get_user_affiliations(user_id: str):
     """Get all affiliations for a user with detailed information"""
@@ -3620,147 +3730,36 @@ async def create_auto_family_groups(user_id: str):
     
     return [family_group.id, relatives_group.id]
 
-async def get_user_family_connections(user_id: str) -> List[str]:
-    """Get all family member user IDs for a given user (supports both old families and new family profiles)"""
-    # Use aggregation pipeline to batch fetch all family connections in one query
-    pipeline = [
-        # Match user's family memberships
-        {
-            "$match": {
-                "user_id": user_id,
-                "is_active": True,
-                "invitation_accepted": True
-            }
-        },
-        # Lookup all members of the same families
-        {
-            "$lookup": {
-                "from": "family_members",
-                "let": {"family_id": "$family_id"},
-                "pipeline": [
-                    {
-                        "$match": {
-                            "$expr": {"$eq": ["$family_id", "$$family_id"]},
-                            "is_active": True,
-                            "invitation_accepted": True
-                        }
-                    },
-                    {"$project": {"user_id": 1}}
-                ],
-                "as": "family_members"
-            }
-        },
-        # Lookup subscriptions for this family
-        {
-            "$lookup": {
-                "from": "family_subscriptions",
-                "let": {"family_id": "$family_id"},
-                "pipeline": [
-                    {
-                        "$match": {
-                            "$expr": {"$eq": ["$subscriber_family_id", "$$family_id"]},
-                            "is_active": True,
-                            "status": "ACTIVE"
-                        }
-                    },
-                    {"$project": {"target_family_id": 1}}
-                ],
-                "as": "subscriptions"
-            }
-        },
-        # Unwind subscriptions to lookup their members
-        {
-            "$unwind": {
-                "path": "$subscriptions",
-                "preserveNullAndEmptyArrays": True
-            }
-        },
-        # Lookup members of subscribed families
-        {
-            "$lookup": {
-                "from": "family_members",
-                "let": {"target_family_id": "$subscriptions.target_family_id"},
-                "pipeline": [
-                    {
-                        "$match": {
-                            "$expr": {"$eq": ["$family_id", "$$target_family_id"]},
-                            "is_active": True,
-                            "invitation_accepted": True
-                        }
-                    },
-                    {"$project": {"user_id": 1}}
-                ],
-                "as": "subscribed_family_members"
-            }
-        },
-        # Group and collect all user IDs
-        {
-            "$group": {
-                "_id": None,
-                "direct_members": {"$push": "$family_members"},
-                "subscribed_members": {"$push": "$subscribed_family_members"}
-            }
-        }
-    ]
+# Family connection sets are materialized per user (family_connections) and
+# recomputed only for the users affected by membership/subscription changes
+from core.family_graph import FamilyGraph
 
-    result = await db.family_members.aggregate(pipeline).to_list(1)
+family_graph = FamilyGraph(db, cache)
 
-    connected_users = set()
-    if result:
-        # Flatten and collect all user IDs from direct family members
-        for members_list in result[0].get("direct_members", []):
-            for member in members_list:
-                connected_users.add(member["user_id"])
+async def get_user_family_connections(user_id: str) -> List[str]:
+    """Get all family member user IDs for a given user (supports both old families and new family profiles)"""
+    return list(await family_graph.connections(user_id))
 
-        # Flatten and collect all user IDs from subscribed family members
-        for members_list in result[0].get("subscribed_members", []):
-            for member in members_list:
-                connected_users.add(member["user_id"])
+# Organization memberships (user_affiliations + work_members) and member
+# sets are cached per user / per organization and invalidated on changes
+from core.org_graph import OrgGraph
 
-    return list(connected_users)
+org_graph = OrgGraph(db, cache)
 
 async def get_user_organization_connections(user_id: str) -> List[str]:
     """Get all organization colleague user IDs for a given user"""
-    user_affiliations = await db.user_affiliations.find({"user_id": user_id, "is_active": True}).to_list(100)
-    
-    connected_users = set()
-    
-    for affiliation in user_affiliations:
-        # Get all other users in the same organization
-        org_members = await db.user_affiliations.find({
-            "affiliation_id": affiliation["affiliation_id"],
-            "is_active": True
-        }).to_list(100)
-        
-        for member in org_members:
-            connected_users.add(member["user_id"])
-    
-    return list(connected_users)
+    return list(await org_graph.colleagues(user_id))
+
+# The merged per-module set is memoized per worker and dropped when either
+# graph invalidates the user's or one of their organizations' entries
+from core.connections import ModuleConnections
+
+module_connections = ModuleConnections(family_graph, org_graph)
+module_connections.attach(cache)
 
 async def get_module_connections(user_id: str, module: str) -> List[str]:
     """Get connected user IDs based on module type"""
-    if module == "family":
-        family_connections = await get_user_family_connections(user_id)
-        # Always include the user's own ID so they can see their own posts
-        connected_users = set(family_connections)
-        connected_users.add(user_id)
-        return list(connected_users)
-    elif module == "organizations":
-        org_connections = await get_user_organization_connections(user_id)
-        # Always include the user's own ID so they can see their own posts
-        connected_users = set(org_connections)
-        connected_users.add(user_id)
-        return list(connected_users)
-    elif module in ["news", "journal", "services", "marketplace", "finance", "events"]:
-        # For other modules, use a combination of family and organization connections
-        family_connections = await get_user_family_connections(user_id)
-        org_connections = await get_user_organization_connections(user_id)
-        connected_users = set(family_connections + org_connections)
-        # Always include the user's own ID so they can see their own posts
-        connected_users.add(user_id)
-        return list(connected_users)
-    else:
-        return [user_id]  # Only user's own posts for unknown modules
+    return (await module_connections.get(user_id, module)).as_list()
 
 async def get_user_chat_groups(user_id: str):
     """Get all chat groups where user is a member"""
@@ -4015,7 +4014,10 @@ async def register_user(user_data: UserRegistration):
         gender=user_data.gender  # NEW: Save gender
     )
     
-    await db.users.insert_one(new_user.dict())
+    user_doc = new_user.dict()
+    user_doc.update(search_fields(user_doc))
+    user_doc.update(dict.fromkeys(USER_COUNTERS, 0))
+    await db.users.insert_one(user_doc)
     
     # Auto-create family groups for new user
     await create_auto_family_groups(new_user.id)
@@ -4168,6 +4170,7 @@ async def reset_password(request: PasswordResetConfirm):
         {"id": token_doc["user_id"]},
         {"$set": {"password_hash": hashed_password}}
     )
+    await invalidate_user_principal(token_doc["user_id"])
 
     if result.modified_count == 0:
         raise HTTPException(status_code=400, detail="Failed to update password")
@@ -4208,6 +4211,7 @@ async def verify_email(request: EmailVerificationRequest):
         {"id": token_doc["user_id"]},
         {"$set": {"is_verified": True, "email_verified_at": datetime.now(timezone.utc)}}
     )
+    await invalidate_user_principal(token_doc["user_id"])
 
     if result.modified_count == 0:
         raise HTTPException(status_code=400, detail="Failed to verify email")
@@ -4300,6 +4304,7 @@ async def update_user_gender(
                 "updated_at": datetime.now(timezone.utc)
             }}
         )
+        await invalidate_user_principal(current_user.id)
         
         if result.modified_count == 0 and result.matched_count == 0:
             logger.error(f"User {current_user.id} not found in database for gender update")
@@ -4340,6 +4345,7 @@ async def change_password(
             "updated_at": datetime.now(timezone.utc)
         }}
     )
+    await invalidate_user_principal(current_user.id)
     
     return {"message": "Пароль успешно изменен"}
 
@@ -4435,6 +4441,7 @@ async def delete_account(
     
     # Delete user account
     await db.users.delete_one({"id": current_user.id})
+    await invalidate_user_principal(current_user.id)
     
     return {"message": "Аккаунт успешно удален"}
 
@@ -4457,6 +4464,7 @@ async def update_profile_picture(
             "updated_at": datetime.now(timezone.utc)
         }}
     )
+    await invalidate_user_principal(current_user.id)
     
     return {"message": "Фото профиля обновлено", "profile_picture": profile_picture}
 
@@ -4472,6 +4480,7 @@ async def delete_profile_picture(
             "updated_at": datetime.now(timezone.utc)
         }}
     )
+    await invalidate_user_principal(current_user.id)
     
     return {"message": "Фото профиля удалено"}
 
@@ -4498,6 +4507,7 @@ async def complete_onboarding(
             start_date=datetime.now(timezone.utc)
         )
         await db.user_affiliations.insert_one(user_affiliation.dict())
+        await org_graph.member_changed("affiliation", affiliation_id, current_user.id)
         affiliations_created.append("work")
     
     # Process university affiliation  
@@ -4515,6 +4525,7 @@ async def complete_onboarding(
             start_date=datetime.now(timezone.utc)
         )
         await db.user_affiliations.insert_one(user_affiliation.dict())
+        await org_graph.member_changed("affiliation", affiliation_id, current_user.id)
         affiliations_created.append("university")
     
     # Process school affiliation
@@ -4532,6 +4543,7 @@ async def complete_onboarding(
             start_date=datetime.now(timezone.utc)
         )
         await db.user_affiliations.insert_one(user_affiliation.dict())
+        await org_graph.member_changed("affiliation", affiliation_id, current_user.id)
         affiliations_created.append("school")
     
     # Update privacy settings if provided
@@ -4543,6 +4555,7 @@ async def complete_onboarding(
                 "updated_at": datetime.now(timezone.utc)
             }}
         )
+        await invalidate_user_principal(current_user.id)
     
     return {
         "message": "Onboarding completed successfully",
@@ -4577,6 +4590,7 @@ async def create_user_affiliation(
     )
     
     await db.user_affiliations.insert_one(user_affiliation.dict())
+    await org_graph.member_changed("affiliation", affiliation_data.affiliation_id, current_user.id)
     return {"message": "Affiliation added successfully"}
 
 @api_router.get("/user-affiliations")
@@ -4888,11 +4902,13 @@ async def update_my_profile(
         update_fields["education"] = profile_data.education
     
     if update_fields:
+        update_fields.update(search_fields(current_user.dict(), update_fields))
         update_fields["updated_at"] = datetime.now(timezone.utc)
         await db.users.update_one(
             {"id": current_user.id},
             {"$set": update_fields}
         )
+        await invalidate_user_principal(current_user.id)
     
     return {"success": True, "message": "Profile updated successfully"}
 
@@ -5031,6 +5047,7 @@ async def create_family_profile(
         invitation_accepted=True  # Creator automatically accepts
     )
     await db.family_members.insert_one(family_member.dict())
+    await family_graph.family_changed([new_family.id])
     
     # Return response with user membership info
     response_data = new_family.dict()
@@ -5134,6 +5151,7 @@ async def create_family_with_members(
             {"id": new_family["id"]},
             {"$set": {"member_count": len(members) + 1}}
         )
+        await family_graph.family_changed([new_family["id"]])
         
         # Remove _id if present to avoid serialization issues
         if "_id" in new_family:
@@ -5362,28 +5380,24 @@ async def search_users_basic(
         if len(query) < 2:
             return {"users": []}
 
-        # Escape user input to prevent NoSQL injection via regex
-        escaped_query = re.escape(query)
+        if people_query(query) is None:
+            return {"users": []}
 
-        # Search in users collection
-        users = await db.users.find({
-            "$or": [
-                {"name": {"$regex": escaped_query, "$options": "i"}},
-                {"surname": {"$regex": escaped_query, "$options": "i"}},
-                {"email": {"$regex": escaped_query, "$options": "i"}}
-            ]
-        }).limit(10).to_list(10)
+        # Indexed name/email search: whole-token matches first, then prefixes
+        users = await find_people(
+            db.users, query, 10, {"id": {"$ne": current_user.id}},
+            {"_id": 0, "id": 1, "first_name": 1, "last_name": 1, "email": 1}
+        )
         
         # Format user data
         user_results = []
         for user in users:
-            if user["id"] != current_user.id:  # Don't include current user
-                user_results.append({
-                    "id": user["id"],
-                    "name": user.get("name", ""),
-                    "surname": user.get("surname", ""),
-                    "email": user.get("email", "")
-                })
+            user_results.append({
+                "id": user["id"],
+                "name": user.get("first_name", ""),
+                "surname": user.get("last_name", ""),
+                "email": user.get("email", "")
+            })
         
         return {"users": user_results}
         
@@ -5502,6 +5516,7 @@ async def add_family_member(
         }
         
         await db.family_members.insert_one(new_member)
+        await family_graph.family_changed([family_id])
         
         # Update family member count
         await db.family_profiles.update_one(
@@ -5576,6 +5591,7 @@ async def remove_family_member(
         )
         
         if result.modified_count > 0:
+            await family_graph.family_changed([family_id], users=[target_member.get("user_id")])
             # Update family member count
             await db.family_profiles.update_one(
                 {"id": family_id},
@@ -5659,11 +5675,15 @@ async def delete_family(
         if not membership:
             raise HTTPException(status_code=403, detail="Only family creator can delete the family")
         
+        # Users connected through this family, found before its members go
+        affected = await family_graph.affected_users([family_id])
+        
         # Delete family and related data
         await db.family_profiles.delete_one({"id": family_id})
         await db.family_members.delete_many({"family_id": family_id})
         await db.family_posts.delete_many({"family_id": family_id})
         await db.family_invitations.delete_many({"family_id": family_id})
+        await family_graph.rebuild(affected)
         
         return {"success": True, "message": "Family deleted successfully"}
         
@@ -6291,6 +6311,7 @@ async def accept_family_invitation(
         invitation_accepted=True
     )
     await db.family_members.insert_one(family_member.dict())
+    await family_graph.family_changed([invitation["family_id"]])
     
     # Update invitation status
     await db.family_invitations.update_one(
@@ -6658,6 +6679,7 @@ async def subscribe_to_family(
     )
     
     await db.family_subscriptions.insert_one(subscription.dict())
+    await family_graph.family_changed([subscriber_family_id])
     
     return {"message": "Successfully subscribed to family", "subscription_id": subscription.id}
 
@@ -6805,6 +6827,7 @@ async def send_chat_message(
     )
     
     await db.chat_messages.insert_one(new_message.dict())
+    await journal_chat_message(new_message.dict())
     
     return {"message": "Message sent successfully", "message_id": new_message.id}
 
@@ -7000,9 +7023,10 @@ async def get_direct_chat_messages(
     chat_id: str,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Get messages from a direct chat"""
+    """Get messages from a direct chat (newest page first; pass next_cursor to load older)"""
     # Verify user is participant
     chat = await db.direct_chats.find_one({
         "id": chat_id,
@@ -7032,41 +7056,47 @@ async def get_direct_chat_messages(
         }}
     )
     
-    messages = await db.chat_messages.find(
-        {"direct_chat_id": chat_id, "is_deleted": False}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    query = apply_cursor(NEWEST_FIRST, {"direct_chat_id": chat_id, "is_deleted": False}, cursor)
+    messages = await db.chat_messages.find(query).sort(NEWEST_FIRST.sort)\
+        .skip(0 if cursor else skip).limit(limit + 1).to_list(limit + 1)
+    messages, next_cursor = NEWEST_FIRST.page(messages, limit)
+    
+    # Batch-load replied-to messages, then every sender, in one query each
+    loaders = request_loaders(db)
+    replies = await loaders.loader(
+        "chat_messages", {"_id": 0, "id": 1, "content": 1, "user_id": 1}
+    ).load_many(m.get("reply_to") for m in messages)
+    senders = await loaders.users.load_many(
+        [m["user_id"] for m in messages] + [r["user_id"] for r in replies.values()]
+    )
     
     # Get sender info and reply message for each message
     for message in messages:
         message.pop("_id", None)
-        sender = await get_user_by_id(message["user_id"])
+        sender = senders.get(message["user_id"])
         if sender:
             message["sender"] = {
-                "id": sender.id,
-                "first_name": sender.first_name,
-                "last_name": sender.last_name,
-                "profile_picture": sender.profile_picture
+                "id": sender["id"],
+                "first_name": sender.get("first_name"),
+                "last_name": sender.get("last_name"),
+                "profile_picture": sender.get("profile_picture")
             }
         
         # Get reply message content if this is a reply
-        if message.get("reply_to"):
-            reply_msg = await db.chat_messages.find_one(
-                {"id": message["reply_to"]},
-                {"_id": 0, "content": 1, "user_id": 1}
-            )
-            if reply_msg:
-                reply_sender = await get_user_by_id(reply_msg["user_id"])
-                message["reply_message"] = {
-                    "content": reply_msg["content"],
-                    "sender": {
-                        "first_name": reply_sender.first_name if reply_sender else "Unknown"
-                    }
+        reply_msg = replies.get(message.get("reply_to"))
+        if reply_msg:
+            reply_sender = senders.get(reply_msg["user_id"])
+            message["reply_message"] = {
+                "content": reply_msg["content"],
+                "sender": {
+                    "first_name": reply_sender.get("first_name") if reply_sender else "Unknown"
                 }
+            }
     
     # Reverse to show chronological order
     messages.reverse()
     
-    return {"messages": messages}
+    return {"messages": messages, "next_cursor": next_cursor}
 
 @api_router.post("/direct-chats/{chat_id}/messages")
 async def send_direct_message(
@@ -7095,6 +7125,7 @@ async def send_direct_message(
     )
     
     await db.chat_messages.insert_one(new_message.dict())
+    await journal_chat_message(new_message.dict(), chat["participant_ids"])
     
     # Update chat timestamp
     await db.direct_chats.update_one(
@@ -7213,25 +7244,19 @@ async def get_user_contacts(
 ):
     """Get list of users that can be contacted (for starting new chats)"""
     query = {"id": {"$ne": current_user.id}}
-    
-    if search:
-        # Escape user input to prevent NoSQL injection via regex
-        escaped_search = re.escape(search)
-        search_regex = {"$regex": escaped_search, "$options": "i"}
-        query["$or"] = [
-            {"first_name": search_regex},
-            {"last_name": search_regex},
-            {"email": search_regex}
-        ]
-    
-    users = await db.users.find(query, {
+    projection = {
         "_id": 0,
         "id": 1,
         "first_name": 1,
         "last_name": 1,
         "email": 1,
         "profile_picture": 1
-    }).limit(50).to_list(50)
+    }
+    
+    if search and people_query(search) is not None:
+        users = await find_people(db.users, search, 50, query, projection)
+    else:
+        users = await db.users.find(query, projection).limit(50).to_list(50)
     
     return {"contacts": users}
 
@@ -7446,6 +7471,7 @@ async def send_message_with_attachment(
     }
     
     await db.chat_messages.insert_one(message_dict)
+    await journal_chat_message(message_dict, chat["participant_ids"])
     
     # Update chat timestamp
     await db.direct_chats.update_one(
@@ -7526,6 +7552,7 @@ async def send_voice_message(
     }
     
     await db.chat_messages.insert_one(message_dict)
+    await journal_chat_message(message_dict, chat["participant_ids"])
     
     # Update chat timestamp
     await db.direct_chats.update_one(
@@ -7534,7 +7561,7 @@ async def send_voice_message(
     )
     
     # Broadcast message via WebSocket
-    await broadcast_new_message(chat_id, message_dict)
+    await broadcast_new_message(chat_id, message_dict, current_user.id)
     
     # Add sender info for response
     message_dict["sender"] = {
@@ -7808,6 +7835,7 @@ async def forward_message(
         message_dict["voice"] = original_message["voice"]
     
     await db.chat_messages.insert_one(message_dict)
+    await journal_chat_message(message_dict, target_chat["participant_ids"] if chat_type == "direct" else None)
     
     # Update target chat timestamp
     if chat_type == "direct":
@@ -7962,15 +7990,7 @@ async def create_media_collection(
     """Create a new media collection (album)"""
     
     # Validate media_ids belong to user
-    valid_media_ids = []
-    if media_ids:
-        for media_id in media_ids:
-            media = await db.media_files.find_one({
-                "id": media_id,
-                "uploaded_by": current_user.id
-            })
-            if media:
-                valid_media_ids.append(media_id)
+    valid_media_ids = [media["id"] for media in await attach_media(db, media_ids, current_user.id)]
     
     # Create collection
     collection = MediaCollection(
@@ -8128,81 +8148,6 @@ async def get_media_file_by_name(
     )
 
 # Helper function to check if user can see post based on visibility
-async def can_user_see_post(post: dict, current_user: User, user_family_membership: dict = None) -> bool:
-    """
-    Determine if current_user can see a post based on role-based visibility rules
-    
-    Args:
-        post: The post document from database
-        current_user: The authenticated user
-        user_family_membership: User's membership in the post's family (if any)
-    
-    Returns:
-        bool: True if user can see the post, False otherwise
-    """
-    visibility = post.get("visibility", "FAMILY_ONLY")
-    post_family_id = post.get("family_id")
-    post_user_id = post.get("user_id")
-    
-    # Creator can always see their own posts
-    if post_user_id == current_user.id:
-        return True
-    
-    # PUBLIC posts - everyone can see
-    if visibility == "PUBLIC":
-        return True
-    
-    # ONLY_ME - only creator can see (already checked above)
-    if visibility == "ONLY_ME":
-        return False
-    
-    # For family-specific visibility, check if user is a member
-    if post_family_id and not user_family_membership:
-        # User is not a member of this family
-        return False
-    
-    # FAMILY_ONLY - all family members can see
-    if visibility == "FAMILY_ONLY":
-        return bool(user_family_membership)
-    
-    # HOUSEHOLD_ONLY - same household members
-    if visibility == "HOUSEHOLD_ONLY":
-        if not user_family_membership:
-            return False
-        # TODO: Add household check when household system is fully implemented
-        # For now, treat as FAMILY_ONLY
-        return True
-    
-    # Role-based visibility checks
-    if not user_family_membership:
-        return False
-    
-    user_relationship = user_family_membership.get("relationship", "")
-    user_gender = current_user.gender
-    
-    # PARENTS_ONLY - all parents (regardless of gender)
-    if visibility == "PARENTS_ONLY":
-        return user_relationship == "PARENT"
-    
-    # FATHERS_ONLY - male parents only
-    if visibility == "FATHERS_ONLY":
-        return user_relationship == "PARENT" and user_gender == "MALE"
-    
-    # MOTHERS_ONLY - female parents only
-    if visibility == "MOTHERS_ONLY":
-        return user_relationship == "PARENT" and user_gender == "FEMALE"
-    
-    # CHILDREN_ONLY - children only
-    if visibility == "CHILDREN_ONLY":
-        return user_relationship == "CHILD"
-    
-    # EXTENDED_FAMILY_ONLY - extended family members
-    if visibility == "EXTENDED_FAMILY_ONLY":
-        return user_relationship == "EXTENDED_FAMILY"
-    
-    # Default: hide post
-    return False
-
 # Posts Endpoints
 @api_router.get("/posts")
 async def get_posts(
@@ -8211,6 +8156,8 @@ async def get_posts(
     module: str = "family",  # Module to filter posts by
     family_id: str = None,  # Filter by specific family ID
     filter: str = None,  # 'subscribed' for subscribed families
+    cursor: Optional[str] = None,  # next_cursor of the previous page (replaces skip)
+    count: CountMode = CountMode.CAPPED,  # total is only computed on the first page
     current_user: User = Depends(get_current_user)
 ):
     """Get posts feed filtered by module, family, and user connections - OPTIMIZED VERSION with pagination"""
@@ -8245,48 +8192,38 @@ async def get_posts(
     
     # Get connected users based on module (for non-family filtering)
     if not family_id and filter != "subscribed":
-        connected_users = await get_module_connections(current_user.id, module)
-        query["user_id"] = {"$in": connected_users}
+        connected_users = await module_connections.get(current_user.id, module)
+        query["user_id"] = connected_users.as_in()
     
-    # Get user's family memberships for visibility checks (batch query)
-    user_family_memberships = {}
+    # Visibility is part of the query: own posts, or posts whose audience
+    # facets match the user's family memberships (see core/audience.py)
+    user_memberships = []
     if module == "family":
         user_memberships = await db.family_members.find({
             "user_id": current_user.id,
             "is_active": True
         }, {"_id": 0, "family_id": 1, "relationship": 1}).to_list(100)
-        
-        for membership in user_memberships:
-            user_family_memberships[membership["family_id"]] = membership
+    query["$or"] = visible_to(current_user.id, viewer_audience(user_memberships, current_user.gender))
     
     # ========== OPTIMIZED: Fetch posts with projection ==========
     # Only fetch fields we need, skip heavy fields initially
     # Get total count for pagination (count once on first page only for performance)
-    total_count = 0
-    if skip == 0:
-        total_count = await db.posts.count_documents(query)
+    total_count, total_exact = 0, True
+    if skip == 0 and not cursor:
+        counted = await list_counter.count(db.posts, query, count)
+        total_count, total_exact = counted.value, counted.exact
     
     posts = await db.posts.find(
-        query,
+        apply_cursor(NEWEST_FIRST, query, cursor),
         {"_id": 0}  # Exclude _id
-    ).sort("created_at", -1).skip(skip).limit(limit + 1).to_list(limit + 1)  # Fetch one extra to check if more exist
+    ).sort(NEWEST_FIRST.sort).skip(0 if cursor else skip).limit(limit + 1).to_list(limit + 1)  # Fetch one extra to check if more exist
     
     # Check if there are more posts available
-    has_more = len(posts) > limit
-    if has_more:
-        posts = posts[:limit]  # Remove the extra post we fetched
-    
-    # First pass: filter by visibility
-    visible_posts = []
-    for post in posts:
-        post_family_id = post.get("family_id")
-        user_membership = user_family_memberships.get(post_family_id) if post_family_id else None
-        
-        if await can_user_see_post(post, current_user, user_membership):
-            visible_posts.append(post)
+    visible_posts, next_cursor = NEWEST_FIRST.page(posts, limit)
+    has_more = next_cursor is not None
     
     if not visible_posts:
-        return {"posts": [], "has_more": has_more, "total": total_count}
+        return {"posts": [], "has_more": has_more, "total": total_count, "total_exact": total_exact, "next_cursor": next_cursor}
     
     # ========== OPTIMIZED: Batch fetch all related data ==========
     post_ids = [p["id"] for p in visible_posts]
@@ -8324,26 +8261,6 @@ async def get_posts(
     ).to_list(len(post_ids))
     user_reactions_map = {r["post_id"]: r["emoji"] for r in user_reactions_list}
     
-    # Batch query 5: All reactions aggregated at once
-    reactions_pipeline = [
-        {"$match": {"post_id": {"$in": post_ids}}},
-        {"$group": {
-            "_id": {"post_id": "$post_id", "emoji": "$emoji"},
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"count": -1}},
-        {"$group": {
-            "_id": "$_id.post_id",
-            "reactions": {
-                "$push": {"emoji": "$_id.emoji", "count": "$count"}
-            }
-        }}
-    ]
-    reactions_cursor = db.post_reactions.aggregate(reactions_pipeline)
-    post_reactions_map = {}
-    async for item in reactions_cursor:
-        post_reactions_map[item["_id"]] = item["reactions"][:5]  # Top 5 reactions
-    
     # ========== Build response using cached data ==========
     result = []
     for post in visible_posts:
@@ -8370,11 +8287,11 @@ async def get_posts(
         post_id = post["id"]
         post["user_liked"] = post_id in user_likes_set
         post["user_reaction"] = user_reactions_map.get(post_id)
-        post["top_reactions"] = post_reactions_map.get(post_id, [])
+        post["top_reactions"] = top_reactions(post.get("reaction_counts"))  # Top 5 from the stored histogram
         
         result.append(PostResponse(**post))
     
-    return {"posts": result, "has_more": has_more, "total": total_count}
+    return {"posts": result, "has_more": has_more, "total": total_count, "total_exact": total_exact, "next_cursor": next_cursor}
 
 @api_router.post("/posts", response_model=PostResponse)
 async def create_post(
@@ -8418,21 +8335,9 @@ async def create_post(
     if youtube_video_id and youtube_video_id not in [extract_youtube_id_from_url(u) for u in youtube_urls]:
         youtube_urls.append(f"https://www.youtube.com/watch?v={youtube_video_id}")
     
-    # Validate media file IDs belong to current user and update their source_module
-    valid_media_ids = []
-    if media_file_ids:
-        for media_id in media_file_ids:
-            media = await db.media_files.find_one({
-                "id": media_id,
-                "uploaded_by": current_user.id
-            })
-            if media:
-                # Update media file's source_module to match the post's context
-                await db.media_files.update_one(
-                    {"id": media_id},
-                    {"$set": {"source_module": source_module}}
-                )
-                valid_media_ids.append(media_id)
+    # Keep the current user's files and move them to the post's module
+    media_files = await attach_media(db, media_file_ids, current_user.id, source_module=source_module)
+    valid_media_ids = [media["id"] for media in media_files]
     
     # Create post with module information and visibility
     new_post = Post(
@@ -8442,6 +8347,7 @@ async def create_post(
         target_audience=target_audience,
         visibility=visibility_enum,
         family_id=family_id,
+        audience=post_audience({"visibility": visibility_enum, "family_id": family_id}),
         media_files=valid_media_ids,
         youtube_urls=youtube_urls,
         youtube_video_id=youtube_video_id,
@@ -8450,6 +8356,7 @@ async def create_post(
     )
     
     await db.posts.insert_one(new_post.dict())
+    await journal_module_post(new_post.dict())
     
     # Check for @ERIC mention or ERIC_AI visibility and trigger AI response
     should_trigger_eric = '@eric' in content.lower() or '@ERIC' in content or visibility == 'ERIC_AI'
@@ -8469,13 +8376,8 @@ async def create_post(
         "last_name": current_user.last_name
     }
     
-    media_files = []
-    for media_id in valid_media_ids:
-        media = await db.media_files.find_one({"id": media_id})
-        if media:
-            media.pop("_id", None)
-            media["file_url"] = f"/api/media/{media_id}"
-            media_files.append(media)
+    for media in media_files:
+        media["file_url"] = f"/api/media/{media['id']}"
     
     return PostResponse(
         id=new_post.id,
@@ -8523,15 +8425,16 @@ async def like_post(
     
     if existing_like:
         # Unlike: Remove the like
-        await db.post_likes.delete_one({
+        result = await db.post_likes.delete_one({
             "post_id": post_id,
             "user_id": current_user.id
         })
-        # Decrement likes count
-        await db.posts.update_one(
-            {"id": post_id},
-            {"$inc": {"likes_count": -1}}
-        )
+        # Decrement likes count (only if this request removed the like)
+        if result.deleted_count:
+            await db.posts.update_one(
+                {"id": post_id},
+                {"$inc": {"likes_count": -1}}
+            )
         
         # Create unlike notification (remove notification)
         await db.notifications.delete_many({
@@ -8566,7 +8469,7 @@ async def like_post(
                 message=f"{current_user.first_name} {current_user.last_name} лайкнул ваш пост",
                 related_post_id=post_id
             )
-            await db.notifications.insert_one(notification.dict())
+            await save_notification(db.notifications, notification.dict())
         
         return {"liked": True, "message": "Post liked"}
 
@@ -8715,7 +8618,7 @@ async def create_comment(
             related_post_id=post_id,
             related_comment_id=new_comment.id
         )
-        await db.notifications.insert_one(notification.dict())
+        await save_notification(db.notifications, notification.dict())
     
     # Return comment with author info
     return {
@@ -8853,7 +8756,7 @@ async def like_comment(
                 message=f"{current_user.first_name} {current_user.last_name} лайкнул ваш комментарий",
                 related_comment_id=comment_id
             )
-            await db.notifications.insert_one(notification.dict())
+            await save_notification(db.notifications, notification.dict())
         
         return {"liked": True, "message": "Comment liked"}
 
@@ -8874,27 +8777,17 @@ async def add_reaction(
     if emoji not in allowed_emojis:
         raise HTTPException(status_code=400, detail="Invalid emoji")
     
-    # Check if user already has a reaction on this post
-    existing_reaction = await db.post_reactions.find_one({
-        "post_id": post_id,
-        "user_id": current_user.id
-    })
+    # Add or replace the user's reaction and move the post's histogram buckets
+    new_reaction = PostReaction(
+        post_id=post_id,
+        user_id=current_user.id,
+        emoji=emoji
+    )
+    previous_emoji = await set_reaction(db, post_id, current_user.id, emoji, new_reaction.dict())
     
-    if existing_reaction:
-        # Update existing reaction
-        await db.post_reactions.update_one(
-            {"post_id": post_id, "user_id": current_user.id},
-            {"$set": {"emoji": emoji, "created_at": datetime.now(timezone.utc)}}
-        )
+    if previous_emoji:
         message = "Reaction updated"
     else:
-        # Create new reaction
-        new_reaction = PostReaction(
-            post_id=post_id,
-            user_id=current_user.id,
-            emoji=emoji
-        )
-        await db.post_reactions.insert_one(new_reaction.dict())
         message = "Reaction added"
         
         # Create notification for post author (don't notify yourself)
@@ -8907,7 +8800,7 @@ async def add_reaction(
                 message=f"{current_user.first_name} {current_user.last_name} отреагировал на ваш пост: {emoji}",
                 related_post_id=post_id
             )
-            await db.notifications.insert_one(notification.dict())
+            await save_notification(db.notifications, notification.dict())
     
     return {"message": message, "emoji": emoji}
 
@@ -8952,44 +8845,67 @@ async def remove_reaction(
     current_user: User = Depends(get_current_user)
 ):
     """Remove user's reaction from a post"""
-    result = await db.post_reactions.delete_one({
-        "post_id": post_id,
-        "user_id": current_user.id
-    })
+    removed_emoji = await clear_reaction(db, post_id, current_user.id)
     
-    if result.deleted_count == 0:
+    if removed_emoji is None:
         raise HTTPException(status_code=404, detail="Reaction not found")
     
     return {"message": "Reaction removed"}
 
+# Delta sync: one cheap poll instead of timers on every list endpoint
+@api_router.get("/sync")
+async def sync_changes(
+    since: Optional[int] = Query(default=None, ge=0),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Changes for the current user after version `since` (see core/journal.py).
+
+    Returns 204 when nothing changed. Without `since` only the current
+    version is returned - clients call it once after their initial load.
+    A response with `reset: true` means entries were dropped; refetch everything.
+    """
+    if since is None:
+        return {"version": await change_journal.version(current_user.id), "reset": False, "changes": []}
+    delta = await change_journal.changes(current_user.id, since)
+    if delta is None:
+        return Response(status_code=204)
+    return delta
+
 # Notifications Endpoints
 @api_router.get("/notifications")
 async def get_notifications(
+    response: Response,
     unread_only: bool = False,
     limit: int = 50,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Get user notifications"""
+    """Get user notifications (the next page's cursor is sent in X-Next-Cursor)"""
     filter_query = {"user_id": current_user.id}
     if unread_only:
         filter_query["is_read"] = False
     
-    notifications = await db.notifications.find(filter_query)\
-        .sort("created_at", -1)\
-        .limit(limit)\
-        .to_list(limit)
+    notifications = await db.notifications.find(apply_cursor(NEWEST_FIRST, filter_query, cursor))\
+        .sort(NEWEST_FIRST.sort)\
+        .limit(limit + 1)\
+        .to_list(limit + 1)
+    notifications, next_cursor = NEWEST_FIRST.page(notifications, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    # Get sender info for all notifications in one query
+    senders = await request_loaders(db).users.load_many(n.get("sender_id") for n in notifications)
     
-    # Get sender info for each notification
     result = []
     for notification in notifications:
         notification.pop("_id", None)
         
-        # Get sender info
-        sender = await get_user_by_id(notification["sender_id"])
+        sender = senders.get(notification.get("sender_id"))
         notification["sender"] = {
-            "id": sender.id,
-            "first_name": sender.first_name,
-            "last_name": sender.last_name
+            "id": sender["id"],
+            "first_name": sender.get("first_name"),
+            "last_name": sender.get("last_name")
         } if sender else {}
         
         result.append(notification)
@@ -9086,6 +9002,7 @@ async def complete_user_profile(
         {"id": current_user.id},
         {"$set": update_data}
     )
+    await invalidate_user_principal(current_user.id)
     
     return {"message": "Profile completed successfully", "profile_completed": True}
 
@@ -9597,11 +9514,13 @@ async def update_my_info(
         update_data["additional_user_data"] = existing_data
     
     if update_data:
+        update_data.update(search_fields(current_user.dict(), update_data))
         update_data["updated_at"] = datetime.now(timezone.utc)
         await db.users.update_one(
             {"id": current_user.id},
             {"$set": update_data}
         )
+        await invalidate_user_principal(current_user.id)
     
     # Fetch updated user
     updated_user = await get_user_by_id(current_user.id)
@@ -9833,29 +9752,31 @@ async def search_work_organizations(
         # Find matching organizations
         organizations = await db.work_organizations.find(search_query).limit(50).to_list(50)
         
-        results = []
-        for org in organizations:
-            org_id = org.get("id") or org.get("organization_id")
-            
-            # Check if user is already a member
-            membership = await db.work_members.find_one({
-                "organization_id": org_id,
+        org_ids = [org.get("id") or org.get("organization_id") for org in organizations]
+        
+        # Memberships, pending requests and member counts for all results at once
+        member_of, pending, counts = await asyncio.gather(
+            db.work_members.distinct("organization_id", {
+                "organization_id": {"$in": org_ids},
                 "user_id": current_user.id,
                 "is_active": True
-            })
-            
-            # Check if user has pending request
-            pending_request = await db.work_join_requests.find_one({
-                "organization_id": org_id,
+            }),
+            db.work_join_requests.distinct("organization_id", {
+                "organization_id": {"$in": org_ids},
                 "user_id": current_user.id,
                 "status": "pending"
-            })
-            
-            # Count members
-            member_count = await db.work_members.count_documents({
-                "organization_id": org_id,
-                "is_active": True
-            })
+            }),
+            db.work_members.aggregate([
+                {"$match": {"organization_id": {"$in": org_ids}, "is_active": True}},
+                {"$group": {"_id": "$organization_id", "count": {"$sum": 1}}}
+            ]).to_list(None),
+        )
+        member_of, pending = set(member_of), set(pending)
+        member_counts = {c["_id"]: c["count"] for c in counts}
+        
+        results = []
+        for org, org_id in zip(organizations, org_ids):
+            member_count = member_counts.get(org_id, 0)
             
             results.append({
                 "id": org_id,
@@ -9870,8 +9791,8 @@ async def search_work_organizations(
                 "member_count": member_count,
                 "logo_url": org.get("logo_url"),
                 "banner_url": org.get("banner_url"),
-                "user_is_member": membership is not None,
-                "user_has_pending_request": pending_request is not None
+                "user_is_member": org_id in member_of,
+                "user_has_pending_request": org_id in pending
             })
         
         return {"organizations": results, "count": len(results)}
@@ -9938,6 +9859,7 @@ async def create_work_organization(
         
         member_dict = member.model_dump(by_alias=False)
         await db.work_members.insert_one(member_dict)
+        await org_graph.member_changed("work", organization.id, current_user.id)
         
         # Return response with user membership details
         response_data = org_dict.copy()
@@ -10147,6 +10069,7 @@ async def add_work_member(
         
         member_dict = member.model_dump(by_alias=True)
         await db.work_members.insert_one(member_dict)
+        await org_graph.member_changed("work", organization_id, target_user["id"])
         
         # Update organization member count
         await db.work_organizations.update_one(
@@ -10204,10 +10127,12 @@ async def get_work_organization_members(
             "is_active": True
         }).to_list(1000)
         
-        # Enrich with user details
+        # Enrich with user details (one query for all members)
+        users = await request_loaders(db).users.load_many(m["user_id"] for m in members)
+        
         member_responses = []
         for member in members:
-            user = await db.users.find_one({"id": member["user_id"]})
+            user = users.get(member["user_id"])
             
             if user:
                 # Handle field mapping for member
@@ -10334,6 +10259,7 @@ async def leave_work_organization(
                 }
             }
         )
+        await org_graph.member_changed("work", organization_id, current_user.id)
         
         return {
             "message": "Successfully left the organization",
@@ -10413,6 +10339,7 @@ async def remove_work_organization_member(
                 }
             }
         )
+        await org_graph.member_changed("work", organization_id, user_id)
         
         # Update organization member count
         await db.work_organizations.update_one(
@@ -10437,7 +10364,7 @@ async def remove_work_organization_member(
                 "is_read": False,
                 "created_at": datetime.now(timezone.utc)
             }
-            await db.notifications.insert_one(notification)
+            await save_notification(db.notifications, notification)
         
         return {
             "message": "Member removed successfully",
@@ -10525,6 +10452,7 @@ async def update_work_member_role(
             {"_id": member["_id"]},
             {"$set": update_dict}
         )
+        await org_graph.org_changed("work", organization_id)
         
         # Send notification to member about role change
         target_user = await db.users.find_one({"id": user_id})
@@ -10546,7 +10474,7 @@ async def update_work_member_role(
                 "is_read": False,
                 "created_at": datetime.now(timezone.utc)
             }
-            await db.notifications.insert_one(notification)
+            await save_notification(db.notifications, notification)
         
         return {
             "message": "Member role updated successfully",
@@ -10640,6 +10568,7 @@ async def transfer_organization_ownership(
                 {"_id": old_owner_membership["_id"]},
                 {"$set": {"is_admin": True}}
             )
+        await org_graph.org_changed("work", organization_id)
         
         # Send notification to new owner
         new_owner = await db.users.find_one({"id": new_owner_id})
@@ -10658,7 +10587,7 @@ async def transfer_organization_ownership(
                 "is_read": False,
                 "created_at": datetime.now(timezone.utc)
             }
-            await db.notifications.insert_one(notification)
+            await save_notification(db.notifications, notification)
         
         return {
             "message": "Ownership transferred successfully",
@@ -10726,6 +10655,7 @@ async def join_work_organization(
         }
         
         await db.work_members.insert_one(new_member)
+        await org_graph.member_changed("work", organization_id, current_user.id)
         
         return {
             "message": "Successfully joined organization",
@@ -10939,6 +10869,7 @@ async def approve_join_request(
         }
         
         await db.work_members.insert_one(new_member)
+        await org_graph.member_changed("work", join_request["organization_id"], join_request["user_id"])
         
         # Update request status
         await db.work_join_requests.update_one(
@@ -10965,7 +10896,7 @@ async def approve_join_request(
             related_request_id=request_id
         )
         
-        await db.work_notifications.insert_one(notification.model_dump())
+        await save_notification(db.work_notifications, notification.model_dump())
         
         return {
             "message": "Join request approved successfully",
@@ -11038,7 +10969,7 @@ async def reject_join_request(
             related_request_id=request_id
         )
         
-        await db.work_notifications.insert_one(notification.model_dump())
+        await save_notification(db.work_notifications, notification.model_dump())
         
         return {"message": "Join request rejected"}
         
@@ -11087,6 +11018,7 @@ async def cancel_join_request(
 @api_router.get("/work/posts/feed")
 async def get_work_feed(
     limit: int = 50,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """Get posts feed from all organizations user is a member of"""
@@ -11100,24 +11032,34 @@ async def get_work_feed(
         org_ids = [m["organization_id"] for m in memberships]
         
         if not org_ids:
-            return {"posts": [], "count": 0}
+            return {"posts": [], "count": 0, "next_cursor": None}
         
         # Get posts from all these organizations
-        posts = await db.work_posts.find({
-            "organization_id": {"$in": org_ids}
-        }).sort("created_at", -1).limit(limit).to_list(length=limit)
+        query = apply_cursor(NEWEST_FIRST, {"organization_id": {"$in": org_ids}}, cursor)
+        posts = await db.work_posts.find(query).sort(NEWEST_FIRST.sort).limit(limit + 1).to_list(length=limit + 1)
+        posts, next_cursor = NEWEST_FIRST.page(posts, limit)
+        
+        # Organizations, likes and authors for the whole page, one query each
+        loaders = request_loaders(db)
+        orgs, liked_post_ids, authors = await asyncio.gather(
+            loaders.load_organizations(p["organization_id"] for p in posts),
+            db.work_post_likes.distinct("post_id", {
+                "post_id": {"$in": [p["id"] for p in posts]},
+                "user_id": current_user.id
+            }),
+            loaders.users.load_many(
+                p.get("posted_by_user_id") or p.get("author_id")
+                for p in posts if "author_name" not in p
+            ),
+        )
+        liked_post_ids = set(liked_post_ids)
         
         # For each post, add organization info and check if user liked it
         for post in posts:
             post.pop("_id", None)
             
             # Get organization info
-            org = await db.work_organizations.find_one({
-                "$or": [
-                    {"id": post["organization_id"]},
-                    {"organization_id": post["organization_id"]}
-                ]
-            })
+            org = orgs.get(post["organization_id"])
             
             if org:
                 post["organization_name"] = org.get("name", "Unknown")
@@ -11127,11 +11069,7 @@ async def get_work_feed(
                 post["organization_logo"] = ""
             
             # Check if user liked this post
-            like = await db.work_post_likes.find_one({
-                "post_id": post["id"],
-                "user_id": current_user.id
-            })
-            post["user_has_liked"] = like is not None
+            post["user_has_liked"] = post["id"] in liked_post_ids
             
             # Ensure post_type is set (default to REGULAR for legacy posts)
             if "post_type" not in post:
@@ -11145,7 +11083,7 @@ async def get_work_feed(
             if "author_name" not in post:
                 author_id = post.get("posted_by_user_id") or post.get("author_id")
                 if author_id:
-                    author = await db.users.find_one({"id": author_id}, {"_id": 0})
+                    author = authors.get(author_id)
                     if author:
                         post["author_name"] = f"{author.get('first_name', '')} {author.get('last_name', '')}".strip()
                         post["author_id"] = author_id
@@ -11155,8 +11093,10 @@ async def get_work_feed(
                         post["author_id"] = author_id
                         post["author_avatar"] = None
         
-        return {"posts": posts, "count": len(posts)}
+        return {"posts": posts, "count": len(posts), "next_cursor": next_cursor}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Get feed error: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -11914,6 +11854,7 @@ async def list_announcements(
     pinned: Optional[bool] = None,
     limit: int = 50,
     offset: int = 0,
+    count: CountMode = CountMode.CAPPED,
     current_user: User = Depends(get_current_user)
 ):
     """List announcements in an organization."""
@@ -11946,7 +11887,7 @@ async def list_announcements(
             ]
         
         # Get total count
-        total = await db.announcements.count_documents(query)
+        counted = await list_counter.count(db.announcements, query, count)
         
         # Get announcements with sorting (pinned first, then by date)
         announcements_cursor = db.announcements.find(query).sort([
@@ -11956,28 +11897,33 @@ async def list_announcements(
         
         announcements = await announcements_cursor.to_list(length=None)
         
-        # Enrich with author and department details
+        # Enrich with author and department details (one query per collection)
+        loaders = request_loaders(db)
+        authors, departments = await asyncio.gather(
+            loaders.users.load_many(a["author_id"] for a in announcements),
+            loaders.departments.load_many(a.get("department_id") for a in announcements),
+        )
+        
         result = []
         for ann in announcements:
             # Get author details
-            author = await db.users.find_one({"id": ann["author_id"]})
+            author = authors.get(ann["author_id"])
             if author:
                 ann["author_name"] = f"{author.get('first_name', '')} {author.get('last_name', '')}"
                 ann["author_avatar"] = author.get("avatar_url")
             
             # Get department details if exists
-            if ann.get("department_id"):
-                dept = await db.departments.find_one({"id": ann["department_id"]})
-                if dept:
-                    ann["department_name"] = dept.get("name")
-                    ann["department_color"] = dept.get("color")
+            dept = departments.get(ann.get("department_id"))
+            if dept:
+                ann["department_name"] = dept.get("name")
+                ann["department_color"] = dept.get("color")
             
             result.append(ann)
         
         return {
             "success": True,
             "data": result,
-            "total": total,
+            **counted.fields(),
             "limit": limit,
             "offset": offset
         }
@@ -12313,16 +12259,21 @@ async def get_organization_followers(
         followers_cursor = db.organization_follows.find({"organization_id": organization_id})
         followers = await followers_cursor.to_list(length=None)
         
-        # Enrich with user details
+        # Enrich with user details and the viewer's relationship to each follower
+        follower_ids = [follow["follower_id"] for follow in followers]
+        users = await request_loaders(db).users.load_many(follower_ids)
+        relations = await relationships.resolve(current_user.id, follower_ids)
         result = []
         for follow in followers:
-            user = await db.users.find_one({"id": follow["follower_id"]})
+            user = users.get(follow["follower_id"])
             if user:
+                relation = relations.get(user["id"])
                 result.append({
                     "user_id": user["id"],
                     "user_name": f"{user.get('first_name', '')} {user.get('last_name', '')}",
                     "user_avatar": user.get("avatar_url"),
-                    "followed_at": follow["followed_at"]
+                    "followed_at": follow["followed_at"],
+                    **(relation.flags() if relation else {})
                 })
         
         return {
@@ -12409,7 +12360,7 @@ async def create_join_request_with_notification(
                 "is_read": False,
                 "created_at": datetime.now(timezone.utc)
             }
-            await db.notifications.insert_one(notification)
+            await save_notification(db.notifications, notification)
         
         return {
             "success": True,
@@ -13848,10 +13799,12 @@ async def get_schedules(
         schedules_cursor = db.class_schedules.find(query).sort([("day_of_week", 1), ("lesson_number", 1)])
         schedules = await schedules_cursor.to_list(1000)  # Safety limit to prevent memory exhaustion
         
-        # Enrich with teacher names
+        # Enrich with teacher names (one query for all teachers)
+        teachers = await request_loaders(db).users.load_many(s["teacher_id"] for s in schedules)
+        
         schedule_responses = []
         for schedule in schedules:
-            teacher = await db.users.find_one({"id": schedule["teacher_id"]})
+            teacher = teachers.get(schedule["teacher_id"])
             teacher_name = f"{teacher.get('first_name', '')} {teacher.get('last_name', '')}" if teacher else None
             
             schedule_responses.append(ScheduleResponse(
@@ -14004,10 +13957,12 @@ async def get_student_grades(
         grades_cursor = db.student_grades.find(query).sort("date", -1)
         grades = await grades_cursor.to_list(1000)  # Safety limit to prevent memory exhaustion
         
-        # Enrich with teacher and student names
+        # Enrich with teacher and student names (one query for all teachers)
+        teachers = await request_loaders(db).users.load_many(g["teacher_id"] for g in grades)
+        
         grade_responses = []
         for grade in grades:
-            teacher = await db.users.find_one({"id": grade["teacher_id"]})
+            teacher = teachers.get(grade["teacher_id"])
             teacher_name = f"{teacher.get('first_name', '')} {teacher.get('last_name', '')}" if teacher else None
             student_name = f"{student.get('student_last_name', '')} {student.get('student_first_name', '')}"
             
@@ -14089,11 +14044,17 @@ async def get_class_grades(
         # Get unique subjects
         subjects = list(set([g["subject"] for g in grades]))
         
+        # Index grades by (student, subject) and load every teacher in one query
+        grades_by_student_subject = {}
+        for g in grades:
+            grades_by_student_subject.setdefault((g["student_id"], g["subject"]), []).append(g)
+        teachers = await request_loaders(db).users.load_many(g["teacher_id"] for g in grades)
+        
         for student in students:
             student_name = f"{student.get('student_last_name', '')} {student.get('student_first_name', '')}"
             
             for subj in subjects:
-                student_grades = [g for g in grades if g["student_id"] == student["student_id"] and g["subject"] == subj]
+                student_grades = grades_by_student_subject.get((student["student_id"], subj), [])
                 
                 if student_grades:
                     # Calculate weighted average
@@ -14104,7 +14065,7 @@ async def get_class_grades(
                     # Enrich grades with teacher names
                     enriched_grades = []
                     for g in student_grades:
-                        teacher = await db.users.find_one({"id": g["teacher_id"]})
+                        teacher = teachers.get(g["teacher_id"])
                         teacher_name = f"{teacher.get('first_name', '')} {teacher.get('last_name', '')}" if teacher else None
                         
                         enriched_grades.append(GradeResponse(
@@ -14186,6 +14147,9 @@ async def create_journal_post(
         if user_role == "parent" and post_data.audience_type not in [JournalAudienceType.PARENTS, JournalAudienceType.PUBLIC]:
             raise HTTPException(status_code=403, detail="Родители могут публиковать только для других родителей или публично")
         
+        # Only the author's own uploads can be attached
+        media_file_ids = [m["id"] for m in await attach_media(db, post_data.media_file_ids, current_user.id)]
+        
         # Create post
         post_id = str(uuid.uuid4())
         post_doc = {
@@ -14196,7 +14160,7 @@ async def create_journal_post(
             "title": post_data.title,
             "content": post_data.content,
             "audience_type": post_data.audience_type,
-            "media_files": post_data.media_file_ids,
+            "media_files": media_file_ids,
             "likes_count": 0,
             "comments_count": 0,
             "is_published": True,
@@ -14223,7 +14187,7 @@ async def create_journal_post(
             title=post_data.title,
             content=post_data.content,
             audience_type=post_data.audience_type,
-            media_files=post_data.media_file_ids,
+            media_files=media_file_ids,
             likes_count=0,
             comments_count=0,
             is_published=True,
@@ -14620,6 +14584,9 @@ async def rsvp_to_event(
                 }
             }
         )
+        await change_journal.record(
+            [event.get("created_by_user_id")], "rsvp", event_id, {"user_id": current_user.id, "status": rsvp.status}
+        )
         
         # Calculate summary
         rsvp_summary = {"YES": 0, "NO": 0, "MAYBE": 0}
@@ -15322,6 +15289,7 @@ async def approve_change_request(
             {"_id": target_membership["_id"]},
             {"$set": update_fields}
         )
+        await org_graph.org_changed("work", organization_id)
         
         # Mark request as approved
         await db.work_change_requests.update_one(
@@ -15361,7 +15329,7 @@ async def approve_change_request(
             related_request_id=request_id
         )
         
-        await db.work_notifications.insert_one(notification.model_dump())
+        await save_notification(db.work_notifications, notification.model_dump())
         
         return {"success": True, "message": "Запрос одобрен"}
         
@@ -15447,7 +15415,7 @@ async def reject_change_request(
             related_request_id=request_id
         )
         
-        await db.work_notifications.insert_one(notification.model_dump())
+        await save_notification(db.work_notifications, notification.model_dump())
         
         return {"success": True, "message": "Запрос отклонен"}
         
@@ -15616,7 +15584,7 @@ async def create_organization_event(
                 message=f"Создано событие '{event_data.title}' в {org_name} на {event_date_str}",
                 related_request_id=new_event.id
             )
-            await db.work_notifications.insert_one(notification.model_dump())
+            await save_notification(db.work_notifications, notification.model_dump())
         
         return {"success": True, "message": "Событие создано", "event_id": new_event.id}
         
@@ -15882,7 +15850,7 @@ async def update_organization_event(
                         message=notif_message,
                         related_request_id=event_id
                     )
-                    await db.work_notifications.insert_one(notification.model_dump())
+                    await save_notification(db.work_notifications, notification.model_dump())
         
         return {"success": True, "message": "Событие обновлено"}
         
@@ -15964,6 +15932,10 @@ async def rsvp_to_work_event(
             {"id": event_id},
             {"$set": {f"rsvp_responses.{current_user.id}": rsvp_data.response.value}}
         )
+        await change_journal.record(
+            [event.get("created_by_user_id")], "rsvp", event_id,
+            {"user_id": current_user.id, "status": rsvp_data.response.value}
+        )
         
         return {"success": True, "message": "RSVP обновлен"}
         
@@ -16200,7 +16172,7 @@ async def create_event_reminder_notification(user_id: str, event: dict, interval
             "created_at": datetime.now(timezone.utc)
         }
         
-        await db.work_notifications.insert_one(notification)
+        await save_notification(db.work_notifications, notification)
         logger.info(f"Created reminder notification for user {user_id}")
         
     except Exception as e:
@@ -16489,6 +16461,7 @@ async def create_task(
         
         # Send notification to assigned user
         if task_data.assigned_to and task_data.assigned_to != current_user.id:
+            await change_journal.record([task_data.assigned_to], "task", new_task.id, {"organization_id": organization_id})
             _org = await db.work_organizations.find_one({"id": organization_id})
             notification = WorkNotification(
                 user_id=task_data.assigned_to,
@@ -16499,7 +16472,7 @@ async def create_task(
                 related_entity_type="task",
                 related_entity_id=new_task.id
             )
-            await db.work_notifications.insert_one(notification.model_dump())
+            await save_notification(db.work_notifications, notification.model_dump())
         
         # Build and return response
         task_dict = new_task.model_dump()
@@ -16677,21 +16650,27 @@ async def get_tasks_for_calendar(
         # Fetch tasks
         tasks = await db.work_tasks.find(query, {"_id": 0}).to_list(500)
         
+        # Creators, assignees and organizations for all tasks, one query per collection
+        loaders = request_loaders(db)
+        users, orgs = await asyncio.gather(
+            loaders.users.load_many(
+                [t["created_by"] for t in tasks] +
+                [t.get("assigned_to") or t.get("accepted_by") for t in tasks]
+            ),
+            loaders.organizations.load_many(t["organization_id"] for t in tasks),
+        )
+        
         # Build calendar task responses
         calendar_tasks = []
         for task in tasks:
             # Get creator info
-            creator = await db.users.find_one({"id": task["created_by"]}, {"_id": 0})
+            creator = users.get(task["created_by"])
             
             # Get assignee info if assigned
-            assignee = None
-            if task.get("assigned_to"):
-                assignee = await db.users.find_one({"id": task["assigned_to"]}, {"_id": 0})
-            elif task.get("accepted_by"):
-                assignee = await db.users.find_one({"id": task["accepted_by"]}, {"_id": 0})
+            assignee = users.get(task.get("assigned_to") or task.get("accepted_by"))
             
             # Get organization info
-            org = await db.work_organizations.find_one({"id": task["organization_id"]}, {"_id": 0})
+            org = orgs.get(task["organization_id"])
             
             # Check if task is overdue (handle both naive and aware datetimes)
             is_overdue = False
@@ -16816,6 +16795,11 @@ async def update_task(
             {"$set": update_dict}
         )
         
+        # Journal the task for its (new) assignee
+        assignee = update_dict.get("assigned_to") or task.get("assigned_to")
+        if assignee and assignee != current_user.id:
+            await change_journal.record([assignee], "task", task_id, {"organization_id": organization_id})
+        
         updated_task = await db.work_tasks.find_one({"id": task_id}, {"_id": 0})
         response = await build_task_response(updated_task, current_user.id)
         
@@ -16884,7 +16868,7 @@ async def accept_task(
                 related_entity_type="task",
                 related_entity_id=task_id
             )
-            await db.work_notifications.insert_one(notification.model_dump())
+            await save_notification(db.work_notifications, notification.model_dump())
         
         updated_task = await db.work_tasks.find_one({"id": task_id}, {"_id": 0})
         response = await build_task_response(updated_task, current_user.id)
@@ -16936,6 +16920,10 @@ async def update_task_status(
         
         # Handle completion
         if status_update.status == TaskStatus.DONE:
+            # Only photos uploaded by the user completing the task count as proof
+            status_update.completion_photo_ids = [
+                m["id"] for m in await attach_media(db, status_update.completion_photo_ids, current_user.id)
+            ]
             # Check if photo proof is required
             if task.get("requires_photo_proof") and not status_update.completion_photo_ids:
                 raise HTTPException(status_code=400, detail="Требуется фото подтверждение выполнения")
@@ -16986,7 +16974,7 @@ async def update_task_status(
                     related_entity_type="task",
                     related_entity_id=task_id
                 )
-                await db.work_notifications.insert_one(notification.model_dump())
+                await save_notification(db.work_notifications, notification.model_dump())
         
         await db.work_tasks.update_one({"id": task_id}, {"$set": update_dict})
         
@@ -17449,10 +17437,10 @@ async def websocket_chat_endpoint(
                 message_ids = data.get("message_ids", [])
                 if message_ids:
                     # Update direct chat messages
-                    await db.direct_chat_messages.update_many(
+                    await db.chat_messages.update_many(
                         {
                             "id": {"$in": message_ids},
-                            "sender_id": {"$ne": user_id}
+                            "user_id": {"$ne": user_id}
                         },
                         {"$set": {"status": "read", "read_at": datetime.now(timezone.utc)}}
                     )
@@ -17470,13 +17458,13 @@ async def websocket_chat_endpoint(
                 # Mark messages as delivered
                 message_ids = data.get("message_ids", [])
                 if message_ids:
-                    await db.direct_chat_messages.update_many(
+                    await db.chat_messages.update_many(
                         {
                             "id": {"$in": message_ids},
-                            "sender_id": {"$ne": user_id},
+                            "user_id": {"$ne": user_id},
                             "status": "sent"
                         },
-                        {"$set": {"status": "delivered"}}
+                        {"$set": {"status": "delivered", "delivered_at": datetime.now(timezone.utc)}}
                     )
                     
                     # Broadcast delivered status
@@ -17511,11 +17499,12 @@ async def websocket_chat_endpoint(
         # Disconnect and cleanup
         await chat_manager.disconnect(websocket, user_id, chat_id)
         
-        # Update user offline status
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"is_online": False, "last_seen": datetime.now(timezone.utc)}}
-        )
+        # Update user offline status (other tabs on this worker keep it online)
+        if not chat_manager.is_user_online(user_id):
+            await db.users.update_one(
+                {"id": user_id},
+                {"$set": {"is_online": False, "last_seen": datetime.now(timezone.utc)}}
+            )
         
         # Notify others that user is offline
         await chat_manager.broadcast_to_chat(chat_id, {
@@ -17529,6 +17518,30 @@ async def websocket_chat_endpoint(
 
 # ===== NEWS MODULE - FRIENDS & FOLLOWERS ENDPOINTS =====
 
+# Each active user's friend, following and channel ids, cached per worker and
+# updated in place by the friend, follow and subscribe endpoints below
+from core.relationship_sets import RelationshipSets
+
+relationship_sets = RelationshipSets(db)
+relationship_sets.attach(cache)
+
+# "People you may know" lists are materialized per user from the friend and
+# organization graphs; relationship changes drop or expire them
+from core.suggestions import SuggestionEngine
+
+suggestion_engine = SuggestionEngine(db, org_graph, relationship_sets=relationship_sets)
+
+# Friend/follow/request flags for many users at once (batched $in queries)
+from core.relationships import RelationshipResolver
+
+relationships = RelationshipResolver(db, relationship_sets)
+
+# Friend/follower/following counts on users and subscriber counts on
+# channels, kept by $inc and repaired by the periodic cleanup job
+from core.social_counters import USER_COUNTERS, SocialCounters, counts_of
+
+social_counters = SocialCounters(db)
+
 @api_router.post("/friends/request")
 async def send_friend_request(
     receiver_id: str = Form(...),
@@ -17573,6 +17586,8 @@ async def send_friend_request(
     )
     
     await db.friend_requests.insert_one(friend_request.model_dump())
+    await suggestion_engine.drop(current_user.id, [receiver_id])
+    await suggestion_engine.drop(receiver_id, [current_user.id])
     
     return {
         "message": "Friend request sent",
@@ -17614,6 +17629,11 @@ async def accept_friend_request(
     )
     
     await db.user_friendships.insert_one(friendship.model_dump())
+    await social_counters.befriended(current_user.id, friend_request["sender_id"])
+    await relationship_sets.friended(current_user.id, friend_request["sender_id"])
+    await news_timelines.refresh_connection(current_user.id, friend_request["sender_id"])
+    await news_timelines.refresh_connection(friend_request["sender_id"], current_user.id)
+    await suggestion_engine.expire([current_user.id, friend_request["sender_id"]])
     
     return {
         "message": "Friend request accepted",
@@ -17675,6 +17695,12 @@ async def remove_friend(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Friendship not found")
     
+    await social_counters.unfriended(current_user.id, friend_id)
+    await relationship_sets.unfriended(current_user.id, friend_id)
+    await news_timelines.refresh_connection(current_user.id, friend_id)
+    await news_timelines.refresh_connection(friend_id, current_user.id)
+    await suggestion_engine.expire([current_user.id, friend_id])
+    
     return {"message": "Friend removed"}
 
 @api_router.get("/friends")
@@ -17703,7 +17729,7 @@ async def get_friends(
     if friend_ids:
         friends_data = await db.users.find(
             {"id": {"$in": friend_ids}},
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         ).to_list(1000)
         
         for friend in friends_data:
@@ -17738,7 +17764,7 @@ async def get_incoming_friend_requests(
     if sender_ids:
         senders_data = await db.users.find(
             {"id": {"$in": sender_ids}},
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         ).to_list(100)
         senders = {s["id"]: s for s in senders_data}
     
@@ -17767,7 +17793,7 @@ async def get_outgoing_friend_requests(
     if receiver_ids:
         receivers_data = await db.users.find(
             {"id": {"$in": receiver_ids}},
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         ).to_list(100)
         receivers = {r["id"]: r for r in receivers_data}
     
@@ -17811,6 +17837,10 @@ async def follow_user(
     )
     
     await db.user_follows.insert_one(follow.model_dump())
+    await social_counters.followed(current_user.id, user_id)
+    await relationship_sets.followed(current_user.id, user_id)
+    await news_timelines.refresh_connection(current_user.id, user_id)
+    await suggestion_engine.drop(current_user.id, [user_id])
     
     return {
         "message": "Now following user",
@@ -17831,34 +17861,25 @@ async def unfollow_user(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Not following this user")
     
+    await social_counters.unfollowed(current_user.id, user_id)
+    await relationship_sets.unfollowed(current_user.id, user_id)
+    await news_timelines.refresh_connection(current_user.id, user_id)
+    await suggestion_engine.expire([current_user.id])
+    
     return {"message": "Unfollowed user"}
 
 @api_router.get("/users/{user_id}/follow/status")
-async def get_user_follow_status(
-    user_id: str,
-    current_user: User = Depends(get_current_user)
-):
-    """Check if current user follows a specific user and vice versa"""
-    is_following = await db.user_follows.find_one({
-        "follower_id": current_user.id,
-        "target_id": user_id
-    }) is not None
-    
-    is_followed_by = await db.user_follows.find_one({
-        "follower_id": user_id,
-        "target_id": current_user.id
-    }) is not None
-    
-    is_friend = await db.user_friendships.find_one({
-        "$or": [
-            {"user1_id": min(current_user.id, user_id), "user2_id": max(current_user.id, user_id)}
-        ]
-    }) is not None
+async def get_user_follow_status(
+    user_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Check if current user follows a specific user and vice versa"""
+    relation = await relationships.between(current_user.id, user_id)
     
     return {
-        "is_following": is_following,
-        "is_followed_by": is_followed_by,
-        "is_friend": is_friend
+        "is_following": relation.is_following,
+        "is_followed_by": relation.follows_me,
+        "is_friend": relation.is_friend
     }
 
 @api_router.get("/users/me/followers")
@@ -17876,7 +17897,7 @@ async def get_my_followers(
     if follower_ids:
         followers_data = await db.users.find(
             {"id": {"$in": follower_ids}},
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         ).to_list(1000)
         
         for follower in followers_data:
@@ -17906,7 +17927,7 @@ async def get_my_following(
     if target_ids:
         following_data = await db.users.find(
             {"id": {"$in": target_ids}},
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         ).to_list(1000)
         
         for user in following_data:
@@ -17926,23 +17947,8 @@ async def get_social_stats(
     current_user: User = Depends(get_current_user)
 ):
     """Get social stats for the current user"""
-    # Count friends
-    friends_count = await db.user_friendships.count_documents({
-        "$or": [
-            {"user1_id": current_user.id},
-            {"user2_id": current_user.id}
-        ]
-    })
-    
-    # Count followers
-    followers_count = await db.user_follows.count_documents({
-        "target_id": current_user.id
-    })
-    
-    # Count following
-    following_count = await db.user_follows.count_documents({
-        "follower_id": current_user.id
-    })
+    # Friend/follower/following counters are stored on the user document
+    counts = await social_counters.user_counts(current_user.id)
     
     # Count pending friend requests
     pending_requests = await db.friend_requests.count_documents({
@@ -17951,235 +17957,32 @@ async def get_social_stats(
     })
     
     return {
-        "friends_count": friends_count,
-        "followers_count": followers_count,
-        "following_count": following_count,
+        **counts,
         "pending_friend_requests": pending_requests
     }
 
 @api_router.get("/users/suggestions")
 async def get_user_suggestions(
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
     current_user: User = Depends(get_current_user)
 ):
-    """Get suggested users to follow/friend (people you may know) with smart ranking - OPTIMIZED"""
-    
-    # Get current user's profile info for matching
-    user_city = current_user.address_city
-    user_country = current_user.address_country
-    
-    # ========== BATCH QUERY 1: Get exclusion sets ==========
-    friendships, following, pending_requests = await asyncio.gather(
-        db.user_friendships.find({
-            "$or": [
-                {"user1_id": current_user.id},
-                {"user2_id": current_user.id}
-            ]
-        }, {"_id": 0, "user1_id": 1, "user2_id": 1}).to_list(1000),
-        
-        db.user_follows.find({
-            "follower_id": current_user.id
-        }, {"_id": 0, "target_id": 1}).to_list(1000),
-        
-        db.friend_requests.find({
-            "$or": [
-                {"sender_id": current_user.id, "status": "pending"},
-                {"receiver_id": current_user.id, "status": "pending"}
-            ]
-        }, {"_id": 0, "sender_id": 1, "receiver_id": 1}).to_list(1000)
-    )
-    
-    friend_ids = set()
-    for f in friendships:
-        if f["user1_id"] == current_user.id:
-            friend_ids.add(f["user2_id"])
-        else:
-            friend_ids.add(f["user1_id"])
+    """Get suggested users to follow/friend (people you may know), ranked by mutual friends, colleagues, school and location"""
+    suggestions, has_more = await suggestion_engine.page(current_user.id, offset=offset, limit=limit)
     
-    following_ids = {f["target_id"] for f in following}
-    pending_ids = {r["sender_id"] for r in pending_requests} | {r["receiver_id"] for r in pending_requests}
+    # The list may predate a friendship, follow or request made elsewhere
+    relations = await relationships.resolve(current_user.id, [s["id"] for s in suggestions])
+    fresh, outdated = [], []
+    for suggestion in suggestions:
+        relation = relations[suggestion["id"]]
+        if relation.is_friend or relation.is_following or relation.request_sent or relation.request_received:
+            outdated.append(suggestion["id"])
+            continue
+        suggestion.update(relation.flags())
+        fresh.append(suggestion)
+    await suggestion_engine.drop(current_user.id, outdated)
     
-    # Exclude self, friends, already following, and pending requests
-    exclude_ids = friend_ids | following_ids | pending_ids | {current_user.id}
-    
-    # ========== BATCH QUERY 2: Get user's organization/school context ==========
-    user_work_memberships, user_school_memberships, user_children = await asyncio.gather(
-        db.work_members.find({
-            "user_id": current_user.id,
-            "status": "active"
-        }, {"_id": 0, "organization_id": 1}).to_list(100),
-        
-        db.school_memberships.find({
-            "user_id": current_user.id
-        }, {"_id": 0, "organization_id": 1}).to_list(100),
-        
-        db.family_students.find({
-            "parent_ids": current_user.id
-        }, {"_id": 0, "organization_id": 1}).to_list(50)
-    )
-    
-    user_org_ids = [m["organization_id"] for m in user_work_memberships]
-    user_school_ids = [m["organization_id"] for m in user_school_memberships]
-    child_school_ids = [c.get("organization_id") for c in user_children if c.get("organization_id")]
-    all_school_ids = list(set(user_school_ids + child_school_ids))
-    
-    # ========== Get candidate users ==========
-    suggestions_raw = await db.users.find(
-        {"id": {"$nin": list(exclude_ids)}},
-        {"_id": 0, "password_hash": 0}
-    ).limit(limit * 3).to_list(limit * 3)
-    
-    if not suggestions_raw:
-        return {"suggestions": []}
-    
-    suggestion_ids = [s["id"] for s in suggestions_raw]
-    
-    # ========== BATCH QUERY 3: Get ALL related data at once ==========
-    # Build queries conditionally to avoid empty $in issues
-    queries = [
-        # All friendships for suggested users (always needed)
-        db.user_friendships.find({
-            "$or": [
-                {"user1_id": {"$in": suggestion_ids}},
-                {"user2_id": {"$in": suggestion_ids}}
-            ]
-        }, {"_id": 0, "user1_id": 1, "user2_id": 1}).to_list(5000),
-        
-        # Users who follow current user (always needed)
-        db.user_follows.find({
-            "follower_id": {"$in": suggestion_ids},
-            "target_id": current_user.id
-        }, {"_id": 0, "follower_id": 1}).to_list(500)
-    ]
-    
-    # Conditionally add work/school queries only if user has relevant memberships
-    has_work_orgs = bool(user_org_ids)
-    has_schools = bool(all_school_ids)
-    
-    results = await asyncio.gather(*queries)
-    all_friendships = results[0]
-    follows_me_list = results[1]
-    
-    # Run work/school queries only if needed
-    all_work_memberships = []
-    all_school_memberships = []
-    all_children = []
-    
-    if has_work_orgs or has_schools:
-        extra_queries = []
-        if has_work_orgs:
-            extra_queries.append(
-                db.work_members.find({
-                    "user_id": {"$in": suggestion_ids},
-                    "organization_id": {"$in": user_org_ids},
-                    "status": "active"
-                }, {"_id": 0, "user_id": 1, "organization_id": 1}).to_list(500)
-            )
-        if has_schools:
-            extra_queries.append(
-                db.school_memberships.find({
-                    "user_id": {"$in": suggestion_ids},
-                    "organization_id": {"$in": all_school_ids}
-                }, {"_id": 0, "user_id": 1}).to_list(500)
-            )
-            extra_queries.append(
-                db.family_students.find({
-                    "parent_ids": {"$in": suggestion_ids},
-                    "organization_id": {"$in": all_school_ids}
-                }, {"_id": 0, "parent_ids": 1}).to_list(500)
-            )
-        
-        extra_results = await asyncio.gather(*extra_queries)
-        idx = 0
-        if has_work_orgs:
-            all_work_memberships = extra_results[idx]
-            idx += 1
-        if has_schools:
-            all_school_memberships = extra_results[idx]
-            idx += 1
-            all_children = extra_results[idx] if idx < len(extra_results) else []
-    
-    # Build lookup maps for O(1) access
-    # Map: user_id -> set of their friend_ids
-    user_friends_map = {}
-    for f in all_friendships:
-        u1, u2 = f["user1_id"], f["user2_id"]
-        if u1 in suggestion_ids:
-            if u1 not in user_friends_map:
-                user_friends_map[u1] = set()
-            user_friends_map[u1].add(u2)
-        if u2 in suggestion_ids:
-            if u2 not in user_friends_map:
-                user_friends_map[u2] = set()
-            user_friends_map[u2].add(u1)
-    
-    # Set of users who are colleagues
-    colleague_user_ids = {m["user_id"] for m in all_work_memberships}
-    
-    # Set of users connected via school
-    school_connected_ids = {m["user_id"] for m in all_school_memberships}
-    for child in all_children:
-        for parent_id in child.get("parent_ids", []):
-            if parent_id in suggestion_ids:
-                school_connected_ids.add(parent_id)
-    
-    # Set of users who follow me
-    follows_me_ids = {f["follower_id"] for f in follows_me_list}
-    
-    # ========== Score each suggestion using cached data ==========
-    scored_suggestions = []
-    
-    for suggestion in suggestions_raw:
-        user_id = suggestion["id"]
-        score = 0
-        reasons = []
-        
-        # 1. Mutual friends (using cached data)
-        their_friends = user_friends_map.get(user_id, set())
-        mutual = friend_ids & their_friends
-        mutual_count = len(mutual)
-        if mutual_count > 0:
-            score += mutual_count * 10
-            if mutual_count == 1:
-                reasons.append("1 общий друг")
-            else:
-                reasons.append(f"{mutual_count} общих друзей")
-        
-        # 2. Same city
-        if user_city and suggestion.get("address_city") == user_city:
-            score += 5
-            reasons.append(f"Живёт в {user_city}")
-        # 3. Same country
-        elif user_country and suggestion.get("address_country") == user_country:
-            score += 2
-            reasons.append(f"Из {user_country}")
-        
-        # 4. Colleague (using cached data)
-        if user_id in colleague_user_ids:
-            score += 8
-            reasons.append("Коллега")
-        
-        # 5. Same school (using cached data)
-        if user_id in school_connected_ids:
-            score += 7
-            reasons.append("Из той же школы")
-        
-        # 6. They follow me (using cached data)
-        if user_id in follows_me_ids:
-            score += 6
-            reasons.append("Подписан на вас")
-        
-        # Only include if there's at least one reason or we need more
-        if score > 0 or len(scored_suggestions) < limit // 2:
-            suggestion["score"] = score
-            suggestion["mutual_friends_count"] = mutual_count
-            suggestion["suggestion_reasons"] = reasons[:3]
-            scored_suggestions.append(suggestion)
-    
-    # Sort by score (highest first)
-    scored_suggestions.sort(key=lambda x: x.get("score", 0), reverse=True)
-    
-    return {"suggestions": scored_suggestions[:limit]}
+    return {"suggestions": fresh, "has_more": has_more}
 
 @api_router.get("/users/search")
 async def search_users(
@@ -18191,53 +17994,20 @@ async def search_users(
     if len(query) < 2:
         return {"users": []}
 
-    # Escape user input to prevent NoSQL injection via regex
-    escaped_query = re.escape(query)
-
-    # Search by first_name or last_name (case-insensitive)
-    search_regex = {"$regex": escaped_query, "$options": "i"}
+    if people_query(query) is None:
+        return {"users": []}
 
-    users = await db.users.find(
-        {
-            "$and": [
-                {"id": {"$ne": current_user.id}},  # Exclude self
-                {
-                    "$or": [
-                        {"first_name": search_regex},
-                        {"last_name": search_regex},
-                        {"email": search_regex}
-                    ]
-                }
-            ]
-        },
-        {"_id": 0, "password_hash": 0}
-    ).limit(limit).to_list(limit)
+    # Indexed name/email search, whole-token matches first (Cyrillic and Latin spellings match)
+    users = await find_people(
+        db.users, query, limit,
+        {"id": {"$ne": current_user.id}},  # Exclude self
+        {"_id": 0, "password_hash": 0, "search_keys": 0}
+    )
     
     # Add relationship info to each user
+    relations = await relationships.resolve(current_user.id, [user["id"] for user in users])
     for user in users:
-        # Check if friend
-        is_friend = await db.user_friendships.find_one({
-            "$or": [
-                {"user1_id": min(current_user.id, user["id"]), "user2_id": max(current_user.id, user["id"])}
-            ]
-        }) is not None
-        
-        # Check if following
-        is_following = await db.user_follows.find_one({
-            "follower_id": current_user.id,
-            "target_id": user["id"]
-        }) is not None
-        
-        # Check for pending request
-        pending_request = await db.friend_requests.find_one({
-            "sender_id": current_user.id,
-            "receiver_id": user["id"],
-            "status": "PENDING"
-        })
-        
-        user["is_friend"] = is_friend
-        user["is_following"] = is_following
-        user["request_sent"] = pending_request is not None
+        user.update(relations[user["id"]].flags())
     
     return {"users": users}
 
@@ -18247,67 +18017,27 @@ async def get_user_public_profile(
     current_user: User = Depends(get_current_user)
 ):
     """Get public profile of a user with social relationship info"""
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0, "search_keys": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Get relationship status
-    is_friend = await db.user_friendships.find_one({
-        "$or": [
-            {"user1_id": min(current_user.id, user_id), "user2_id": max(current_user.id, user_id)}
-        ]
-    }) is not None
-    
-    is_following = await db.user_follows.find_one({
-        "follower_id": current_user.id,
-        "target_id": user_id
-    }) is not None
-    
-    is_followed_by = await db.user_follows.find_one({
-        "follower_id": user_id,
-        "target_id": current_user.id
-    }) is not None
-    
-    # Check for pending friend request
-    pending_request = await db.friend_requests.find_one({
-        "$or": [
-            {"sender_id": current_user.id, "receiver_id": user_id, "status": "PENDING"},
-            {"sender_id": user_id, "receiver_id": current_user.id, "status": "PENDING"}
-        ]
-    })
+    relation = await relationships.between(current_user.id, user_id)
     
     pending_request_type = None
-    pending_request_id = None
-    if pending_request:
-        pending_request_id = pending_request["id"]
-        pending_request_type = "sent" if pending_request["sender_id"] == current_user.id else "received"
-    
-    # Get social stats for this user
-    friends_count = await db.user_friendships.count_documents({
-        "$or": [
-            {"user1_id": user_id},
-            {"user2_id": user_id}
-        ]
-    })
-    
-    followers_count = await db.user_follows.count_documents({
-        "target_id": user_id
-    })
-    
-    following_count = await db.user_follows.count_documents({
-        "follower_id": user_id
-    })
+    if relation.request_sent:
+        pending_request_type = "sent"
+    elif relation.request_received:
+        pending_request_type = "received"
     
     return {
         **user,
-        "is_friend": is_friend,
-        "is_following": is_following,
-        "is_followed_by": is_followed_by,
+        "is_friend": relation.is_friend,
+        "is_following": relation.is_following,
+        "is_followed_by": relation.follows_me,
         "pending_request_type": pending_request_type,
-        "pending_request_id": pending_request_id,
-        "friends_count": friends_count,
-        "followers_count": followers_count,
-        "following_count": following_count,
+        "pending_request_id": relation.request_id,
+        **counts_of(user),  # social stats stored on the user document
         "is_self": user_id == current_user.id
     }
 
@@ -18325,102 +18055,17 @@ class LinkPreviewResponse(BaseModel):
     is_youtube: bool = False
     youtube_id: Optional[str] = None
 
+# Shared pooled session, per-URL cache (memory + MongoDB) and head-only parsing
+from core.link_preview import LinkPreviewService
+link_previews = LinkPreviewService(db, cache)
+
 @api_router.post("/utils/link-preview")
 async def get_link_preview(
     request: LinkPreviewRequest,
     current_user: User = Depends(get_current_user)
 ):
     """Fetch OpenGraph metadata for a URL to generate link preview"""
-    import aiohttp
-    from urllib.parse import urlparse, parse_qs
-    
-    url = request.url.strip()
-    
-    # Check if it's a YouTube URL
-    youtube_id = None
-    is_youtube = False
-    
-    parsed_url = urlparse(url)
-    
-    # Check for youtube.com/watch?v=
-    if 'youtube.com' in parsed_url.netloc and '/watch' in parsed_url.path:
-        query_params = parse_qs(parsed_url.query)
-        if 'v' in query_params:
-            youtube_id = query_params['v'][0]
-            is_youtube = True
-    # Check for youtu.be/
-    elif 'youtu.be' in parsed_url.netloc:
-        youtube_id = parsed_url.path.strip('/')
-        is_youtube = True
-    # Check for youtube.com/embed/
-    elif 'youtube.com' in parsed_url.netloc and '/embed/' in parsed_url.path:
-        youtube_id = parsed_url.path.split('/embed/')[1].split('?')[0]
-        is_youtube = True
-    
-    if is_youtube and youtube_id:
-        return {
-            "url": url,
-            "title": "YouTube Video",
-            "description": None,
-            "image": f"https://img.youtube.com/vi/{youtube_id}/hqdefault.jpg",
-            "site_name": "YouTube",
-            "is_youtube": True,
-            "youtube_id": youtube_id
-        }
-    
-    # For non-YouTube URLs, try to fetch OpenGraph metadata
-    try:
-        async with aiohttp.ClientSession() as session:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (compatible; ZionBot/1.0)'
-            }
-            async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=5)) as response:
-                if response.status != 200:
-                    return {"url": url, "title": None, "description": None, "image": None, "site_name": None, "is_youtube": False, "youtube_id": None}
-                
-                html = await response.text()
-                
-                # Simple regex-based OG tag extraction
-                import re
-                
-                def extract_og_tag(html, property_name):
-                    patterns = [
-                        rf'<meta[^>]*property=["\']og:{property_name}["\'][^>]*content=["\']([^"\']*)["\']',
-                        rf'<meta[^>]*content=["\']([^"\']*)["\'][^>]*property=["\']og:{property_name}["\']',
-                    ]
-                    for pattern in patterns:
-                        match = re.search(pattern, html, re.IGNORECASE)
-                        if match:
-                            return match.group(1)
-                    return None
-                
-                def extract_title(html):
-                    # Try og:title first
-                    og_title = extract_og_tag(html, 'title')
-                    if og_title:
-                        return og_title
-                    # Fall back to <title> tag
-                    match = re.search(r'<title[^>]*>([^<]*)</title>', html, re.IGNORECASE)
-                    return match.group(1) if match else None
-                
-                title = extract_title(html)
-                description = extract_og_tag(html, 'description')
-                image = extract_og_tag(html, 'image')
-                site_name = extract_og_tag(html, 'site_name')
-                
-                return {
-                    "url": url,
-                    "title": title,
-                    "description": description,
-                    "image": image,
-                    "site_name": site_name,
-                    "is_youtube": False,
-                    "youtube_id": None
-                }
-                
-    except Exception as e:
-        logger.error(f"Error fetching link preview: {e}")
-        return {"url": url, "title": None, "description": None, "image": None, "site_name": None, "is_youtube": False, "youtube_id": None}
+    return await link_previews.preview(request.url)
 
 # ===== NEWS CHANNELS ENDPOINTS =====
 
@@ -18515,7 +18160,7 @@ async def get_channels(
     for channel in channels:
         owner = await db.users.find_one(
             {"id": channel["owner_id"]},
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         )
         if owner:
             channel["owner"] = {"first_name": owner.get("first_name"), "last_name": owner.get("last_name")}
@@ -18591,7 +18236,7 @@ async def get_channel(
     # Get owner info
     owner_data = await db.users.find_one(
         {"id": channel["owner_id"]},
-        {"_id": 0, "password_hash": 0}
+        {"_id": 0, "password_hash": 0, "search_keys": 0}
     )
     owner = {"first_name": owner_data.get("first_name"), "last_name": owner_data.get("last_name")} if owner_data else None
     
@@ -18656,10 +18301,8 @@ async def subscribe_to_channel(
     await db.channel_subscriptions.insert_one(subscription.model_dump())
     
     # Update subscriber count
-    await db.news_channels.update_one(
-        {"id": channel_id},
-        {"$inc": {"subscribers_count": 1}}
-    )
+    await social_counters.subscribed(channel_id)
+    await relationship_sets.subscribed(current_user.id, channel_id)
     
     return {"message": "Subscribed successfully"}
 
@@ -18678,10 +18321,8 @@ async def unsubscribe_from_channel(
         raise HTTPException(status_code=404, detail="Not subscribed to this channel")
     
     # Update subscriber count
-    await db.news_channels.update_one(
-        {"id": channel_id},
-        {"$inc": {"subscribers_count": -1}}
-    )
+    await social_counters.unsubscribed(channel_id)
+    await relationship_sets.unsubscribed(current_user.id, channel_id)
     
     return {"message": "Unsubscribed successfully"}
 
@@ -18769,8 +18410,10 @@ async def delete_channel(
         raise HTTPException(status_code=403, detail="Not authorized to delete this channel")
     
     # Delete channel and all subscriptions
+    subscriber_ids = await db.channel_subscriptions.distinct("subscriber_id", {"channel_id": channel_id})
     await db.news_channels.delete_one({"id": channel_id})
     await db.channel_subscriptions.delete_many({"channel_id": channel_id})
+    await relationship_sets.invalidate(subscriber_ids)
     
     return {"message": "Channel deleted successfully"}
 
@@ -18838,28 +18481,16 @@ async def get_news_events(
         # 2. Events from subscribed channels
         # 3. Events from friends
         
-        # Get subscribed channel IDs
-        subscriptions = await db.channel_subscriptions.find(
-            {"subscriber_id": current_user.id}
-        ).to_list(1000)
-        subscribed_channel_ids = [s["channel_id"] for s in subscriptions]
-        
-        # Get friend IDs
-        friendships = await db.friendships.find({
-            "$or": [
-                {"user_id": current_user.id, "status": "ACCEPTED"},
-                {"friend_id": current_user.id, "status": "ACCEPTED"}
-            ]
-        }).to_list(1000)
-        friend_ids = [
-            f["friend_id"] if f["user_id"] == current_user.id else f["user_id"]
-            for f in friendships
-        ]
+        # Subscribed channel and friend IDs (cached per user)
+        subscribed_channel_ids, friend_ids = await asyncio.gather(
+            relationship_sets.channels(current_user.id),
+            relationship_sets.friends(current_user.id),
+        )
         
         query["$or"] = [
             {"creator_id": current_user.id},  # Own events
-            {"channel_id": {"$in": subscribed_channel_ids}},  # Subscribed channels
-            {"creator_id": {"$in": friend_ids}, "channel_id": None}  # Friends' personal events
+            {"channel_id": subscribed_channel_ids.as_in()},  # Subscribed channels
+            {"creator_id": friend_ids.as_in(), "channel_id": None}  # Friends' personal events
         ]
     
     if event_type:
@@ -19014,6 +18645,12 @@ async def delete_news_event(
 
 # ===== NEWS POSTS ENDPOINTS =====
 
+# Materialized home timelines: posts are fanned out on write, channels and
+# high-follower authors are pulled at read time
+from core.timelines import NewsTimelines
+
+news_timelines = NewsTimelines(db, cache, journal=change_journal, relationship_sets=relationship_sets)
+
 @api_router.post("/news/posts")
 async def create_news_post(
     post_data: NewsPostCreate,
@@ -19038,6 +18675,7 @@ async def create_news_post(
     )
     
     await db.news_posts.insert_one(post.model_dump())
+    await news_timelines.publish(post.model_dump())
     
     # Check for @ERIC mention or ERIC_AI visibility and trigger AI response
     should_trigger_eric = '@eric' in post_data.content.lower() or '@ERIC' in post_data.content or post_data.visibility == 'ERIC_AI'
@@ -19066,116 +18704,34 @@ async def create_news_post(
 async def get_news_feed(
     limit: int = 20,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    count: CountMode = CountMode.CAPPED,
     current_user: User = Depends(get_current_user)
 ):
     """Get personalized news feed - only posts from your network (friends, following, subscribed channels)"""
 
-    # PARALLEL LOAD: Fetch friendships, follows, and subscriptions concurrently
-    friendships_task = db.user_friendships.find({
-        "$or": [
-            {"user1_id": current_user.id},
-            {"user2_id": current_user.id}
-        ]
-    }).to_list(1000)
-
-    following_task = db.user_follows.find({
-        "follower_id": current_user.id
-    }).to_list(1000)
-
-    subscriptions_task = db.channel_subscriptions.find({
-        "subscriber_id": current_user.id
-    }).to_list(1000)
-
-    # Execute all three queries in parallel
-    friendships, following, subscriptions = await asyncio.gather(
-        friendships_task, following_task, subscriptions_task
+    # Feed shows my own posts, PUBLIC and FRIENDS_AND_FOLLOWERS posts from
+    # friends and people I follow, FRIENDS_ONLY posts from friends, and posts
+    # from subscribed channels. PUBLIC posts from strangers do NOT appear.
+    # Pushed entries come from the materialized timeline; channels and
+    # high-follower authors are merged in at read time (core/timelines.py).
+    offset, limit = validate_pagination(offset, limit)
+    try:
+        posts, next_cursor = await news_timelines.read(current_user.id, limit, cursor=cursor, offset=0 if cursor else offset)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # BATCH LOAD: authors, channels and likes with one query each
+    loaders = request_loaders(db)
+    authors_map, channels_map, liked_post_ids = await asyncio.gather(
+        loaders.users.load_many(post["user_id"] for post in posts),
+        loaders.channels.load_many(post.get("channel_id") for post in posts),
+        db.news_post_likes.distinct("post_id", {
+            "post_id": {"$in": [post["id"] for post in posts]},
+            "user_id": current_user.id
+        }),
     )
-
-    # Process friendships
-    friend_ids = set()
-    for f in friendships:
-        if f["user1_id"] == current_user.id:
-            friend_ids.add(f["user2_id"])
-        else:
-            friend_ids.add(f["user1_id"])
-
-    # Process follows
-    following_ids = {f["target_id"] for f in following}
-
-    # Combined network: friends + people I follow
-    network_ids = friend_ids | following_ids
-
-    # Process subscriptions
-    subscribed_channel_ids = [s["channel_id"] for s in subscriptions]
-    
-    # Build query for posts from MY NETWORK only
-    # Feed shows:
-    # 1. My own posts (any visibility)
-    # 2. PUBLIC posts from my network (friends + following)
-    # 3. FRIENDS_AND_FOLLOWERS posts from my network
-    # 4. FRIENDS_ONLY posts from friends only
-    # 5. Posts from subscribed channels
-    # 
-    # NOTE: PUBLIC posts from strangers do NOT appear in feed
-    # (they can only be seen when visiting that user's profile directly)
-    
-    query = {
-        "is_active": True,
-        "$or": [
-            # My own posts (all visibilities)
-            {"user_id": current_user.id},
-            # PUBLIC posts from my network only
-            {
-                "visibility": "PUBLIC",
-                "user_id": {"$in": list(network_ids)}
-            },
-            # FRIENDS_AND_FOLLOWERS posts from my network
-            {
-                "visibility": "FRIENDS_AND_FOLLOWERS",
-                "user_id": {"$in": list(network_ids)}
-            },
-            # FRIENDS_ONLY posts from friends only
-            {
-                "visibility": "FRIENDS_ONLY",
-                "user_id": {"$in": list(friend_ids)}
-            },
-            # Posts from subscribed channels
-            {"channel_id": {"$in": subscribed_channel_ids}}
-        ]
-    }
-    
-    posts = await db.news_posts.find(
-        query,
-        {"_id": 0}
-    ).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
-
-    # BATCH LOAD: Collect all unique IDs first
-    author_ids = list(set(post["user_id"] for post in posts))
-    channel_ids = list(set(post["channel_id"] for post in posts if post.get("channel_id")))
-    post_ids = [post["id"] for post in posts]
-
-    # Batch load authors (single query instead of N queries)
-    authors_list = await db.users.find(
-        {"id": {"$in": author_ids}},
-        {"_id": 0, "id": 1, "first_name": 1, "last_name": 1, "profile_picture": 1}
-    ).to_list(len(author_ids))
-    authors_map = {a["id"]: a for a in authors_list}
-
-    # Batch load channels (single query instead of N queries)
-    channels_map = {}
-    if channel_ids:
-        channels_list = await db.news_channels.find(
-            {"id": {"$in": channel_ids}},
-            {"_id": 0, "id": 1, "name": 1, "avatar_url": 1, "is_verified": 1}
-        ).to_list(len(channel_ids))
-        channels_map = {c["id"]: c for c in channels_list}
-
-    # Batch load likes (single query instead of N queries)
-    liked_posts = await db.news_post_likes.find({
-        "post_id": {"$in": post_ids},
-        "user_id": current_user.id
-    }).to_list(len(post_ids))
-    liked_post_ids = set(lp["post_id"] for lp in liked_posts)
+    liked_post_ids = set(liked_post_ids)
 
     # Enrich posts with batch-loaded data
     for post in posts:
@@ -19189,18 +18745,24 @@ async def get_news_feed(
 
         # Add channel info if applicable
         if post.get("channel_id"):
-            post["channel"] = channels_map.get(post["channel_id"])
+            channel = channels_map.get(post["channel_id"])
+            post["channel"] = {
+                "id": channel["id"],
+                "name": channel.get("name"),
+                "avatar_url": channel.get("avatar_url"),
+                "is_verified": channel.get("is_verified", False)
+            } if channel else None
 
         # Check if current user liked this post
-        liked = post["id"] in liked_post_ids
-        post["is_liked"] = liked is not None
+        post["is_liked"] = post["id"] in liked_post_ids
     
-    total = await db.news_posts.count_documents(query)
+    counted = await news_timelines.count(current_user.id, count, list_counter)
     
     return {
         "posts": posts,
-        "total": total,
-        "has_more": offset + limit < total
+        **counted.fields(),
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
     }
 
 @api_router.get("/news/posts/channel/{channel_id}")
@@ -19220,12 +18782,18 @@ async def get_channel_posts(
         {"_id": 0}
     ).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
     
-    # Enrich posts with author info
+    # Enrich posts with author info and likes (one query each)
+    authors, liked_post_ids = await asyncio.gather(
+        request_loaders(db).users.load_many(post["user_id"] for post in posts),
+        db.news_post_likes.distinct("post_id", {
+            "post_id": {"$in": [post["id"] for post in posts]},
+            "user_id": current_user.id
+        }),
+    )
+    liked_post_ids = set(liked_post_ids)
+    
     for post in posts:
-        author = await db.users.find_one(
-            {"id": post["user_id"]},
-            {"_id": 0, "password_hash": 0}
-        )
+        author = authors.get(post["user_id"])
         post["author"] = {
             "id": author["id"] if author else None,
             "first_name": author.get("first_name") if author else None,
@@ -19233,11 +18801,7 @@ async def get_channel_posts(
             "profile_picture": author.get("profile_picture") if author else None
         }
         
-        liked = await db.news_post_likes.find_one({
-            "post_id": post["id"],
-            "user_id": current_user.id
-        })
-        post["is_liked"] = liked is not None
+        post["is_liked"] = post["id"] in liked_post_ids
     
     total = await db.news_posts.count_documents({"channel_id": channel_id, "is_active": True})
     
@@ -19257,17 +18821,13 @@ async def get_user_news_posts(
 ):
     """Get posts from a specific user (respecting visibility)"""
     
-    # Determine relationship
-    is_friend = await db.user_friendships.find_one({
-        "$or": [
-            {"user1_id": min(current_user.id, user_id), "user2_id": max(current_user.id, user_id)}
-        ]
-    }) is not None
-    
-    is_following = await db.user_follows.find_one({
-        "follower_id": current_user.id,
-        "target_id": user_id
-    }) is not None
+    # Determine relationship (cached per viewer)
+    friend_ids, following_ids = await asyncio.gather(
+        relationship_sets.friends(current_user.id),
+        relationship_sets.following(current_user.id),
+    )
+    is_friend = user_id in friend_ids
+    is_following = user_id in following_ids
     
     is_self = user_id == current_user.id
     
@@ -19445,6 +19005,11 @@ async def update_news_post(
     # Get updated post
     updated_post = await db.news_posts.find_one({"id": post_id}, {"_id": 0})
     
+    # A visibility change changes the audience: re-fan-out
+    if update_data.visibility is not None and update_data.visibility != post.get("visibility"):
+        await news_timelines.retract(post_id)
+        await news_timelines.publish(updated_post)
+    
     return updated_post
 
 @api_router.delete("/news/posts/{post_id}")
@@ -19465,6 +19030,7 @@ async def delete_news_post(
         {"id": post_id},
         {"$set": {"is_active": False}}
     )
+    await news_timelines.retract(post_id)
     
     # Update channel post count if applicable
     if post.get("channel_id"):
@@ -19497,6 +19063,18 @@ async def get_news_post_comments(
         "is_deleted": {"$ne": True}
     }).sort("created_at", 1).to_list(1000)  # Safety limit to prevent memory exhaustion
     
+    # Authors and the current user's likes for all comments, one query each
+    authors, liked_ids = await asyncio.gather(
+        request_loaders(db).users.load_many(
+            c["user_id"] for c in comments if c["user_id"] != "eric-ai"
+        ),
+        db.news_comment_likes.distinct("comment_id", {
+            "comment_id": {"$in": [c["id"] for c in comments]},
+            "user_id": current_user.id
+        }),
+    )
+    liked_ids = set(liked_ids)
+    
     # Build response with author info and nested replies
     comments_dict = {}
     top_level_comments = []
@@ -19513,20 +19091,16 @@ async def get_news_post_comments(
                 "profile_picture": "/eric-avatar.jpg"
             }
         else:
-            author = await get_user_by_id(comment["user_id"])
+            author = authors.get(comment["user_id"])
             comment["author"] = {
-                "id": author.id if author else "",
-                "first_name": author.first_name if author else "Deleted",
-                "last_name": author.last_name if author else "User",
-                "profile_picture": author.profile_picture if author else None
+                "id": author["id"] if author else "",
+                "first_name": author.get("first_name") if author else "Deleted",
+                "last_name": author.get("last_name") if author else "User",
+                "profile_picture": author.get("profile_picture") if author else None
             }
         
         # Check if current user liked this comment
-        liked = await db.news_comment_likes.find_one({
-            "comment_id": comment["id"],
-            "user_id": current_user.id
-        })
-        comment["user_liked"] = liked is not None
+        comment["user_liked"] = comment["id"] in liked_ids
         
         comment["replies"] = []
         comments_dict[comment["id"]] = comment
@@ -19605,7 +19179,7 @@ async def create_news_post_comment(
             "is_read": False,
             "created_at": datetime.now(timezone.utc).isoformat()
         }
-        await db.notifications.insert_one(notification)
+        await save_notification(db.notifications, notification)
     
     # Return with author info
     new_comment.pop("_id", None)
@@ -19795,7 +19369,7 @@ async def get_channel_moderators(
     for mod in moderators:
         user = await db.users.find_one(
             {"id": mod["user_id"]},
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         )
         if user:
             mod["user"] = {
@@ -20335,7 +19909,8 @@ async def get_service_listings(
     price_max: Optional[float] = None,
     skip: int = 0,
     limit: int = 20,
-    sort_by: str = "rating"  # "rating", "price", "newest", "popular"
+    sort_by: str = "rating",  # "rating", "price", "newest", "popular"
+    count: CountMode = CountMode.CACHED
 ):
     """Search and filter service listings"""
     try:
@@ -20377,7 +19952,7 @@ async def get_service_listings(
         sort = sort_options.get(sort_by, sort_options["rating"])
         
         listings = await db.service_listings.find(query, {"_id": 0}).sort(sort).skip(skip).limit(limit).to_list(limit)
-        total = await db.service_listings.count_documents(query)
+        counted = await list_counter.count(db.service_listings, query, count)
         
         # Enrich with organization info
         for listing in listings:
@@ -20388,7 +19963,7 @@ async def get_service_listings(
         
         return {
             "listings": listings,
-            "total": total,
+            **counted.fields(),
             "skip": skip,
             "limit": limit
         }
@@ -21369,7 +20944,8 @@ async def get_marketplace_products(
     seller_type: Optional[SellerType] = None,
     sort_by: str = "newest",  # newest, price_asc, price_desc, popular
     skip: int = 0,
-    limit: int = 20
+    limit: int = 20,
+    count: CountMode = CountMode.CACHED
 ):
     """Get marketplace products with filters"""
     try:
@@ -21413,7 +20989,7 @@ async def get_marketplace_products(
             sort = [("view_count", -1)]
         
         products = await db.marketplace_products.find(query, {"_id": 0}).sort(sort).skip(skip).limit(limit).to_list(limit)
-        total = await db.marketplace_products.count_documents(query)
+        counted = await list_counter.count(db.marketplace_products, query, count)
         
         # Enrich with seller info
         for product in products:
@@ -21428,7 +21004,7 @@ async def get_marketplace_products(
                     product["organization_name"] = org.get("name")
                     product["organization_logo"] = org.get("logo")
         
-        return {"products": products, "total": total}
+        return {"products": products, **counted.fields()}
         
     except Exception as e:
         logger.error(f"Error fetching products: {e}")
@@ -22284,6 +21860,7 @@ async def get_transactions(
     limit: int = 50,
     offset: int = 0,
     asset_type: Optional[str] = None,
+    cursor: Optional[str] = None,
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     """Get user's transaction history"""
@@ -22295,7 +21872,9 @@ async def get_transactions(
         if asset_type:
             query["asset_type"] = asset_type
         
-        transactions = await db.transactions.find(query, {"_id": 0}).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
+        transactions = await db.transactions.find(apply_cursor(NEWEST_FIRST, query, cursor), {"_id": 0})\
+            .sort(NEWEST_FIRST.sort).skip(0 if cursor else offset).limit(limit + 1).to_list(limit + 1)
+        transactions, next_cursor = NEWEST_FIRST.page(transactions, limit)
         total = await db.transactions.count_documents(query)
         
         # Enrich with user names
@@ -22314,9 +21893,12 @@ async def get_transactions(
             "transactions": enriched,
             "total": total,
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "next_cursor": next_cursor
         }
         
+    except HTTPException:
+        raise
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
@@ -23905,10 +23487,10 @@ async def detailed_health_check():
         health_status["checks"]["database"] = {"status": "unhealthy", "error": str(e)}
     
     # Check cache
-    health_status["checks"]["cache"] = {"status": "healthy", "entries": len(cache._cache)}
+    health_status["checks"]["cache"] = {"status": "healthy", "entries": len(cache.local), "shared": cache.shared}
     
     # Check rate limiter
-    health_status["checks"]["rate_limiter"] = {"status": "healthy", "tracked_keys": len(rate_limiter._requests)}
+    health_status["checks"]["rate_limiter"] = {"status": "healthy", "tracked_keys": len(rate_limiter.local), "shared": rate_limiter.shared}
     
     return health_status
 
@@ -23916,8 +23498,8 @@ async def detailed_health_check():
 async def get_metrics():
     """Simple metrics endpoint for monitoring"""
     try:
-        # Get basic database stats
-        db_stats = await db.command("dbStats")
+        # Get basic database stats (dbStats walks every collection, so reuse it for a minute)
+        db_stats = await cache.get_or_set("metrics:dbstats", lambda: db.command("dbStats"), ttl=60)
         
         return {
             "database": {
@@ -23926,18 +23508,22 @@ async def get_metrics():
                 "storage_mb": round(db_stats.get("storageSize", 0) / (1024 * 1024), 2),
                 "index_mb": round(db_stats.get("indexSize", 0) / (1024 * 1024), 2)
             },
-            "cache": {
-                "entries": len(cache._cache),
-                "ttl_seconds": cache.default_ttl
-            },
-            "rate_limiter": {
-                "tracked_users": len(rate_limiter._requests)
-            },
+            "cache": cache.stats(),
+            "websocket_broker": chat_manager.stats(),
+            "principal_cache": principal_cache.stats(),
+            "relationship_sets": relationship_sets.stats(),
+            "rate_limiter": rate_limiter.stats(),
             "timestamp": datetime.now(timezone.utc)
         }
     except Exception as e:
         return {"error": str(e)}
 
+@api_router.get("/metrics/prometheus")
+async def get_prometheus_metrics():
+    """Per-route request and MongoDB metrics of all workers, in Prometheus text format"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # ===== GOOD WILL MODULE - ДОБРАЯ ВОЛЯ (Events & Gatherings) =====
 
 class EventVisibility(str, Enum):
@@ -24539,9 +24125,11 @@ async def list_events(
     is_free: Optional[bool] = None,
     limit: int = 20,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    count: CountMode = CountMode.CACHED,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(lambda: None)
 ):
-    """List events with filters"""
+    """List events with filters (soonest first; pass next_cursor for the next page)"""
     query = {}
     
     # Default to public events if not authenticated
@@ -24595,8 +24183,10 @@ async def list_events(
     if start_to:
         query.setdefault("start_date", {})["$lte"] = start_to
     
-    events = await db.goodwill_events.find(query, {"_id": 0}).sort("start_date", 1).skip(offset).limit(limit).to_list(limit)
-    total = await db.goodwill_events.count_documents(query)
+    events = await db.goodwill_events.find(apply_cursor(SOONEST_FIRST, query, cursor), {"_id": 0})\
+        .sort(SOONEST_FIRST.sort).skip(0 if cursor else offset).limit(limit + 1).to_list(limit + 1)
+    events, next_cursor = SOONEST_FIRST.page(events, limit)
+    counted = await list_counter.count(db.goodwill_events, query, count)
     
     # Enrich events with organizer info and category
     for event in events:
@@ -24611,7 +24201,7 @@ async def list_events(
             attendance = await db.event_attendees.find_one({"event_id": event["id"], "user_id": user_id}, {"_id": 0})
             event["my_rsvp"] = attendance.get("status") if attendance else None
     
-    return {"events": events, "total": total}
+    return {"events": events, **counted.fields(), "next_cursor": next_cursor}
 
 async def get_user_organizer_ids(user_id: str) -> List[str]:
     """Get all organizer profile IDs the user owns or is part of"""
@@ -24745,6 +24335,17 @@ async def rsvp_to_event(
         if update_ops:
             await db.goodwill_events.update_one({"id": event_id}, update_ops)
         
+        # Journal the change for the organizer and co-organizers
+        organizer = await db.event_organizer_profiles.find_one(
+            {"id": event.get("organizer_profile_id")}, {"_id": 0, "user_id": 1}
+        )
+        organizers = [organizer.get("user_id")] if organizer else []
+        organizers += event.get("co_organizer_ids", [])
+        await change_journal.record(
+            [uid for uid in organizers if uid != user_id], "rsvp", event_id,
+            {"user_id": user_id, "status": request.status.value}
+        )
+        
         return {"success": True, "status": request.status.value, "message": "RSVP updated"}
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -25689,13 +25290,7 @@ async def agent_chat(
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         
-        # Rate limiting for AI requests
-        if not await check_rate_limit(user_id, "ai_chat"):
-            raise HTTPException(
-                status_code=429, 
-                detail="Слишком много запросов. Пожалуйста, подождите минуту."
-            )
-        
+        # Rate limited by RateLimitMiddleware ("ai_chat" route group)
         response = await eric_agent.chat(user_id, request)
         return response.dict()
     except jwt.ExpiredSignatureError:
@@ -26043,13 +25638,7 @@ async def chat_with_search(
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         
-        # Rate limiting for AI search requests
-        if not await check_rate_limit(user_id, "ai_chat"):
-            raise HTTPException(
-                status_code=429, 
-                detail="Слишком много запросов. Пожалуйста, подождите минуту."
-            )
-        
+        # Rate limited by RateLimitMiddleware ("ai_chat" route group)
         result = await eric_agent.chat_with_search(
             user_id=user_id,
             message=request.message,
@@ -26594,7 +26183,7 @@ async def get_admin_dashboard(admin: str = Depends(get_current_admin)):
         recent_users = []
         cursor = db.users.find(
             {},
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         ).sort("created_at", -1).limit(10)
         async for user in cursor:
             recent_users.append({
@@ -26641,13 +26230,11 @@ async def get_admin_users(
         
         # Search filter
         if search:
-            search_regex = {"$regex": safe_regex(search), "$options": "i"}
-            query["$or"] = [
-                {"email": search_regex},
-                {"first_name": search_regex},
-                {"last_name": search_regex},
-                {"phone": search_regex}
-            ]
+            search_query = people_query(search) or {"id": None}
+            if any(ch.isdigit() for ch in search):
+                # Phone numbers are not in the shared search keys
+                search_query = {"$or": [search_query, {"phone": {"$regex": safe_regex(search), "$options": "i"}}]}
+            query.update(search_query)
         
         # Status filter
         if status_filter == "active":
@@ -26666,7 +26253,7 @@ async def get_admin_users(
         users = []
         cursor = db.users.find(
             query,
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         ).sort(sort_field, sort_direction).skip(skip).limit(limit)
         
         async for user in cursor:
@@ -26704,7 +26291,7 @@ async def get_admin_user_detail(
     try:
         user = await db.users.find_one(
             {"id": user_id},
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         )
         
         if not user:
@@ -26770,16 +26357,18 @@ async def update_admin_user(
             update_data["role"] = user_data.role
         
         if update_data:
+            update_data.update(search_fields(user, update_data))
             update_data["updated_at"] = datetime.now(timezone.utc)
             await db.users.update_one(
                 {"id": user_id},
                 {"$set": update_data}
             )
+            await invalidate_user_principal(user_id)
         
         # Fetch updated user
         updated_user = await db.users.find_one(
             {"id": user_id},
-            {"_id": 0, "password_hash": 0}
+            {"_id": 0, "password_hash": 0, "search_keys": 0}
         )
         
         return {"message": "Пользователь обновлен", "user": updated_user}
@@ -26809,6 +26398,7 @@ async def toggle_user_status(
                 "updated_at": datetime.now(timezone.utc)
             }}
         )
+        await invalidate_user_principal(user_id)
         
         status_text = "активирован" if new_status else "деактивирован"
         return {"message": f"Пользователь {status_text}", "is_active": new_status}
@@ -26831,6 +26421,7 @@ async def delete_admin_user(
         
         # Hard delete the user
         await db.users.delete_one({"id": user_id})
+        await invalidate_user_principal(user_id)
         
         # Also clean up related data
         await db.posts.delete_many({"user_id": user_id})
@@ -26870,6 +26461,7 @@ async def reset_user_password(
                 "updated_at": datetime.now(timezone.utc)
             }}
         )
+        await invalidate_user_principal(user_id)
         
         return {"message": "Пароль сброшен"}
     except HTTPException:
@@ -29043,6 +28635,40 @@ async def list_chunked_backups(
 
 # ===== END ADMIN PANEL ENDPOINTS =====
 
+# ===== BATCH REQUESTS =====
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem] = Field(..., min_length=1)
+
+@api_router.post("/batch")
+async def run_batch(
+    payload: BatchRequest,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Run several GET requests in one round-trip.
+
+    Items run concurrently and share the caller's authentication and the
+    request-scoped loaders; each gets its own status, headers and body.
+    """
+    request_loaders(db)  # created here so that every item shares it
+    try:
+        with shared_principal(credentials.credentials, current_user):
+            responses = await batch_dispatcher.run(request.scope, [item.model_dump() for item in payload.requests])
+    except BatchError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return {"responses": responses}
+
+# ===== END BATCH REQUESTS =====
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -29071,12 +28697,53 @@ else:
     cors_origins = []
     logger.warning("CORS_ORIGINS not configured. CORS will reject cross-origin requests.")
 
+def rate_limit_identity(scope: dict) -> str:
+    """Identify the caller for rate limiting: JWT subject, else client IP."""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization" and value[:7].lower() == b"bearer ":
+            try:
+                payload = jwt.decode(value[7:].decode(), SECRET_KEY, algorithms=[ALGORITHM])
+                if payload.get("sub"):
+                    return f"user:{payload['sub']}"
+            except jwt.PyJWTError:
+                pass
+            break
+    # nginx sets X-Real-IP; fall back to the socket peer when running directly
+    for name, value in scope.get("headers", []):
+        if name == b"x-real-ip":
+            return f"ip:{value.decode()}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+# Added before CORS so that 429 responses still carry CORS headers
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=rate_limiter,
+    rules=RATE_LIMIT_RULES,
+    identify=rate_limit_identity,
+    message="Слишком много запросов. Пожалуйста, подождите минуту.",
+)
+
+# /api/batch dispatches its items straight into the router, below the
+# middleware stack, so route-group limits are applied again per item
+batch_dispatcher = BatchDispatcher(
+    RateLimitMiddleware(
+        app.router,
+        limiter=rate_limiter,
+        rules=RATE_LIMIT_RULES,
+        identify=rate_limit_identity,
+        message="Слишком много запросов. Пожалуйста, подождите минуту.",
+    ),
+    excluded_paths={"/api/batch"},
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=cors_origins if cors_origins else [],
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type", "Accept", "Origin", "X-Requested-With"],
+    expose_headers=["X-Next-Cursor"],
     max_age=86400,  # Cache preflight requests for 24 hours
 )
 
@@ -29100,6 +28767,33 @@ async def limit_request_body_size(request: Request, call_next):
             )
     return await call_next(request)
 
+# Per-request MongoDB query budgets and N+1 detection. Routes not listed use
+# QUERY_BUDGET_DEFAULT; QUERY_BUDGET_MODE is log (default), raise or off.
+QUERY_BUDGETS = {
+    "/api/notifications": 5,
+    "/api/direct-chats/{chat_id}/messages": 6,
+    "/api/organizations/{organization_id}/announcements": 6,
+    "/api/work/organizations/{organization_id}/members": 6,
+    "/api/work/organizations/{organization_id}/grades/by-class": 8,
+    "/api/news/posts/{post_id}/comments": 6,
+    "/api/work/organizations/search": 5,
+    "/api/sync": 1,
+    # Sum of its sub-requests; each item is bounded by its own route's work
+    "/api/batch": None,
+}
+
+app.add_middleware(
+    QueryBudgetMiddleware,
+    default_budget=int(os.environ.get('QUERY_BUDGET_DEFAULT', 30)),
+    budgets=QUERY_BUDGETS,
+    repeat_threshold=int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5)),
+    mode=os.environ.get('QUERY_BUDGET_MODE', 'log'),
+)
+
+# Per-route latency/status metrics; added last so it is the outermost layer
+# and also times the middleware above
+app.add_middleware(MetricsMiddleware, skip_paths={"/api/metrics/prometheus"})
+
 # ============================================================
 # LOGGING CONFIGURATION
 # ============================================================
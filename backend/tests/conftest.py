@@ -7,8 +7,13 @@ import asyncio
 from datetime import datetime, timezone, timedelta
 from unittest.mock import AsyncMock, MagicMock, patch
 from typing import Generator, Dict, Any
+from contextlib import contextmanager
 import jwt
 import uuid
+from pymongo.errors import DuplicateKeyError
+
+from core.cache import TieredCache
+from core.query_budget import current_recorder, recording
 
 # Test configuration
 TEST_SECRET_KEY = "test-secret-key-for-testing-only-do-not-use-in-production"
@@ -31,6 +36,78 @@ def event_loop():
 # Mock Database Fixtures
 # ============================================================
 
+_COMPARISONS = {
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$ne": lambda a, b: a != b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    """Match a document against equality, $in, $all, $exists, comparison, $or and $and conditions."""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(doc, branch) for branch in condition):
+                return False
+        elif key == "$and":
+            if not all(_matches(doc, branch) for branch in condition):
+                return False
+        elif isinstance(condition, dict) and "$in" in condition:
+            # Array fields match when any element is listed (multikey)
+            values = doc.get(key) if isinstance(doc.get(key), list) else [doc.get(key)]
+            if not any(value in condition["$in"] for value in values):
+                return False
+        elif isinstance(condition, dict) and "$all" in condition:
+            values = doc.get(key) if isinstance(doc.get(key), list) else [doc.get(key)]
+            if not all(value in values for value in condition["$all"]):
+                return False
+        elif isinstance(condition, dict) and "$exists" in condition:
+            if (key in doc) != bool(condition["$exists"]):
+                return False
+        elif isinstance(condition, dict) and condition and set(condition) <= set(_COMPARISONS):
+            if not all(_COMPARISONS[op](doc.get(key), value) for op, value in condition.items()):
+                return False
+        elif isinstance(doc.get(key), list) and not isinstance(condition, list):
+            # Equality on an array field matches any element (multikey)
+            if condition not in doc[key]:
+                return False
+        elif doc.get(key) != condition:
+            return False
+    return True
+
+
+def _apply_update(doc: dict, update: dict) -> None:
+    """Apply $set, $push (with $each/$slice), $pull and $inc modifiers in place."""
+    if "$set" in update:
+        doc.update(update["$set"])
+    if "$push" in update:
+        for key, value in update["$push"].items():
+            items = doc.setdefault(key, [])
+            if isinstance(value, dict) and "$each" in value:
+                items.extend(value["$each"])
+                if "$slice" in value:
+                    doc[key] = items[value["$slice"]:] if value["$slice"] < 0 else items[:value["$slice"]]
+            else:
+                items.append(value)
+    if "$pull" in update:
+        for key, condition in update["$pull"].items():
+            doc[key] = [
+                item for item in doc.get(key, [])
+                if not (_matches(item, condition) if isinstance(item, dict) else item == condition)
+            ]
+    if "$inc" in update:
+        for key, value in update["$inc"].items():
+            # Dotted keys increment inside embedded documents
+            *parents, leaf = key.split(".")
+            target = doc
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = target.get(leaf, 0) + value
+
+
 class MockCollection:
     """Mock MongoDB collection for testing."""
 
@@ -38,81 +115,210 @@ class MockCollection:
         self.name = name
         self._data: Dict[str, Any] = {}
 
-    async def find_one(self, query: dict) -> dict | None:
+    def _record(self, command_name: str, command: dict):
+        """Report the equivalent server command to the active query recorder."""
+        recorder = current_recorder()
+        if recorder is not None:
+            recorder.record(command_name, {command_name: self.name, **command})
+
+    async def find_one(self, query: dict, projection: dict = None) -> dict | None:
         """Find a single document matching the query."""
+        self._record("find", {"filter": query})
         for doc in self._data.values():
-            matches = all(doc.get(k) == v for k, v in query.items())
+            matches = _matches(doc, query)
             if matches:
-                return doc.copy()
+                found = doc.copy()
+                # Array $slice projections ([skip, limit]) are applied; others ignored
+                for key, spec in (projection or {}).items():
+                    if isinstance(spec, dict) and "$slice" in spec and key in found:
+                        skip, limit = spec["$slice"]
+                        found[key] = found[key][skip:skip + limit]
+                return found
         return None
 
     async def insert_one(self, document: dict):
         """Insert a document into the collection."""
+        self._record("insert", {"documents": [document]})
         doc_id = document.get("id") or str(uuid.uuid4())
         self._data[doc_id] = document.copy()
         return MagicMock(inserted_id=doc_id)
 
-    async def update_one(self, query: dict, update: dict):
+    async def insert_many(self, documents: list, ordered: bool = True):
+        """Insert several documents."""
+        self._record("insert", {"documents": documents})
+        ids = []
+        for document in documents:
+            doc_id = document.get("id") or str(uuid.uuid4())
+            self._data[doc_id] = document.copy()
+            ids.append(doc_id)
+        return MagicMock(inserted_ids=ids)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
         """Update a single document."""
+        self._record("update", {"updates": [{"q": query, "u": update}]})
         for doc_id, doc in self._data.items():
-            matches = all(doc.get(k) == v for k, v in query.items())
+            matches = _matches(doc, query)
             if matches:
-                if "$set" in update:
-                    doc.update(update["$set"])
-                if "$push" in update:
-                    for key, value in update["$push"].items():
-                        if key not in doc:
-                            doc[key] = []
-                        doc[key].append(value)
-                if "$inc" in update:
-                    for key, value in update["$inc"].items():
-                        doc[key] = doc.get(key, 0) + value
-                return MagicMock(modified_count=1)
-        return MagicMock(modified_count=0)
+                _apply_update(doc, update)
+                return MagicMock(modified_count=1, matched_count=1, upserted_id=None)
+        if upsert:
+            document = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            if document.get("id") in self._data:
+                # Like the unique id indexes: a non-matching upsert cannot reuse an id
+                raise DuplicateKeyError(f"E11000 duplicate key: {self.name} id {document['id']}")
+            document.update(update.get("$setOnInsert", {}))
+            _apply_update(document, update)
+            await self.insert_one(document)
+            return MagicMock(modified_count=0, matched_count=0, upserted_id=document.get("id"))
+        return MagicMock(modified_count=0, matched_count=0, upserted_id=None)
+
+    async def update_many(self, query: dict, update: dict):
+        """Apply an update to every matching document."""
+        self._record("update", {"updates": [{"q": query, "u": update, "multi": True}]})
+        matched = [doc for doc in self._data.values() if _matches(doc, query)]
+        for doc in matched:
+            _apply_update(doc, update)
+        return MagicMock(modified_count=len(matched), matched_count=len(matched))
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        """Apply pymongo UpdateOne requests as a single command."""
+        self._record("update", {"updates": [{"q": r._filter, "u": r._doc} for r in requests]})
+        modified = 0
+        with recording():  # the individual updates are not separate commands
+            for request in requests:
+                result = await self.update_one(request._filter, request._doc, upsert=request._upsert)
+                modified += result.modified_count
+        return MagicMock(modified_count=modified)
+
+    async def find_one_and_update(self, query: dict, update: dict, upsert: bool = False, return_document=False):
+        """Update a document and return it as it was before (or after) the update."""
+        before = await self.find_one(query)
+        await self.update_one(query, update, upsert=upsert)
+        return await self.find_one(query) if return_document else before
+
+    async def find_one_and_delete(self, query: dict):
+        """Delete a document and return it."""
+        doc = await self.find_one(query)
+        if doc is not None:
+            await self.delete_one(query)
+        return doc
+
+    def aggregate(self, pipeline: list, **options):
+        """Run a $match/$group pipeline ($sum accumulators only)."""
+        self._record("aggregate", {"pipeline": pipeline})
+        docs = list(self._data.values())
+        for stage in pipeline:
+            if "$match" in stage:
+                docs = [doc for doc in docs if _matches(doc, stage["$match"])]
+            elif "$group" in stage:
+                docs = _group(docs, stage["$group"])
+        return MockAggregateCursor(docs)
 
     async def delete_one(self, query: dict):
         """Delete a single document."""
+        self._record("delete", {"deletes": [{"q": query}]})
         for doc_id, doc in list(self._data.items()):
-            matches = all(doc.get(k) == v for k, v in query.items())
+            matches = _matches(doc, query)
             if matches:
                 del self._data[doc_id]
                 return MagicMock(deleted_count=1)
         return MagicMock(deleted_count=0)
 
-    def find(self, query: dict = None):
+    async def delete_many(self, query: dict):
+        """Delete every matching document."""
+        self._record("delete", {"deletes": [{"q": query}]})
+        doomed = [doc_id for doc_id, doc in self._data.items() if _matches(doc, query)]
+        for doc_id in doomed:
+            del self._data[doc_id]
+        return MagicMock(deleted_count=len(doomed))
+
+    def find(self, query: dict = None, projection: dict = None):
         """Return a cursor-like object for find operations."""
-        return MockCursor(self._data, query or {})
+        return MockCursor(self._data, query or {}, on_execute=lambda: self._record("find", {"filter": query or {}}))
 
-    async def count_documents(self, query: dict = None):
-        """Count documents matching the query."""
-        if not query:
-            return len(self._data)
-        count = 0
+    async def distinct(self, key: str, query: dict = None):
+        """Distinct values of a field among matching documents."""
+        self._record("distinct", {"key": key, "query": query or {}})
+        values = []
         for doc in self._data.values():
-            matches = all(doc.get(k) == v for k, v in query.items())
-            if matches:
-                count += 1
-        return count
+            if (not query or _matches(doc, query)) and key in doc and doc[key] not in values:
+                values.append(doc[key])
+        return values
+
+    async def count_documents(self, query: dict = None, limit: int = 0):
+        """Count documents matching the query (at most limit, when given)."""
+        self._record("count", {"query": query or {}})
+        count = sum(1 for doc in self._data.values() if not query or _matches(doc, query))
+        return min(count, limit) if limit else count
 
     async def create_index(self, *args, **kwargs):
         """Mock index creation."""
         pass
 
+    async def index_information(self) -> dict:
+        """Mock collections have no indexes besides _id."""
+        return {"_id_": {"key": [("_id", 1)]}}
+
+    async def drop_index(self, name: str):
+        """Mock index removal."""
+        pass
+
     def clear(self):
         """Clear all data from the collection."""
         self._data.clear()
 
 
+def _group_value(doc: dict, expression):
+    """Evaluate a "$field" reference or a document of references."""
+    if isinstance(expression, dict):
+        return tuple((k, _group_value(doc, v)) for k, v in expression.items())
+    if isinstance(expression, str) and expression.startswith("$"):
+        return doc.get(expression[1:])
+    return expression
+
+
+def _group(docs: list, spec: dict) -> list:
+    """Apply a $group stage whose accumulators are all $sum."""
+    groups: Dict[Any, dict] = {}
+    for doc in docs:
+        key = _group_value(doc, spec["_id"])
+        row = groups.setdefault(key, {"_id": dict(key) if isinstance(key, tuple) else key})
+        for field, accumulator in spec.items():
+            if field != "_id":
+                row[field] = row.get(field, 0) + _group_value(doc, accumulator["$sum"])
+    return list(groups.values())
+
+
+class MockAggregateCursor:
+    """Async-iterable result of MockCollection.aggregate."""
+
+    def __init__(self, docs: list):
+        self._docs = docs
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length: int = None) -> list:
+        return self._docs[:length] if length else list(self._docs)
+
+
 class MockCursor:
     """Mock MongoDB cursor for testing."""
 
-    def __init__(self, data: dict, query: dict):
+    def __init__(self, data: dict, query: dict, on_execute=None):
         self._data = data
         self._query = query
+        self._on_execute = on_execute
         self._skip_count = 0
         self._limit_count = None
-        self._sort_key = None
-        self._sort_direction = 1
+        self._sort = []
 
     def skip(self, count: int):
         """Skip a number of documents."""
@@ -127,27 +333,28 @@ class MockCursor:
     def sort(self, key_or_list, direction=1):
         """Sort the results."""
         if isinstance(key_or_list, list):
-            self._sort_key, self._sort_direction = key_or_list[0]
+            self._sort = list(key_or_list)
         else:
-            self._sort_key = key_or_list
-            self._sort_direction = direction
+            self._sort = [(key_or_list, direction)]
         return self
 
     async def to_list(self, length: int = None) -> list:
         """Convert cursor to list."""
+        if self._on_execute:
+            self._on_execute()
         results = []
         for doc in self._data.values():
             if self._query:
-                matches = all(doc.get(k) == v for k, v in self._query.items())
+                matches = _matches(doc, self._query)
                 if not matches:
                     continue
             results.append(doc.copy())
 
-        # Apply sorting
-        if self._sort_key:
+        # Apply sorting (stable sorts, least significant key first)
+        for sort_key, sort_direction in reversed(self._sort):
             results.sort(
-                key=lambda x: x.get(self._sort_key, ""),
-                reverse=self._sort_direction == -1
+                key=lambda x: x.get(sort_key, ""),
+                reverse=sort_direction == -1
             )
 
         # Apply skip and limit
@@ -191,6 +398,53 @@ def mock_db():
     return MockDatabase()
 
 
+@pytest.fixture
+async def cache():
+    """Provide a memory-only TieredCache (no Redis tier)."""
+    cache = TieredCache(namespace="test", default_ttl=60, shared=False)
+    await cache.start()
+    yield cache
+    await cache.close()
+
+
+# ============================================================
+# Query Budget Fixtures
+# ============================================================
+
+@pytest.fixture
+def query_budget():
+    """
+    Assert how many MongoDB queries a block issues.
+
+    Works with real Motor clients (via QueryRecorderListener) and with
+    mock_db. Fails on more than `max_queries` queries or on any query shape
+    repeated `max_repeats` times (a suspected N+1):
+
+        with query_budget(max_queries=3, max_repeats=2) as recorder:
+            await list_notifications(...)
+    """
+    @contextmanager
+    def budget(max_queries: int = None, max_repeats: int = None):
+        with recording() as recorder:
+            yield recorder
+        recorder.check(max_queries, max_repeats)
+
+    return budget
+
+
+@pytest.fixture(autouse=True)
+def _query_budget_marker(request):
+    """Enforce @pytest.mark.query_budget(max_queries, max_repeats=None) on a whole test."""
+    marker = request.node.get_closest_marker("query_budget")
+    if marker is None:
+        yield
+        return
+    max_queries = marker.args[0] if marker.args else marker.kwargs.get("max_queries")
+    with recording() as recorder:
+        yield recorder
+    recorder.check(max_queries, marker.kwargs.get("max_repeats"))
+
+
 # ============================================================
 # Test User Fixtures
 # ============================================================
@@ -0,0 +1,112 @@
+"""
+Unit tests for post audience facets.
+Tests the visibility rules encoded as tokens, that feed queries return full
+pages of visible posts, and the backfill of posts without an audience.
+"""
+import pytest
+from datetime import datetime, timedelta
+
+from core.audience import backfill_post_audiences, post_audience, viewer_audience, visible_to
+
+BASE_TIME = datetime(2026, 4, 1, 8, 0, 0)
+
+
+def can_see(post, viewer_id, memberships, gender=None):
+    """Evaluate the query condition in Python, as Mongo would."""
+    tokens = viewer_audience(memberships, gender)
+    return post["user_id"] == viewer_id or any(t in tokens for t in post_audience(post))
+
+
+# ============================================================
+# Visibility Rule Tests
+# ============================================================
+
+class TestVisibilityRules:
+    """Test who matches each visibility."""
+
+    @pytest.mark.parametrize("visibility,relationship,gender,expected", [
+        ("PUBLIC", None, None, True),
+        ("FAMILY_ONLY", "CHILD", None, True),
+        ("HOUSEHOLD_ONLY", "CHILD", None, True),
+        ("PARENTS_ONLY", "PARENT", "FEMALE", True),
+        ("PARENTS_ONLY", "CHILD", None, False),
+        ("FATHERS_ONLY", "PARENT", "MALE", True),
+        ("FATHERS_ONLY", "PARENT", "FEMALE", False),
+        ("MOTHERS_ONLY", "PARENT", "FEMALE", True),
+        ("MOTHERS_ONLY", "PARENT", None, False),
+        ("CHILDREN_ONLY", "CHILD", None, True),
+        ("EXTENDED_FAMILY_ONLY", "EXTENDED_FAMILY", None, True),
+        ("EXTENDED_FAMILY_ONLY", "PARENT", "MALE", False),
+        ("ONLY_ME", "PARENT", "MALE", False),
+    ])
+    def test_family_member(self, visibility, relationship, gender, expected):
+        """Test a member of the post's family against each visibility."""
+        post = {"user_id": "author", "visibility": visibility, "family_id": "f1"}
+        membership = {"family_id": "f1", "relationship": relationship}
+        assert can_see(post, "viewer", [membership], gender) is expected
+
+    def test_other_family_cannot_see(self):
+        """Test that membership in another family grants nothing."""
+        post = {"user_id": "author", "visibility": "FAMILY_ONLY", "family_id": "f1"}
+        assert not can_see(post, "viewer", [{"family_id": "f2", "relationship": "PARENT"}], "MALE")
+
+    def test_author_always_sees_own_post(self):
+        """Test that ONLY_ME posts stay visible to their author."""
+        post = {"user_id": "author", "visibility": "ONLY_ME", "family_id": "f1"}
+        assert can_see(post, "author", [])
+
+    def test_family_visibility_without_family_is_private(self):
+        """Test that a family visibility with no family_id has no audience."""
+        assert post_audience({"visibility": "FAMILY_ONLY", "family_id": None}) == []
+
+    def test_enum_values_accepted(self):
+        """Test that str enums for visibility and gender are unwrapped."""
+        from enum import Enum
+
+        class Gender(str, Enum):
+            MALE = "MALE"
+
+        assert "family:f1:PARENT:MALE" in viewer_audience([{"family_id": "f1", "relationship": "PARENT"}], Gender.MALE)
+
+
+# ============================================================
+# Query Tests
+# ============================================================
+
+class TestFeedQuery:
+    """Test visibility evaluated inside the query."""
+
+    async def test_pages_are_full(self, mock_db):
+        """Test that hidden posts do not consume page slots."""
+        for i in range(10):
+            visibility = "FATHERS_ONLY" if i % 2 else "FAMILY_ONLY"
+            post = {"id": f"p{i}", "user_id": "author", "family_id": "f1", "visibility": visibility,
+                    "created_at": BASE_TIME + timedelta(minutes=i)}
+            post["audience"] = post_audience(post)
+            await mock_db.posts.insert_one(post)
+
+        tokens = viewer_audience([{"family_id": "f1", "relationship": "PARENT"}], "FEMALE")
+        page = await mock_db.posts.find(
+            {"family_id": "f1", "$or": visible_to("mother", tokens)}
+        ).sort([("created_at", -1), ("id", -1)]).limit(3).to_list(3)
+
+        assert [p["id"] for p in page] == ["p8", "p6", "p4"]
+
+
+# ============================================================
+# Backfill Tests
+# ============================================================
+
+class TestBackfill:
+    """Test filling audience on existing posts."""
+
+    async def test_backfill_sets_missing_audience(self, mock_db):
+        """Test that only posts without audience are updated, in batches."""
+        for i in range(5):
+            await mock_db.posts.insert_one({"id": f"p{i}", "user_id": "u", "visibility": "PUBLIC"})
+        await mock_db.posts.insert_one({"id": "done", "user_id": "u", "visibility": "PUBLIC", "audience": ["x"]})
+
+        assert await backfill_post_audiences(mock_db.posts, batch=2) == 5
+        assert mock_db.posts._data["p3"]["audience"] == ["public"]
+        assert mock_db.posts._data["done"]["audience"] == ["x"]
+        assert await backfill_post_audiences(mock_db.posts) == 0
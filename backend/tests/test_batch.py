@@ -0,0 +1,152 @@
+"""
+Unit tests for batch requests.
+Tests in-process dispatch of sub-requests, per-item errors, the batch
+size cap, the shared principal and sharing of request-scoped state.
+"""
+import asyncio
+import contextvars
+import time
+
+import pytest
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Request
+from starlette.testclient import TestClient
+
+from core.batch import BatchDispatcher, BatchError, current_principal, shared_principal
+from core.rate_limit import RateLimiter, RateLimitMiddleware, RateLimitRule
+
+request_state = contextvars.ContextVar("request_state", default=None)
+logins = []
+
+
+def authenticate(authorization: str = Header(...)):
+    token = authorization.split(" ", 1)[1]
+    shared = current_principal(token)
+    if shared is not None:
+        return shared
+    logins.append(token)
+    return {"id": f"user-{token}"}
+
+
+def build_app(max_items=5, rules=()):
+    app = FastAPI()
+    router = APIRouter(prefix="/api")
+
+    @router.get("/me")
+    async def me(user=Depends(authenticate)):
+        return user
+
+    @router.get("/items/{item_id}")
+    async def item(item_id: int, q: str = ""):
+        await asyncio.sleep(0.01)
+        return {"id": item_id, "q": q}
+
+    @router.get("/missing")
+    async def missing():
+        raise HTTPException(status_code=404, detail="Not found")
+
+    @router.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    @router.get("/state")
+    async def state():
+        return {"state": id(request_state.get())}
+
+    @router.post("/batch")
+    async def batch(payload: dict, request: Request, authorization: str = Header(...)):
+        user = authenticate(authorization)
+        request_state.set(object())
+        try:
+            with shared_principal(authorization.split(" ", 1)[1], user):
+                return {"responses": await dispatcher.run(request.scope, payload["requests"])}
+        except BatchError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+
+    app.include_router(router)
+    target = RateLimitMiddleware(app.router, RateLimiter(namespace="test", shared=False), rules, lambda s: "caller")
+    dispatcher = BatchDispatcher(target, max_items=max_items, excluded_paths={"/api/batch"})
+    return app
+
+
+def run(app, *paths, token="t1"):
+    return TestClient(app).post(
+        "/api/batch",
+        json={"requests": [{"id": str(i), "path": path} for i, path in enumerate(paths)]},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+
+@pytest.fixture(autouse=True)
+def reset_logins():
+    logins.clear()
+
+
+# ============================================================
+# Dispatch Tests
+# ============================================================
+
+class TestDispatch:
+    """Test running sub-requests in-process."""
+
+    def test_results_in_order(self):
+        """Test that every item gets its own status and body, in request order."""
+        response = run(build_app(), "/api/items/1?q=a", "/api/items/2")
+        assert response.status_code == 200
+        bodies = [(r["id"], r["status"], r["body"]) for r in response.json()["responses"]]
+        assert bodies == [("0", 200, {"id": 1, "q": "a"}), ("1", 200, {"id": 2, "q": ""})]
+
+    def test_items_run_concurrently(self):
+        """Test that slow items overlap instead of running back to back."""
+        app = build_app(max_items=20)
+        start = time.perf_counter()
+        run(app, *[f"/api/items/{i}" for i in range(20)])
+        assert time.perf_counter() - start < 20 * 0.01
+
+    def test_errors_stay_per_item(self):
+        """Test that HTTP, validation and unexpected errors fail only their item."""
+        response = run(build_app(), "/api/missing", "/api/items/abc", "/api/boom", "/api/items/3")
+        statuses = [r["status"] for r in response.json()["responses"]]
+        assert statuses == [404, 422, 500, 200]
+        assert response.json()["responses"][0]["body"] == {"detail": "Not found"}
+
+    def test_disallowed_items(self):
+        """Test that non-GET methods, nested batches and non-API paths are rejected per item."""
+        client = TestClient(build_app())
+        response = client.post("/api/batch", headers={"Authorization": "Bearer t1"}, json={"requests": [
+            {"path": "/api/items/1", "method": "DELETE"},
+            {"path": "/api/batch"},
+            {"path": "/docs"},
+        ]})
+        assert [r["status"] for r in response.json()["responses"]] == [405, 400, 400]
+
+    def test_batch_size_is_capped(self):
+        """Test that oversized batches are refused as a whole."""
+        response = run(build_app(max_items=2), "/api/items/1", "/api/items/2", "/api/items/3")
+        assert response.status_code == 413
+
+    def test_rate_limits_apply_per_item(self):
+        """Test that batching does not bypass route-group rate limits."""
+        rule = RateLimitRule(name="items", pattern=r"^/api/items/", max_requests=2, window_seconds=60)
+        response = run(build_app(rules=[rule]), "/api/items/1", "/api/items/2", "/api/items/3")
+        assert sorted(r["status"] for r in response.json()["responses"]) == [200, 200, 429]
+
+
+# ============================================================
+# Shared State Tests
+# ============================================================
+
+class TestSharedState:
+    """Test what sub-requests share with the batch request."""
+
+    def test_principal_is_shared(self):
+        """Test that items authenticate from the batch principal without a new login."""
+        response = run(build_app(), "/api/me", "/api/me")
+        assert [r["body"] for r in response.json()["responses"]] == [{"id": "user-t1"}] * 2
+        assert logins == ["t1"]
+
+    def test_request_state_is_shared(self):
+        """Test that context set before dispatch is visible to every item."""
+        response = run(build_app(), "/api/state", "/api/state")
+        states = {r["body"]["state"] for r in response.json()["responses"]}
+        assert len(states) == 1
+        assert states != {id(None)}
@@ -0,0 +1,255 @@
+"""
+Unit tests for the tiered cache and the authenticated principal cache.
+Tests LRU eviction, memory bounds, per-key TTL, copy isolation,
+load coalescing and principal invalidation.
+"""
+import pytest
+import asyncio
+import time
+
+from core.cache import LRUCache, TieredCache
+from core.principal_cache import PrincipalCache
+
+
+# ============================================================
+# LRU Tier Tests
+# ============================================================
+
+class TestLRUCache:
+    """Test the bounded in-process LRU tier."""
+
+    def test_get_returns_stored_blob(self):
+        """Test that a stored blob is returned."""
+        lru = LRUCache(max_entries=10)
+        lru.set("a", b"1", ttl=60)
+        assert lru.get("a") == b"1"
+
+    def test_evicts_least_recently_used_entry(self):
+        """Test that the least recently used key is evicted at capacity."""
+        lru = LRUCache(max_entries=2)
+        lru.set("a", b"1", ttl=60)
+        lru.set("b", b"2", ttl=60)
+        lru.get("a")  # touch a, so b is now LRU
+        lru.set("c", b"3", ttl=60)
+
+        assert lru.get("a") == b"1"
+        assert lru.get("b") is None
+        assert lru.get("c") == b"3"
+        assert lru.evictions == 1
+
+    def test_memory_bound_is_enforced(self):
+        """Test that total blob size never exceeds max_bytes."""
+        lru = LRUCache(max_entries=1000, max_bytes=100)
+        for i in range(20):
+            lru.set(f"k{i}", b"x" * 30, ttl=60)
+
+        assert lru.nbytes <= 100
+        assert len(lru) == 3
+
+    def test_oversized_value_is_not_cached(self):
+        """Test that a value larger than the whole tier is skipped."""
+        lru = LRUCache(max_entries=10, max_bytes=10)
+        lru.set("small", b"1", ttl=60)
+        lru.set("big", b"x" * 11, ttl=60)
+
+        assert lru.get("big") is None
+        assert lru.get("small") == b"1"
+
+    def test_per_key_ttl(self):
+        """Test that each key honours its own TTL."""
+        lru = LRUCache()
+        lru.set("short", b"1", ttl=0.05)
+        lru.set("long", b"2", ttl=60)
+        time.sleep(0.1)
+
+        assert lru.get("short") is None
+        assert lru.get("long") == b"2"
+
+    def test_clear_expired(self):
+        """Test that clear_expired removes only expired entries."""
+        lru = LRUCache()
+        lru.set("short", b"1", ttl=0.01)
+        lru.set("long", b"2", ttl=60)
+        time.sleep(0.05)
+
+        assert lru.clear_expired() == 1
+        assert len(lru) == 1
+        assert lru.nbytes == 1
+
+    def test_overwrite_updates_size(self):
+        """Test that overwriting a key keeps byte accounting correct."""
+        lru = LRUCache()
+        lru.set("a", b"12345", ttl=60)
+        lru.set("a", b"12", ttl=60)
+        assert lru.nbytes == 2
+
+
+# ============================================================
+# Tiered Cache Tests (local-only mode)
+# ============================================================
+
+class TestTieredCache:
+    """Test TieredCache behaviour without a shared tier."""
+
+    @pytest.fixture
+    async def cache(self):
+        cache = TieredCache(namespace="test", default_ttl=60, shared=False)
+        await cache.start()
+        yield cache
+        await cache.close()
+
+    async def test_set_and_get(self, cache):
+        """Test round-tripping a value."""
+        await cache.set("user:1", {"id": "1", "name": "Test"})
+        assert await cache.get("user:1") == {"id": "1", "name": "Test"}
+
+    async def test_returned_values_are_private_copies(self, cache):
+        """Test that mutating a returned value does not corrupt the cache."""
+        await cache.set("user:1", {"id": "1", "tags": ["a"]})
+        value = await cache.get("user:1")
+        value["tags"].append("b")
+
+        assert await cache.get("user:1") == {"id": "1", "tags": ["a"]}
+
+    async def test_set_honours_ttl_argument(self, cache):
+        """Test that ttl passed to set() is applied."""
+        await cache.set("k", "v", ttl=0.05)
+        await asyncio.sleep(0.1)
+        assert await cache.get("k") is None
+
+    async def test_invalidate(self, cache):
+        """Test that invalidate removes keys."""
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        await cache.invalidate("a", "b")
+
+        assert await cache.get("a") is None
+        assert await cache.get("b") is None
+
+    async def test_get_or_set_coalesces_concurrent_loads(self, cache):
+        """Test that concurrent misses share a single loader call."""
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"value": 42}
+
+        results = await asyncio.gather(*[cache.get_or_set("hot", loader) for _ in range(10)])
+
+        assert calls == 1
+        assert all(r == {"value": 42} for r in results)
+
+    async def test_get_or_set_does_not_cache_none(self, cache):
+        """Test that None results are not cached."""
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            return None
+
+        await cache.get_or_set("missing", loader)
+        await cache.get_or_set("missing", loader)
+        assert calls == 2
+
+    async def test_get_or_set_propagates_errors(self, cache):
+        """Test that loader errors reach every waiter and are not cached."""
+        async def loader():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *[cache.get_or_set("bad", loader) for _ in range(3)],
+            return_exceptions=True
+        )
+        assert all(isinstance(r, ValueError) for r in results)
+        assert await cache.get("bad") is None
+
+    async def test_stats(self, cache):
+        """Test hit/miss accounting."""
+        await cache.set("a", 1)
+        await cache.get("a")
+        await cache.get("missing")
+
+        stats = cache.stats()
+        assert stats["local_hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+        assert stats["shared"] is False
+
+
+# ============================================================
+# Principal Cache Tests
+# ============================================================
+
+class TestPrincipalCache:
+    """Test the get_current_user principal cache."""
+
+    def test_hit_requires_same_token(self):
+        """Test that entries are keyed by user id and token."""
+        principals = PrincipalCache(ttl=30)
+        principals.set("user-1", "token-a", {"id": "user-1"})
+
+        assert principals.get("user-1", "token-a") == {"id": "user-1"}
+        assert principals.get("user-1", "token-b") is None
+        assert principals.hits == 1
+        assert principals.misses == 1
+
+    def test_entries_expire(self):
+        """Test that principals expire after the TTL."""
+        principals = PrincipalCache(ttl=0.05)
+        principals.set("user-1", "token-a", {"id": "user-1"})
+        time.sleep(0.1)
+        assert principals.get("user-1", "token-a") is None
+
+    def test_size_bound(self):
+        """Test that the cache never exceeds max_entries."""
+        principals = PrincipalCache(max_entries=3)
+        for i in range(10):
+            principals.set(f"user-{i}", "token", {"id": i})
+
+        assert len(principals) == 3
+        assert principals.get("user-9", "token") == {"id": 9}
+        assert principals.get("user-0", "token") is None
+
+    async def test_invalidate_user_drops_all_tokens(self):
+        """Test that invalidation drops every token of the user only."""
+        principals = PrincipalCache()
+        principals.set("user-1", "phone", {"id": "user-1"})
+        principals.set("user-1", "laptop", {"id": "user-1"})
+        principals.set("user-2", "phone", {"id": "user-2"})
+
+        await principals.invalidate_user("user-1")
+
+        assert principals.get("user-1", "phone") is None
+        assert principals.get("user-1", "laptop") is None
+        assert principals.get("user-2", "phone") == {"id": "user-2"}
+
+    async def test_invalidation_via_attached_cache(self):
+        """Test that invalidations are routed through the attached cache bus."""
+        bus = TieredCache(namespace="test", shared=False)
+        principals = PrincipalCache()
+        principals.attach(bus)
+        principals.set("user-1", "token", {"id": "user-1"})
+
+        await principals.invalidate_user("user-1")
+        assert principals.get("user-1", "token") is None
+
+        principals.set("user-1", "token", {"id": "user-1"})
+        await bus.clear()
+        assert len(principals) == 0
+
+    def test_stats(self):
+        """Test that hit/miss counters are exposed."""
+        principals = PrincipalCache(ttl=30, max_entries=5)
+        principals.set("user-1", "token", {"id": "user-1"})
+        principals.get("user-1", "token")
+        principals.get("user-2", "token")
+
+        stats = principals.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+        assert stats["entries"] == 1
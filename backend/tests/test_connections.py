@@ -0,0 +1,163 @@
+"""
+Unit tests for memoized module connection sets.
+Tests the per-module source union, memo hits, invalidation through the
+graphs' cache keys, the LRU bound and the ConnectionSet helpers.
+"""
+import pytest
+
+from core.connections import ConnectionSet, ModuleConnections
+from core.org_graph import OrgGraph
+
+
+class StubFamilyGraph:
+    """Family connections from a dict, counting lookups."""
+
+    def __init__(self, connections):
+        self.connections_by_user = connections
+        self.calls = 0
+
+    async def connections(self, user_id):
+        self.calls += 1
+        return set(self.connections_by_user.get(user_id, ()))
+
+
+@pytest.fixture
+async def orgs(mock_db):
+    # acme (work): ann, cat
+    for user_id in ("ann", "cat"):
+        await mock_db.work_members.insert_one({
+            "id": f"w-acme-{user_id}", "organization_id": "acme", "user_id": user_id, "is_active": True,
+        })
+    return mock_db
+
+
+@pytest.fixture
+def family():
+    return StubFamilyGraph({"ann": {"ann", "mom"}})
+
+
+@pytest.fixture
+def connections(orgs, cache, family):
+    module_connections = ModuleConnections(family, OrgGraph(orgs, cache))
+    module_connections.attach(cache)
+    return module_connections
+
+
+# ============================================================
+# Module Tests
+# ============================================================
+
+class TestModuleSources:
+    """Test which graphs each module draws from."""
+
+    async def test_family_module(self, connections):
+        """Test that the family module uses family connections only."""
+        assert await connections.get("ann", "family") == {"ann", "mom"}
+
+    async def test_organizations_module(self, connections):
+        """Test that the organizations module uses colleagues only."""
+        assert await connections.get("ann", "organizations") == {"ann", "cat"}
+
+    async def test_shared_modules_use_union(self, connections):
+        """Test that news and the other shared modules merge both graphs."""
+        for module in ("news", "journal", "services", "events"):
+            assert await connections.get("ann", module) == {"ann", "mom", "cat"}
+
+    async def test_unknown_module_is_self_only(self, connections):
+        """Test that unknown modules only show the user's own posts."""
+        assert await connections.get("ann", "unknown") == {"ann"}
+
+    async def test_user_always_included(self, connections):
+        """Test that a user without connections still sees themselves."""
+        assert await connections.get("zed", "news") == {"zed"}
+
+
+# ============================================================
+# Memoization Tests
+# ============================================================
+
+class TestMemoization:
+    """Test memo hits, invalidation and the entry bound."""
+
+    async def test_hit_issues_no_query(self, connections, query_budget):
+        """Test that a repeated lookup is served from the memo."""
+        first = await connections.get("ann", "news")
+        with query_budget(max_queries=0):
+            assert await connections.get("ann", "news") is first
+        assert connections.stats()["hits"] == 1
+
+    async def test_modules_share_an_entry(self, connections, family):
+        """Test that modules with the same sources share one memoized set."""
+        await connections.get("ann", "news")
+        await connections.get("ann", "events")
+        assert family.calls == 1
+
+    async def test_family_change_drops_user(self, connections, cache, family):
+        """Test that a family graph invalidation recomputes that user only."""
+        await connections.get("ann", "news")
+        await connections.get("cat", "news")
+        family.connections_by_user["ann"] = {"ann", "dad"}
+        await cache.invalidate("family_graph:ann")
+        assert await connections.get("ann", "news") == {"ann", "dad", "cat"}
+        assert family.calls == 3
+        await connections.get("cat", "news")
+        assert family.calls == 3
+
+    async def test_membership_change_drops_colleagues(self, connections, orgs):
+        """Test that a new member reaches the memoized sets of existing members."""
+        assert await connections.get("cat", "organizations") == {"ann", "cat"}
+        await orgs.work_members.insert_one({
+            "id": "w-acme-ben", "organization_id": "acme", "user_id": "ben", "is_active": True,
+        })
+        await connections.org_graph.member_changed("work", "acme", "ben")
+        assert await connections.get("cat", "organizations") == {"ann", "ben", "cat"}
+
+    async def test_clear_drops_everything(self, connections, cache):
+        """Test that clearing the cache clears the memo."""
+        await connections.get("ann", "news")
+        await cache.clear()
+        assert connections.stats()["entries"] == 0
+
+    async def test_invalidation_during_compute_is_not_stored(self, connections, family):
+        """Test that a set computed across an invalidation is returned but not memoized."""
+        original = family.connections
+
+        async def racing(user_id):
+            connections.invalidate_user(user_id)
+            return await original(user_id)
+
+        family.connections = racing
+        await connections.get("ann", "family")
+        assert connections.stats()["entries"] == 0
+
+    async def test_entry_bound(self, orgs, family):
+        """Test that the least recently used entry is evicted past max_entries."""
+        bounded = ModuleConnections(family, OrgGraph(orgs), max_entries=2)
+        await bounded.get("ann", "family")
+        await bounded.get("cat", "family")
+        await bounded.get("ann", "family")
+        await bounded.get("zed", "family")
+        assert set(u for u, _ in bounded._entries) == {"ann", "zed"}
+
+
+# ============================================================
+# ConnectionSet Tests
+# ============================================================
+
+class TestConnectionSet:
+    """Test the immutable set helpers."""
+
+    def test_as_in(self):
+        """Test the Mongo $in rendering and that callers cannot mutate it."""
+        connected = ConnectionSet(["b", "a"])
+        clause = connected.as_in()
+        assert clause == {"$in": ["a", "b"]}
+        clause["$in"].append("c")
+        assert connected.as_in() == {"$in": ["a", "b"]}
+
+    def test_intersection_and_membership(self):
+        """Test filtering candidates in Python."""
+        connected = ConnectionSet(["a", "b"])
+        assert connected & ["b", "c"] == {"b"}
+        assert "a" in connected and "c" not in connected
+        assert len(connected) == 2
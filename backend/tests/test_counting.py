@@ -0,0 +1,81 @@
+"""
+Unit tests for list counting strategies.
+Tests exact, capped, cached and skipped counts and the response fields
+they produce.
+"""
+import pytest
+
+from core.counting import Count, CountMode, ListCounter
+
+
+@pytest.fixture
+async def products(mock_db):
+    for i in range(12):
+        await mock_db.marketplace_products.insert_one({"id": f"p{i}", "status": "active" if i < 10 else "sold"})
+    return mock_db.marketplace_products
+
+
+# ============================================================
+# Count Result Tests
+# ============================================================
+
+class TestCount:
+    """Test count values and response fields."""
+
+    def test_display(self):
+        """Test that capped counts render with a plus sign."""
+        assert Count(1000, False).display == "1000+"
+        assert Count(42, True).display == "42"
+        assert Count(None, False).display is None
+
+    def test_fields(self):
+        """Test the total/total_exact response fields."""
+        assert Count(5, True).fields() == {"total": 5, "total_exact": True}
+
+
+# ============================================================
+# Strategy Tests
+# ============================================================
+
+class TestListCounter:
+    """Test each counting mode."""
+
+    async def test_exact(self, products):
+        """Test that exact mode counts every match."""
+        counted = await ListCounter(cap=3).count(products, {"status": "active"}, CountMode.EXACT)
+        assert counted == Count(10, True)
+
+    async def test_capped_beyond_cap(self, products):
+        """Test that capped mode stops at the cap and reports an inexact total."""
+        counted = await ListCounter(cap=3).count(products, {"status": "active"}, CountMode.CAPPED)
+        assert counted == Count(3, False)
+        assert counted.display == "3+"
+
+    async def test_capped_within_cap(self, products):
+        """Test that small results are exact in capped mode."""
+        counted = await ListCounter(cap=3).count(products, {"status": "sold"}, "capped")
+        assert counted == Count(2, True)
+
+    async def test_none_skips_query(self, products, query_budget):
+        """Test that none mode issues no query."""
+        with query_budget(max_queries=0):
+            counted = await ListCounter().count(products, {}, CountMode.NONE)
+        assert counted.fields() == {"total": None, "total_exact": False}
+
+    async def test_cached_counts_once(self, products, cache, query_budget):
+        """Test that repeated filters are counted once per TTL."""
+        counter = ListCounter(cache)
+        with query_budget(max_queries=1):
+            first = await counter.count(products, {"status": "active"}, CountMode.CACHED)
+            second = await counter.count(products, {"status": "active"}, CountMode.CACHED)
+        assert first == second == Count(10, True)
+
+    async def test_cached_keys_differ_by_filter(self, products, cache):
+        """Test that different filters do not share a cached count."""
+        counter = ListCounter(cache)
+        assert (await counter.count(products, {"status": "sold"}, CountMode.CACHED)).value == 2
+        assert (await counter.count(products, {"status": "active"}, CountMode.CACHED)).value == 10
+
+    async def test_cached_without_cache_is_exact(self, products):
+        """Test that cached mode degrades to an exact count without a cache."""
+        assert await ListCounter().count(products, {}, CountMode.CACHED) == Count(12, True)
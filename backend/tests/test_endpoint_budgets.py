@@ -0,0 +1,103 @@
+"""
+Query budget tests for API endpoints.
+Drives real routes from server.py against mock_db and holds each one to
+its entry in QUERY_BUDGETS, with enough rows to expose an N+1.
+"""
+import os
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from core.query_budget import recording
+
+# server.py reads its configuration at import; the client never connects
+for name, value in {
+    "MONGO_URL": "mongodb://localhost:27017",
+    "JWT_SECRET_KEY": "test-secret-key-for-testing-only-do-not-use-in-production",
+    "ADMIN_USERNAME": "admin",
+    "ADMIN_PASSWORD": "admin",
+    "CORS_ORIGINS": "http://localhost",
+}.items():
+    os.environ.setdefault(name, value)
+
+import server  # noqa: E402
+
+VIEWER = "viewer"
+SENDERS = [f"sender{i}" for i in range(5)]
+
+
+@pytest.fixture
+async def api(mock_db, monkeypatch):
+    """The API router alone (no budget middleware) against mock_db, as VIEWER."""
+    monkeypatch.setattr(server, "db", mock_db)
+    app = FastAPI()
+    app.include_router(server.api_router)
+    app.dependency_overrides[server.get_current_user] = lambda: server.User(
+        id=VIEWER, email="viewer@example.com", password_hash="x", first_name="View", last_name="Er"
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def seed(collection, docs):
+    # Recorded apart from the test's budget
+    with recording():
+        for doc in docs:
+            await collection.insert_one(doc)
+
+
+async def seed_users(mock_db):
+    await seed(mock_db.users, [
+        {"id": user_id, "first_name": user_id, "last_name": "Test", "email": f"{user_id}@example.com"}
+        for user_id in SENDERS
+    ])
+
+
+# ============================================================
+# Notification Tests
+# ============================================================
+
+class TestNotificationBudget:
+    """Test the notifications page."""
+
+    @pytest.mark.query_budget(server.QUERY_BUDGETS["/api/notifications"], max_repeats=2)
+    async def test_notifications(self, api, mock_db):
+        """Test that a page of notifications from many senders stays within its budget."""
+        await seed_users(mock_db)
+        await seed(mock_db.notifications, [
+            {"id": f"n{i}", "user_id": VIEWER, "sender_id": SENDERS[i % len(SENDERS)],
+             "type": "like", "title": "t", "message": "m", "is_read": False,
+             "created_at": server.datetime(2026, 1, 1, 0, i, tzinfo=server.timezone.utc)}
+            for i in range(10)
+        ])
+        response = await api.get("/api/notifications")
+        assert response.status_code == 200
+        assert {n["sender"]["id"] for n in response.json()} == set(SENDERS)
+
+
+# ============================================================
+# News Comment Tests
+# ============================================================
+
+class TestNewsCommentBudget:
+    """Test the news post comment thread."""
+
+    @pytest.mark.query_budget(server.QUERY_BUDGETS["/api/news/posts/{post_id}/comments"], max_repeats=2)
+    async def test_comments(self, api, mock_db):
+        """Test that a thread with replies by many authors stays within its budget."""
+        await seed_users(mock_db)
+        await seed(mock_db.news_posts, [{"id": "p1", "user_id": SENDERS[0]}])
+        await seed(mock_db.news_post_comments, [
+            {"id": f"c{i}", "post_id": "p1", "user_id": SENDERS[i % len(SENDERS)],
+             "content": "hi", "parent_comment_id": "c0" if i else None,
+             "created_at": server.datetime(2026, 1, 1, 0, i, tzinfo=server.timezone.utc)}
+            for i in range(10)
+        ])
+        await seed(mock_db.news_comment_likes, [{"id": "l1", "comment_id": "c3", "user_id": VIEWER}])
+        response = await api.get("/api/news/posts/p1/comments")
+        assert response.status_code == 200
+        thread = response.json()["comments"]
+        assert len(thread) == 1 and len(thread[0]["replies"]) == 9
+        assert [reply["user_liked"] for reply in thread[0]["replies"]].count(True) == 1
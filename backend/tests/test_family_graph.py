@@ -0,0 +1,117 @@
+"""
+Unit tests for the materialized family connection graph.
+Tests connection sets through memberships and subscriptions, lazy builds,
+targeted recomputation on changes and cache invalidation.
+"""
+import pytest
+
+from core.family_graph import FamilyGraph
+
+
+async def join(db, family_id, user_id, accepted=True):
+    await db.family_members.insert_one({
+        "id": f"m-{family_id}-{user_id}", "family_id": family_id, "user_id": user_id,
+        "is_active": True, "invitation_accepted": accepted,
+    })
+
+
+async def subscribe(db, subscriber, target):
+    await db.family_subscriptions.insert_one({
+        "id": f"s-{subscriber}-{target}", "subscriber_family_id": subscriber, "target_family_id": target,
+        "is_active": True, "status": "ACTIVE",
+    })
+
+
+@pytest.fixture
+async def families(mock_db):
+    # f1: ann, ben; f2: cat; f1 subscribes to f2; f3: dan (unrelated)
+    await join(mock_db, "f1", "ann")
+    await join(mock_db, "f1", "ben")
+    await join(mock_db, "f2", "cat")
+    await join(mock_db, "f3", "dan")
+    await subscribe(mock_db, "f1", "f2")
+    return mock_db
+
+
+# ============================================================
+# Read Tests
+# ============================================================
+
+class TestConnections:
+    """Test connection sets built from the family tables."""
+
+    async def test_members_and_subscribed_families(self, families):
+        """Test that own family and subscribed family members are connected."""
+        graph = FamilyGraph(families)
+        assert await graph.connections("ann") == {"ann", "ben", "cat"}
+
+    async def test_subscription_is_one_way(self, families):
+        """Test that the target family does not see the subscriber's members."""
+        graph = FamilyGraph(families)
+        assert await graph.connections("cat") == {"cat"}
+
+    async def test_pending_invitation_not_connected(self, families):
+        """Test that unaccepted memberships are ignored."""
+        await join(families, "f1", "eve", accepted=False)
+        graph = FamilyGraph(families)
+        assert "eve" not in await graph.connections("ann")
+        assert await graph.connections("eve") == set()
+
+    async def test_first_read_materializes(self, families):
+        """Test that a missing set is built once and stored."""
+        graph = FamilyGraph(families)
+        await graph.connections("ben")
+        stored = await families.family_connections.find_one({"user_id": "ben"})
+        assert stored["connections"] == ["ann", "ben", "cat"]
+        assert stored["families"] == ["f1"]
+
+    async def test_cached_reads_skip_database(self, families, cache, query_budget):
+        """Test that repeated reads are served from the cache."""
+        graph = FamilyGraph(families, cache)
+        await graph.connections("ann")
+        with query_budget(max_queries=0):
+            assert await graph.connections("ann") == {"ann", "ben", "cat"}
+
+
+# ============================================================
+# Maintenance Tests
+# ============================================================
+
+class TestMaintenance:
+    """Test targeted recomputation after graph changes."""
+
+    async def test_join_updates_family_and_subscribers(self, families, cache):
+        """Test that joining a family reaches its members and subscriber families."""
+        graph = FamilyGraph(families, cache)
+        for user in ("ann", "cat", "dan"):
+            await graph.connections(user)
+
+        await join(families, "f2", "fay")
+        await graph.family_changed(["f2"])
+
+        assert "fay" in await graph.connections("ann")
+        assert "fay" in await graph.connections("cat")
+        assert await graph.connections("dan") == {"dan"}
+
+    async def test_leave_updates_leaver(self, families, cache):
+        """Test that a member who left loses the family and vice versa."""
+        graph = FamilyGraph(families, cache)
+        await graph.connections("ann")
+        await graph.connections("ben")
+
+        families.family_members._data["m-f1-ben"]["is_active"] = False
+        await graph.family_changed(["f1"], users=["ben"])
+
+        assert await graph.connections("ben") == set()
+        assert await graph.connections("ann") == {"ann", "cat"}
+
+    async def test_rebuild_is_batched(self, families, query_budget):
+        """Test that rebuilding many users costs three reads and one bulk write."""
+        graph = FamilyGraph(families)
+        with query_budget(max_queries=4):
+            await graph.rebuild(["ann", "ben", "cat", "dan"])
+
+    async def test_only_affected_users_rebuilt(self, families):
+        """Test that users outside the changed families are left alone."""
+        graph = FamilyGraph(families)
+        assert await graph.affected_users(["f2"]) == {"ann", "ben", "cat"}
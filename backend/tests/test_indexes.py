@@ -0,0 +1,248 @@
+"""
+Unit tests for the declarative index registry.
+Tests index naming and matching, reconciliation against existing indexes,
+explain-plan parsing, seeding, and that every registered hot query has a
+candidate index.
+"""
+import pytest
+
+from core.indexes import IndexRegistry, IndexSpec, plan_stages, reconcile_indexes, sample_document
+from db_indexes import HOT_QUERIES, INDEXES
+
+
+class FakeCollection:
+    def __init__(self, indexes=None):
+        self.indexes = {"_id_": {"key": [("_id", 1)], "v": 2}, **(indexes or {})}
+        self.created = []
+        self.dropped = []
+
+    async def index_information(self):
+        return dict(self.indexes)
+
+    async def create_index(self, keys, **options):
+        name = options["name"]
+        self.created.append(name)
+        self.indexes[name] = {"key": keys, **{k: v for k, v in options.items() if k not in ("name", "background")}}
+        return name
+
+    async def drop_index(self, name):
+        self.dropped.append(name)
+        del self.indexes[name]
+
+
+class FakeDB(dict):
+    def __getitem__(self, name):
+        return self.setdefault(name, FakeCollection())
+
+
+# ============================================================
+# Index Spec Tests
+# ============================================================
+
+class TestIndexSpec:
+    """Test names, options and matching of declared indexes."""
+
+    def test_default_name_matches_mongodb(self):
+        """Test that unnamed specs use MongoDB's default index name."""
+        registry = IndexRegistry()
+        assert registry.add("posts", [("user_id", 1), ("created_at", -1)]).index_name == "user_id_1_created_at_-1"
+        assert registry.add("users", "email", unique=True).index_name == "email_1"
+
+    def test_create_options(self):
+        """Test that partial and TTL options are passed to create_index."""
+        spec = IndexSpec("tokens", (("expires_at", 1),), ttl=0)
+        assert spec.create_options()["expireAfterSeconds"] == 0
+        partial = IndexSpec("products", (("category", 1),), partial={"status": "active"}, name="active_category")
+        assert partial.create_options()["partialFilterExpression"] == {"status": "active"}
+        assert partial.create_options()["name"] == "active_category"
+
+    def test_matches_index_information(self):
+        """Test comparison against index_information() entries."""
+        spec = IndexSpec("users", (("email", 1),), unique=True)
+        assert spec.matches({"key": [("email", 1)], "unique": True, "v": 2})
+        assert spec.matches({"key": [("email", 1.0)], "unique": True})
+        assert not spec.matches({"key": [("email", 1)]})
+        assert not IndexSpec("t", (("at", 1),), ttl=60).matches({"key": [("at", 1)], "expireAfterSeconds": 30})
+
+    def test_conflicting_redeclaration_rejected(self):
+        """Test that one name cannot be declared with different options."""
+        registry = IndexRegistry()
+        registry.add("users", "email")
+        registry.add("users", "email")
+        with pytest.raises(ValueError):
+            registry.add("users", "email", unique=True)
+        assert len(registry) == 1
+
+
+# ============================================================
+# Reconciliation Tests
+# ============================================================
+
+class TestReconcile:
+    """Test reconciling a registry against a database."""
+
+    async def test_creates_missing_and_keeps_existing(self):
+        """Test that only missing indexes are created."""
+        registry = IndexRegistry()
+        registry.add("users", "id", unique=True)
+        registry.add("users", "email", unique=True)
+        db = FakeDB(users=FakeCollection({"id_1": {"key": [("id", 1)], "unique": True}}))
+
+        report = await reconcile_indexes(db, registry)
+        assert report.created == ["users.email_1"]
+        assert report.unchanged == ["users.id_1"]
+
+        again = await reconcile_indexes(db, registry)
+        assert again.created == [] and len(again.unchanged) == 2
+
+    async def test_conflicts_are_reported_not_dropped(self):
+        """Test that an index with different options is left alone by default."""
+        registry = IndexRegistry()
+        registry.add("notifications", [("created_at", -1)])
+        ttl_index = {"key": [("created_at", -1)], "expireAfterSeconds": 2592000}
+        db = FakeDB(notifications=FakeCollection({"created_at_-1": ttl_index}))
+
+        report = await reconcile_indexes(db, registry)
+        assert report.conflicts == ["notifications.created_at_-1"]
+        assert db["notifications"].dropped == []
+
+        report = await reconcile_indexes(db, registry, drop_conflicting=True)
+        assert report.created == ["notifications.created_at_-1"]
+        assert db["notifications"].dropped == ["created_at_-1"]
+
+    async def test_unregistered_indexes_are_reported(self):
+        """Test that indexes missing from the registry are listed, never dropped."""
+        registry = IndexRegistry()
+        registry.add("users", "id")
+        db = FakeDB(users=FakeCollection({"created_at_-1": {"key": [("created_at", -1)]}}))
+
+        report = await reconcile_indexes(db, registry)
+        assert report.unregistered == ["users.created_at_-1"]
+        assert "created_at_-1" in db["users"].indexes
+
+    async def test_retired_indexes_are_dropped(self):
+        """Test that retired indexes are dropped after their replacement is created, and never created."""
+        registry = IndexRegistry()
+        registry.add("posts", [("user_id", 1), ("created_at", -1), ("id", -1)])
+        registry.retire("posts", [("user_id", 1), ("created_at", -1)],
+                        superseded_by=[("user_id", 1), ("created_at", -1), ("id", -1)])
+        db = FakeDB(posts=FakeCollection({"user_id_1_created_at_-1": {"key": [("user_id", 1), ("created_at", -1)]}}))
+        drop = db["posts"].drop_index
+
+        async def drop_after_replacement(name):
+            assert "user_id_1_created_at_-1_id_-1" in db["posts"].indexes
+            await drop(name)
+
+        db["posts"].drop_index = drop_after_replacement
+        report = await reconcile_indexes(db, registry)
+        assert report.dropped == ["posts.user_id_1_created_at_-1"]
+        assert report.created == ["posts.user_id_1_created_at_-1_id_-1"]
+        assert report.unregistered == []
+        assert (await reconcile_indexes(db, registry)).dropped == []
+
+    async def test_retired_index_kept_without_replacement(self):
+        """Test that a retired index is kept when its replacement could not be created."""
+        registry = IndexRegistry()
+        registry.add("posts", [("user_id", 1), ("created_at", -1), ("id", -1)])
+        registry.retire("posts", [("user_id", 1), ("created_at", -1)],
+                        superseded_by=[("user_id", 1), ("created_at", -1), ("id", -1)])
+        db = FakeDB(posts=FakeCollection({"user_id_1_created_at_-1": {"key": [("user_id", 1), ("created_at", -1)]}}))
+
+        async def conflict(keys, **options):
+            raise RuntimeError("IndexOptionsConflict")
+
+        db["posts"].create_index = conflict
+        report = await reconcile_indexes(db, registry)
+        assert report.dropped == [] and len(report.errors) == 1
+        assert "user_id_1_created_at_-1" in db["posts"].indexes
+        assert report.unregistered == []
+
+    async def test_failed_conflict_drop_is_reported(self):
+        """Test that a failing drop of a conflicting index does not abort reconciliation."""
+        registry = IndexRegistry()
+        registry.add("notifications", [("created_at", -1)])
+        registry.add("notifications", "user_id")
+        ttl_index = {"key": [("created_at", -1)], "expireAfterSeconds": 2592000}
+        db = FakeDB(notifications=FakeCollection({"created_at_-1": ttl_index}))
+
+        async def locked(name):
+            raise RuntimeError("index build in progress")
+
+        db["notifications"].drop_index = locked
+        report = await reconcile_indexes(db, registry, drop_conflicting=True)
+        assert report.errors == ["notifications.created_at_-1: index build in progress"]
+        assert report.created == ["notifications.user_id_1"]
+
+    def test_retiring_a_declared_index_is_rejected(self):
+        """Test that an index cannot be both declared and retired."""
+        registry = IndexRegistry()
+        registry.add("users", "email")
+        with pytest.raises(ValueError):
+            registry.retire("users", "email", superseded_by=[("email", 1), ("id", 1)])
+
+
+# ============================================================
+# Explain and Seeding Tests
+# ============================================================
+
+class TestExplain:
+    """Test plan parsing and seed documents."""
+
+    def test_plan_stages_classic(self):
+        """Test stage collection from a classic winning plan."""
+        plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_id_1"}}
+        assert plan_stages(plan) == ["FETCH", "IXSCAN"]
+
+    def test_plan_stages_or_and_sbe(self):
+        """Test $or branches and the slot-based engine's nested queryPlan."""
+        plan = {"queryPlan": {"stage": "SORT", "inputStage": {
+            "stage": "OR", "inputStages": [{"stage": "IXSCAN"}, {"stage": "COLLSCAN"}]}}}
+        assert "COLLSCAN" in plan_stages(plan)
+
+    def test_sample_document(self):
+        """Test that seed documents satisfy equality, $in, range and $or terms."""
+        doc = sample_document({
+            "user_id": "u1",
+            "status": {"$in": ["A", "B"]},
+            "updated_at": {"$gte": 5},
+            "is_deleted": {"$ne": True},
+            "$or": [{"from_user_id": "u1"}, {"to_user_id": "u1"}],
+        })
+        assert doc == {"user_id": "u1", "status": "A", "updated_at": 5, "from_user_id": "u1"}
+
+
+# ============================================================
+# Registry Coverage Tests
+# ============================================================
+
+def _equality_fields(query_filter):
+    return {k for k, v in query_filter.items() if not k.startswith("$") and (not isinstance(v, dict) or "$in" in v)}
+
+
+def _has_candidate_index(collection, query_filter, sort):
+    fields = _equality_fields(query_filter) | {k for k, v in query_filter.items() if isinstance(v, dict)}
+    for spec in INDEXES.for_collection(collection):
+        if spec.partial and any(query_filter.get(k) != v for k, v in spec.partial.items()):
+            continue
+        leading = spec.keys[0][0]
+        if leading in fields or (sort and leading == sort[0][0] and spec.partial):
+            return True
+    return False
+
+
+class TestRegistry:
+    """Test the application's registry."""
+
+    @pytest.mark.parametrize("query", HOT_QUERIES, ids=lambda q: q.name)
+    def test_hot_query_has_candidate_index(self, query):
+        """Test that every hot query (and each $or branch) can use an index."""
+        branches = query.filter.get("$or") or [query.filter]
+        for branch in branches:
+            assert _has_candidate_index(query.collection, {**query.filter, **branch}, query.sort), query.name
+
+    def test_legacy_indexes_keep_default_names(self):
+        """Test that indexes created before the registry are recognised by name."""
+        names = {(spec.collection, spec.index_name) for spec in INDEXES}
+        assert ("users", "email_1") in names
+        assert ("news_posts", "visibility_1_user_id_1_created_at_-1") in names
+        assert ("news_post_likes", "post_id_1_user_id_1") in names
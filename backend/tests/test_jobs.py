@@ -0,0 +1,100 @@
+"""
+Unit tests for shared background job state.
+Tests one-off migration markers (claims, failures, retries) and the
+id-ordered walk shared by all workers.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core.jobs import SharedCursor, run_once
+
+
+class Job:
+    """A migration that counts its runs and can be made to fail."""
+
+    def __init__(self, fail=False):
+        self.runs = 0
+        self.fail = fail
+
+    async def __call__(self):
+        self.runs += 1
+        if self.fail:
+            raise RuntimeError("boom")
+        return self.runs
+
+
+# ============================================================
+# Migration Tests
+# ============================================================
+
+class TestRunOnce:
+    """Test one-off migrations behind a persisted marker."""
+
+    async def test_runs_once_per_database(self, mock_db):
+        """Test that a completed migration is not run again by any worker."""
+        job = Job()
+        assert await run_once(mock_db, "fill", job)
+        assert not await run_once(mock_db, "fill", job)
+        assert job.runs == 1
+        assert mock_db.job_state._data["fill"]["status"] == "done"
+
+    async def test_failure_is_recorded_and_retried(self, mock_db):
+        """Test that a failure does not raise and the next start retries it."""
+        job = Job(fail=True)
+        assert not await run_once(mock_db, "fill", job)
+        assert mock_db.job_state._data["fill"]["error"] == "boom"
+        job.fail = False
+        assert await run_once(mock_db, "fill", job)
+        assert job.runs == 2
+
+    async def test_running_claim_is_respected_until_stale(self, mock_db):
+        """Test that another worker's live claim is skipped and an abandoned one is taken over."""
+        started = datetime.now(timezone.utc) - timedelta(minutes=5)
+        await mock_db.job_state.insert_one({"id": "fill", "status": "running", "started_at": started})
+        job = Job()
+        assert not await run_once(mock_db, "fill", job, stale_after=3600)
+        assert await run_once(mock_db, "fill", job, stale_after=60)
+        assert job.runs == 1
+
+
+# ============================================================
+# Shared Cursor Tests
+# ============================================================
+
+@pytest.fixture
+async def users(mock_db):
+    for user_id in ("a", "b", "c", "d", "e"):
+        await mock_db.users.insert_one({"id": user_id})
+    return mock_db
+
+
+class TestSharedCursor:
+    """Test the walk shared by every worker."""
+
+    async def test_workers_continue_each_other(self, users):
+        """Test that separate instances (workers) take consecutive batches and wrap."""
+        workers = [SharedCursor(users, "walk", users.users, batch=2) for _ in range(2)]
+        batches = [[doc["id"] for doc in await workers[i % 2].next_batch({"id": 1})] for i in range(4)]
+        assert batches == [["a", "b"], ["c", "d"], ["e"], ["a", "b"]]
+
+    async def test_lost_claim_returns_nothing(self, users):
+        """Test that a batch claimed by another worker in the meantime is not processed twice."""
+        walk = SharedCursor(users, "walk", users.users, batch=2)
+        await walk.next_batch({"id": 1})
+        read = users.users.find
+
+        def find_then_advance(*args, **kwargs):
+            users.job_state._data["walk"]["cursor"] = "d"
+            return read(*args, **kwargs)
+
+        users.users.find = find_then_advance
+        assert await walk.next_batch({"id": 1}) == []
+        users.users.find = read
+        assert [doc["id"] for doc in await walk.next_batch({"id": 1})] == ["e"]
+
+    async def test_query_filters_the_walk(self, users):
+        """Test that only matching documents are visited."""
+        users.users._data["c"]["flag"] = True
+        walk = SharedCursor(users, "flagged", users.users, batch=10, query={"flag": True})
+        assert [doc["id"] for doc in await walk.next_batch({"id": 1})] == ["c"]
@@ -0,0 +1,84 @@
+"""
+Unit tests for the per-user change journal.
+Tests versioning, deltas after a version, resets for clients that fell
+behind, and the cost of recording and polling.
+"""
+import pytest
+
+from core.journal import ChangeJournal
+
+
+@pytest.fixture
+def journal(mock_db):
+    return ChangeJournal(mock_db, max_entries=3)
+
+
+# ============================================================
+# Recording Tests
+# ============================================================
+
+class TestRecord:
+    """Test appending changes."""
+
+    async def test_versions_are_per_user(self, journal):
+        """Test that each user's version counts only their own changes."""
+        await journal.record(["ann", "ben"], "message", "m1", {"chat_id": "c1"})
+        await journal.record(["ann"], "notification", "n1")
+        assert await journal.version("ann") == 2
+        assert await journal.version("ben") == 1
+        assert await journal.version("cat") == 0
+
+    async def test_fan_out_is_one_write(self, journal, query_budget):
+        """Test that recording for many users is a single command."""
+        with query_budget(max_queries=1):
+            await journal.record([f"u{i}" for i in range(50)], "feed", "p1")
+
+    async def test_unknown_kind_rejected(self, journal):
+        """Test that kinds outside the documented set are refused."""
+        with pytest.raises(ValueError):
+            await journal.record(["ann"], "likes", "x")
+
+
+# ============================================================
+# Delta Tests
+# ============================================================
+
+class TestChanges:
+    """Test reading deltas."""
+
+    async def test_nothing_changed(self, journal):
+        """Test that an up-to-date client gets None (served as 204)."""
+        await journal.record(["ann"], "task", "t1")
+        assert await journal.changes("ann", 1) is None
+        assert await journal.changes("zed", 0) is None
+
+    async def test_only_newer_changes(self, journal):
+        """Test that changes after the client's version are returned with their versions."""
+        for ref in ["n1", "n2", "n3"]:
+            await journal.record(["ann"], "notification", ref)
+        delta = await journal.changes("ann", 1)
+        assert [(c["version"], c["id"]) for c in delta["changes"]] == [(2, "n2"), (3, "n3")]
+        assert delta["version"] == 3 and not delta["reset"]
+
+    async def test_reset_when_entries_dropped(self, journal):
+        """Test that a client behind the retained window is told to refetch."""
+        for i in range(5):
+            await journal.record(["ann"], "notification", f"n{i}")
+        delta = await journal.changes("ann", 1)
+        assert delta["reset"]
+        assert [c["version"] for c in delta["changes"]] == [3, 4, 5]
+
+    async def test_reset_when_client_is_ahead(self, journal):
+        """Test that a version newer than the journal forces a refetch."""
+        await journal.record(["ann"], "rsvp", "e1")
+        assert (await journal.changes("ann", 9))["reset"]
+
+    async def test_reset_when_journal_is_missing(self, journal):
+        """Test that a client with a version but no journal document is told to refetch."""
+        assert await journal.changes("zed", 4) == {"version": 0, "reset": True, "changes": []}
+
+    async def test_idle_poll_is_one_query(self, journal, query_budget):
+        """Test that polling costs a single lookup."""
+        await journal.record(["ann"], "task", "t1")
+        with query_budget(max_queries=1):
+            assert await journal.changes("ann", 1) is None
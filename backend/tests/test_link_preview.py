@@ -0,0 +1,154 @@
+"""
+Unit tests for link previews.
+Tests head-only streaming parsing, the memory and MongoDB cache tiers,
+coalescing of concurrent fetches and failure caching, against a local
+HTTP server.
+"""
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from core.cache import TieredCache
+from core.link_preview import LinkPreviewService, parse_head
+
+HEAD = (
+    '<html><head><title> Fallback &amp; title </title>'
+    '<meta property="og:title" content="Tom &amp; Jerry">'
+    '<meta content="A cartoon" property="og:description">'
+    '<meta property="og:image" content="/cover.jpg">'
+    '</head>'
+)
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk.encode() if isinstance(chunk, str) else chunk
+
+
+@pytest.fixture
+async def site():
+    hits = {"page": 0, "slow": 0}
+
+    async def page(request):
+        hits["page"] += 1
+        return web.Response(text=HEAD + "<body>" + "x" * 200_000 + "</body></html>", content_type="text/html")
+
+    async def slow(request):
+        hits["slow"] += 1
+        await asyncio.sleep(0.05)
+        return web.Response(text=HEAD, content_type="text/html")
+
+    async def missing(request):
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get("/page", page)
+    app.router.add_get("/slow", slow)
+    app.router.add_get("/missing", missing)
+    server = TestServer(app)
+    await server.start_server()
+    server.hits = hits
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+async def service(mock_db, cache):
+    service = LinkPreviewService(mock_db, cache)
+    yield service
+    await service.close()
+
+
+# ============================================================
+# Parser Tests
+# ============================================================
+
+class TestParseHead:
+    """Test the streaming head parser."""
+
+    async def test_extracts_og_tags(self):
+        """Test that og tags are read in either attribute order, with entities decoded."""
+        head = await parse_head(stream(HEAD))
+        assert head.og == {"title": "Tom & Jerry", "description": "A cartoon", "image": "/cover.jpg"}
+        assert head.title == "Fallback & title"
+
+    async def test_stops_at_end_of_head(self):
+        """Test that no chunk after the one closing the head is consumed."""
+        consumed = []
+
+        async def chunks():
+            for chunk in [HEAD[:40], HEAD[40:], "<body>never"]:
+                consumed.append(chunk)
+                yield chunk.encode()
+
+        head = await parse_head(chunks())
+        assert head.done and len(consumed) == 2
+
+    async def test_stops_after_max_bytes(self):
+        """Test that a head that never ends is cut off at max_bytes."""
+        head = await parse_head(stream("<head><title>t</title>", "<meta>" * 1000,
+                                       '<meta property="og:title" content="late">'), max_bytes=100)
+        assert head.title == "t" and "title" not in head.og
+
+    async def test_multibyte_split_across_chunks(self):
+        """Test that UTF-8 sequences split between chunks decode correctly."""
+        raw = "<title>Привет</title></head>".encode()
+        head = await parse_head(stream(raw[:8], raw[8:]))
+        assert head.title == "Привет"
+
+
+# ============================================================
+# Service Tests
+# ============================================================
+
+class TestLinkPreviewService:
+    """Test fetching and caching previews."""
+
+    async def test_preview(self, service, site):
+        """Test that a page yields its og fields with the image resolved to an absolute URL."""
+        preview = await service.preview(str(site.make_url("/page")))
+        assert preview["title"] == "Tom & Jerry"
+        assert preview["image"] == str(site.make_url("/cover.jpg"))
+        assert preview["is_youtube"] is False
+
+    async def test_cached_in_memory(self, service, site):
+        """Test that a repeated URL is served without a second fetch."""
+        url = str(site.make_url("/page"))
+        await service.preview(url)
+        await service.preview(url)
+        assert site.hits["page"] == 1
+
+    async def test_cached_in_mongo(self, mock_db, service, site):
+        """Test that another worker with a cold memory tier reads the stored preview."""
+        url = str(site.make_url("/page"))
+        await service.preview(url)
+        other = LinkPreviewService(mock_db, TieredCache(namespace="other", shared=False))
+        assert (await other.preview(url))["title"] == "Tom & Jerry"
+        assert site.hits["page"] == 1
+
+    async def test_concurrent_requests_coalesce(self, service, site):
+        """Test that concurrent previews of one URL share a single fetch."""
+        url = str(site.make_url("/slow"))
+        previews = await asyncio.gather(*(service.preview(url) for _ in range(5)))
+        assert site.hits["slow"] == 1
+        assert {p["title"] for p in previews} == {"Tom & Jerry"}
+
+    async def test_failures_cached_but_not_persisted(self, mock_db, service, site, cache):
+        """Test that failed fetches return an empty preview, cached but not stored in MongoDB."""
+        url = str(site.make_url("/missing"))
+        preview = await service.preview(url)
+        assert preview["title"] is None
+        assert mock_db.link_previews._data == {}
+
+        async def refetch(url):
+            raise AssertionError("failure was not cached")
+
+        service.fetch = refetch
+        assert (await service.preview(url))["title"] is None
+
+    async def test_youtube_needs_no_fetch(self, service):
+        """Test that YouTube links are previewed from the URL alone."""
+        preview = await service.preview("https://youtu.be/abc123")
+        assert preview["youtube_id"] == "abc123" and preview["is_youtube"]
@@ -0,0 +1,111 @@
+"""
+Unit tests for request-scoped batch loaders.
+Tests coalescing of concurrent loads into one $in query, memoization,
+missing keys, error handling and per-request scoping.
+"""
+import asyncio
+import contextvars
+import pytest
+
+from core.loaders import BatchLoader, RequestLoaders, request_loaders
+
+
+@pytest.fixture
+async def users(mock_db):
+    for i in range(5):
+        await mock_db.users.insert_one({"id": f"u{i}", "first_name": f"User{i}"})
+    return mock_db.users
+
+
+# ============================================================
+# Batch Loader Tests
+# ============================================================
+
+class TestBatchLoader:
+    """Test DataLoader-style batching on one collection."""
+
+    async def test_concurrent_loads_share_one_query(self, users, query_budget):
+        """Test that loads in the same tick are fetched with one $in query."""
+        loader = BatchLoader(users)
+        with query_budget(max_queries=1):
+            results = await asyncio.gather(*(loader.load(f"u{i}") for i in range(5)))
+
+        assert [r["first_name"] for r in results] == [f"User{i}" for i in range(5)]
+        assert loader.batches == 1
+
+    async def test_load_many(self, users, query_budget):
+        """Test that load_many deduplicates keys and skips missing ones."""
+        loader = BatchLoader(users)
+        with query_budget(max_queries=1):
+            found = await loader.load_many(["u1", "u2", "u1", None, "missing"])
+
+        assert set(found) == {"u1", "u2"}
+
+    async def test_results_are_memoized(self, users, query_budget):
+        """Test that a key is fetched at most once per loader."""
+        loader = BatchLoader(users)
+        await loader.load_many(["u1", "u2"])
+
+        with query_budget(max_queries=0):
+            assert (await loader.load("u1"))["id"] == "u1"
+            assert await loader.load_many(["u2"]) == {"u2": await loader.load("u2")}
+
+    async def test_missing_key_resolves_to_none(self, users):
+        """Test that unknown keys resolve to None."""
+        assert await BatchLoader(users).load("nobody") is None
+
+    async def test_prime_and_clear(self, users, query_budget):
+        """Test seeding and forgetting memoized documents."""
+        loader = BatchLoader(users)
+        loader.prime("u1", {"id": "u1", "first_name": "Primed"})
+        with query_budget(max_queries=0):
+            assert (await loader.load("u1"))["first_name"] == "Primed"
+
+        loader.clear("u1")
+        assert (await loader.load("u1"))["first_name"] == "User1"
+
+    async def test_errors_are_not_memoized(self):
+        """Test that a failed batch fails its waiters and can be retried."""
+        class FlakyCollection:
+            calls = 0
+
+            def find(self, query, projection=None):
+                FlakyCollection.calls += 1
+
+                class Cursor:
+                    async def to_list(self, length):
+                        if FlakyCollection.calls == 1:
+                            raise RuntimeError("network")
+                        return [{"id": k} for k in query["id"]["$in"]]
+                return Cursor()
+
+        loader = BatchLoader(FlakyCollection())
+        with pytest.raises(RuntimeError):
+            await loader.load("a")
+        assert await loader.load("a") == {"id": "a"}
+
+
+# ============================================================
+# Request Scope Tests
+# ============================================================
+
+class TestRequestLoaders:
+    """Test request-scoped loader registry."""
+
+    async def test_same_instance_within_request(self, mock_db):
+        """Test that one request reuses its loaders."""
+        assert request_loaders(mock_db) is request_loaders(mock_db)
+
+    async def test_requests_do_not_share_loaders(self, mock_db):
+        """Test that separate request contexts get separate loaders."""
+        first = contextvars.Context().run(request_loaders, mock_db)
+        second = contextvars.Context().run(request_loaders, mock_db)
+        assert first is not second
+
+    async def test_load_organizations_falls_back_to_alias(self, mock_db):
+        """Test lookup of organizations stored under organization_id only."""
+        await mock_db.work_organizations.insert_one({"id": "o1", "name": "New"})
+        await mock_db.work_organizations.insert_one({"organization_id": "o2", "name": "Legacy"})
+
+        orgs = await RequestLoaders(mock_db).load_organizations(["o1", "o2", "o3"])
+        assert {k: v["name"] for k, v in orgs.items()} == {"o1": "New", "o2": "Legacy"}
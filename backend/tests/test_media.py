@@ -0,0 +1,53 @@
+"""
+Unit tests for bulk media attachment.
+Tests ownership filtering, ordering, re-tagging and the query count of
+attaching many files at once.
+"""
+import pytest
+
+from core.media import attach_media
+
+
+@pytest.fixture
+async def uploads(mock_db):
+    for i in range(10):
+        await mock_db.media_files.insert_one(
+            {"id": f"m{i}", "uploaded_by": "alice", "source_module": "personal", "file_type": "image"})
+    await mock_db.media_files.insert_one({"id": "theirs", "uploaded_by": "bob", "source_module": "personal"})
+    return mock_db
+
+
+# ============================================================
+# Attachment Tests
+# ============================================================
+
+class TestAttachMedia:
+    """Test validating and re-tagging attached media files."""
+
+    async def test_keeps_only_own_files_in_order(self, uploads):
+        """Test that foreign and unknown ids are dropped and request order is kept."""
+        files = await attach_media(uploads, ["m3", "theirs", "missing", "m1", "m3"], "alice")
+        assert [f["id"] for f in files] == ["m3", "m1"]
+
+    async def test_retags_module(self, uploads):
+        """Test that files are moved to the given module, in storage and in the result."""
+        files = await attach_media(uploads, ["m1", "theirs"], "alice", source_module="family")
+        assert files[0]["source_module"] == "family"
+        assert uploads.media_files._data["m1"]["source_module"] == "family"
+        assert uploads.media_files._data["theirs"]["source_module"] == "personal"
+
+    async def test_without_module_leaves_files_alone(self, uploads):
+        """Test that validation alone does not write."""
+        await attach_media(uploads, ["m1"], "alice")
+        assert uploads.media_files._data["m1"]["source_module"] == "personal"
+
+    async def test_ten_files_two_queries(self, uploads, query_budget):
+        """Test that attaching ten files costs one find and one update_many."""
+        with query_budget(max_queries=2):
+            files = await attach_media(uploads, [f"m{i}" for i in range(10)], "alice", source_module="family")
+        assert len(files) == 10
+
+    async def test_empty_list_issues_no_query(self, uploads, query_budget):
+        """Test that posts without media cost nothing."""
+        with query_budget(max_queries=0):
+            assert await attach_media(uploads, [], "alice", source_module="family") == []
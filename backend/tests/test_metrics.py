@@ -0,0 +1,114 @@
+"""
+Unit tests for Prometheus request and MongoDB command metrics.
+Tests route-template labelling, status codes, unmatched paths and
+attribution of Mongo commands to the issuing route.
+"""
+import pytest
+from types import SimpleNamespace
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from core.metrics import MetricsMiddleware, MongoCommandMetrics, NO_ROUTE, UNMATCHED_ROUTE, render_metrics
+
+listener = MongoCommandMetrics()
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/api/test-posts/{post_id}")
+    async def get_post(post_id: str):
+        if post_id == "missing":
+            raise HTTPException(status_code=404, detail="not found")
+        # Simulates a pymongo command issued while serving this request
+        listener.succeeded(SimpleNamespace(command_name="find", duration_micros=1500))
+        return {"id": post_id}
+
+    app.add_middleware(MetricsMiddleware, skip_paths={"/api/skipped"})
+    return TestClient(app)
+
+
+# ============================================================
+# Request Metrics Tests
+# ============================================================
+
+class TestMetricsMiddleware:
+    """Test per-route request instrumentation."""
+
+    def test_requests_are_labelled_by_route_template(self, client):
+        """Test that different ids share one route-template series."""
+        route = "/api/test-posts/{post_id}"
+        before = sample("zion_http_requests_total", method="GET", route=route, status="200")
+
+        client.get("/api/test-posts/1")
+        client.get("/api/test-posts/2")
+
+        assert sample("zion_http_requests_total", method="GET", route=route, status="200") == before + 2
+        assert REGISTRY.get_sample_value(
+            "zion_http_requests_total", {"method": "GET", "route": "/api/test-posts/1", "status": "200"}
+        ) is None
+
+    def test_status_codes_are_recorded(self, client):
+        """Test that error responses are counted with their status."""
+        route = "/api/test-posts/{post_id}"
+        before = sample("zion_http_requests_total", method="GET", route=route, status="404")
+        client.get("/api/test-posts/missing")
+        assert sample("zion_http_requests_total", method="GET", route=route, status="404") == before + 1
+
+    def test_duration_histogram(self, client):
+        """Test that request durations are observed."""
+        route = "/api/test-posts/{post_id}"
+        before = sample("zion_http_request_duration_seconds_count", method="GET", route=route)
+        client.get("/api/test-posts/3")
+        assert sample("zion_http_request_duration_seconds_count", method="GET", route=route) == before + 1
+
+    def test_unmatched_paths_share_one_label(self, client):
+        """Test that unknown paths cannot create new series."""
+        before = sample("zion_http_requests_total", method="GET", route=UNMATCHED_ROUTE, status="404")
+        client.get("/random/scanner/path-1")
+        client.get("/random/scanner/path-2")
+        assert sample("zion_http_requests_total", method="GET", route=UNMATCHED_ROUTE, status="404") == before + 2
+
+    def test_in_progress_returns_to_zero(self, client):
+        """Test that the in-flight gauge is decremented after the response."""
+        client.get("/api/test-posts/4")
+        assert sample("zion_http_requests_in_progress", method="GET") == 0
+
+
+# ============================================================
+# Mongo Command Metrics Tests
+# ============================================================
+
+class TestMongoCommandMetrics:
+    """Test attribution of Mongo commands to routes."""
+
+    def test_command_is_attributed_to_route(self, client):
+        """Test that commands issued by an endpoint carry its route label."""
+        labels = {"route": "/api/test-posts/{post_id}", "command": "find"}
+        before = sample("zion_mongo_commands_total", outcome="success", **labels)
+        client.get("/api/test-posts/5")
+
+        assert sample("zion_mongo_commands_total", outcome="success", **labels) == before + 1
+        assert sample("zion_mongo_command_duration_seconds_sum", **labels) > 0
+
+    def test_command_outside_request(self):
+        """Test that commands outside a request use the background label."""
+        before = sample("zion_mongo_commands_total", route=NO_ROUTE, command="insert", outcome="failure")
+        listener.failed(SimpleNamespace(command_name="insert", duration_micros=100))
+        assert sample("zion_mongo_commands_total", route=NO_ROUTE, command="insert", outcome="failure") == before + 1
+
+    def test_render_metrics(self, client):
+        """Test Prometheus text exposition."""
+        client.get("/api/test-posts/6")
+        body, content_type = render_metrics()
+
+        assert content_type.startswith("text/plain")
+        assert b"zion_http_request_duration_seconds_bucket" in body
+        assert b"zion_mongo_commands_total" in body
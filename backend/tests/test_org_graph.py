@@ -0,0 +1,98 @@
+"""
+Unit tests for the organization membership graph.
+Tests colleague sets across affiliations and work organizations, the
+shared-organization check, query counts and invalidation.
+"""
+import pytest
+
+from core.org_graph import OrgGraph
+
+
+async def affiliate(db, affiliation_id, user_id, active=True):
+    await db.user_affiliations.insert_one({
+        "id": f"a-{affiliation_id}-{user_id}", "affiliation_id": affiliation_id, "user_id": user_id, "is_active": active,
+    })
+
+
+async def employ(db, organization_id, user_id, active=True):
+    await db.work_members.insert_one({
+        "id": f"w-{organization_id}-{user_id}", "organization_id": organization_id, "user_id": user_id, "is_active": active,
+    })
+
+
+@pytest.fixture
+async def orgs(mock_db):
+    # school: ann, ben; acme (work): ann, cat; dan alone; eve left acme
+    await affiliate(mock_db, "school", "ann")
+    await affiliate(mock_db, "school", "ben")
+    await employ(mock_db, "acme", "ann")
+    await employ(mock_db, "acme", "cat")
+    await employ(mock_db, "acme", "eve", active=False)
+    await affiliate(mock_db, "club", "dan")
+    return mock_db
+
+
+# ============================================================
+# Query Tests
+# ============================================================
+
+class TestColleagues:
+    """Test colleague sets and shared-organization checks."""
+
+    async def test_colleagues_across_sources(self, orgs):
+        """Test that affiliation and work memberships both count, inactive ones do not."""
+        graph = OrgGraph(orgs)
+        assert await graph.colleagues("ann") == {"ann", "ben", "cat"}
+        assert await graph.colleagues("ben") == {"ann", "ben"}
+
+    async def test_no_memberships(self, orgs):
+        """Test that users without organizations have no colleagues."""
+        assert await OrgGraph(orgs).colleagues("zed") == set()
+
+    async def test_share_org(self, orgs):
+        """Test the shared-organization check."""
+        graph = OrgGraph(orgs)
+        assert await graph.share_org("ben", "ann")
+        assert not await graph.share_org("ben", "cat")
+
+    async def test_large_org_not_truncated(self, mock_db):
+        """Test that organizations beyond 100 members are returned in full."""
+        for i in range(150):
+            await employ(mock_db, "big", f"u{i}")
+        assert len(await OrgGraph(mock_db).colleagues("u0")) == 150
+
+    async def test_cold_call_is_bounded(self, orgs, query_budget):
+        """Test that a cold lookup issues one query per source for each step."""
+        with query_budget(max_queries=4):
+            await OrgGraph(orgs).colleagues("ann")
+
+    async def test_warm_call_uses_cache(self, orgs, cache, query_budget):
+        """Test that repeated lookups are answered from the cache."""
+        graph = OrgGraph(orgs, cache)
+        await graph.colleagues("ann")
+        with query_budget(max_queries=0):
+            assert await graph.colleagues("ann") == {"ann", "ben", "cat"}
+
+
+# ============================================================
+# Invalidation Tests
+# ============================================================
+
+class TestInvalidation:
+    """Test that membership events refresh cached sets."""
+
+    async def test_join_and_leave(self, orgs, cache):
+        """Test that joining and leaving update both the member and the org."""
+        graph = OrgGraph(orgs, cache)
+        await graph.colleagues("ann")
+        await graph.colleagues("dan")
+
+        await employ(orgs, "acme", "dan")
+        await graph.member_changed("work", "acme", "dan")
+        assert "dan" in await graph.colleagues("ann")
+        assert "cat" in await graph.colleagues("dan")
+
+        orgs.work_members._data["w-acme-dan"]["is_active"] = False
+        await graph.member_changed("work", "acme", "dan")
+        assert "dan" not in await graph.colleagues("ann")
+        assert await graph.colleagues("dan") == {"dan"}
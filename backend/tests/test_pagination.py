@@ -0,0 +1,119 @@
+"""
+Unit tests for keyset (cursor) pagination.
+Tests cursor encoding, tie-breaking on id, stability under concurrent
+inserts, and rejection of malformed or forged cursors.
+"""
+import pytest
+from datetime import datetime, timedelta
+
+from core.pagination import InvalidCursor, Keyset
+
+NEWEST_FIRST = Keyset("created_at", -1)
+BASE_TIME = datetime(2026, 1, 1, 12, 0, 0)
+
+
+async def fetch_page(collection, query, cursor, limit, keyset=NEWEST_FIRST):
+    docs = await collection.find(keyset.after(query, cursor)).sort(keyset.sort).limit(limit + 1).to_list(limit + 1)
+    return keyset.page(docs, limit)
+
+
+@pytest.fixture
+async def posts(mock_db):
+    # Posts 0-9, one minute apart; posts 4 and 5 share a timestamp
+    for i in range(10):
+        created_at = BASE_TIME + timedelta(minutes=4 if i == 5 else i)
+        await mock_db.posts.insert_one({"id": f"p{i}", "user_id": "u1", "created_at": created_at})
+    return mock_db.posts
+
+
+# ============================================================
+# Cursor Encoding Tests
+# ============================================================
+
+class TestCursor:
+    """Test cursor round-trips and validation."""
+
+    def test_round_trip_preserves_types(self):
+        """Test that datetimes, strings and numbers survive encoding."""
+        assert NEWEST_FIRST.decode(NEWEST_FIRST.encode({"created_at": BASE_TIME, "id": "a"})) == (BASE_TIME, "a")
+        by_date = Keyset("start_date", 1)
+        assert by_date.decode(by_date.encode({"start_date": "2026-05-01", "id": "e"})) == ("2026-05-01", "e")
+
+    def test_cursor_is_url_safe(self):
+        """Test that cursors need no escaping in query strings."""
+        cursor = NEWEST_FIRST.encode({"created_at": BASE_TIME, "id": "a/b+c?"})
+        assert all(c.isalnum() or c in "-_" for c in cursor)
+
+    @pytest.mark.parametrize("cursor", ["not-a-cursor", "", "eyJ9", "e30"])
+    def test_malformed_cursor_rejected(self, cursor):
+        """Test that garbage cursors raise InvalidCursor."""
+        with pytest.raises(InvalidCursor):
+            NEWEST_FIRST.decode(cursor)
+
+    def test_operator_injection_rejected(self):
+        """Test that a forged cursor cannot carry query operators."""
+        forged = Keyset("created_at", -1).encode({"created_at": "x", "id": {"$ne": None}})
+        with pytest.raises(InvalidCursor):
+            NEWEST_FIRST.after({}, forged)
+
+    def test_cursor_from_other_listing_rejected(self):
+        """Test that a cursor for a different sort field is refused."""
+        other = Keyset("start_date", 1).encode({"start_date": "2026-05-01", "id": "e"})
+        with pytest.raises(InvalidCursor):
+            NEWEST_FIRST.decode(other)
+
+    def test_empty_cursor_leaves_query_unchanged(self):
+        """Test that the first page uses the query as given."""
+        query = {"user_id": "u1"}
+        assert NEWEST_FIRST.after(query, None) is query
+
+    def test_existing_or_is_preserved(self):
+        """Test that the keyset condition is ANDed with an existing $or."""
+        cursor = NEWEST_FIRST.encode({"created_at": BASE_TIME, "id": "a"})
+        query = NEWEST_FIRST.after({"$or": [{"from": "u"}, {"to": "u"}]}, cursor)
+        assert query["$or"] == [{"from": "u"}, {"to": "u"}]
+        assert len(query["$and"]) == 1
+
+
+# ============================================================
+# Paging Tests
+# ============================================================
+
+class TestKeysetPaging:
+    """Test walking a collection page by page."""
+
+    async def test_walks_every_row_once(self, posts):
+        """Test that pages cover all rows, newest first, including timestamp ties."""
+        seen, cursor = [], None
+        while True:
+            page, cursor = await fetch_page(posts, {"user_id": "u1"}, cursor, 3)
+            seen.extend(p["id"] for p in page)
+            if cursor is None:
+                break
+
+        assert seen == ["p9", "p8", "p7", "p6", "p5", "p4", "p3", "p2", "p1", "p0"]
+
+    async def test_last_page_has_no_cursor(self, posts):
+        """Test that an exact final page returns no next cursor."""
+        page, cursor = await fetch_page(posts, {"user_id": "u1"}, None, 10)
+        assert len(page) == 10
+        assert cursor is None
+
+    async def test_inserts_do_not_shift_pages(self, posts):
+        """Test that rows added while scrolling do not repeat earlier rows."""
+        first, cursor = await fetch_page(posts, {"user_id": "u1"}, None, 3)
+        await posts.insert_one({"id": "new", "user_id": "u1", "created_at": BASE_TIME + timedelta(hours=1)})
+        second, _ = await fetch_page(posts, {"user_id": "u1"}, cursor, 3)
+
+        assert [p["id"] for p in first] == ["p9", "p8", "p7"]
+        assert [p["id"] for p in second] == ["p6", "p5", "p4"]
+
+    async def test_ascending_order(self, mock_db):
+        """Test soonest-first paging on another sort field."""
+        soonest = Keyset("start_date", 1)
+        for i, day in enumerate(["2026-05-03", "2026-05-01", "2026-05-02"]):
+            await mock_db.goodwill_events.insert_one({"id": f"e{i}", "start_date": day})
+
+        page, cursor = await fetch_page(mock_db.goodwill_events, {}, None, 2, soonest)
+        rest, _ = await fetch_page(mock_db.goodwill_events, {}, cursor, 2, soonest)
+        assert [e["id"] for e in page + rest] == ["e1", "e2", "e0"]
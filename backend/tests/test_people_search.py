@@ -0,0 +1,145 @@
+"""
+Unit tests for the people-search index.
+Tests normalization and transliteration, prefix keys, indexed lookups,
+ranking and the backfill of existing users.
+"""
+import pytest
+
+from core.people_search import (
+    backfill_search_keys,
+    find_people,
+    index_keys,
+    normalize,
+    people_query,
+    rank_people,
+    search_fields,
+    tokens,
+)
+
+
+def person(user_id, first_name, last_name, email=None, **extra):
+    user = {"id": user_id, "first_name": first_name, "last_name": last_name,
+            "email": email or f"{user_id}@example.com", **extra}
+    user.update(search_fields(user))
+    return user
+
+
+@pytest.fixture
+async def people(mock_db):
+    for user in [
+        person("u1", "Иван", "Петров"),
+        person("u2", "Ivan", "Sidorov"),
+        person("u3", "Алексей", "Иванов"),
+        person("u4", "Мария", "Петрова", email="masha.p@mail.ru"),
+        person("u5", "Peter", "Jones"),
+    ]:
+        await mock_db.users.insert_one(user)
+    return mock_db
+
+
+async def search(db, text):
+    users = await db.users.find(people_query(text)).to_list(None)
+    return [user["id"] for user in rank_people(users, text)]
+
+
+# ============================================================
+# Normalization Tests
+# ============================================================
+
+class TestNormalization:
+    """Test tokenization, transliteration and key generation."""
+
+    def test_cyrillic_and_latin_meet(self):
+        """Test that Cyrillic and Latin spellings give the same tokens."""
+        assert tokens("Иван") == tokens("IVAN") == ["ivan"]
+        assert tokens("Алексей") == tokens("Alexey") == ["aleksei"]
+        assert tokens("Юрий") == tokens("Yurii")
+
+    def test_diacritics_and_separators(self):
+        """Test that accents are stripped and punctuation splits tokens."""
+        assert tokens("José Müller-Ёлкин") == ["jose", "muller", "elkin"]
+        assert tokens("ivan.petrov@mail.ru") == ["ivan", "petrov", "mail", "ru"]
+        assert normalize("Щукин") == "shchukin"
+
+    def test_index_keys_are_prefixes(self):
+        """Test that every prefix of every token is a key, and every whole token an exact key."""
+        keys = index_keys({"first_name": "Ян", "last_name": "Ли", "email": "a@b.io"})
+        assert keys == ["=a", "=b", "=ian", "=io", "=li", "a", "b", "i", "ia", "ian", "io", "l", "li"]
+
+    def test_update_without_indexed_fields(self):
+        """Test that unrelated profile updates do not rewrite keys."""
+        assert search_fields({"first_name": "Иван"}, {"bio": "hi"}) == {}
+        keys = search_fields({"first_name": "Иван", "last_name": "Петров"}, {"last_name": "Смирнов"})
+        assert "smir" in keys["search_keys"] and "pet" not in keys["search_keys"]
+
+    def test_query_without_tokens(self):
+        """Test that punctuation-only queries give no filter."""
+        assert people_query(" !? ") is None
+
+
+# ============================================================
+# Lookup Tests
+# ============================================================
+
+class TestLookup:
+    """Test indexed lookups and ranking."""
+
+    async def test_transliterated_prefix(self, people):
+        """Test that a Latin prefix finds Cyrillic names and vice versa."""
+        assert set(await search(people, "ivan")) == {"u1", "u2", "u3"}
+        assert set(await search(people, "Петр")) == {"u1", "u4"}
+
+    async def test_all_tokens_must_match(self, people):
+        """Test that every query token must prefix some name token."""
+        assert await search(people, "ив пет") == ["u1"]
+
+    async def test_email_tokens(self, people):
+        """Test that email tokens are searchable."""
+        assert await search(people, "masha") == ["u4"]
+
+    async def test_whole_token_matches_rank_first(self, people):
+        """Test that exact name matches come before prefix-only matches."""
+        ranked = await search(people, "ivan")
+        assert set(ranked[:2]) == {"u1", "u2"}
+        assert ranked[2] == "u3"
+
+    async def test_exact_matches_beyond_the_prefix_pool(self, mock_db):
+        """Test that whole-token matches are found even when prefix matches fill the pool."""
+        for i in range(20):
+            await mock_db.users.insert_one(person(f"a{i:02}", "Ivanka", "Aaronson"))
+        await mock_db.users.insert_one(person("z", "Ivan", "Zimin"))
+        users = await find_people(mock_db.users, "ivan", 3)
+        assert [user["id"] for user in users] == ["z", "a00", "a01"]
+
+    async def test_find_people_filter(self, people):
+        """Test that the extra filter applies to both lookups."""
+        users = await find_people(people.users, "ivan", 10, {"id": {"$ne": "u1"}})
+        assert [user["id"] for user in users] == ["u2", "u3"]
+
+    async def test_single_query(self, people, query_budget):
+        """Test that a lookup is one query."""
+        with query_budget(max_queries=1):
+            await people.users.find(people_query("ivan pet")).to_list(20)
+
+
+# ============================================================
+# Backfill Tests
+# ============================================================
+
+class TestBackfill:
+    """Test filling keys on users that predate them."""
+
+    async def test_backfill(self, mock_db):
+        """Test that users without keys get them and others are left alone."""
+        await mock_db.users.insert_one({"id": "old", "first_name": "Ольга", "last_name": "Орлова", "email": "o@x.ru"})
+        await mock_db.users.insert_one(person("new", "Anna", "Lee"))
+        assert await backfill_search_keys(mock_db.users, batch=1) == 1
+        assert "olga" in mock_db.users._data["old"]["search_keys"]
+        assert await backfill_search_keys(mock_db.users) == 0
+
+    async def test_rebuild(self, mock_db):
+        """Test that a rebuild rewrites the keys of every user."""
+        for user_id in ("a", "b", "c"):
+            await mock_db.users.insert_one({"id": user_id, "first_name": "Anna", "search_keys": ["an"]})
+        assert await backfill_search_keys(mock_db.users, batch=2, rebuild=True) == 3
+        assert all("=anna" in user["search_keys"] for user in mock_db.users._data.values())
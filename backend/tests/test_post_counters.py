@@ -0,0 +1,182 @@
+"""
+Unit tests for denormalized post counters.
+Tests reaction histogram maintenance, top-reaction ranking and the
+reconciliation job that repairs drifted counters.
+"""
+import pytest
+
+from pymongo.errors import DuplicateKeyError
+
+from core.post_counters import (
+    clear_reaction,
+    reconcile_post_counters,
+    reconcile_step,
+    set_reaction,
+    top_reactions,
+    unique_reactions,
+)
+
+
+def reaction_doc(post_id, user_id, emoji):
+    return {"id": f"r-{post_id}-{user_id}", "post_id": post_id, "user_id": user_id, "emoji": emoji}
+
+
+@pytest.fixture
+async def post(mock_db):
+    await mock_db.posts.insert_one({"id": "p1", "likes_count": 0, "comments_count": 0, "reaction_counts": {}})
+    return mock_db
+
+
+def histogram(db, post_id="p1"):
+    return {k: v for k, v in db.posts._data[post_id].get("reaction_counts", {}).items() if v}
+
+
+# ============================================================
+# Write Path Tests
+# ============================================================
+
+class TestReactions:
+    """Test histogram updates on reaction writes."""
+
+    async def test_add_reaction(self, post):
+        """Test that a first reaction increments its bucket and reports no previous emoji."""
+        assert await set_reaction(post, "p1", "u1", "🔥", reaction_doc("p1", "u1", "🔥")) is None
+        assert histogram(post) == {"🔥": 1}
+
+    async def test_change_reaction_moves_bucket(self, post):
+        """Test that changing emoji moves one count between buckets."""
+        await set_reaction(post, "p1", "u1", "🔥", reaction_doc("p1", "u1", "🔥"))
+        assert await set_reaction(post, "p1", "u1", "👍", reaction_doc("p1", "u1", "👍")) == "🔥"
+        assert histogram(post) == {"👍": 1}
+        assert len(post.post_reactions._data) == 1
+
+    async def test_same_reaction_is_idempotent(self, post):
+        """Test that repeating the same reaction does not double count."""
+        for _ in range(2):
+            await set_reaction(post, "p1", "u1", "🔥", reaction_doc("p1", "u1", "🔥"))
+        assert histogram(post) == {"🔥": 1}
+
+    async def test_concurrent_first_reaction(self, post):
+        """Test that losing an insert race to a double click counts the reaction once."""
+        swap = post.post_reactions.find_one_and_update
+
+        async def racing(*args, **kwargs):
+            # The other request inserts the row between our lookup and insert
+            post.post_reactions.find_one_and_update = swap
+            await set_reaction(post, "p1", "u1", "🔥", reaction_doc("p1", "u1", "🔥"))
+            raise DuplicateKeyError("E11000 duplicate key")
+
+        post.post_reactions.find_one_and_update = racing
+        assert await set_reaction(post, "p1", "u1", "🔥", reaction_doc("p1", "u1", "🔥")) == "🔥"
+        assert histogram(post) == {"🔥": 1}
+        assert len(post.post_reactions._data) == 1
+
+    async def test_clear_reaction(self, post):
+        """Test that removing a reaction decrements its bucket once."""
+        await set_reaction(post, "p1", "u1", "🔥", reaction_doc("p1", "u1", "🔥"))
+        assert await clear_reaction(post, "p1", "u1") == "🔥"
+        assert await clear_reaction(post, "p1", "u1") is None
+        assert histogram(post) == {}
+
+
+class TestTopReactions:
+    """Test ranking a histogram."""
+
+    def test_top_five_by_count(self):
+        """Test that the five most used emoji are returned, most used first."""
+        counts = {"a": 1, "b": 6, "c": 3, "d": 0, "e": 2, "f": 5, "g": 4}
+        assert [r["emoji"] for r in top_reactions(counts)] == ["b", "f", "g", "c", "e"]
+
+    def test_missing_histogram(self):
+        """Test that posts without a histogram have no top reactions."""
+        assert top_reactions(None) == []
+
+
+# ============================================================
+# Reconciliation Tests
+# ============================================================
+
+class TestReconcile:
+    """Test repairing drifted counters."""
+
+    async def test_repairs_drift(self, mock_db):
+        """Test that counters are recomputed from likes, top-level comments and reactions."""
+        await mock_db.posts.insert_one({"id": "p1", "likes_count": 7, "comments_count": 0})
+        await mock_db.posts.insert_one({"id": "p2", "likes_count": 0, "comments_count": 0, "reaction_counts": {}})
+        await mock_db.post_likes.insert_one({"id": "l1", "post_id": "p1", "user_id": "u1"})
+        for cid, parent, deleted in [("c1", None, False), ("c2", "c1", False), ("c3", None, True)]:
+            await mock_db.post_comments.insert_one(
+                {"id": cid, "post_id": "p1", "parent_comment_id": parent, "is_deleted": deleted})
+        for user, emoji in [("u1", "🔥"), ("u2", "🔥"), ("u3", "👍")]:
+            await mock_db.post_reactions.insert_one(reaction_doc("p1", user, emoji))
+
+        assert await reconcile_post_counters(mock_db, batch=1) == 1
+        repaired = mock_db.posts._data["p1"]
+        assert (repaired["likes_count"], repaired["comments_count"]) == (1, 1)
+        assert repaired["reaction_counts"] == {"🔥": 2, "👍": 1}
+
+    async def test_only_missing(self, mock_db):
+        """Test that the startup pass only touches posts without a histogram."""
+        await mock_db.posts.insert_one({"id": "old", "likes_count": 0, "comments_count": 0})
+        await mock_db.posts.insert_one({"id": "new", "likes_count": 3, "comments_count": 0, "reaction_counts": {}})
+        assert await reconcile_post_counters(mock_db, only_missing=True) == 1
+        assert mock_db.posts._data["new"]["likes_count"] == 3
+        assert mock_db.posts._data["old"]["reaction_counts"] == {}
+
+    async def test_consistent_posts_untouched(self, post):
+        """Test that posts whose counters match are not rewritten."""
+        await set_reaction(post, "p1", "u1", "🔥", reaction_doc("p1", "u1", "🔥"))
+        assert await reconcile_post_counters(post) == 0
+
+    async def test_periodic_step_walks_all_posts(self, mock_db):
+        """Test that steps share one cursor, repair drift and start over at the end."""
+        for post_id in ("a", "b", "c"):
+            await mock_db.posts.insert_one({"id": post_id, "likes_count": 0, "comments_count": 0, "reaction_counts": {}})
+        mock_db.posts._data["c"]["likes_count"] = 4
+        assert await reconcile_step(mock_db, batch=2) == 0  # a, b
+        assert await reconcile_step(mock_db, batch=2) == 1  # c
+        assert mock_db.posts._data["c"]["likes_count"] == 0
+        mock_db.posts._data["a"]["likes_count"] = 2
+        assert await reconcile_step(mock_db, batch=2) == 1  # a, b again
+
+    async def test_increment_after_recount_is_kept(self, post):
+        """Test that a repair does not overwrite counters that changed after they were read."""
+        post.posts._data["p1"]["likes_count"] = 5
+        read = post.posts.find
+
+        def find_then_like(*args, **kwargs):
+            cursor = read(*args, **kwargs)
+            to_list = cursor.to_list
+
+            async def racing(length=None):
+                docs = await to_list(length)
+                await post.posts.update_one({"id": "p1"}, {"$inc": {"likes_count": 1}})
+                return docs
+
+            cursor.to_list = racing
+            return cursor
+
+        post.posts.find = find_then_like
+        assert await reconcile_post_counters(post) == 0
+        assert post.posts._data["p1"]["likes_count"] == 6
+
+
+# ============================================================
+# Migration Tests
+# ============================================================
+
+class TestUniqueReactions:
+    """Test the one-off removal of duplicate reaction rows."""
+
+    async def test_duplicates_removed_and_counts_repaired(self, post):
+        """Test that each user keeps only their newest reaction and the histogram follows."""
+        for row_id, created_at, emoji in [("r1", 1, "🔥"), ("r2", 2, "👍"), ("r3", 3, "👍")]:
+            await post.post_reactions.insert_one(
+                {"id": row_id, "post_id": "p1", "user_id": "u1", "emoji": emoji, "created_at": created_at})
+        await post.post_reactions.insert_one({**reaction_doc("p1", "u2", "🔥"), "created_at": 1})
+        post.posts._data["p1"]["reaction_counts"] = {"🔥": 2, "👍": 2}
+
+        assert await unique_reactions(post) == 2
+        assert set(post.post_reactions._data) == {"r3", "r-p1-u2"}
+        assert histogram(post) == {"🔥": 1, "👍": 1}
+        assert await unique_reactions(post) == 0
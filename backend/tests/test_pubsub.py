@@ -0,0 +1,88 @@
+"""
+Unit tests for the cross-worker pub/sub broker.
+Tests pattern routing, fan-out to several subscribers (workers),
+handler isolation and local fallback when Redis is unavailable.
+"""
+from core.pubsub import InProcessBroker, RedisBroker, create_broker
+
+
+class Recorder:
+    """Collects (channel, data) pairs delivered to a handler."""
+
+    def __init__(self):
+        self.events = []
+
+    async def __call__(self, channel, data):
+        self.events.append((channel, data))
+
+
+# ============================================================
+# In-Process Broker Tests
+# ============================================================
+
+class TestInProcessBroker:
+    """Test in-process dispatch used without Redis."""
+
+    async def test_pattern_routing(self):
+        """Test that events reach only handlers whose pattern matches."""
+        broker = InProcessBroker()
+        chats, users = Recorder(), Recorder()
+        await broker.subscribe("chat:*", chats)
+        await broker.subscribe("user:*", users)
+
+        await broker.publish("chat:1", "hello")
+        await broker.publish("user:42", "ping")
+
+        assert chats.events == [("chat:1", "hello")]
+        assert users.events == [("user:42", "ping")]
+
+    async def test_every_subscriber_receives_event(self):
+        """Test fan-out to several subscribers, as with several workers."""
+        broker = InProcessBroker()
+        worker_a, worker_b = Recorder(), Recorder()
+        await broker.subscribe("chat:*", worker_a)
+        await broker.subscribe("chat:*", worker_b)
+
+        await broker.publish("chat:1", "typing")
+
+        assert worker_a.events == worker_b.events == [("chat:1", "typing")]
+
+    async def test_failing_handler_does_not_block_others(self):
+        """Test that one handler error does not stop delivery to the rest."""
+        broker = InProcessBroker()
+        received = Recorder()
+
+        async def broken(channel, data):
+            raise RuntimeError("socket gone")
+
+        await broker.subscribe("chat:*", broken)
+        await broker.subscribe("chat:*", received)
+        await broker.publish("chat:1", "message")
+
+        assert received.events == [("chat:1", "message")]
+
+
+# ============================================================
+# Redis Broker Tests (no server)
+# ============================================================
+
+class TestRedisBroker:
+    """Test RedisBroker behaviour when Redis cannot be reached."""
+
+    async def test_publish_falls_back_to_local_dispatch(self):
+        """Test that events still reach this worker without a connection."""
+        broker = RedisBroker(namespace="test", redis_url="")
+        received = Recorder()
+        await broker.subscribe("chat:*", received)
+        await broker.start()
+
+        await broker.publish("chat:1", "message")
+        await broker.close()
+
+        assert received.events == [("chat:1", "message")]
+        assert broker.stats()["shared"] is False
+
+    def test_create_broker_without_redis_url(self, monkeypatch):
+        """Test that an in-process broker is used when Redis is not configured."""
+        monkeypatch.setattr("core.pubsub.REDIS_URL", "")
+        assert isinstance(create_broker(), InProcessBroker)
@@ -0,0 +1,174 @@
+"""
+Unit tests for request-scoped query recording and query budgets.
+Tests query-shape normalization, N+1 detection, the query_budget
+fixture and marker, and the budget middleware.
+"""
+import logging
+import pytest
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.query_budget import (
+    QueryBudgetExceeded,
+    QueryBudgetMiddleware,
+    QueryRecorderListener,
+    query_shape,
+    recording,
+)
+
+
+# ============================================================
+# Query Shape Tests
+# ============================================================
+
+class TestQueryShape:
+    """Test that shapes ignore values but keep structure."""
+
+    def test_values_are_ignored(self):
+        """Test that queries differing only in values share a shape."""
+        a = query_shape("find", {"find": "users", "filter": {"id": "u1"}})
+        b = query_shape("find", {"find": "users", "filter": {"id": "u2"}})
+        assert a == b
+        assert a[0] == "users"
+
+    def test_fields_and_collections_matter(self):
+        """Test that different fields or collections give different shapes."""
+        by_id = query_shape("find", {"find": "users", "filter": {"id": "u1"}})
+        by_email = query_shape("find", {"find": "users", "filter": {"email": "a@b.c"}})
+        other = query_shape("find", {"find": "posts", "filter": {"id": "u1"}})
+        assert len({by_id, by_email, other}) == 3
+
+    def test_in_lists_collapse(self):
+        """Test that $in lists of any length share a shape."""
+        short = query_shape("find", {"find": "users", "filter": {"id": {"$in": ["a"]}}})
+        long = query_shape("find", {"find": "users", "filter": {"id": {"$in": ["a", "b", "c"]}}})
+        assert short == long
+
+    def test_write_commands_use_statement_filter(self):
+        """Test that update/delete shapes come from their first statement."""
+        collection, shape = query_shape("update", {"update": "posts", "updates": [{"q": {"id": "p1"}, "u": {}}]})
+        assert collection == "posts"
+        assert "'id': '?'" in shape
+
+
+# ============================================================
+# Recorder Tests
+# ============================================================
+
+class TestQueryRecorder:
+    """Test recording via the pymongo listener and mock_db."""
+
+    def test_listener_records_only_inside_block(self):
+        """Test that commands are recorded only while recording is active."""
+        listener = QueryRecorderListener()
+        event = SimpleNamespace(command_name="find", command={"find": "users", "filter": {"id": "1"}})
+
+        listener.started(event)
+        with recording() as recorder:
+            listener.started(event)
+            listener.started(SimpleNamespace(command_name="getMore", command={"getMore": 1}))
+
+        assert recorder.count == 1
+
+    async def test_detects_n_plus_one(self, mock_db):
+        """Test that one find_one per item is reported as a repeated shape."""
+        with recording() as recorder:
+            notifications = await mock_db.notifications.find({"user_id": "u1"}).to_list(100)
+            for user_id in ["a", "b", "c", "d"]:
+                await mock_db.users.find_one({"id": user_id})
+
+        assert notifications == []
+        assert recorder.count == 5
+        assert recorder.repeated(3) == [("find users {'id': '?'}", 4)]
+
+    def test_check_raises_on_budget(self):
+        """Test that check() raises with a readable description."""
+        with recording() as recorder:
+            for i in range(3):
+                recorder.record("find", {"find": "users", "filter": {"id": i}})
+
+        recorder.check(3)
+        with pytest.raises(QueryBudgetExceeded, match="3 queries \\(budget 2\\)"):
+            recorder.check(2)
+        with pytest.raises(QueryBudgetExceeded, match="3x find users"):
+            recorder.check(repeat_threshold=3)
+
+
+# ============================================================
+# Pytest Fixture and Marker Tests
+# ============================================================
+
+class TestQueryBudgetFixture:
+    """Test the query_budget fixture and marker."""
+
+    async def test_fixture_passes_within_budget(self, query_budget, mock_db):
+        """Test that a block within its budget passes."""
+        with query_budget(max_queries=2, max_repeats=2) as recorder:
+            await mock_db.users.find_one({"id": "a"})
+            await mock_db.posts.count_documents({"author_id": "a"})
+        assert recorder.count == 2
+
+    async def test_fixture_fails_on_repeated_shape(self, query_budget, mock_db):
+        """Test that an N+1 pattern fails the budget."""
+        with pytest.raises(QueryBudgetExceeded):
+            with query_budget(max_repeats=2):
+                for user_id in ["a", "b"]:
+                    await mock_db.users.find_one({"id": user_id})
+
+    @pytest.mark.query_budget(2)
+    async def test_marker_budget(self, mock_db):
+        """Test that the marker records the whole test body."""
+        await mock_db.users.insert_one({"id": "a"})
+        await mock_db.users.update_one({"id": "a"}, {"$set": {"name": "A"}})
+
+
+# ============================================================
+# Middleware Tests
+# ============================================================
+
+def make_app(mode, budgets=None):
+    listener = QueryRecorderListener()
+    app = FastAPI()
+
+    @app.get("/api/items/{item_id}")
+    async def get_item(item_id: str):
+        for i in range(int(item_id)):
+            listener.started(SimpleNamespace(command_name="find", command={"find": "users", "filter": {"id": i}}))
+        return {"ok": True}
+
+    app.add_middleware(QueryBudgetMiddleware, default_budget=3, budgets=budgets, repeat_threshold=4, mode=mode)
+    return TestClient(app)
+
+
+class TestQueryBudgetMiddleware:
+    """Test per-route budget enforcement."""
+
+    def test_within_budget_is_silent(self, caplog):
+        """Test that requests within budget log nothing."""
+        with caplog.at_level(logging.WARNING, logger="core.query_budget"):
+            assert make_app("log").get("/api/items/2").status_code == 200
+        assert caplog.records == []
+
+    def test_log_mode_warns_with_route_template(self, caplog):
+        """Test that violations are logged against the route template."""
+        with caplog.at_level(logging.WARNING, logger="core.query_budget"):
+            assert make_app("log").get("/api/items/5").status_code == 200
+
+        message = caplog.records[0].getMessage()
+        assert "GET /api/items/{item_id}" in message
+        assert "5 queries (budget 3)" in message
+        assert "5x find users" in message
+
+    def test_per_route_budget_overrides_default(self, caplog):
+        """Test that a configured route budget replaces the default."""
+        client = make_app("log", budgets={"/api/items/{item_id}": 10})
+        with caplog.at_level(logging.WARNING, logger="core.query_budget"):
+            client.get("/api/items/3")
+        assert caplog.records == []
+
+    def test_raise_mode(self):
+        """Test that raise mode surfaces violations as exceptions."""
+        with pytest.raises(QueryBudgetExceeded):
+            make_app("raise").get("/api/items/5")
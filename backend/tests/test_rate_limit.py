@@ -0,0 +1,151 @@
+"""
+Unit tests for the sliding-window rate limiter and its middleware.
+Tests window rollover, weighted estimates, stale-key cleanup, rule
+matching and 429 responses.
+"""
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from core.rate_limit import LocalSlidingWindow, RateLimiter, RateLimitRule, RateLimitMiddleware
+
+
+# ============================================================
+# Sliding Window Tests
+# ============================================================
+
+class TestLocalSlidingWindow:
+    """Test the fixed-memory sliding-window counters."""
+
+    def test_allows_up_to_limit_then_rejects(self):
+        """Test that exactly `limit` requests are admitted in one window."""
+        window = LocalSlidingWindow()
+        results = [window.hit("k", 5, 60, now=1000.0) for _ in range(7)]
+
+        assert [r.allowed for r in results] == [True] * 5 + [False] * 2
+        assert results[4].remaining == 0
+        assert results[-1].retry_after > 0
+
+    def test_previous_window_is_weighted(self):
+        """Test that the previous window counts proportionally to overlap."""
+        window = LocalSlidingWindow()
+        for _ in range(10):
+            window.hit("k", 10, 60, now=60.0)
+
+        # Halfway into the next window, half of the previous 10 still count
+        allowed = sum(window.hit("k", 10, 60, now=150.0).allowed for _ in range(10))
+        assert allowed == 5
+
+    def test_counters_reset_after_two_windows(self):
+        """Test that old windows stop counting entirely."""
+        window = LocalSlidingWindow()
+        for _ in range(10):
+            window.hit("k", 10, 60, now=0.0)
+
+        assert window.hit("k", 10, 60, now=200.0).allowed
+
+    def test_keys_are_independent(self):
+        """Test that limits are tracked per key."""
+        window = LocalSlidingWindow()
+        for _ in range(3):
+            window.hit("a", 3, 60, now=0.0)
+
+        assert not window.hit("a", 3, 60, now=1.0).allowed
+        assert window.hit("b", 3, 60, now=1.0).allowed
+
+    def test_memory_is_constant_per_key(self):
+        """Test that a key's state does not grow with its request count."""
+        window = LocalSlidingWindow()
+        for i in range(10000):
+            window.hit("k", 1000000, 60, now=float(i % 60))
+
+        assert len(window) == 1
+        assert len(window._counters["k"]) == 4
+
+    def test_cleanup_removes_only_stale_keys(self):
+        """Test that cleanup drops counters older than the previous window."""
+        window = LocalSlidingWindow()
+        window.hit("old", 10, 60, now=0.0)
+        window.hit("recent", 10, 60, now=100.0)
+
+        assert window.cleanup(now=130.0) == 1
+        assert len(window) == 1
+
+
+class TestRateLimiter:
+    """Test the RateLimiter facade without a shared backend."""
+
+    async def test_is_allowed(self):
+        """Test the boolean compatibility API."""
+        limiter = RateLimiter(shared=False)
+        await limiter.start()
+
+        assert await limiter.is_allowed("user:1", 2, 60)
+        assert await limiter.is_allowed("user:1", 2, 60)
+        assert not await limiter.is_allowed("user:1", 2, 60)
+        assert limiter.stats()["rejected"] == 1
+        assert limiter.stats()["shared"] is False
+
+
+# ============================================================
+# Middleware Tests
+# ============================================================
+
+class TestRateLimitMiddleware:
+    """Test declarative per-route-group limits."""
+
+    @pytest.fixture
+    def client(self):
+        async def ok(request):
+            return JSONResponse({"ok": True})
+
+        app = Starlette(routes=[
+            Route("/api/users/search", ok),
+            Route("/api/posts", ok, methods=["GET", "POST"]),
+            Route("/api/health", ok),
+        ])
+        app.add_middleware(
+            RateLimitMiddleware,
+            limiter=RateLimiter(shared=False),
+            rules=[
+                RateLimitRule("search", r"^/api/users/search$", 3, 60),
+                RateLimitRule("posts", r"^/api/posts$", 2, 60, methods={"POST"}),
+            ],
+            identify=lambda scope: dict(scope["headers"]).get(b"x-user", b"anon").decode(),
+        )
+        return TestClient(app)
+
+    def test_rule_limits_matching_route(self, client):
+        """Test that requests beyond the group limit get 429."""
+        codes = [client.get("/api/users/search").status_code for _ in range(4)]
+        assert codes == [200, 200, 200, 429]
+
+    def test_rejection_has_retry_headers(self, client):
+        """Test that 429 responses include Retry-After and limit headers."""
+        for _ in range(3):
+            client.get("/api/users/search")
+        response = client.get("/api/users/search")
+
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+        assert response.headers["x-ratelimit-limit"] == "3"
+        assert "detail" in response.json()
+
+    def test_method_filter(self, client):
+        """Test that a POST-only rule does not limit GET."""
+        assert [client.post("/api/posts").status_code for _ in range(3)] == [200, 200, 429]
+        assert client.get("/api/posts").status_code == 200
+
+    def test_unmatched_routes_pass_through(self, client):
+        """Test that routes outside any group are never limited."""
+        assert all(client.get("/api/health").status_code == 200 for _ in range(20))
+
+    def test_limits_are_per_identity(self, client):
+        """Test that one caller's usage does not limit another."""
+        for _ in range(3):
+            client.get("/api/users/search", headers={"x-user": "alice"})
+
+        assert client.get("/api/users/search", headers={"x-user": "alice"}).status_code == 429
+        assert client.get("/api/users/search", headers={"x-user": "bob"}).status_code == 200
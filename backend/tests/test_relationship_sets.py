@@ -0,0 +1,152 @@
+"""
+Unit tests for cached per-user relationship sets.
+Tests full loads, cache hits, in-place updates from the relationship
+endpoints, cross-worker invalidation, the LRU bound and the resolver
+backed by the sets.
+"""
+import pytest
+
+from core.relationship_sets import RelationshipSets
+from core.relationships import RelationshipResolver
+
+
+@pytest.fixture
+async def network(mock_db):
+    # ann-ben friends (stored as user1/user2), ann follows cat, fan follows ann,
+    # ann subscribes to ch1
+    await mock_db.user_friendships.insert_one({"id": "f1", "user1_id": "ann", "user2_id": "ben"})
+    await mock_db.user_follows.insert_one({"id": "fl1", "follower_id": "ann", "target_id": "cat"})
+    await mock_db.user_follows.insert_one({"id": "fl2", "follower_id": "fan", "target_id": "ann"})
+    await mock_db.channel_subscriptions.insert_one({"id": "s1", "channel_id": "ch1", "subscriber_id": "ann"})
+    return mock_db
+
+
+@pytest.fixture
+def sets(network, cache):
+    relationship_sets = RelationshipSets(network)
+    relationship_sets.attach(cache)
+    return relationship_sets
+
+
+# ============================================================
+# Load Tests
+# ============================================================
+
+class TestLoad:
+    """Test loading and serving the sets."""
+
+    async def test_sets(self, sets):
+        """Test each kind from both sides of the stored rows."""
+        assert await sets.friends("ann") == {"ben"}
+        assert await sets.friends("ben") == {"ann"}
+        assert await sets.following("ann") == {"cat"}
+        assert await sets.channels("ann") == {"ch1"}
+        assert await sets.following("nobody") == set()
+
+    async def test_no_row_cap(self, mock_db):
+        """Test that heavy users get every row, not the first thousand."""
+        for i in range(1200):
+            await mock_db.user_follows.insert_one({"id": f"fl{i}", "follower_id": "heavy", "target_id": f"u{i}"})
+        assert len(await RelationshipSets(mock_db).following("heavy")) == 1200
+
+    async def test_hit_issues_no_query(self, sets, query_budget):
+        """Test that a cached set is served without a query."""
+        await sets.friends("ann")
+        with query_budget(max_queries=0):
+            assert await sets.friends("ann") == {"ben"}
+        assert sets.stats()["hits"] == 1
+
+    async def test_entry_bound(self, network):
+        """Test that the least recently used set is evicted past max_entries."""
+        bounded = RelationshipSets(network, max_entries=2)
+        await bounded.friends("ann")
+        await bounded.friends("ben")
+        await bounded.friends("ann")
+        await bounded.friends("cat")
+        assert set(bounded._entries) == {("ann", "friends"), ("cat", "friends")}
+
+
+# ============================================================
+# Update Tests
+# ============================================================
+
+class TestUpdates:
+    """Test in-place updates and invalidation."""
+
+    async def test_follow_updates_in_place(self, sets, query_budget):
+        """Test that follow and unfollow change the cached set without a reload."""
+        await sets.following("ann")
+        with query_budget(max_queries=0):
+            await sets.followed("ann", "dan")
+            assert await sets.following("ann") == {"cat", "dan"}
+            await sets.unfollowed("ann", "cat")
+            assert await sets.following("ann") == {"dan"}
+
+    async def test_friendship_updates_both_users(self, sets):
+        """Test that a friendship change reaches both users' sets."""
+        await sets.friends("ann")
+        await sets.friends("ben")
+        await sets.unfriended("ann", "ben")
+        assert await sets.friends("ann") == set()
+        assert await sets.friends("ben") == set()
+
+    async def test_subscription_updates(self, sets):
+        """Test subscribe and unsubscribe."""
+        await sets.channels("ann")
+        await sets.subscribed("ann", "ch2")
+        await sets.unsubscribed("ann", "ch1")
+        assert await sets.channels("ann") == {"ch2"}
+
+    async def test_uncached_user_is_left_unloaded(self, sets):
+        """Test that changes for users without cached sets do not load them."""
+        await sets.followed("zed", "ann")
+        assert sets.stats()["entries"] == 0
+
+    async def test_bus_invalidation(self, sets, cache, network):
+        """Test that another worker's change drops the user's sets here."""
+        await sets.following("ann")
+        await network.user_follows.insert_one({"id": "fl3", "follower_id": "ann", "target_id": "dan"})
+        await cache.invalidate("relationship_sets:ann")
+        assert await sets.following("ann") == {"cat", "dan"}
+
+    async def test_load_across_change_is_not_stored(self, sets, network):
+        """Test that a set loaded across a change is returned but not cached."""
+        original = network.user_follows.distinct
+
+        async def racing(*args, **kwargs):
+            await sets.followed("ann", "dan")
+            return await original(*args, **kwargs)
+
+        network.user_follows.distinct = racing
+        await sets.following("ann")
+        assert sets.stats()["entries"] == 0
+
+    async def test_invalidate(self, sets):
+        """Test bulk invalidation of several users."""
+        await sets.channels("ann")
+        await sets.friends("ben")
+        await sets.invalidate(["ann", "ben"])
+        assert sets.stats()["entries"] == 0
+
+
+# ============================================================
+# Resolver Tests
+# ============================================================
+
+class TestResolverWithSets:
+    """Test relationship flags answered from the viewer's sets."""
+
+    async def test_flags_match(self, sets, network):
+        """Test that cached and uncached resolution agree."""
+        targets = ["ben", "cat", "fan", "stranger"]
+        cached = await RelationshipResolver(network, sets).resolve("ann", targets)
+        plain = await RelationshipResolver(network).resolve("ann", targets)
+        assert cached == plain
+        assert cached["ben"].is_friend and cached["cat"].is_following and cached["fan"].follows_me
+
+    async def test_two_queries_when_warm(self, sets, network, query_budget):
+        """Test that warm sets leave only the follower and request queries."""
+        resolver = RelationshipResolver(network, sets)
+        await resolver.resolve("ann", ["ben"])
+        with query_budget(max_queries=2):
+            await resolver.resolve("ann", [f"user{i}" for i in range(20)] + ["ben"])
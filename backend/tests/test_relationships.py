@@ -0,0 +1,60 @@
+"""
+Unit tests for the relationship resolver.
+Tests each flag in both directions, unrelated and self targets, and the
+query count for many targets.
+"""
+import pytest
+
+from core.relationships import RelationshipResolver
+
+
+@pytest.fixture
+async def social(mock_db):
+    # me-friend are friends; I follow "idol"; "fan" follows me; I sent a
+    # request to "crush"; "admirer" sent me one; an old request to "ex" was rejected
+    await mock_db.user_friendships.insert_one({"id": "f1", "user1_id": "friend", "user2_id": "me"})
+    await mock_db.user_follows.insert_one({"id": "fl1", "follower_id": "me", "target_id": "idol"})
+    await mock_db.user_follows.insert_one({"id": "fl2", "follower_id": "fan", "target_id": "me"})
+    await mock_db.friend_requests.insert_one(
+        {"id": "r1", "sender_id": "me", "receiver_id": "crush", "status": "PENDING"})
+    await mock_db.friend_requests.insert_one(
+        {"id": "r2", "sender_id": "admirer", "receiver_id": "me", "status": "PENDING"})
+    await mock_db.friend_requests.insert_one(
+        {"id": "r3", "sender_id": "me", "receiver_id": "ex", "status": "REJECTED"})
+    return RelationshipResolver(mock_db)
+
+
+# ============================================================
+# Resolver Tests
+# ============================================================
+
+class TestResolve:
+    """Test batched relationship flags."""
+
+    async def test_flags(self, social):
+        """Test that every flag is resolved for its target only."""
+        relations = await social.resolve("me", ["friend", "idol", "fan", "crush", "admirer", "ex", "stranger"])
+        assert relations["friend"].is_friend and not relations["idol"].is_friend
+        assert relations["idol"].is_following and not relations["fan"].is_following
+        assert relations["fan"].follows_me and not relations["idol"].follows_me
+        assert relations["crush"].request_sent and relations["crush"].request_id == "r1"
+        assert relations["admirer"].request_received and not relations["admirer"].request_sent
+        assert relations["ex"].flags() == relations["stranger"].flags() == {
+            "is_friend": False, "is_following": False, "follows_me": False, "request_sent": False,
+        }
+
+    async def test_three_queries(self, social, query_budget):
+        """Test that any number of targets costs three queries."""
+        with query_budget(max_queries=3):
+            relations = await social.resolve("me", [f"user{i}" for i in range(20)] + ["friend"])
+        assert len(relations) == 21
+
+    async def test_self_and_empty(self, social, query_budget):
+        """Test that the viewer and empty lists issue no query."""
+        with query_budget(max_queries=0):
+            assert await social.resolve("me", ["me", None]) == {}
+
+    async def test_between(self, social):
+        """Test the single-target helper."""
+        assert (await social.between("me", "admirer")).request_id == "r2"
+        assert not (await social.between("me", "me")).is_friend
@@ -0,0 +1,124 @@
+"""
+Unit tests for denormalized social counters.
+Tests incremental follow/friend/subscription updates, reads, and the
+reconciliation of drifted or missing counters.
+"""
+import pytest
+
+from core.social_counters import SocialCounters, counts_of
+
+
+@pytest.fixture
+async def social(mock_db):
+    for user_id in ("ann", "ben", "cat"):
+        await mock_db.users.insert_one({"id": user_id})
+    await mock_db.news_channels.insert_one({"id": "ch1"})
+    return SocialCounters(mock_db, batch=2)
+
+
+async def relate(db):
+    """ann-ben friends, ann and cat follow ben, cat subscribes to ch1."""
+    await db.user_friendships.insert_one({"id": "f1", "user1_id": "ann", "user2_id": "ben"})
+    await db.user_follows.insert_one({"id": "fl1", "follower_id": "ann", "target_id": "ben"})
+    await db.user_follows.insert_one({"id": "fl2", "follower_id": "cat", "target_id": "ben"})
+    await db.channel_subscriptions.insert_one({"id": "s1", "channel_id": "ch1", "subscriber_id": "cat"})
+
+
+# ============================================================
+# Incremental Update Tests
+# ============================================================
+
+class TestIncrements:
+    """Test counter updates made by relationship endpoints."""
+
+    async def test_follow_and_unfollow(self, social, query_budget):
+        """Test that a follow moves both users' counters in one write."""
+        with query_budget(max_queries=1):
+            await social.followed("ann", "ben")
+        assert await social.user_counts("ann") == {"friends_count": 0, "followers_count": 0, "following_count": 1}
+        assert (await social.user_counts("ben"))["followers_count"] == 1
+        await social.unfollowed("ann", "ben")
+        assert (await social.user_counts("ben"))["followers_count"] == 0
+
+    async def test_friendship(self, social, query_budget):
+        """Test that a friendship counts for both users in one write."""
+        with query_budget(max_queries=1):
+            await social.befriended("ann", "ben")
+        assert (await social.user_counts("ann"))["friends_count"] == 1
+        assert (await social.user_counts("ben"))["friends_count"] == 1
+        await social.unfriended("ann", "ben")
+        assert (await social.user_counts("ann"))["friends_count"] == 0
+
+    async def test_subscription(self, social, mock_db):
+        """Test the channel subscriber counter."""
+        await social.subscribed("ch1")
+        await social.subscribed("ch1")
+        await social.unsubscribed("ch1")
+        assert mock_db.news_channels._data["ch1"]["subscribers_count"] == 1
+
+    def test_counts_of_defaults(self):
+        """Test that missing or negative counters read as zero."""
+        assert counts_of(None) == {"friends_count": 0, "followers_count": 0, "following_count": 0}
+        assert counts_of({"followers_count": -1})["followers_count"] == 0
+
+
+# ============================================================
+# Reconciliation Tests
+# ============================================================
+
+class TestReconcile:
+    """Test repairing counters from the relationship collections."""
+
+    async def test_reconcile_missing(self, social, mock_db):
+        """Test that users and channels without counters get them."""
+        await relate(mock_db)
+        assert await social.reconcile_missing() == 4
+        assert await social.user_counts("ben") == {"friends_count": 1, "followers_count": 2, "following_count": 0}
+        assert await social.user_counts("cat") == {"friends_count": 0, "followers_count": 0, "following_count": 1}
+        assert mock_db.news_channels._data["ch1"]["subscribers_count"] == 1
+        assert await social.reconcile_missing() == 0
+
+    async def test_reconcile_drifted(self, social, mock_db):
+        """Test that only drifted documents are rewritten."""
+        await relate(mock_db)
+        await social.reconcile_missing()
+        await mock_db.users.update_one({"id": "ben"}, {"$set": {"followers_count": 7}})
+        assert await social.reconcile_users(["ann", "ben", "cat"]) == 1
+        assert (await social.user_counts("ben"))["followers_count"] == 2
+
+    async def test_rolling_step(self, social, mock_db):
+        """Test that the periodic step walks all users a batch at a time and wraps."""
+        await relate(mock_db)
+        await social.reconcile_missing()
+        await mock_db.users.update_one({"id": "cat"}, {"$set": {"following_count": 0}})
+        assert await social.reconcile_step() == 0  # ann, ben
+        assert await social.reconcile_step() == 1  # cat
+        assert (await social.user_counts("cat"))["following_count"] == 1
+        await mock_db.users.update_one({"id": "ann"}, {"$set": {"friends_count": 5}})
+        assert await social.reconcile_step() == 1  # back to ann, ben
+
+    async def test_step_position_is_shared(self, social, mock_db):
+        """Test that another instance (worker, or a restart) continues the same walk."""
+        await relate(mock_db)
+        await social.reconcile_missing()
+        await social.reconcile_step()  # ann, ben
+        await mock_db.users.update_one({"id": "ann"}, {"$set": {"friends_count": 5}})
+        await mock_db.users.update_one({"id": "cat"}, {"$set": {"following_count": 0}})
+        assert await SocialCounters(mock_db, batch=2).reconcile_step() == 1  # cat
+        assert mock_db.users._data["ann"]["friends_count"] == 5
+
+    async def test_change_after_recount_is_kept(self, social, mock_db):
+        """Test that a repair does not overwrite counters that changed after they were read."""
+        await relate(mock_db)
+        await social.reconcile_missing()
+        await mock_db.users.update_one({"id": "ben"}, {"$set": {"followers_count": 7}})
+        recount = social.actual_user_counts
+
+        async def recount_then_follow(user_ids):
+            actual = await recount(user_ids)
+            await social.followed("ann", "ben")
+            return actual
+
+        social.actual_user_counts = recount_then_follow
+        assert await social.reconcile_users(["ben"]) == 0
+        assert (await social.user_counts("ben"))["followers_count"] == 8
@@ -0,0 +1,160 @@
+"""
+Unit tests for materialized friend suggestions.
+Tests candidate generation and ranking, exclusions, paging from the stored
+list, and the drop/expire/refresh maintenance paths.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core.org_graph import OrgGraph
+from core.suggestions import EXPIRED, SuggestionEngine
+
+
+async def befriend(db, a, b):
+    await db.user_friendships.insert_one({"id": f"f-{a}-{b}", "user1_id": min(a, b), "user2_id": max(a, b)})
+
+
+@pytest.fixture
+async def network(mock_db):
+    # ann's friends: ben, cat. ben's friends: dan, eve; cat's friends: dan.
+    # fay works with ann, gus follows ann, hal lives in ann's city, ivy is
+    # already followed by ann, jon has a pending request from ann.
+    for user_id, city in [("ann", "Moscow"), ("ben", None), ("cat", None), ("dan", "Kazan"), ("eve", None),
+                          ("fay", None), ("gus", None), ("hal", "Moscow"), ("ivy", None), ("jon", None)]:
+        await mock_db.users.insert_one({
+            "id": user_id, "first_name": user_id.title(), "address_city": city,
+            "address_country": "Russia",
+        })
+    await befriend(mock_db, "ann", "ben")
+    await befriend(mock_db, "ann", "cat")
+    await befriend(mock_db, "ben", "dan")
+    await befriend(mock_db, "ben", "eve")
+    await befriend(mock_db, "cat", "dan")
+    for user_id in ("ann", "fay"):
+        await mock_db.work_members.insert_one({
+            "id": f"w-{user_id}", "organization_id": "acme", "user_id": user_id, "is_active": True,
+        })
+    await mock_db.user_follows.insert_one({"id": "fl1", "follower_id": "gus", "target_id": "ann"})
+    await mock_db.user_follows.insert_one({"id": "fl2", "follower_id": "ann", "target_id": "ivy"})
+    await mock_db.user_follows.insert_one({"id": "fl3", "follower_id": "ivy", "target_id": "ann"})
+    await mock_db.friend_requests.insert_one(
+        {"id": "r1", "sender_id": "ann", "receiver_id": "jon", "status": "PENDING"})
+    await befriend(mock_db, "jon", "ben")
+    return mock_db
+
+
+@pytest.fixture
+def engine(network):
+    return SuggestionEngine(network, OrgGraph(network))
+
+
+# ============================================================
+# Candidate Tests
+# ============================================================
+
+class TestBuild:
+    """Test candidate generation and ranking."""
+
+    async def test_ranked_candidates(self, engine):
+        """Test that candidates come from every source, ranked by score."""
+        items = await engine.build("ann")
+        assert [item["user_id"] for item in items] == ["dan", "eve", "fay", "gus", "hal"]
+        dan = items[0]
+        assert dan["mutual_friends_count"] == 2
+        assert dan["score"] == 2 + 20  # same country, two mutual friends
+        assert dan["reasons"] == ["2 общих друзей", "Из Russia"]
+
+    async def test_reasons(self, engine):
+        """Test the reason labels of colleagues, followers and neighbours."""
+        reasons = {item["user_id"]: item["reasons"] for item in await engine.build("ann")}
+        assert "Коллега" in reasons["fay"]
+        assert "Подписан на вас" in reasons["gus"]
+        assert reasons["hal"] == ["Живёт в Moscow"]
+
+    async def test_exclusions(self, engine):
+        """Test that friends, followed users, pending requests and self are excluded."""
+        ids = {item["user_id"] for item in await engine.build("ann")}
+        assert not ids & {"ann", "ben", "cat", "ivy", "jon"}
+
+    async def test_school_affiliation(self, network, engine):
+        """Test that school affiliation co-members are labelled as school."""
+        await network.affiliations.insert_one({"id": "sch", "type": "SCHOOL"})
+        for user_id in ("ann", "eve"):
+            await network.user_affiliations.insert_one({
+                "id": f"a-{user_id}", "affiliation_id": "sch", "user_id": user_id, "is_active": True,
+            })
+        eve = next(item for item in await engine.build("ann") if item["user_id"] == "eve")
+        assert eve["reasons"] == ["1 общий друг", "Из Russia", "Из той же школы"]
+
+    async def test_max_items(self, network):
+        """Test that only the best max_items candidates are kept."""
+        items = await SuggestionEngine(network, OrgGraph(network), max_items=2).build("ann")
+        assert [item["user_id"] for item in items] == ["dan", "eve"]
+
+
+# ============================================================
+# Serving Tests
+# ============================================================
+
+class TestPage:
+    """Test serving pages from the materialized list."""
+
+    async def test_first_request_builds(self, engine, network):
+        """Test that a missing list is built and stored."""
+        cards, has_more = await engine.page("ann", limit=2)
+        assert [c["id"] for c in cards] == ["dan", "eve"]
+        assert has_more
+        assert cards[0]["suggestion_reasons"] == ["2 общих друзей", "Из Russia"]
+        assert await network.user_suggestions.find_one({"user_id": "ann"}) is not None
+
+    async def test_stored_page_two_queries(self, engine, query_budget):
+        """Test that a stored list is served with one list read and one card fetch."""
+        await engine.rebuild("ann")
+        with query_budget(max_queries=2):
+            cards, has_more = await engine.page("ann", offset=3, limit=5)
+        assert [c["id"] for c in cards] == ["gus", "hal"]
+        assert not has_more
+
+    async def test_deleted_user_skipped(self, engine, network):
+        """Test that users deleted since the build are left out."""
+        await engine.rebuild("ann")
+        await network.users.delete_one({"id": "dan"})
+        cards, _ = await engine.page("ann")
+        assert "dan" not in [c["id"] for c in cards]
+
+
+# ============================================================
+# Maintenance Tests
+# ============================================================
+
+class TestMaintenance:
+    """Test dropping, expiring and refreshing lists."""
+
+    async def test_drop(self, engine):
+        """Test that a requested candidate disappears without a rebuild."""
+        await engine.rebuild("ann")
+        await engine.drop("ann", ["dan"])
+        cards, _ = await engine.page("ann")
+        assert [c["id"] for c in cards] == ["eve", "fay", "gus", "hal"]
+
+    async def test_expire_and_refresh(self, engine, network):
+        """Test that an expired list is rebuilt by the refresh job."""
+        await engine.rebuild("ann")
+        await engine.rebuild("ben")
+        await befriend(network, "ann", "dan")
+        await engine.expire(["ann"])
+        assert (await network.user_suggestions.find_one({"user_id": "ann"}))["computed_at"] == EXPIRED
+        assert await engine.refresh() == 1
+        items = (await network.user_suggestions.find_one({"user_id": "ann"}))["items"]
+        assert "dan" not in [item["user_id"] for item in items]
+
+    async def test_refresh_outdated(self, engine, network):
+        """Test that lists older than the TTL are refreshed, fresh ones are not."""
+        await engine.rebuild("ann")
+        await engine.rebuild("ben")
+        stale = datetime.now(timezone.utc) - timedelta(seconds=engine.ttl + 60)
+        await network.user_suggestions.update_one({"user_id": "ben"}, {"$set": {"computed_at": stale}})
+        assert await engine.refresh() == 1
+        doc = await network.user_suggestions.find_one({"user_id": "ben"})
+        assert doc["computed_at"] > stale
@@ -0,0 +1,190 @@
+"""
+Unit tests for materialized news timelines.
+Tests fan-out by visibility, the pull path for channels and high-follower
+authors, backfill on follow/unfollow, trimming, lazy builds and paging.
+"""
+import pytest
+from datetime import datetime, timedelta
+
+from core.journal import ChangeJournal
+from core.timelines import NewsTimelines
+
+BASE_TIME = datetime(2026, 3, 1, 9, 0, 0)
+
+
+async def make_post(db, post_id, user_id, minutes, visibility="PUBLIC", channel_id=None):
+    post = {
+        "id": post_id, "user_id": user_id, "channel_id": channel_id, "visibility": visibility,
+        "content": post_id, "is_active": True, "created_at": BASE_TIME + timedelta(minutes=minutes),
+    }
+    await db.news_posts.insert_one(post)
+    return post
+
+
+async def befriend(db, a, b):
+    await db.user_friendships.insert_one({"id": f"f-{a}-{b}", "user1_id": min(a, b), "user2_id": max(a, b)})
+
+
+async def follow(db, follower, target):
+    await db.user_follows.insert_one({"id": f"w-{follower}-{target}", "follower_id": follower, "target_id": target})
+
+
+def owners(db, post_id):
+    return sorted(e["owner_id"] for e in db.news_timelines._data.values() if e["post_id"] == post_id)
+
+
+@pytest.fixture
+async def network(mock_db):
+    # alice: friend bob, follower carol; dave is a stranger
+    await befriend(mock_db, "alice", "bob")
+    await follow(mock_db, "carol", "alice")
+    return mock_db
+
+
+# ============================================================
+# Fan-out Tests
+# ============================================================
+
+class TestFanOut:
+    """Test which timelines receive a published post."""
+
+    async def test_public_post_reaches_friends_and_followers(self, network):
+        """Test that a PUBLIC post is pushed to the author, friends and followers."""
+        timelines = NewsTimelines(network)
+        await timelines.publish(await make_post(network, "p1", "alice", 1), wait=True)
+        assert owners(network, "p1") == ["alice", "bob", "carol"]
+
+    async def test_fan_out_is_journaled(self, network):
+        """Test that recipients of a pushed post get a feed change in their journal."""
+        journal = ChangeJournal(network)
+        timelines = NewsTimelines(network, journal=journal)
+        await timelines.publish(await make_post(network, "p1", "alice", 1), wait=True)
+        assert [c["id"] for c in (await journal.changes("bob", 0))["changes"]] == ["p1"]
+        assert await journal.changes("alice", 0) is None
+
+    async def test_friends_only_post_skips_followers(self, network):
+        """Test that a FRIENDS_ONLY post is not pushed to followers."""
+        timelines = NewsTimelines(network)
+        await timelines.publish(await make_post(network, "p1", "alice", 1, "FRIENDS_ONLY"), wait=True)
+        assert owners(network, "p1") == ["alice", "bob"]
+
+    async def test_large_audience_switches_author_to_pull(self, network):
+        """Test that authors above the audience limit are read at query time."""
+        timelines = NewsTimelines(network, max_audience=1)
+        await timelines.publish(await make_post(network, "p1", "alice", 1), wait=True)
+
+        assert owners(network, "p1") == ["alice"]
+        assert await timelines.pull_authors() == {"alice"}
+        posts, _ = await timelines.read("carol", limit=10)
+        assert [p["id"] for p in posts] == ["p1"]
+
+    async def test_retract_removes_entries(self, network):
+        """Test that deleting a post removes it from every timeline."""
+        timelines = NewsTimelines(network)
+        await timelines.publish(await make_post(network, "p1", "alice", 1), wait=True)
+        await timelines.retract("p1")
+        assert owners(network, "p1") == []
+
+
+# ============================================================
+# Read Path Tests
+# ============================================================
+
+class TestRead:
+    """Test feed pages assembled from timelines and pull sources."""
+
+    async def test_feed_respects_visibility(self, network):
+        """Test that followers do not see FRIENDS_ONLY posts and strangers see nothing."""
+        timelines = NewsTimelines(network)
+        for post in [await make_post(network, "p1", "alice", 1),
+                     await make_post(network, "p2", "alice", 2, "FRIENDS_ONLY")]:
+            await timelines.publish(post, wait=True)
+
+        assert [p["id"] for p in (await timelines.read("bob", 10))[0]] == ["p2", "p1"]
+        assert [p["id"] for p in (await timelines.read("carol", 10))[0]] == ["p1"]
+        assert (await timelines.read("dave", 10))[0] == []
+
+    async def test_channel_posts_are_pulled(self, network):
+        """Test that subscribed channel posts are merged in without fan-out."""
+        timelines = NewsTimelines(network)
+        await network.channel_subscriptions.insert_one({"id": "s1", "subscriber_id": "dave", "channel_id": "c1"})
+        await make_post(network, "p1", "erin", 1, channel_id="c1")
+
+        posts, _ = await timelines.read("dave", 10)
+        assert [p["id"] for p in posts] == ["p1"]
+
+    async def test_cursor_pages_merge_sources(self, network):
+        """Test that cursor pages interleave pushed and pulled posts without gaps."""
+        timelines = NewsTimelines(network)
+        await network.channel_subscriptions.insert_one({"id": "s1", "subscriber_id": "bob", "channel_id": "c1"})
+        await timelines.read("bob", 1)  # build the (empty) timeline
+        for i in range(6):
+            if i % 2:
+                await make_post(network, f"p{i}", "erin", i, channel_id="c1")
+            else:
+                await timelines.publish(await make_post(network, f"p{i}", "alice", i), wait=True)
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = await timelines.read("bob", 2, cursor=cursor)
+            seen += [p["id"] for p in page]
+            if cursor is None:
+                break
+        assert seen == ["p5", "p4", "p3", "p2", "p1", "p0"]
+
+    async def test_first_read_builds_timeline(self, network):
+        """Test that posts written before timelines existed are materialized on first read."""
+        timelines = NewsTimelines(network)
+        await make_post(network, "old", "alice", 1)
+
+        posts, _ = await timelines.read("bob", 10)
+        assert [p["id"] for p in posts] == ["old"]
+        assert owners(network, "old") == ["bob"]
+
+    async def test_offset_is_supported(self, network):
+        """Test that offset pagination still works for older clients."""
+        timelines = NewsTimelines(network)
+        await timelines.read("bob", 1)  # build the (empty) timeline
+        for i in range(4):
+            await timelines.publish(await make_post(network, f"p{i}", "alice", i), wait=True)
+
+        posts, _ = await timelines.read("bob", 2, offset=2)
+        assert [p["id"] for p in posts] == ["p1", "p0"]
+
+
+# ============================================================
+# Maintenance Tests
+# ============================================================
+
+class TestMaintenance:
+    """Test backfill on relationship changes and trimming."""
+
+    async def test_follow_backfills_and_unfollow_removes(self, network):
+        """Test that following copies recent visible posts and unfollowing drops them."""
+        timelines = NewsTimelines(network)
+        await make_post(network, "p1", "alice", 1)
+        await make_post(network, "p2", "alice", 2, "FRIENDS_ONLY")
+
+        await follow(network, "dave", "alice")
+        await timelines.refresh_connection("dave", "alice")
+        assert owners(network, "p1") == ["dave"]
+        assert owners(network, "p2") == []
+
+        await network.user_follows.delete_one({"follower_id": "dave", "target_id": "alice"})
+        await timelines.refresh_connection("dave", "alice")
+        assert owners(network, "p1") == []
+
+    async def test_trim_bounds_timeline_and_falls_back(self, network):
+        """Test that trimmed timelines keep the newest entries and older pages still load."""
+        timelines = NewsTimelines(network, max_length=2)
+        await timelines.read("bob", 1)
+        for i in range(4):
+            await timelines.publish(await make_post(network, f"p{i}", "alice", i), wait=True)
+
+        assert await timelines.trim() > 0
+        bob_entries = sorted(e["post_id"] for e in network.news_timelines._data.values() if e["owner_id"] == "bob")
+        assert bob_entries == ["p2", "p3"]
+
+        first, cursor = await timelines.read("bob", 2)
+        rest, _ = await timelines.read("bob", 2, cursor=cursor)
+        assert [p["id"] for p in first + rest] == ["p3", "p2", "p1", "p0"]
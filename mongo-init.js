@@ -21,6 +21,8 @@ db.createUser({
 });
 
 // Create indexes for optimal performance
+// Application indexes are declared in backend/db_indexes.py and reconciled by
+// the API at startup; the ones below only seed a fresh volume.
 print('Creating indexes...');
 
 // Users collection